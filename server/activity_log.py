@@ -0,0 +1,207 @@
+"""Write-behind buffer for question_activity_logs.
+
+Verify/unverify clicks used to cost one Supabase insert each. Here an
+action costs one small commit to a spool database next to the local store
+(activity_spool.db). That database is in WAL mode with synchronous=NORMAL,
+so the commit needs no fsync and never waits on the main store's write
+lock, which an Excel import or a migration backfill may be holding. A
+flusher thread moves the spool into question_activity_logs in batches,
+each one transaction, triggered by size or time.
+
+Durability: a spooled event survives a crash or kill of the server process.
+Whatever is still spooled is flushed by the next process that starts.
+Moving a batch commits to two files, and that commit is not atomic across
+them in WAL mode, so every event carries a unique event_id. Replaying a
+batch that already reached the log is then a no-op (INSERT OR IGNORE).
+Several worker processes share one spool, and any of them may flush it.
+
+IDCS_ACTIVITY_FLUSH_SIZE (default 200) and IDCS_ACTIVITY_FLUSH_SECONDS
+(default 1.0) set the flush thresholds.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Iterable, List, Optional
+
+from server.db import BUSY_TIMEOUT, DB_PATH, TimedConnection, get_conn
+from server.metrics import ACTIVITY_EVENTS
+
+logger = logging.getLogger('activity_log')
+
+FLUSH_SIZE = int(os.environ.get('IDCS_ACTIVITY_FLUSH_SIZE', '200'))
+FLUSH_SECONDS = float(os.environ.get('IDCS_ACTIVITY_FLUSH_SECONDS', '1.0'))
+# Rows moved per flush transaction, so a large backlog does not hold the main write lock for long
+FLUSH_BATCH = 5000
+
+FIELDS = ('event_id', 'user_id', 'action', 'question_id', 'title_id', 'details', 'created_at')
+
+
+def spool_path(db_path: Optional[str] = None) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path or DB_PATH)), 'activity_spool.db')
+
+
+def _utcnow() -> str:
+    # Same format as db.SQL_NOW
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _row(event: dict) -> tuple:
+    action = event.get('action')
+    if not action:
+        raise ValueError('activity event needs an action')
+    details = event.get('details')
+    if details is not None and not isinstance(details, str):
+        details = json.dumps(details, ensure_ascii=False)
+    return (event.get('event_id') or uuid.uuid4().hex, event.get('user_id'), action,
+            event.get('question_id'), event.get('title_id'), details, event.get('created_at') or _utcnow())
+
+
+class ActivityLog:
+    def __init__(self, db_path: Optional[str] = None, flush_size: int = FLUSH_SIZE, flush_seconds: float = FLUSH_SECONDS):
+        self.db_path = db_path
+        self.spool_path = spool_path(db_path)
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spool: Optional[sqlite3.Connection] = None
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _spool_conn(self) -> sqlite3.Connection:
+        # Callers hold self._lock
+        if self._spool is None:
+            conn = sqlite3.connect(self.spool_path, timeout=BUSY_TIMEOUT, factory=TimedConnection,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS activity_spool(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id TEXT NOT NULL,
+                    user_id TEXT,
+                    action TEXT NOT NULL,
+                    question_id,
+                    title_id,
+                    details TEXT,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            self._spool = conn
+        return self._spool
+
+    def record(self, events: Iterable[dict]) -> List[str]:
+        """Spool events (dicts with action and optional user_id, question_id,
+        title_id, details, created_at, event_id). Returns their event ids."""
+        rows = [_row(e) for e in events]
+        if not rows:
+            return []
+        with self._lock:
+            conn = self._spool_conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(f'INSERT INTO activity_spool({", ".join(FIELDS)}) VALUES ({", ".join("?" * len(FIELDS))})', rows)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._pending += len(rows)
+            if self._pending >= self.flush_size:
+                self._wake.set()
+        ACTIVITY_EVENTS.labels('queued').inc(len(rows))
+        return [r[0] for r in rows]
+
+    def spooled(self) -> int:
+        with self._lock:
+            return self._spool_conn().execute('SELECT COUNT(*) FROM activity_spool').fetchone()[0]
+
+    def flush(self) -> int:
+        """Move everything spooled (by any process) into question_activity_logs. Returns rows moved."""
+        with self._flush_lock:
+            with self._lock:
+                # Skip the main store's write lock when there is nothing to move
+                if self._spool_conn().execute('SELECT 1 FROM activity_spool LIMIT 1').fetchone() is None:
+                    self._pending = 0
+                    return 0
+            moved = 0
+            conn = get_conn(self.db_path)
+            conn.isolation_level = None
+            try:
+                conn.execute('ATTACH DATABASE ? AS spool', (self.spool_path,))
+                cols = ', '.join(FIELDS)
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        hi = conn.execute('SELECT MAX(seq) FROM (SELECT seq FROM spool.activity_spool ORDER BY seq LIMIT ?)',
+                                          (FLUSH_BATCH,)).fetchone()[0]
+                        if hi is not None:
+                            conn.execute(f'INSERT OR IGNORE INTO question_activity_logs({cols}) '
+                                         f'SELECT {cols} FROM spool.activity_spool WHERE seq <= ? ORDER BY seq', (hi,))
+                            n = conn.execute('DELETE FROM spool.activity_spool WHERE seq <= ?', (hi,)).rowcount
+                        conn.execute('COMMIT')
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    if hi is None:
+                        break
+                    moved += n
+            finally:
+                conn.close()
+            with self._lock:
+                self._pending = max(0, self._pending - moved)
+            ACTIVITY_EVENTS.labels('flushed').inc(moved)
+            return moved
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Events stay spooled; the next round retries
+                logger.exception('Activity log flush failed')
+
+    def start(self):
+        """Flush what a previous process left spooled, then start the flusher thread."""
+        if self._thread is not None:
+            return
+        try:
+            moved = self.flush()
+            if moved:
+                logger.info('Recovered %d spooled activity events', moved)
+        except Exception:
+            logger.exception('Activity log recovery failed')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='idcs-activity-log', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and flush what is left."""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                if self._spool is not None:
+                    self._spool.close()
+                    self._spool = None
+
+
+activity_log = ActivityLog()
+
+
+def install(app):
+    """Start the flusher with the app and drain the spool on shutdown."""
+    app.add_event_handler('startup', activity_log.start)
+    app.add_event_handler('shutdown', activity_log.stop)
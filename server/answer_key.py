@@ -0,0 +1,133 @@
+"""Answer key and scheme of evaluation for a generated question paper.
+
+The key is drawn from the same paper_layout.PaperLayout as the paper, so
+its numbering, (OR) rows and marks line up with the paper the students
+get. It starts from the same cached DOCX skeleton. Answers come from the
+question bank's `correct_answer`, `options` and `answer_text`; rows
+without any are left blank for the setter to fill in.
+
+paper_bundle() zips the paper and its key into one download.
+"""
+import json
+import re
+import tempfile
+import zipfile
+from io import BytesIO
+from typing import List, Optional, Sequence, Tuple
+
+from server.docx_skeleton import new_document
+from server.paper_layout import PART_A_HEADING, PART_B_HEADING, PaperLayout, PaperRow
+from server.question import Question
+from server.timing import Stopwatch
+
+PAPER_NAME = 'question_paper.docx'
+KEY_NAME = 'answer_key.docx'
+_OPTION_LABEL_RE = re.compile(r'^\(?([a-h])[).:]?$|^option\s*([a-h])$', re.IGNORECASE)
+
+
+def _options(q: Question) -> List[str]:
+    opts = q.options
+    if isinstance(opts, str):
+        try:
+            opts = json.loads(opts)
+        except ValueError:
+            return []
+    if isinstance(opts, dict):
+        opts = list(opts.values())
+    if not isinstance(opts, list):
+        return []
+    return ['' if o is None else str(o) for o in opts]
+
+
+def answer_for(q: Question) -> str:
+    """The answer to print for `q`: the correct option spelled out, then any model answer."""
+    options = _options(q)
+    correct = q.str_of('correct_answer').strip()
+    if correct and options:
+        m = _OPTION_LABEL_RE.match(correct)
+        idx: Optional[int] = None
+        if m:
+            idx = ord((m.group(1) or m.group(2)).lower()) - ord('a')
+        elif correct.isdigit():
+            idx = int(correct) - 1
+        else:
+            lowered = [o.strip().lower() for o in options]
+            if correct.lower() in lowered:
+                idx = lowered.index(correct.lower())
+        if idx is not None and 0 <= idx < len(options):
+            correct = f'({chr(ord("a") + idx)}) {options[idx]}'
+    model = q.str_of('answer_text').strip()
+    return '\n'.join(a for a in (correct, model if model != correct else '') if a)
+
+
+def render_answer_key_docx(layout: PaperLayout, fields: dict) -> str:
+    """Build the answer key for a laid-out paper and return the path of the saved temp .docx."""
+    from docx.enum.table import WD_TABLE_ALIGNMENT
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Inches, Pt
+
+    sw = Stopwatch()
+    doc = new_document()
+    sw.lap('skeleton')
+
+    def add_bold_line(text: str, size=12):
+        p = doc.add_paragraph(); p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        run = p.add_run(text); run.bold = True; run.font.size = Pt(size)
+
+    add_bold_line('K. RAMAKRISHNAN COLLEGE OF ENGINEERING', 14)
+    add_bold_line('(AUTONOMOUS)')
+    add_bold_line('ANSWER KEY AND SCHEME OF EVALUATION')
+    add_bold_line(f"Question Paper Code: {fields.get('qpcode') or ''}")
+    exam_title = fields.get('exam_title') or ''
+    if exam_title.strip() and not exam_title.lower().startswith('question paper code:'):
+        add_bold_line(exam_title)
+    for line in (fields.get('semester'), fields.get('dept')):
+        if line:
+            p = doc.add_paragraph(); p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run = p.add_run(line); run.italic = True; run.font.size = Pt(11)
+    add_bold_line(f"{fields.get('cc') or ''} – {fields.get('cn') or ''}")
+
+    widths = [Inches(0.7), Inches(2.6), Inches(3.2), Inches(0.8)]
+
+    def add_part(heading: str, rows: Sequence[Optional[PaperRow]]):
+        # The paper's headings pad the marks with spaces for its wider tables
+        add_bold_line(re.sub(r' {2,}', '   ', heading))
+        tbl = doc.add_table(rows=1, cols=4); tbl.style = 'Table Grid'; tbl.alignment = WD_TABLE_ALIGNMENT.CENTER; tbl.autofit = False
+        for c, label in zip(tbl.rows[0].cells, ('Q.No.', 'Question', 'Answer / Key points', 'Marks')):
+            c.text = label
+            for p in c.paragraphs:
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                for r in p.runs: r.bold = True
+        for row in rows:
+            cells = tbl.add_row().cells
+            if row is None:
+                merged = cells[0].merge(cells[-1]); merged.text = '(OR)'
+                for p in merged.paragraphs:
+                    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    for r in p.runs: r.bold = True
+                continue
+            cells[0].text = row.number; cells[1].text = row.text; cells[2].text = answer_for(row.question); cells[3].text = row.marks
+            for p in cells[0].paragraphs + cells[3].paragraphs:
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        for row in tbl.rows:
+            for c, w in zip(row.cells, widths): c.width = w
+
+    add_part(PART_A_HEADING, layout.part_a)
+    add_part(PART_B_HEADING, layout.part_b)
+    if layout.part_c:
+        add_part(layout.part_c_heading, layout.part_c)
+    sw.lap('answer_key')
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
+        doc.save(tmp.name); path = tmp.name
+    sw.lap('save')
+    return path
+
+
+def paper_bundle(files: Sequence[Tuple[str, bytes]]) -> bytes:
+    """Zip (name, bytes) documents. DOCX files are already compressed, so they are
+    stored as is; fixed timestamps make the same documents give the same zip."""
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as z:
+        for name, data in files:
+            z.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data)
+    return buf.getvalue()
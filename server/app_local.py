@@ -1,71 +1,49 @@
-import os, json, sqlite3, tempfile, csv, random, logging
+import os, json, sqlite3, tempfile, csv, logging
 from typing import List, Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from server.routes.upload_questions_excel import router as upload_questions_router
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-
-
-# Use a writable DB path: next to EXE if frozen, else next to this file
-def get_db_path():
-    if getattr(sys, 'frozen', False):
-        # Use LOCALAPPDATA for writable DB location
-        local_appdata = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
-        db_dir = os.path.join(local_appdata, 'IDCS-QP-Generator')
-        os.makedirs(db_dir, exist_ok=True)
-        return os.path.join(db_dir, 'local_store.db')
-    else:
-        return os.path.join(os.path.dirname(__file__), 'local_store.db')
-
-import sys
-DB_PATH = get_db_path()
-
-def get_conn():
-    return sqlite3.connect(DB_PATH)
-
-def init_db():
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS templates(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            total_marks INTEGER,
-            instructions TEXT,
-            sections TEXT
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS question_bank_titles(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT UNIQUE NOT NULL
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS question_bank(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question_text TEXT NOT NULL,
-            type TEXT NOT NULL,
-            options TEXT,
-            correct_answer TEXT,
-            answer_text TEXT,
-            btl INTEGER,
-            marks INTEGER,
-            status TEXT,
-            chapter TEXT,
-            course_outcomes TEXT,
-            title_id INTEGER,
-            FOREIGN KEY(title_id) REFERENCES question_bank_titles(id)
-        )
-    """)
-    conn.commit(); conn.close()
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response
+from server.routes.upload_questions_excel import co_numbers, router as upload_questions_router
+from server.routes.import_questions_excel import router as import_questions_router
+from server.routes.question_bank_stats import router as question_bank_stats_router
+from server.routes.question_status import router as question_status_router, transition_status
+from server.routes.question_activity import router as question_activity_router
+from server.routes.export_questions_excel import router as export_questions_router
+from server.routes.sync import router as sync_router
+from server.docx_skeleton import new_document
+from server.json_response import FastJSONResponse
+from server.compression import CompressionMiddleware
+from server.executor import install as install_executor, run_cpu, run_io
+from server.memprofile import checkpoint, install as install_memprofile
+from server.timing import Stopwatch, install as install_timing, stage
+from server.metrics import RENDERS_IN_FLIGHT, add_image_bytes, install as install_metrics
+from server.db import DB_PATH, get_conn, init_db  # noqa: F401
+from server.migrations import install as install_backfills
+from server.activity_log import install as install_activity_log
+from server.logsetup import setup_logging
+from server.paper_cache import (PDF_MIME, cached_paper_response, lookup_paper, lookup_papers, paper_headers, paper_key, parse_seed,
+                                store_paper, store_paper_bytes)
+from server.paper_layout import PART_A_HEADING, PART_B_HEADING, layout_paper
+from server.paper_pdf import render_paper_pdf, render_papers_pdf
+from server.answer_key import KEY_NAME, PAPER_NAME, paper_bundle, render_answer_key_docx
+from server.paper_preview import IMAGE_TYPES, image_ref, preview_images, render_paper_html
+from server.question import Question, parse_questions, scan_dicts
+from starlette.background import BackgroundTask
+
+# Records go through a queue; a background thread writes console + server.log
+setup_logging()
 
 init_db()
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 app.include_router(upload_questions_router, prefix="/api")
+app.include_router(import_questions_router, prefix="/api")
+app.include_router(question_bank_stats_router, prefix="/api")
+app.include_router(question_status_router, prefix="/api")
+app.include_router(question_activity_router, prefix="/api")
+app.include_router(export_questions_router, prefix="/api")
+# Offline-first: POST /api/sync reconciles with Supabase when configured
+app.include_router(sync_router, prefix="/api")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -73,10 +51,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli for JSON bodies over 1 KB (question lists carry base64 images)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+# Blocking work (SQLite, python-docx) runs in sized pools, not on the event loop
+install_executor(app)
+# IDCS_MEMPROFILE=1: per-request tracemalloc/RSS records at /api/debug/memory
+install_memprofile(app)
+# Server-Timing headers, timing log lines and /api/debug/timings histograms
+install_timing(app)
+# Prometheus text metrics at /metrics
+install_metrics(app)
+# Row backfills queued by schema migrations run in batches after startup
+install_backfills(app)
+# Activity events are spooled and flushed to question_activity_logs in batches
+install_activity_log(app)
 
 # Templates
 @app.post('/api/templates')
-async def create_template(name: str = Form(...), description: str = Form(""), total_marks: int = Form(100), instructions: str = Form(""), sections: str = Form("[]")):
+def create_template(name: str = Form(...), description: str = Form(""), total_marks: int = Form(100), instructions: str = Form(""), sections: str = Form("[]")):
     try:
         conn = get_conn(); cur = conn.cursor()
         cur.execute("INSERT INTO templates(name,description,total_marks,instructions,sections) VALUES (?,?,?,?,?)", (name,description,total_marks,instructions,sections))
@@ -87,7 +79,7 @@ async def create_template(name: str = Form(...), description: str = Form(""), to
         raise HTTPException(status_code=500, detail=f'Template insert failed: {e}')
 
 @app.post('/api/templates/update')
-async def update_template(id: int = Form(...), name: str = Form(...), description: str = Form(""), total_marks: int = Form(100), instructions: str = Form(""), sections: str = Form("[]")):
+def update_template(id: int = Form(...), name: str = Form(...), description: str = Form(""), total_marks: int = Form(100), instructions: str = Form(""), sections: str = Form("[]")):
     try:
         conn = get_conn(); cur = conn.cursor()
         cur.execute("UPDATE templates SET name=?,description=?,total_marks=?,instructions=?,sections=? WHERE id=?", (name,description,total_marks,instructions,sections,id))
@@ -101,7 +93,7 @@ async def update_template(id: int = Form(...), name: str = Form(...), descriptio
         raise HTTPException(status_code=500, detail=f'Template update failed: {e}')
 
 @app.get('/api/templates')
-async def list_templates():
+def list_templates():
     conn = get_conn(); cur = conn.cursor()
     rows = cur.execute('SELECT id,name,description,total_marks,instructions,sections FROM templates ORDER BY id DESC').fetchall()
     conn.close()
@@ -111,7 +103,7 @@ async def list_templates():
 
 # Question bank titles
 @app.post('/api/question-bank-titles')
-async def create_title(title: str = Form(...)):
+def create_title(title: str = Form(...)):
     try:
         conn = get_conn(); cur = conn.cursor()
         cur.execute('INSERT OR IGNORE INTO question_bank_titles(title) VALUES (?)', (title,))
@@ -122,14 +114,14 @@ async def create_title(title: str = Form(...)):
         raise HTTPException(status_code=500, detail=f'Title insert failed: {e}')
 
 @app.get('/api/question-bank-titles')
-async def list_titles():
+def list_titles():
     conn = get_conn(); cur = conn.cursor()
     rows = cur.execute('SELECT id,title FROM question_bank_titles ORDER BY title').fetchall(); conn.close()
     return [{'id': r[0], 'title': r[1]} for r in rows]
 
 # Question bank
 @app.post('/api/question-bank/bulk')
-async def bulk_insert_questions(title_id: int = Form(...), status: str = Form('pending'), payload: str = Form(...)):
+def bulk_insert_questions(title_id: int = Form(...), status: str = Form('pending'), payload: str = Form(...)):
     try:
         data = json.loads(payload)
         if not isinstance(data, list):
@@ -137,17 +129,17 @@ async def bulk_insert_questions(title_id: int = Form(...), status: str = Form('p
         conn = get_conn(); cur = conn.cursor()
         inserted = 0
         failed = []
-        for idx, q in enumerate(data):
+        for idx, item in enumerate(data):
             try:
-                # Remove images from payload to avoid huge blobs in DB table
-                if isinstance(q, dict) and 'images' in q:
-                    q.pop('images', None)
-                opts = q.get('options') if isinstance(q, dict) else None
-                cur.execute("""INSERT INTO question_bank(question_text,type,options,correct_answer,answer_text,btl,marks,status,chapter,course_outcomes,title_id)
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
-                    (q.get('question_text','') if isinstance(q, dict) else '', q.get('type','objective') if isinstance(q, dict) else 'descriptive', json.dumps(opts) if opts else None,
-                     q.get('correct_answer') if isinstance(q, dict) else None, q.get('answer_text','') if isinstance(q, dict) else None, q.get('btl',2) if isinstance(q, dict) else 2, q.get('marks',1) if isinstance(q, dict) else 1, status,
-                     q.get('chapter') if isinstance(q, dict) else None, q.get('course_outcomes') if isinstance(q, dict) else None, title_id))
+                q = Question.from_dict(item) if isinstance(item, dict) else None
+                if q is None:
+                    row = ('', 'descriptive', None, None, None, 2, 1, status, None, None, None, None, title_id)
+                else:
+                    row = (q.text, q.get('type', 'objective'), json.dumps(q.options) if q.options else None,
+                           q.correct_answer, q.get('answer_text', ''), q.get('btl', 2), q.get('marks', 1), status,
+                           q.chapter, q.co, q.co_numbers or co_numbers(q.co), q.image or None, title_id)
+                cur.execute("""INSERT INTO question_bank(question_text,type,options,correct_answer,answer_text,btl,marks,status,chapter,course_outcomes,course_outcomes_numbers,image_url,title_id)
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)""", row)
                 inserted += 1
             except Exception as e:
                 logging.exception('Failed inserting question index %s: %s', idx, e)
@@ -160,9 +152,9 @@ async def bulk_insert_questions(title_id: int = Form(...), status: str = Form('p
         raise HTTPException(status_code=500, detail=f'Bulk insert failed: {e}')
 
 @app.get('/api/question-bank')
-async def list_questions(status: Optional[str] = None, title_id: Optional[int] = None, title: Optional[str] = None):
+def list_questions(status: Optional[str] = None, title_id: Optional[int] = None, title: Optional[str] = None):
     conn = get_conn(); cur = conn.cursor()
-    base = 'SELECT id,question_text,type,options,correct_answer,answer_text,btl,marks,status,chapter,course_outcomes,title_id FROM question_bank WHERE 1=1'
+    base = 'SELECT id,question_text,type,options,correct_answer,answer_text,btl,marks,status,chapter,course_outcomes,title_id,course_outcomes_numbers,image_url FROM question_bank WHERE 1=1'
     params: List = []
     if status:
         base += ' AND status=?'; params.append(status)
@@ -171,22 +163,25 @@ async def list_questions(status: Optional[str] = None, title_id: Optional[int] =
     if title:
         base += ' AND title=?'; params.append(title)
     rows = cur.execute(base, params).fetchall(); conn.close()
-    return [{
+    return FastJSONResponse([{
         'id': r[0], 'question_text': r[1], 'type': r[2], 'options': json.loads(r[3]) if r[3] else None,
         'correct_answer': r[4], 'answer_text': r[5], 'btl': r[6], 'marks': r[7], 'status': r[8],
-        'chapter': r[9], 'course_outcomes': r[10], 'title_id': r[11]
-    } for r in rows]
+        'chapter': r[9], 'course_outcomes': r[10], 'title_id': r[11],
+        'course_outcomes_numbers': r[12], 'image_url': r[13]
+    } for r in rows])
 
 @app.post('/api/question-bank/update-status')
-async def update_question_status(ids: str = Form(...), status: str = Form(...)):
+def update_question_status(ids: str = Form(...), status: str = Form(...)):
     try:
         id_list = [int(x) for x in ids.split(',') if x.strip().isdigit()]
         if not id_list:
             raise HTTPException(status_code=400, detail='No valid ids')
-        conn = get_conn(); cur = conn.cursor()
-        cur.executemany('UPDATE question_bank SET status=? WHERE id=?', [(status, i) for i in id_list])
-        conn.commit(); conn.close()
-        return {'updated': len(id_list), 'status': status}
+        # One set-based UPDATE plus activity log rows; see routes/question_status.py
+        conn = get_conn()
+        try:
+            return transition_status(conn, status, id_list)
+        finally:
+            conn.close()
     except HTTPException:
         raise
     except Exception as e:
@@ -195,7 +190,7 @@ async def update_question_status(ids: str = Form(...), status: str = Form(...)):
 
 # Admin-only: seed sample pending questions for a given title_id
 @app.post('/api/admin/seed-question-bank')
-async def seed_question_bank(title_id: str = Form(...), count: int = Form(3), admin_secret: str = Form(...)):
+def seed_question_bank(title_id: str = Form(...), count: int = Form(3), admin_secret: str = Form(...)):
     """Seed `count` pending questions with the given `title_id`.
     This endpoint is protected by an admin secret (set ADMIN_SECRET env var).
     Use only for testing/local development.
@@ -220,11 +215,11 @@ async def seed_question_bank(title_id: str = Form(...), count: int = Form(3), ad
         raise HTTPException(status_code=500, detail=f'Seed failed: {e}')
 
 # Template file upload/scan
-@app.post('/api/template/upload')
-async def upload_template(file: UploadFile = File(...)):
-    ext = os.path.splitext(file.filename)[1].lower(); content_lines: List[str] = []
+def extract_template_lines(data: bytes, ext: str):
+    """Return the non-empty lines of a txt/csv/docx template, or None if unsupported."""
+    content_lines: List[str] = []
     with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(await file.read()); tmp_path = tmp.name
+        tmp.write(data); tmp_path = tmp.name
     try:
         if ext == '.txt':
             with open(tmp_path, encoding='utf-8') as f:
@@ -241,19 +236,31 @@ async def upload_template(file: UploadFile = File(...)):
                 if t:
                     content_lines.append(t)
         else:
-            return JSONResponse(status_code=400, content={'error':'Unsupported file type'})
+            return None
     finally:
         os.remove(tmp_path)
+    return content_lines
+
+@app.post('/api/template/upload')
+async def upload_template(file: UploadFile = File(...)):
+    ext = os.path.splitext(file.filename)[1].lower()
+    content_lines = await run_cpu(extract_template_lines, await file.read(), ext)
+    if content_lines is None:
+        return JSONResponse(status_code=400, content={'error':'Unsupported file type'})
     return {'lines': content_lines}
 
-@app.post('/api/template/scan-docx')
-async def scan_docx(file: UploadFile = File(...)):
+def scan_docx_bytes(data: bytes) -> dict:
+    """Extract questions (and parse diagnostics) from a question-paper DOCX."""
     from docx import Document
+    sw = Stopwatch()
     with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
-        tmp.write(await file.read()); tmp_path = tmp.name
+        tmp.write(data); tmp_path = tmp.name
+    sw.lap('write_temp')
     questions = []
     try:
         doc = Document(tmp_path); part=None
+        sw.lap('docx_load')
+        checkpoint('document_loaded')
         import base64
         # Build a map of image related parts (rid -> data-uri)
         image_map = {}
@@ -263,9 +270,11 @@ async def scan_docx(file: UploadFile = File(...)):
                 if ct.startswith('image/'):
                     blob = getattr(part_obj, 'blob', None)
                     if blob:
+                        add_image_bytes('docx_scan', len(blob))
                         image_map[rid] = f"data:{ct};base64,{base64.b64encode(blob).decode('ascii')}"
         except Exception:
             image_map = {}
+        sw.lap('image_parts')
 
         def extract_images_from_paragraph(p):
             imgs = []
@@ -277,7 +286,7 @@ async def scan_docx(file: UploadFile = File(...)):
                             if image_map[attrib_value] not in imgs:
                                 imgs.append(image_map[attrib_value])
                                 if logger:
-                                    logger.info('[scan-docx] found image via attribute %s="%s" on tag %s', attrib_name, attrib_value, elem.tag)
+                                    logger.debug('[scan-docx] found image via attribute %s="%s" on tag %s', attrib_name, attrib_value, elem.tag)
             except Exception as e:
                 if logger:
                     logger.error('[scan-docx] error extracting images from paragraph: %s', e)
@@ -297,7 +306,7 @@ async def scan_docx(file: UploadFile = File(...)):
                         if rel in image_map and image_map[rel] not in imgs:
                             imgs.append(image_map[rel])
                             if logger:
-                                logger.info('[scan-docx] cell attached image via r:embed rel=%s', rel)
+                                logger.debug('[scan-docx] cell attached image via r:embed rel=%s', rel)
                 except Exception:
                     pass
             except Exception:
@@ -323,6 +332,7 @@ async def scan_docx(file: UploadFile = File(...)):
             except Exception:
                 sample_table_texts.append('error')
         para_snippets = [p.text.strip().replace('\n',' ')[:240] for p in doc.paragraphs[:20]]
+        sw.lap('table_summary')
         # First, try to extract questions from tables (expected template format)
         for table in doc.tables:
             cols = len(table.columns)
@@ -338,10 +348,8 @@ async def scan_docx(file: UploadFile = File(...)):
                     marks = row.cells[4].text.strip() if cols == 5 and len(row.cells) > 4 else (row.cells[3].text.strip() if len(row.cells) > 3 else '')
                     if qcell:
                         imgs = extract_images_from_cell(row.cells[1]) if len(row.cells) > 1 else []
-                        qobj = {'number': len(questions) + 1, 'text': qcell, 'co': co, 'btl': btl, 'marks': marks or 2, 'part': 'A'}
-                        if imgs:
-                            qobj['images'] = imgs
-                        questions.append(qobj)
+                        questions.append(Question(qcell, number=len(questions) + 1, co=co, btl=btl, marks=marks or 2,
+                                                  part='A', images=imgs or None))
             # Part B: tables with OR structure - accept 5+ columns as well (some generators use 5 columns)
             elif cols >= 5:
                 part = 'B'; rows = table.rows; i = 0
@@ -358,20 +366,19 @@ async def scan_docx(file: UploadFile = File(...)):
                         btl_b = rows[i+2].cells[3].text.strip() if len(rows[i+2].cells) > 3 else ''
                         marks_a = rows[i].cells[-1].text.strip() if len(rows[i].cells) > 0 else '16'
                         marks_b = rows[i+2].cells[-1].text.strip() if len(rows[i+2].cells) > 0 else '16'
-                        base_num = 10 + (len([q for q in questions if q.get('part') == 'B']) // 2) + 1
+                        base_num = 10 + (len([q for q in questions if q.part == 'B']) // 2) + 1
                         if q_a:
                             imgs_a = extract_images_from_cell(rows[i].cells[1]) if len(rows[i].cells) > 1 else []
-                            qobj_a = {'number': f'{base_num}a', 'text': q_a, 'co': co_a, 'btl': btl_a, 'marks': marks_a, 'part': 'B', 'or': False}
-                            if imgs_a: qobj_a['images'] = imgs_a
-                            questions.append(qobj_a)
+                            questions.append(Question(q_a, number=f'{base_num}a', co=co_a, btl=btl_a, marks=marks_a,
+                                                      part='B', alternative=False, images=imgs_a or None))
                         if q_b:
                             imgs_b = extract_images_from_cell(rows[i+2].cells[1]) if len(rows[i+2].cells) > 1 else []
-                            qobj_b = {'number': f'{base_num}b', 'text': q_b, 'co': co_b, 'btl': btl_b, 'marks': marks_b, 'part': 'B', 'or': True}
-                            if imgs_b: qobj_b['images'] = imgs_b
-                            questions.append(qobj_b)
+                            questions.append(Question(q_b, number=f'{base_num}b', co=co_b, btl=btl_b, marks=marks_b,
+                                                      part='B', alternative=True, images=imgs_b or None))
                         i += 3
                     else:
                         i += 1
+        sw.lap('table_parse')
         # If no questions found in tables, try a fallback: parse paragraphs for numbered lines
         if not questions:
             import re
@@ -421,15 +428,11 @@ async def scan_docx(file: UploadFile = File(...)):
                         except Exception:
                             pass
                         j += 1
-                    qobj = {'number': num, 'text': text, 'co': None, 'btl': None, 'marks': None, 'part': None}
-                    if options:
-                        qobj['options'] = options
-                        qobj['type'] = 'objective'
-                    if answer_text:
-                        qobj['answer_text'] = answer_text
+                    qobj = Question(text, number=num, options=options or None,
+                                    type='objective' if options else None, answer_text=answer_text)
                     # attach any collected images
                     if 'images' in locals() and images:
-                        qobj['images'] = images
+                        qobj.images = images
                         del images
                     questions.append(qobj)
                     i = j
@@ -437,13 +440,14 @@ async def scan_docx(file: UploadFile = File(...)):
                     i += 1
     finally:
         os.remove(tmp_path)
+    sw.lap('paragraph_fallback')
     diagnostic = {
         'table_count': len(table_shapes),
         'table_shapes': table_shapes,
         'sample_table_texts': sample_table_texts,
         'paragraph_snippets': para_snippets,
         'parsed_questions': len(questions),
-        'image_count': sum(len(q.get('images', [])) for q in questions)
+        'image_count': sum(len(q.images or ()) for q in questions)
     }
     # Summarize related parts (images, media) present in the docx package for debugging
     try:
@@ -482,20 +486,36 @@ async def scan_docx(file: UploadFile = File(...)):
     except Exception:
         diagnostic['references'] = {}
         diagnostic['image_hint_parts'] = []
+    sw.lap('package_scan')
     if logger:
         try:
-            logger.info('[scan-docx] diagnostic: %s', diagnostic)
+            # Counts only; the full dict (snippets, part references) is in the response
+            logger.info('[scan-docx] parsed %d question(s), %d image(s), %d table(s)',
+                        diagnostic['parsed_questions'], diagnostic['image_count'], diagnostic['table_count'],
+                        extra={'related_parts': len(diagnostic.get('related_parts', []))})
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('[scan-docx] diagnostic: %s', diagnostic)
         except Exception:
             pass
+    sw.lap('diagnostic_log')
+    checkpoint('questions_extracted')
     # Return diagnostic for debugging; front-end can ignore if not used
-    return {'questions': questions, 'diagnostic': diagnostic}
+    return {'questions': scan_dicts(questions), 'diagnostic': diagnostic}
 
-@app.post('/api/template/generate-docx')
-async def generate_docx(
-    questions: str = Form(...), dept: str = Form(""), cc: str = Form(""), cn: str = Form(""), qpcode: str = Form(""),
-    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"), regulation: str = Form("Regulation 2024"),
-    semester: str = Form("Second Semester")
-):
+@app.post('/api/template/scan-docx')
+async def scan_docx(file: UploadFile = File(...)):
+    return FastJSONResponse(await run_cpu(scan_docx_bytes, await file.read()))
+
+# Part of the rendered-paper cache key: bump whenever render_paper_docx output changes
+PAPER_LAYOUT_VERSION = 1
+
+def render_paper_docx(questions, dept: str, cc: str, cn: str, qpcode: str, exam_title: str, regulation: str, semester: str, seed: int = 0,
+                      layout=None) -> str:
+    """Build the question paper and return the path of the saved temp .docx.
+
+    The Part A/B/C tables come from paper_layout.layout_paper(questions, seed),
+    or from `layout` when the caller has already laid the paper out.
+    """
     from docx import Document
     from docx.shared import Pt, Inches
     from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -503,7 +523,9 @@ async def generate_docx(
     from docx.oxml import OxmlElement
     from docx.oxml.ns import qn
 
-    doc = Document()
+    sw = Stopwatch()
+    doc = new_document()
+    sw.lap('skeleton')
 
     def add_bold_line(text: str, center=True, size=12, underline=False, border=False):
         p = doc.add_paragraph(); run = p.add_run(text); run.bold=True; run.font.size=Pt(size); run.underline=underline
@@ -577,182 +599,229 @@ async def generate_docx(
             p.alignment = WD_ALIGN_PARAGRAPH.LEFT if ci==0 else WD_ALIGN_PARAGRAPH.RIGHT
             for r in p.runs: r.font.size=Pt(11)
 
+    sw.lap('header')
     doc.add_paragraph('')
-    add_bold_line('PART- A                                                                (10 x 2 = 20 Marks)', True, 12)
-    table_a = doc.add_table(rows=1, cols=5); table_a.alignment=WD_TABLE_ALIGNMENT.CENTER; table_a.autofit=False
-    hdr=table_a.rows[0].cells; hdr[0].text='Q.No.'; hdr[1].text='Answer ALL Questions'; hdr[2].text='CO'; hdr[3].text='BTL'; hdr[4].text='Marks'
-    widths_a=[Inches(0.7), Inches(4.2), Inches(0.8), Inches(0.8), Inches(0.8)]
-    for i,w in enumerate(widths_a):
-        for row in table_a.rows: row.cells[i].width=w
-    for c in hdr:
-        for p in c.paragraphs:
-            p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-            for r in p.runs: r.bold=True
-
-    def normalize(raw):
-        out=[]
-        def push(item):
-            if isinstance(item,str):
-                try: item=json.loads(item)
-                except Exception: item={'text':item}
-            if isinstance(item,list):
-                for sub in item: push(sub)
-            elif isinstance(item,dict): out.append(item)
-        push(raw)
-        return out if out else []
-
-    try:
-        parsed = normalize(questions)
-    except Exception:
-        parsed=[]
-
-    def first(d:dict, keys:List[str]):
-        for k in keys:
-            if k in d and str(d[k]).strip(): return str(d[k])
-        return ''
-
-    shared_btl=random.choice([3,4,5])
-    import re
-    for idx,q in enumerate(parsed[:10], start=1):
-        cells=table_a.add_row().cells
-        for j,w in enumerate(widths_a): cells[j].width=w
-        cells[0].text=str(idx)
-        txt=first(q,['text','question_text'])
-        if txt: txt=re.sub(r'^\s*[DO]\.[\s-]*','',txt,flags=re.IGNORECASE)
-        cells[1].text=txt
-        co_val=q.get('co') or f'CO{(idx+1)//2}'
-        cells[2].text=str(co_val)
-        btl_val=q.get('btl') or (shared_btl if idx>4 else random.choice([1,2,3,4,5]))
-        cells[3].text=f'BTL{btl_val}'
-        cells[4].text='2'
-        for p in cells[0].paragraphs+cells[2].paragraphs+cells[3].paragraphs+cells[4].paragraphs:
-            p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-
-    add_bold_line('PART – B                          (5 x 16 = 80 Marks)', True, 12)
-    table_b=doc.add_table(rows=1, cols=5); table_b.alignment=WD_TABLE_ALIGNMENT.CENTER; table_b.autofit=False
-    bh=table_b.rows[0].cells; bh[0].text='Q.No.'; bh[1].text='Question'; bh[2].text='CO'; bh[3].text='BTL'; bh[4].text='Marks'
-    widths_b=[Inches(0.9), Inches(4.5), Inches(0.9), Inches(0.9), Inches(1.0)]
-    for i,w in enumerate(widths_b):
-        for row in table_b.rows: row.cells[i].width=w
-    for c in bh:
-        for p in c.paragraphs:
-            p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-            for r in p.runs: r.bold=True
-
-    from collections import defaultdict
-    groups=defaultdict(list)
-    for q in parsed:
-        if str(q.get('part','')).upper()=='B':
-            groups[q.get('number')] .append(q)
-    def sort_key(k):
-        try: return int(str(k).split('.')[0])
-        except: return 9999
-    for base in sorted(groups.keys(), key=sort_key):
-        group=groups[base]; group.sort(key=lambda x: str(x.get('sub','a')))
-        for idx_in, q in enumerate(group):
-            cells=table_b.add_row().cells
-            for i,w in enumerate(widths_b): cells[i].width=w
-            sub=q.get('sub'); disp=f'{base}.{sub}' if sub else str(base)
-            cells[0].text=disp
-            cells[1].text=first(q,['text','question_text'])
-            co_val=first(q,['co','course_outcomes']); cells[2].text=co_val
-            btl_val=first(q,['btl'])
-            if btl_val and not btl_val.upper().startswith('BTL'): btl_val=f'BTL{btl_val}'
-            cells[3].text=btl_val
-            cells[4].text=first(q,['marks']) or '16'
-            for p in cells[0].paragraphs+cells[2].paragraphs+cells[3].paragraphs+cells[4].paragraphs:
+    if layout is None:
+        try:
+            parsed = parse_questions(questions)
+        except Exception:
+            parsed=[]
+        layout = layout_paper(parsed, seed)
+
+    def add_question_table(widths, header):
+        tbl=doc.add_table(rows=1, cols=5); tbl.alignment=WD_TABLE_ALIGNMENT.CENTER; tbl.autofit=False
+        hdr=tbl.rows[0].cells
+        for c, label in zip(hdr, header): c.text=label
+        for i,w in enumerate(widths):
+            for row in tbl.rows: row.cells[i].width=w
+        for c in hdr:
+            for p in c.paragraphs:
                 p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-            if idx_in==0 and any(str(x.get('sub','')).lower()=='b' for x in group):
-                or_row=table_b.add_row().cells
-                for i,w in enumerate(widths_b): or_row[i].width=w
-                merged=or_row[0]
-                for c_idx in range(1,len(or_row)): merged=merged.merge(or_row[c_idx])
+                for r in p.runs: r.bold=True
+        return tbl
+
+    def add_question_rows(tbl, widths, rows):
+        for row in rows:
+            cells=tbl.add_row().cells
+            for i,w in enumerate(widths): cells[i].width=w
+            if row is None:
+                merged=cells[0]
+                for ci in range(1,len(cells)): merged=merged.merge(cells[ci])
                 merged.text='(OR)'
                 for p in merged.paragraphs:
                     p.alignment=WD_ALIGN_PARAGRAPH.CENTER
                     for r in p.runs: r.bold=True
+                continue
+            cells[0].text=row.number; cells[1].text=row.text; cells[2].text=row.co; cells[3].text=row.btl; cells[4].text=row.marks
+            for p in cells[0].paragraphs+cells[2].paragraphs+cells[3].paragraphs+cells[4].paragraphs:
+                p.alignment=WD_ALIGN_PARAGRAPH.CENTER
+
+    add_bold_line(PART_A_HEADING, True, 12)
+    widths_a=[Inches(0.7), Inches(4.2), Inches(0.8), Inches(0.8), Inches(0.8)]
+    table_a=add_question_table(widths_a, ('Q.No.', 'Answer ALL Questions', 'CO', 'BTL', 'Marks'))
+    add_question_rows(table_a, widths_a, layout.part_a)
 
+    sw.lap('part_a')
+    add_bold_line(PART_B_HEADING, True, 12)
+    widths_b=[Inches(0.9), Inches(4.5), Inches(0.9), Inches(0.9), Inches(1.0)]
+    table_b=add_question_table(widths_b, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'))
+    add_question_rows(table_b, widths_b, layout.part_b)
+
+    sw.lap('part_b')
     # PART-C (optional) - typically single pair 16.a / 16.b with OR
-    c_items = [q for q in parsed if str(q.get('part','')).upper()=='C']
-    if c_items:
-        # Determine counts and projection marks for header
-        from collections import defaultdict
-        c_groups=defaultdict(list)
-        for q in c_items:
-            key=str(q.get('number') or q.get('baseNumber') or 16)
-            # normalize to base number such as 16
-            try:
-                key = str(int(str(key).split('.')[0]))
-            except Exception:
-                key = '16'
-            c_groups[key].append(q)
-        # Use first question's marks as projection marks
-        first_c = c_items[0]
-        proj_marks = first_c.get('marks') or '10'
-        try:
-            count_pairs = len(c_groups.keys())
-            total_marks = int(str(proj_marks)) * count_pairs
-            add_bold_line(f'PART – C                          ({count_pairs} x {proj_marks} = {total_marks} Marks)', True, 12)
-        except Exception:
-            add_bold_line('PART – C', True, 12)
-        table_c=doc.add_table(rows=1, cols=5); table_c.alignment=WD_TABLE_ALIGNMENT.CENTER; table_c.autofit=False
-        ch=table_c.rows[0].cells; ch[0].text='Q.No.'; ch[1].text='Question'; ch[2].text='CO'; ch[3].text='BTL'; ch[4].text='Marks'
+    if layout.part_c:
+        add_bold_line(layout.part_c_heading, True, 12)
         widths_c=[Inches(0.9), Inches(4.5), Inches(0.9), Inches(0.9), Inches(1.0)]
-        for i,w in enumerate(widths_c):
-            for row in table_c.rows: row.cells[i].width=w
-        for c in ch:
-            for p in c.paragraphs:
-                p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-                for r in p.runs: r.bold=True
-        for base in sorted(c_groups.keys(), key=lambda k: int(k)):
-            group=c_groups[base]
-            # try to order a then b
-            try:
-                group.sort(key=lambda q: str(q.get('sub','a')))
-            except Exception: pass
-            # (a)
-            row_a=table_c.add_row().cells
-            for i,w in enumerate(widths_c): row_a[i].width=w
-            row_a[0].text=f'{base}.a'
-            row_a[1].text=first(group[0] if group else {},['text','question_text']) if group else ''
-            row_a[2].text=first(group[0] if group else {},['co','course_outcomes']) if group else ''
-            btl_val=first(group[0] if group else {},['btl'])
-            if btl_val and not btl_val.upper().startswith('BTL'): btl_val=f'BTL{btl_val}'
-            row_a[3].text=btl_val
-            row_a[4].text=str((group[0] or {}).get('marks','')) if group else ''
-            for p in row_a[0].paragraphs + row_a[2].paragraphs + row_a[3].paragraphs + row_a[4].paragraphs:
-                p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-            # OR row
-            or_row=table_c.add_row().cells
-            for i,w in enumerate(widths_c): or_row[i].width=w
-            merged=or_row[0]
-            for ci in range(1,len(or_row)): merged=merged.merge(or_row[ci])
-            merged.text='(OR)'
-            for p in merged.paragraphs:
-                p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-                for r in p.runs: r.bold=True
-            # (b)
-            row_b=table_c.add_row().cells
-            for i,w in enumerate(widths_c): row_b[i].width=w
-            row_b[0].text=f'{base}.b'
-            sec = group[1] if len(group)>1 else {}
-            row_b[1].text=first(sec,['text','question_text'])
-            row_b[2].text=first(sec,['co','course_outcomes'])
-            btl_val=first(sec,['btl'])
-            if btl_val and not btl_val.upper().startswith('BTL'): btl_val=f'BTL{btl_val}'
-            row_b[3].text=btl_val
-            row_b[4].text=str(sec.get('marks',''))
-            for p in row_b[0].paragraphs + row_b[2].paragraphs + row_b[3].paragraphs + row_b[4].paragraphs:
-                p.alignment=WD_ALIGN_PARAGRAPH.CENTER
-
+        table_c=add_question_table(widths_c, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'))
+        add_question_rows(table_c, widths_c, layout.part_c)
+    sw.lap('part_c')
     doc.add_paragraph(' ')
     doc.add_paragraph('******************').bold=True
     doc.add_paragraph(f'  {qpcode}').bold=True
+    checkpoint('document_built')
     with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
         doc.save(tmp.name); path=tmp.name
-    return FileResponse(path, filename='question_paper.docx')
+    sw.lap('save')
+    return path
+
+# Part of the answer-key cache key: bump whenever render_answer_key_docx output changes
+ANSWER_KEY_LAYOUT_VERSION = 1
+
+def render_paper_with_key(parsed, fields: dict, seed: int, paper: Optional[bytes] = None, key: Optional[bytes] = None):
+    """-> (paper .docx bytes, answer key .docx bytes), both drawn from one layout_paper() call.
+
+    Documents passed in (cache hits) are not rendered again.
+    """
+    layout = layout_paper(parsed, seed)
+
+    def read(path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+    if paper is None:
+        paper = read(render_paper_docx(parsed, fields['dept'], fields['cc'], fields['cn'], fields['qpcode'], fields['exam_title'],
+                                       fields['regulation'], fields['semester'], seed, layout=layout))
+    if key is None:
+        key = read(render_answer_key_docx(layout, fields))
+    return paper, key
+
+async def paper_with_key_response(questions: str, fields: dict, seed_val: Optional[int]) -> Response:
+    parsed, seed_val, entries = await run_io(lookup_papers, [(f'app_local-v{PAPER_LAYOUT_VERSION}', 'docx'),
+                                                              (f'app_local-key-v{ANSWER_KEY_LAYOUT_VERSION}', 'docx')], questions, fields, seed_val)
+    (paper_k, paper), (key_k, key) = entries
+    hit = paper is not None and key is not None
+    if not hit:
+        with RENDERS_IN_FLIGHT.track('app_local'):
+            paper_new, key_new = await run_cpu(render_paper_with_key, parsed, fields, seed_val, paper, key)
+        if paper is None:
+            await run_io(store_paper_bytes, paper_k, paper_new)
+        if key is None:
+            await run_io(store_paper_bytes, key_k, key_new)
+        paper, key = paper_new, key_new
+    return Response(paper_bundle([(PAPER_NAME, paper), (KEY_NAME, key)]), media_type='application/zip', headers={
+        'Content-Disposition': 'attachment; filename="question_paper.zip"', **paper_headers(seed_val, 'hit' if hit else 'miss')})
+
+@app.post('/api/template/generate-docx')
+async def generate_docx(
+    questions: str = Form(...), dept: str = Form(""), cc: str = Form(""), cn: str = Form(""), qpcode: str = Form(""),
+    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"), regulation: str = Form("Regulation 2024"),
+    semester: str = Form("Second Semester"), seed: str = Form(""), answer_key: str = Form("")
+):
+    """The question paper as .docx; with answer_key=1, a zip of the paper and its answer key."""
+    try:
+        seed_val = parse_seed(seed)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='seed must be an integer')
+    fields = {'dept': dept, 'cc': cc, 'cn': cn, 'qpcode': qpcode, 'exam_title': exam_title, 'regulation': regulation, 'semester': semester}
+    if answer_key.strip().lower() in ('1', 'true', 'yes', 'on'):
+        return await paper_with_key_response(questions, fields, seed_val)
+    parsed, seed_val, key, cached = await run_io(lookup_paper, f'app_local-v{PAPER_LAYOUT_VERSION}', questions, fields, seed_val)
+    if cached is not None:
+        return cached_paper_response(cached, seed_val)
+    with RENDERS_IN_FLIGHT.track('app_local'):
+        path = await run_cpu(render_paper_docx, parsed, dept, cc, cn, qpcode, exam_title, regulation, semester, seed_val)
+    await run_io(store_paper, key, path)
+    return FileResponse(path, filename='question_paper.docx', headers=paper_headers(seed_val, 'miss'),
+                        background=BackgroundTask(os.remove, path))
+
+@app.post('/api/template/preview')
+def preview_paper(
+    request: Request, questions: str = Form(...), dept: str = Form(""), cc: str = Form(""), cn: str = Form(""), qpcode: str = Form(""),
+    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"), regulation: str = Form("Regulation 2024"),
+    semester: str = Form("Second Semester"), seed: str = Form("")
+):
+    """The generate-docx paper as HTML, for fast previews; same fields, same seed, same layout."""
+    try:
+        seed_val = parse_seed(seed)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='seed must be an integer')
+    fields = {'dept': dept, 'cc': cc, 'cn': cn, 'qpcode': qpcode, 'exam_title': exam_title, 'regulation': regulation, 'semester': semester}
+    parsed, seed_val, _key = paper_key(f'app_local-v{PAPER_LAYOUT_VERSION}', questions, fields, seed_val)
+
+    def image_src(q):
+        url = q.image
+        if isinstance(url, str) and url.startswith(('http://', 'https://')):
+            return url
+        name = image_ref(url)
+        return str(request.url_for('preview_image', name=name)) if name else None
+    with stage('render_html'):
+        page = render_paper_html(layout_paper(parsed, seed_val), fields, image_src)
+    return HTMLResponse(page, headers={'X-Paper-Seed': str(seed_val)})
+
+@app.get('/api/template/preview/images/{name}', name='preview_image')
+def preview_image(name: str):
+    try:
+        data = preview_images.get(name)
+    except ValueError:
+        data = None
+    media_type = IMAGE_TYPES.get(name.rsplit('.', 1)[-1])
+    if data is None or media_type is None:
+        raise HTTPException(status_code=404, detail='Preview image not found')
+    # Names are content hashes, so the bytes behind a URL never change
+    return Response(data, media_type=media_type, headers={'Cache-Control': 'public, max-age=604800, immutable'})
+
+# Part of the rendered-paper cache key: bump whenever paper_pdf output changes
+PDF_LAYOUT_VERSION = 1
+PDF_BATCH_LIMIT = 200
+PAPER_FIELD_DEFAULTS = {'dept': '', 'cc': '', 'cn': '', 'qpcode': '', 'exam_title': 'B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024',
+                        'regulation': 'Regulation 2024', 'semester': 'Second Semester'}
+
+@app.post('/api/template/generate-pdf')
+async def generate_pdf(
+    questions: str = Form(...), dept: str = Form(""), cc: str = Form(""), cn: str = Form(""), qpcode: str = Form(""),
+    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"), regulation: str = Form("Regulation 2024"),
+    semester: str = Form("Second Semester"), seed: str = Form("")
+):
+    """The generate-docx paper as PDF, drawn directly; same fields, same seed, same layout."""
+    try:
+        seed_val = parse_seed(seed)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='seed must be an integer')
+    fields = {'dept': dept, 'cc': cc, 'cn': cn, 'qpcode': qpcode, 'exam_title': exam_title, 'regulation': regulation, 'semester': semester}
+    parsed, seed_val, key, cached = await run_io(lookup_paper, f'app_local-pdf-v{PDF_LAYOUT_VERSION}', questions, fields, seed_val, 'pdf')
+    if cached is not None:
+        return cached_paper_response(cached, seed_val, PDF_MIME, 'question_paper.pdf')
+    with RENDERS_IN_FLIGHT.track('app_local_pdf'):
+        data = await run_cpu(render_paper_pdf, layout_paper(parsed, seed_val), fields)
+    await run_io(store_paper_bytes, key, data)
+    return Response(data, media_type=PDF_MIME, headers={
+        'Content-Disposition': 'attachment; filename="question_paper.pdf"', **paper_headers(seed_val, 'miss')})
+
+@app.post('/api/template/generate-pdf/batch')
+async def generate_pdf_batch(papers: str = Form(...)):
+    """Several papers in one PDF for printing, each from a new page.
+
+    `papers` is a JSON list of objects with the generate-pdf fields;
+    `questions` may be a list or a JSON string. The seeds used are
+    reported in X-Paper-Seeds, in order.
+    """
+    try:
+        items = json.loads(papers)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='papers must be a JSON list')
+    if not isinstance(items, list) or not items or not all(isinstance(p, dict) and 'questions' in p for p in items):
+        raise HTTPException(status_code=400, detail='papers must be a non-empty list of objects with questions')
+    if len(items) > PDF_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f'at most {PDF_BATCH_LIMIT} papers per batch')
+    batch, seeds = [], []
+    for i, item in enumerate(items):
+        try:
+            seed_val = parse_seed(str(item.get('seed') if item.get('seed') is not None else ''))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f'papers[{i}].seed must be an integer')
+        fields = {name: str(item.get(name) if item.get(name) is not None else default) for name, default in PAPER_FIELD_DEFAULTS.items()}
+        parsed, seed_val, _key = paper_key(f'app_local-pdf-v{PDF_LAYOUT_VERSION}', item['questions'], fields, seed_val, 'pdf')
+        batch.append((layout_paper(parsed, seed_val), fields))
+        seeds.append(str(seed_val))
+    with RENDERS_IN_FLIGHT.track('app_local_pdf'):
+        data = await run_cpu(render_papers_pdf, batch)
+    return Response(data, media_type=PDF_MIME, headers={
+        'Content-Disposition': 'attachment; filename="question_papers.pdf"', 'X-Paper-Seeds': ','.join(seeds)})
 
 if __name__ == '__main__':
-    import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=4001)
+    # IDCS_WORKERS=<n>|auto runs several worker processes sharing the same DB
+    from server.serve import run
+    run('server.app_local:app', host='0.0.0.0', port=4001, app_obj=app)
 # For deployment, use: https://idcs-main-kucq.onrender.com
@@ -1,13 +1,17 @@
+import multiprocessing
 import os
 import sys
-import threading
 import time
-import webbrowser
 from pathlib import Path
 
+_PROCESS_T0 = time.perf_counter()
+
 # Reuse the existing FastAPI app and routes
-from server.app_local import app  # noqa: F401
-from fastapi.staticfiles import StaticFiles
+from server.app_local import app, get_conn  # noqa: F401
+from server.docx_skeleton import load_skeleton
+from server.startup import StartupOrchestrator
+from server.serve import run, worker_count
+from server.static_assets import PrecompressedStaticFiles
 
 
 def resource_path(*parts: str) -> Path:
@@ -28,34 +32,55 @@ def mount_frontend():
         if alt.exists():
             dist_dir = alt
     if dist_dir.exists():
-        # Serve the built Vite app and let it handle client-side routing
-        app.mount("/", StaticFiles(directory=str(dist_dir), html=True), name="frontend")
+        # Serve the built Vite app and let it handle client-side routing.
+        # Precompressed .br/.gz siblings and immutable caching for hashed assets
+        # are handled by PrecompressedStaticFiles (see server/compress_assets.py).
+        app.mount("/", PrecompressedStaticFiles(directory=str(dist_dir), html=True), name="frontend")
     else:
         # If no frontend build is found, keep backend only
         print("[packaged] No dist/ folder found. Backend APIs will run without serving frontend.")
 
 
-def open_browser_when_ready(url: str):
-    def _opener():
-        # small delay so server is ready
-        time.sleep(1.2)
-        try:
-            webbrowser.open(url)
-        except Exception:
-            pass
+def warm_db():
+    conn = get_conn()
+    try:
+        conn.execute("SELECT COUNT(*) FROM question_bank").fetchone()
+    finally:
+        conn.close()
 
-    threading.Thread(target=_opener, daemon=True).start()
 
+def open_browser_when_ready(host: str, port: int, url: str, attach: bool = True) -> StartupOrchestrator:
+    """Open the browser once the server accepts connections, warming caches meanwhile."""
+    orchestrator = StartupOrchestrator(host, port, url, t0=_PROCESS_T0)
+    orchestrator.add_warmup("db", warm_db)
+    orchestrator.add_warmup("docx_skeleton", load_skeleton)
+    if attach:
+        orchestrator.attach(app)
+    else:
+        # Worker processes import their own app; rely on the socket poll alone
+        orchestrator.app_started.set()
+    orchestrator.start(open_browser=os.environ.get("NO_BROWSER") != "1")
+    return orchestrator
 
 
-def main():
+def create_app():
+    """App factory used by multi-worker mode: every worker mounts the frontend itself."""
     mount_frontend()
-    # Allow overriding port via environment variable; default to 4000 for packaged exe
+    return app
+
+
+def main():
+    # Required for multi-worker mode in the frozen EXE (workers are spawned processes)
+    multiprocessing.freeze_support()
+    # Allow overriding host/port via environment variables; default to 127.0.0.1:4000 for packaged exe
+    host = os.environ.get("HOST", "127.0.0.1")
     port = int(os.environ.get("PORT", "4000"))
     url = f"http://127.0.0.1:{port}"
-    open_browser_when_ready(url)
-    import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=port)
+    workers = worker_count()
+    if workers == 1:
+        mount_frontend()
+    open_browser_when_ready("127.0.0.1", port, url, attach=workers == 1)
+    run("server.app_packaged:create_app", host=host, port=port, factory=True, app_obj=app)
 
 
 if __name__ == "__main__":
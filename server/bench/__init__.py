@@ -0,0 +1,5 @@
+"""Benchmark suite: synthetic workbook/DOCX corpora and an in-process runner.
+
+    python -m server.bench.run --rows 500 --iterations 20
+    python -m server.bench.run --compare bench_results/old.json bench_results/new.json
+"""
@@ -0,0 +1,155 @@
+"""Synthetic inputs shaped like the real CO workbooks and question papers.
+
+Everything is derived from a seeded random.Random so a given set of
+parameters always produces byte-for-byte comparable work.
+"""
+import base64
+import random
+from io import BytesIO
+from typing import List, Sequence
+
+from openpyxl import Workbook
+
+try:
+    from PIL import Image
+except ImportError:  # images are skipped without Pillow
+    Image = None
+
+CO_SHEETS = ('CO1-CO2', 'CO3-CO4', 'CO5')
+HEADERS = ('S.No', 'Question Bank', 'Figure', 'TYPE', 'BTL Level', 'Course Outcomes', 'Marks', 'Part')
+
+_VERBS = ('Explain', 'Describe', 'Derive', 'Compare', 'Illustrate', 'Analyse', 'Design', 'Evaluate', 'Discuss', 'Outline')
+_TOPICS = ('pipelining', 'cache coherence', 'virtual memory', 'normal forms', 'deadlock avoidance', 'TCP congestion control',
+           'binary search trees', 'dynamic programming', 'Fourier transforms', 'operational amplifiers', 'finite automata',
+           'RSA encryption', 'process scheduling', 'B+ trees', 'gradient descent', 'Kirchhoff\'s laws')
+_TAILS = ('with a neat diagram.', 'with a suitable example.', 'and state its limitations.', 'in detail.',
+          'and compare it with the alternatives.', 'using a worked example.')
+
+
+def question_text(rnd: random.Random, long: bool = False) -> str:
+    text = f"{rnd.choice(_VERBS)} {rnd.choice(_TOPICS)} {rnd.choice(_TAILS)}"
+    if long:
+        text += ' ' + ' '.join(f"{rnd.choice(_VERBS)} how {rnd.choice(_TOPICS)} relates to {rnd.choice(_TOPICS)}." for _ in range(3))
+    return text
+
+
+def png_bytes(rnd: random.Random, width: int = 160, height: int = 100) -> bytes:
+    """A small noisy PNG (noise keeps it from compressing to nothing)."""
+    im = Image.frombytes('RGB', (width, height), rnd.randbytes(width * height * 3))
+    bio = BytesIO()
+    im.save(bio, 'PNG')
+    return bio.getvalue()
+
+
+def png_data_url(data: bytes) -> str:
+    return 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')
+
+
+def make_workbook(rows: int = 200, sheets: Sequence[str] = CO_SHEETS, image_every: int = 10, seed: int = 0,
+                  course_code: str = 'CS3401', course_name: str = 'Algorithms', semester: str = '4') -> bytes:
+    """Build a CO workbook: an INDEX sheet plus `rows` questions per CO sheet.
+
+    Header sits on row 3 under two title rows, as in the department
+    templates. A Figure image is anchored on every `image_every`-th
+    question (0 disables images). Returns the .xlsx bytes.
+    """
+    from openpyxl.drawing.image import Image as XLImage
+
+    rnd = random.Random(seed)
+    wb = Workbook()
+    index = wb.active
+    index.title = 'INDEX'
+    index.cell(row=7, column=2, value='Semester')
+    index.cell(row=7, column=3, value=semester)
+    index.cell(row=8, column=2, value='Course Code')
+    index.cell(row=8, column=3, value=course_code)
+    index.cell(row=9, column=2, value='Course Name')
+    index.cell(row=9, column=3, value=course_name)
+
+    for si, name in enumerate(sheets):
+        ws = wb.create_sheet(name)
+        ws.cell(row=1, column=1, value=f'{course_code} - {course_name}')
+        ws.cell(row=2, column=1, value=f'Question bank for {name}')
+        for c, h in enumerate(HEADERS, start=1):
+            ws.cell(row=3, column=c, value=h)
+        co_lo = 2 * si + 1
+        for i in range(rows):
+            r = 4 + i
+            qtype = rnd.choices(('O', 'D', 'C'), weights=(2, 6, 1))[0]
+            marks = 2 if qtype == 'O' else (16 if qtype == 'D' else 15)
+            ws.cell(row=r, column=1, value=i + 1)
+            ws.cell(row=r, column=2, value=question_text(rnd, long=qtype != 'O'))
+            ws.cell(row=r, column=4, value=qtype)
+            ws.cell(row=r, column=5, value=rnd.choice(('BTL1', 'BTL2', 'K3', 'BTL4', '2')))
+            ws.cell(row=r, column=6, value=rnd.choice((f'CO{co_lo}', f'CO{min(co_lo + 1, 5)}', f'{co_lo},{min(co_lo + 1, 5)}')))
+            ws.cell(row=r, column=7, value=marks)
+            ws.cell(row=r, column=8, value=rnd.choice(('Unit 1', 'Unit 2', 'Unit 3')))
+            if image_every and Image is not None and i % image_every == 0:
+                ws.add_image(XLImage(BytesIO(png_bytes(rnd))), f'C{r}')
+
+    bio = BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def make_questions(part_a: int = 10, part_b_pairs: int = 5, image_every: int = 0, seed: int = 0) -> List[dict]:
+    """Question dicts in the shape the frontend posts to generate-docx."""
+    rnd = random.Random(seed)
+    out = []
+    for i in range(part_a):
+        out.append({'text': question_text(rnd), 'part': 'A', 'number': i + 1, 'btl': rnd.randint(1, 3),
+                    'marks': 2, 'co': f'CO{rnd.randint(1, 5)}'})
+    n = 0
+    for p in range(part_b_pairs):
+        for sub in ('a', 'b'):
+            q = {'text': question_text(rnd, long=True), 'part': 'B', 'number': part_a + 1 + p, 'sub': sub,
+                 'btl': rnd.randint(2, 5), 'marks': 16, 'co': f'CO{rnd.randint(1, 5)}'}
+            if image_every and Image is not None and n % image_every == 0:
+                q['image_url'] = png_data_url(png_bytes(rnd))
+            out.append(q)
+            n += 1
+    return out
+
+
+def make_paper_docx(part_a: int = 10, part_b_pairs: int = 5, image_every: int = 0, seed: int = 0) -> bytes:
+    """A filled question paper in the table layout scan-docx understands.
+
+    Part A is a 5-column table (Q.No, Question, CO, BTL, Marks); Part B is a
+    6-column table of a / OR / b row triples.
+    """
+    from docx import Document
+    from docx.shared import Inches
+
+    questions = make_questions(part_a, part_b_pairs, image_every, seed)
+    doc = Document()
+    doc.add_paragraph('B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024')
+    doc.add_paragraph('PART A - (10 x 2 = 20 Marks)')
+    table_a = doc.add_table(rows=1, cols=5)
+    for c, h in zip(table_a.rows[0].cells, ('Q.No', 'Question', 'CO', 'BTL', 'Marks')):
+        c.text = h
+    for q in questions:
+        if q['part'] != 'A':
+            continue
+        cells = table_a.add_row().cells
+        for c, v in zip(cells, (q['number'], q['text'], q['co'], f"K{q['btl']}", q['marks'])):
+            c.text = str(v)
+
+    doc.add_paragraph('PART B - (5 x 16 = 80 Marks)')
+    table_b = doc.add_table(rows=1, cols=6)
+    for c, h in zip(table_b.rows[0].cells, ('Q.No', 'Question', 'CO', 'BTL', 'PI', 'Marks')):
+        c.text = h
+    for q in questions:
+        if q['part'] != 'B':
+            continue
+        if q['sub'] == 'b':
+            table_b.add_row().cells[0].text = 'OR'
+        cells = table_b.add_row().cells
+        for c, v in zip(cells, (f"{q['number']}.{q['sub']}", q['text'], q['co'], f"K{q['btl']}", '1.2.1', q['marks'])):
+            c.text = str(v)
+        if q.get('image_url'):
+            data = base64.b64decode(q['image_url'].split(',', 1)[1])
+            cells[1].add_paragraph().add_run().add_picture(BytesIO(data), width=Inches(2))
+
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
@@ -0,0 +1,97 @@
+"""Memory report for the upload and generation paths.
+
+Without --url, profiles the corpus in-process (IDCS_MEMPROFILE is switched
+on for this run) and exits non-zero if any request's traced peak exceeds
+--budget-mb. With --url, prints the records a running server collected
+at /api/debug/memory (start it with IDCS_MEMPROFILE=1).
+
+    python -m server.bench.memory --rows 1000 --image-every 1 --budget-mb 250
+    python -m server.bench.memory --url http://127.0.0.1:4001
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from server.bench.run import SCENARIOS, Inputs, add_corpus_args
+
+DEFAULT_SCENARIOS = ('upload_excel', 'scan_docx_local', 'generate_docx_template')
+
+
+def print_report(data: dict, top: int):
+    budget = data.get('budget_mb')
+    print(f"{'path':<36}{'status':>7}{'peak MB':>9}{'kept MB':>9}{'rss MB':>8}{'ms':>9}")
+    for rec in data.get('records', []):
+        flag = '  OVER BUDGET' if rec.get('over_budget') else ''
+        print(f"{rec['path']:<36}{rec['status']:>7}{rec['peak_traced_mb']:>9.1f}{rec['retained_mb']:>9.1f}"
+              f"{rec['rss_end_mb']:>8.0f}{rec['duration_ms']:>9.0f}{flag}")
+        marks = ', '.join(f"{c['label']}={c['live_mb']}" for c in rec.get('checkpoints', []))
+        if marks:
+            print(f"    live at checkpoints (MB): {marks}")
+        if rec.get('top_sites'):
+            print(f"    top allocation sites at '{rec.get('top_sites_at')}':")
+            for site in rec['top_sites'][:top]:
+                print(f"      {site['size_kb']:>10.1f} KB  {site['count']:>7}  {site['site']}")
+    if budget:
+        print(f"budget: {budget:g} MB traced peak per request")
+
+
+def fetch(url: str) -> dict:
+    import requests
+    r = requests.get(url.rstrip('/') + '/api/debug/memory', timeout=30)
+    if r.status_code == 404:
+        raise SystemExit('profiling is not enabled on that server (start it with IDCS_MEMPROFILE=1)')
+    r.raise_for_status()
+    return r.json()
+
+
+def profile_in_process(args) -> dict:
+    from fastapi.testclient import TestClient
+    from server import memprofile
+
+    # The apps call memprofile.install() at import, which reads these
+    memprofile.ENABLED = True
+    if args.budget_mb:
+        memprofile.BUDGET_MB = args.budget_mb
+    os.environ.setdefault('IDCS_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='idcs-mem-'), 'local_store.db'))
+
+    inputs = Inputs(args)
+    # Build the corpus before tracing starts so its allocations are not counted
+    inputs.workbook, inputs.paper, inputs.questions_json
+    for name in args.scenario or DEFAULT_SCENARIOS:
+        load_app, request = SCENARIOS[name]
+        with TestClient(load_app()) as client:
+            for _ in range(args.repeat):
+                request(client, inputs)
+    return memprofile.debug_memory()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m server.bench.memory', description=__doc__.split('\n')[0])
+    ap.add_argument('--url', help='read records from a running server instead of profiling in-process')
+    ap.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                    help=f"scenario to profile (repeatable; default: {', '.join(DEFAULT_SCENARIOS)})")
+    add_corpus_args(ap)
+    ap.add_argument('--repeat', type=int, default=1, help='requests per scenario')
+    ap.add_argument('--budget-mb', type=float, help='fail if any request peaks above this many MB')
+    ap.add_argument('--top', type=int, default=5, help='allocation sites shown per request')
+    ap.add_argument('--json', help='also write the raw records to this file')
+    args = ap.parse_args(argv)
+
+    data = fetch(args.url) if args.url else profile_in_process(args)
+    print_report(data, args.top)
+    if not args.url:
+        print('(in-process: request bodies held by the test client are included in the figures)')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+    over = [r for r in data.get('records', []) if r.get('over_budget')]
+    if over:
+        print(f"FAIL: {len(over)} request(s) over the memory budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""Run the benchmark scenarios and store/compare the results.
+
+Each scenario posts a synthetic corpus to one endpoint through the ASGI
+test client (no sockets, no uvicorn) and records latency percentiles,
+throughput and peak RSS. By default every scenario runs in its own child
+process so the peak RSS figure belongs to that scenario alone.
+
+    python -m server.bench.run                                  # all scenarios, defaults
+    python -m server.bench.run --rows 2000 --image-every 5 -s upload_excel
+    python -m server.bench.run --compare bench_results/a.json bench_results/b.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from server.bench import corpus
+from server.memprofile import peak_rss_bytes, rss_bytes
+
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Metrics where a larger value is a regression (throughput is the other way round)
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb')
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+# --- scenarios -------------------------------------------------------------
+
+class Inputs:
+    """Corpus for one run, built lazily so a scenario only pays for what it uses."""
+
+    def __init__(self, args):
+        self.args = args
+        self._cache = {}
+
+    def _get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def workbook(self) -> bytes:
+        a = self.args
+        return self._get('workbook', lambda: corpus.make_workbook(
+            rows=a.rows, sheets=corpus.CO_SHEETS[:a.sheets], image_every=a.image_every, seed=a.seed))
+
+    @property
+    def paper(self) -> bytes:
+        a = self.args
+        return self._get('paper', lambda: corpus.make_paper_docx(
+            part_a=a.part_a, part_b_pairs=a.part_b_pairs, image_every=a.paper_image_every, seed=a.seed))
+
+    @property
+    def questions_json(self) -> str:
+        a = self.args
+        return self._get('questions', lambda: json.dumps(corpus.make_questions(
+            part_a=a.part_a, part_b_pairs=a.part_b_pairs, image_every=a.paper_image_every, seed=a.seed)))
+
+
+def _local_app():
+    import server.app_local as app_local
+    return app_local.app
+
+
+def _template_app():
+    import server.template_backend as template_backend
+    return template_backend.app
+
+
+def _upload_excel(client, inputs: Inputs):
+    return client.post('/api/upload-questions-excel/', files={'file': ('bank.xlsx', inputs.workbook, XLSX_MIME)})
+
+
+def _scan_docx(client, inputs: Inputs):
+    return client.post('/api/template/scan-docx', files={'file': ('paper.docx', inputs.paper, DOCX_MIME)})
+
+
+def _generate_docx(client, inputs: Inputs):
+    return client.post('/api/template/generate-docx', data={
+        'questions': inputs.questions_json, 'dept': 'Computer Science and Engineering',
+        'cc': 'CS3401', 'cn': 'Algorithms', 'qpcode': 'QP-BENCH'})
+
+
+# name -> (app loader, request)
+SCENARIOS: Dict[str, tuple] = {
+    'upload_excel': (_local_app, _upload_excel),
+    'scan_docx_local': (_local_app, _scan_docx),
+    'scan_docx_template': (_template_app, _scan_docx),
+    'generate_docx_local': (_local_app, _generate_docx),
+    'generate_docx_template': (_template_app, _generate_docx),
+}
+
+
+def _count_items(response):
+    """Questions parsed by a JSON endpoint, as a sanity check on the corpus."""
+    if response is None or 'json' not in response.headers.get('content-type', ''):
+        return None
+    try:
+        return len(response.json().get('questions') or [])
+    except Exception:
+        return None
+
+
+def run_scenario(name: str, args) -> dict:
+    """Run one scenario in this process and return its result record."""
+    from fastapi.testclient import TestClient
+
+    load_app, request = SCENARIOS[name]
+    inputs = Inputs(args)
+    app = load_app()
+    latencies: List[float] = []
+    errors = 0
+    response_bytes = 0
+
+    with TestClient(app) as client:
+        call: Callable = lambda: request(client, inputs)
+        # Warm-up requests also build the corpus and import lazily loaded modules
+        warm = None
+        for _ in range(args.warmup):
+            warm = call()
+            warm.raise_for_status()
+        rss_before = rss_bytes()
+
+        def timed(_):
+            t = time.perf_counter()
+            r = call()
+            return (time.perf_counter() - t) * 1000, r.status_code, len(r.content)
+
+        wall = time.perf_counter()
+        if args.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                results = list(pool.map(timed, range(args.iterations)))
+        else:
+            results = [timed(i) for i in range(args.iterations)]
+        wall = time.perf_counter() - wall
+
+    for ms, status, size in results:
+        latencies.append(ms)
+        response_bytes = size
+        if status != 200:
+            errors += 1
+    latencies.sort()
+    return {
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'throughput_rps': round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        'rss_before_mb': round(rss_before / 2 ** 20, 1),
+        'peak_rss_mb': round(peak_rss_bytes() / 2 ** 20, 1),
+        'response_bytes': response_bytes,
+        'items': _count_items(warm),
+    }
+
+
+def run_isolated(name: str, argv: List[str]) -> dict:
+    """Run one scenario in a fresh interpreter and parse its JSON result."""
+    cmd = [sys.executable, '-m', 'server.bench.run', '--in-process', '--emit-json', '-s', name] + argv
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode != 0:
+        return {'error': (out.stderr or out.stdout).strip().splitlines()[-1:] or ['failed']}
+    # The scenario's own logging goes to stdout too; the result is the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])[name]
+
+
+# --- reporting ---------------------------------------------------------------
+
+def print_table(results: Dict[str, dict]):
+    print(f"{'scenario':<24}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>9}{'peak MB':>9}{'err':>5}")
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"{name:<24}  failed: {r['error']}")
+            continue
+        print(f"{name:<24}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['throughput_rps']:>9.2f}{r['peak_rss_mb']:>9.1f}{r['errors']:>5}")
+
+
+def compare(base_path: str, new_path: str, threshold_pct: float) -> int:
+    """Print per-metric deltas between two result files; 1 if anything regressed."""
+    with open(base_path, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"base {base['meta'].get('commit')} ({base_path}) -> new {new['meta'].get('commit')} ({new_path})")
+    if base['meta'].get('params') != new['meta'].get('params'):
+        print('warning: runs used different corpus parameters; deltas are not like-for-like')
+    regressed = []
+    for name, b in base['scenarios'].items():
+        n = new['scenarios'].get(name)
+        if n is None or 'error' in b or 'error' in n:
+            continue
+        cells = []
+        for metric in LOWER_IS_BETTER + ('throughput_rps',):
+            if not b.get(metric):
+                continue
+            delta = (n[metric] - b[metric]) / b[metric] * 100
+            worse = delta > threshold_pct if metric in LOWER_IS_BETTER else delta < -threshold_pct
+            if worse:
+                regressed.append(f'{name}.{metric}')
+            cells.append(f"{metric}={n[metric]:g} ({delta:+.1f}%{'!' if worse else ''})")
+        print(f"{name:<24}" + '  '.join(cells))
+    if regressed:
+        print(f"REGRESSED (>{threshold_pct:g}%): {', '.join(regressed)}")
+        return 1
+    print('no regressions')
+    return 0
+
+
+# --- CLI -----------------------------------------------------------------------
+
+# Options that shape the corpus/load; recorded so comparisons can check them
+PARAM_KEYS = ('rows', 'sheets', 'image_every', 'part_a', 'part_b_pairs', 'paper_image_every',
+              'iterations', 'warmup', 'concurrency', 'seed')
+
+
+def add_corpus_args(ap):
+    ap.add_argument('--rows', type=int, default=200, help='questions per CO sheet')
+    ap.add_argument('--sheets', type=int, default=3, choices=(1, 2, 3), help='number of CO sheets')
+    ap.add_argument('--image-every', type=int, default=10, help='workbook image on every Nth row (0 = none)')
+    ap.add_argument('--part-a', type=int, default=10, help='Part A questions per paper')
+    ap.add_argument('--part-b-pairs', type=int, default=5, help='Part B a/b pairs per paper')
+    ap.add_argument('--paper-image-every', type=int, default=3, help='paper image on every Nth Part B question (0 = none)')
+    ap.add_argument('--seed', type=int, default=0)
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog='python -m server.bench.run', description=__doc__.split('\n')[0])
+    ap.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                    help='scenario to run (repeatable; default: all)')
+    add_corpus_args(ap)
+    ap.add_argument('-n', '--iterations', type=int, default=10)
+    ap.add_argument('--warmup', type=int, default=1)
+    ap.add_argument('-c', '--concurrency', type=int, default=1, help='client threads issuing requests')
+    ap.add_argument('-o', '--out', help='result file (default: bench_results/<timestamp>-<commit>.json)')
+    ap.add_argument('--in-process', action='store_true', help='run all scenarios in this process (shared peak RSS)')
+    ap.add_argument('--emit-json', action='store_true', help=argparse.SUPPRESS)
+    ap.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two result files and exit')
+    ap.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent for --compare')
+    return ap
+
+
+def _without_scenarios(argv: List[str]) -> List[str]:
+    out, skip = [], False
+    for a in argv:
+        if skip:
+            skip = False
+        elif a in ('-s', '--scenario'):
+            skip = True
+        elif not (a.startswith('--scenario=') or (a.startswith('-s') and len(a) > 2)):
+            out.append(a)
+    return out
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    # Never touch the real question bank
+    os.environ.setdefault('IDCS_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='idcs-bench-'), 'local_store.db'))
+    names = args.scenario or list(SCENARIOS)
+
+    results = {}
+    if args.in_process:
+        for name in names:
+            try:
+                results[name] = run_scenario(name, args)
+            except Exception as e:
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+        if args.emit_json:
+            print(json.dumps(results))
+            return 0
+    else:
+        child_argv = _without_scenarios(argv)
+        for name in names:
+            print(f'[bench] {name} ...', flush=True)
+            results[name] = run_isolated(name, child_argv)
+
+    print_table(results)
+    commit = git_commit()
+    record = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'isolated': not args.in_process,
+            'params': {k: getattr(args, k) for k in PARAM_KEYS},
+        },
+        'scenarios': results,
+    }
+    out = args.out or os.path.join('bench_results', f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    print(f'[bench] results written to {out}')
+    return 1 if any('error' in r or r.get('errors') for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
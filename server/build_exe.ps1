@@ -37,6 +37,9 @@ $py = Join-Path $venv "Scripts/python.exe"
 & $py -m pip install --upgrade pip wheel setuptools
 & $py -m pip install -r server/requirements.txt pyinstaller
 
+# Precompressed .gz/.br siblings served by the packaged app's static layer
+& $py -m server.compress_assets dist
+
 Write-Host "[4/5] Building single-file EXE with PyInstaller..." -ForegroundColor Cyan
 # Include the built frontend (dist) into the executable
 & $py -m PyInstaller `
@@ -45,6 +48,7 @@ Write-Host "[4/5] Building single-file EXE with PyInstaller..." -ForegroundColor
   --onefile `
   --name "KR-Question-Generator" `
   --add-data "dist;dist" `
+  --hidden-import server.app_packaged `
   server/app_packaged.py
 
 Write-Host "[5/5] Done. EXE at: dist/KR-Question-Generator.exe" -ForegroundColor Green
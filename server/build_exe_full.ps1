@@ -41,6 +41,9 @@ $py = Join-Path $venv "Scripts/python.exe"
 & $py -m pip install --upgrade pip wheel setuptools
 & $py -m pip install -r server/requirements.txt pyinstaller
 
+# Precompressed .gz/.br siblings served by the packaged app's static layer
+& $py -m server.compress_assets dist
+
 Write-Host "[4/6] Preparing packaging options..." -ForegroundColor Cyan
 $name = "KR-Question-Generator"
 $timestamp = Get-Date -Format "yyyyMMddHHmm"
@@ -59,7 +62,9 @@ $pyArgs = @(
   "--noconfirm",
   "--clean",
   "--onefile",
-  "--name", $exeName
+  "--name", $exeName,
+  # Multi-worker mode (IDCS_WORKERS) imports the app factory by module path
+  "--hidden-import", "server.app_packaged"
 )
 
 foreach ($d in $addData) { $pyArgs += "--add-data"; $pyArgs += $d }
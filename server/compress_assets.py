@@ -0,0 +1,75 @@
+"""Write precompressed .gz/.br siblings next to the built frontend assets.
+
+Run after `npm run build` (the build scripts do this automatically):
+
+    python -m server.compress_assets dist
+
+PrecompressedStaticFiles picks the siblings up at startup. Brotli output is
+skipped when the `brotli` package is not installed.
+"""
+import gzip
+import os
+import sys
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional: gzip siblings are still produced
+    brotli = None
+
+COMPRESSIBLE_EXTS = {'.js', '.mjs', '.css', '.html', '.svg', '.json', '.txt', '.map', '.xml', '.ico', '.wasm'}
+MIN_SIZE = 1024
+
+
+def _write_if_smaller(path: str, original_size: int, data: bytes) -> bool:
+    # Keep the sibling only when it actually saves bytes
+    if len(data) >= original_size:
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def compress_dir(directory: str, min_size: int = MIN_SIZE) -> dict:
+    stats = {'files': 0, 'gz': 0, 'br': 0, 'bytes_in': 0, 'bytes_gz': 0, 'bytes_br': 0}
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTS:
+                continue
+            full = os.path.join(root, name)
+            size = os.path.getsize(full)
+            if size < min_size:
+                continue
+            with open(full, 'rb') as f:
+                raw = f.read()
+            stats['files'] += 1
+            stats['bytes_in'] += size
+            # mtime=0 keeps the output byte-identical across builds
+            gz = gzip.compress(raw, compresslevel=9, mtime=0)
+            if _write_if_smaller(full + '.gz', size, gz):
+                stats['gz'] += 1
+                stats['bytes_gz'] += len(gz)
+            if brotli is not None:
+                br = brotli.compress(raw, quality=11)
+                if _write_if_smaller(full + '.br', size, br):
+                    stats['br'] += 1
+                    stats['bytes_br'] += len(br)
+    return stats
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    directory = argv[0] if argv else 'dist'
+    if not os.path.isdir(directory):
+        print(f'[compress] directory not found: {directory}')
+        return 1
+    stats = compress_dir(directory)
+    print(f"[compress] {stats['files']} files, {stats['bytes_in']} bytes -> "
+          f"gzip {stats['gz']} ({stats['bytes_gz']} bytes), brotli {stats['br']} ({stats['bytes_br']} bytes)"
+          + ('' if brotli is not None else ' [brotli not installed]'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server.static_assets import accepted_encodings
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/',
+)
+
+
+class _Encoder:
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        self.coding = coding
+        if coding == 'br':
+            self._c = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 writes a gzip header/trailer around the deflate stream
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.coding == 'br':
+            return self._c.process(data)
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        if self.coding == 'br':
+            return self._c.finish()
+        return self._c.flush()
+
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli compression for text-like responses.
+
+    Picks brotli when the client accepts it and the `brotli` package is
+    installed, otherwise gzip. Bodies smaller than `minimum_size`, binary
+    downloads (docx/xlsx are already zipped) and responses that already carry
+    a Content-Encoding (precompressed static assets) pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        if brotli is not None and accepted.get('br', 0) > 0:
+            return 'br'
+        if accepted.get('gzip', 0) > 0:
+            return 'gzip'
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        coding = self.choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self, coding)(self.app, scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, mw: CompressionMiddleware, coding: str):
+        self.mw = mw
+        self.coding = coding
+        self.start: Optional[Message] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await app(scope, receive, self.on_send)
+
+    def _compressible(self, headers: Headers) -> bool:
+        if 'content-encoding' in headers:
+            return False
+        ctype = headers.get('content-type', '').lower()
+        return ctype.startswith(COMPRESSIBLE_TYPES)
+
+    async def on_send(self, message: Message) -> None:
+        mtype = message['type']
+        if mtype == 'http.response.start':
+            # Hold the start message until we know whether the body is worth compressing
+            self.start = message
+            self.passthrough = not self._compressible(Headers(raw=message['headers']))
+            return
+        if mtype != 'http.response.body':
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            if self.passthrough or (not more_body and len(body) < self.mw.minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers = MutableHeaders(raw=start['headers'])
+            headers['Content-Encoding'] = self.coding
+            headers.add_vary_header('Accept-Encoding')
+            self.encoder = _Encoder(self.coding, self.mw.gzip_level, self.mw.brotli_quality)
+            if not more_body:
+                data = self.encoder.compress(body) + self.encoder.flush()
+                headers['Content-Length'] = str(len(data))
+                await self.send(start)
+                await self.send({'type': 'http.response.body', 'body': data})
+                return
+            # Streaming response: length is unknown once compressed
+            if 'content-length' in headers:
+                del headers['content-length']
+            await self.send(start)
+
+        if self.passthrough or self.encoder is None:
+            await self.send(message)
+            return
+        data = self.encoder.compress(body)
+        if not more_body:
+            data += self.encoder.flush()
+        if data or not more_body:
+            await self.send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import sys
+import time
+
+from server.metrics import SQL_LATENCY
+
+
+def get_data_dir():
+    """Writable directory for the DB and on-disk caches.
+
+    %LOCALAPPDATA%\\IDCS-QP-Generator when frozen, else the server/ folder.
+    """
+    if getattr(sys, 'frozen', False):
+        local_appdata = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+        data_dir = os.path.join(local_appdata, 'IDCS-QP-Generator')
+        os.makedirs(data_dir, exist_ok=True)
+        return data_dir
+    return os.path.dirname(__file__)
+
+
+# Use a writable DB path: next to EXE if frozen, else next to this file.
+# IDCS_DB_PATH overrides it, e.g. to share one DB between server workers.
+def get_db_path():
+    override = os.environ.get('IDCS_DB_PATH')
+    if override:
+        os.makedirs(os.path.dirname(os.path.abspath(override)), exist_ok=True)
+        return override
+    return os.path.join(get_data_dir(), 'local_store.db')
+
+
+DB_PATH = get_db_path()
+
+# Seconds a connection waits on another process's write lock before failing
+BUSY_TIMEOUT = float(os.environ.get('IDCS_DB_BUSY_TIMEOUT', '30'))
+
+
+_SQL_OPS = frozenset(('select', 'insert', 'update', 'delete', 'create', 'alter', 'pragma', 'begin', 'commit', 'rollback'))
+
+
+def _sql_op(sql) -> str:
+    head = str(sql).lstrip()[:10].split(None, 1)
+    op = head[0].lower() if head else ''
+    return op if op in _SQL_OPS else 'other'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement execution time in idcs_sqlite_query_duration_seconds."""
+
+    def execute(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            SQL_LATENCY.labels(_sql_op(sql)).observe(time.perf_counter() - t)
+
+    def executemany(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            SQL_LATENCY.labels(_sql_op(sql)).observe(time.perf_counter() - t)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() builds its cursor in C without calling cursor()
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def get_conn(path=None):
+    return sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT, factory=TimedConnection)
+
+
+# UTC write time in the ISO form PostgREST compares against
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+def init_db(path=None):
+    """Bring the schema up to date (server/migrations.py). Safe to call from several worker processes at once."""
+    # server.migrations imports get_conn and SQL_NOW from this module
+    from server.migrations import migrate
+    conn = get_conn(path)
+    try:
+        # WAL lets other workers keep reading while one of them writes
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.isolation_level = None
+        migrate(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,157 @@
+"""Bounded on-disk LRU cache for derived bytes (parse results and the like).
+
+Entries are files named by key under <data dir>/cache/<name>/. Each file
+starts with a small header recording when the entry was written; entries
+written more than `max_age` seconds ago are dropped on read and during
+eviction, however often they are read (files without the header, from
+before it was added, count as misses). The file's mtime is only the LRU
+clock: reads touch it, and eviction (once the directory is over its byte
+budget) removes the oldest mtime first. Writes go to a temp file and are
+renamed into place, so concurrent workers sharing the directory never see
+partial entries. Callers put version information in the key: entries
+written by an older parser simply stop being hit and age out.
+
+    IDCS_CACHE_DIR=<path>     root directory (default: <data dir>/cache)
+"""
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from server.metrics import cache_hit, cache_miss
+
+_KEY_RE = re.compile(r'^[A-Za-z0-9._-]{1,200}$')
+# Entry header: magic, then the write time as a big-endian double
+_MAGIC = b'IDCS-DC1'
+_HEADER = struct.Struct('>8sd')
+
+
+def cache_root() -> str:
+    override = os.environ.get('IDCS_CACHE_DIR')
+    if override:
+        return override
+    from server.db import get_data_dir
+    return os.path.join(get_data_dir(), 'cache')
+
+
+class DiskCache:
+    def __init__(self, name: str, max_bytes: int, max_age: Optional[float] = None, root: Optional[str] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.dir = os.path.join(root or cache_root(), name)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        if not _KEY_RE.match(key):
+            raise ValueError(f'invalid cache key: {key!r}')
+        return os.path.join(self.dir, key)
+
+    def _expired(self, written: float, now: float) -> bool:
+        return self.max_age is not None and now - written > self.max_age
+
+    def _written(self, path: str) -> Optional[float]:
+        """Write time from an entry's header; None for a missing or headerless file."""
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(_HEADER.size)
+        except OSError:
+            return None
+        if len(head) < _HEADER.size:
+            return None
+        magic, written = _HEADER.unpack(head)
+        return written if magic == _MAGIC else None
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(_HEADER.size)
+                data = f.read()
+            magic, written = _HEADER.unpack(head) if len(head) == _HEADER.size else (None, 0.0)
+            if magic != _MAGIC or self._expired(written, time.time()):
+                self._remove(path)
+                raise FileNotFoundError(path)
+            os.utime(path)
+        except OSError:
+            cache_miss(self.name)
+            return None
+        cache_hit(self.name)
+        return data
+
+    def contains(self, key: str) -> bool:
+        """Whether a live entry exists, without reading its body or counting a hit."""
+        written = self._written(self._path(key))
+        return written is not None and not self._expired(written, time.time())
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) + _HEADER.size > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.dir, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(_HEADER.pack(_MAGIC, time.time()))
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                self._remove(tmp)
+                raise
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used until under max_bytes. Returns entries removed."""
+        with self._lock:
+            try:
+                entries = []
+                with os.scandir(self.dir) as it:
+                    for e in it:
+                        if e.is_file() and not e.name.startswith('.tmp-'):
+                            st = e.stat()
+                            entries.append((st.st_mtime, st.st_size, e.path))
+            except OSError:
+                return 0
+            removed = 0
+            now = time.time()
+            if self.max_age is not None:
+                keep = []
+                for ent in entries:
+                    # Not used for max_age means written before then too. Recently
+                    # used entries past their write age are dropped by their next get()
+                    if self._expired(ent[0], now):
+                        removed += self._remove(ent[2])
+                    else:
+                        keep.append(ent)
+                entries = keep
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                entries.sort()
+                for _mtime, size, path in entries:
+                    if total <= self.max_bytes:
+                        break
+                    removed += self._remove(path)
+                    total -= size
+            return removed
+
+    def clear(self) -> None:
+        try:
+            with os.scandir(self.dir) as it:
+                for e in it:
+                    self._remove(e.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
@@ -0,0 +1,34 @@
+import threading
+from io import BytesIO
+
+from server.metrics import cache_hit, cache_miss
+
+# The blank python-docx package every generated paper starts from. Loading it
+# (and importing python-docx itself) is the slowest part of the first render,
+# so it is built once per process and reused.
+_lock = threading.Lock()
+_skeleton_bytes = None
+
+
+def load_skeleton() -> bytes:
+    """Return the serialized blank document, building it on first use."""
+    global _skeleton_bytes
+    if _skeleton_bytes is not None:
+        cache_hit('docx_skeleton')
+        return _skeleton_bytes
+    with _lock:
+        if _skeleton_bytes is None:
+            cache_miss('docx_skeleton')
+            from docx import Document
+            bio = BytesIO()
+            Document().save(bio)
+            _skeleton_bytes = bio.getvalue()
+        else:
+            cache_hit('docx_skeleton')
+    return _skeleton_bytes
+
+
+def new_document():
+    """Create a fresh, independent Document from the cached skeleton."""
+    from docx import Document
+    return Document(BytesIO(load_skeleton()))
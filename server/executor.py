@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+# Pool sizing. IO covers SQLite, temp files and outbound HTTP; CPU covers
+# python-docx parsing/rendering and openpyxl. IDCS_CPU_POOL=process moves CPU
+# work into worker processes (real parallelism, but per-request stage
+# timings recorded inside the worker are not visible to the parent).
+IO_WORKERS = int(os.environ.get('IDCS_IO_THREADS') or min(32, (os.cpu_count() or 1) + 4))
+CPU_WORKERS = int(os.environ.get('IDCS_CPU_WORKERS') or (os.cpu_count() or 1))
+CPU_POOL_KIND = (os.environ.get('IDCS_CPU_POOL') or 'thread').lower()
+
+_lock = threading.Lock()
+_io_pool = None
+_cpu_pool = None
+
+
+def io_pool() -> Executor:
+    global _io_pool
+    if _io_pool is None:
+        with _lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='idcs-io')
+    return _io_pool
+
+
+def cpu_pool() -> Executor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _lock:
+            if _cpu_pool is None:
+                if CPU_POOL_KIND == 'process':
+                    _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+                else:
+                    _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='idcs-cpu')
+    return _cpu_pool
+
+
+async def _run(pool: Executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    if isinstance(pool, ThreadPoolExecutor):
+        # Carry request-scoped context (timings, metrics labels) into the worker thread
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(pool, call)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking IO-bound callable in the IO thread pool."""
+    return await _run(io_pool(), fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a CPU-bound callable in the CPU pool.
+
+    In process mode `fn` and its arguments must be picklable, i.e. a
+    module-level function called with plain data.
+    """
+    return await _run(cpu_pool(), fn, *args, **kwargs)
+
+
+def configure_threadpool():
+    """Size the anyio pool FastAPI uses for plain `def` endpoints.
+
+    Must be called from inside the event loop (a startup hook).
+    """
+    try:
+        import anyio.to_thread
+        anyio.to_thread.current_default_thread_limiter().total_tokens = IO_WORKERS
+    except Exception:
+        pass
+
+
+def shutdown():
+    global _io_pool, _cpu_pool
+    with _lock:
+        for pool in (_io_pool, _cpu_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = _cpu_pool = None
+
+
+def install(app):
+    """Register pool sizing/shutdown hooks on a FastAPI app."""
+    app.add_event_handler('startup', configure_threadpool)
+    app.add_event_handler('shutdown', shutdown)
@@ -0,0 +1,23 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed.
+
+    Endpoints that return large payloads (question lists, parsed workbooks,
+    scan results) should return this directly: FastAPI then skips its
+    recursive jsonable_encoder pass over the content, which costs more than
+    the serialization itself for multi-megabyte bodies.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,164 @@
+"""Process-wide logging: a queue in front of the handlers, JSON records on disk.
+
+Request threads only put records on an in-memory queue (QueueHandler); a
+QueueListener thread does the formatting and the console/file writes, so a
+slow disk or terminal no longer stalls a render. Per-item messages (one per
+question, image or relationship id) pass `extra=SAMPLE` and are thinned by
+SampleFilter before they are even queued: the first few of each message are
+kept, then one in every N, each carrying the running count as `seen`.
+
+    IDCS_LOG_LEVEL=INFO           root level
+    IDCS_LOG_FILE=server.log      JSON-lines file, rotated at 2 MB x 3 ('' disables)
+    IDCS_LOG_CONSOLE=text         console format: text or json
+    IDCS_LOG_SAMPLE_FIRST=5       sampled messages always logged per message
+    IDCS_LOG_SAMPLE_EVERY=100     ...then one in this many
+
+With IDCS_WORKERS > 1 each worker writes its own file (server.<pid>.log)
+so rotation never races between processes.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s %(message)s'
+
+# Pass as extra= on per-item log calls to have them sampled
+SAMPLE = {'sample': True}
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any extra= fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.threadName and record.threadName != 'MainThread':
+            out['thread'] = record.threadName
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out['exc'] = record.exc_text
+        if record.stack_info:
+            out['stack'] = record.stack_info
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keeps the first `first` records of each sampled message, then one in `every`."""
+
+    def __init__(self, first: int = 5, every: int = 100):
+        super().__init__()
+        self.first = max(0, first)
+        self.every = max(1, every)
+        self._seen: Dict[Tuple[str, object], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sample', False):
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            n = self._seen.get(key, 0) + 1
+            self._seen[key] = n
+        if n <= self.first or n % self.every == 0:
+            record.seen = n
+            return True
+        return False
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args so the listener never touches caller-owned objects, but
+        # leave the formatting (timestamps, JSON) to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _log_file() -> Optional[str]:
+    path = os.environ.get('IDCS_LOG_FILE', 'server.log').strip()
+    if not path or path.lower() == 'none':
+        return None
+    from server.serve import worker_count
+    if worker_count() > 1:
+        root, ext = os.path.splitext(path)
+        path = f'{root}.{os.getpid()}{ext or ".log"}'
+    return path
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """Route the root logger through the queue. Safe to call more than once.
+
+    Leaves logging alone if something else (a test runner, an embedding
+    app) already configured the root logger.
+    """
+    global _listener
+    with _lock:
+        root = logging.getLogger()
+        if _listener is not None or root.handlers:
+            return
+        level = (level or os.environ.get('IDCS_LOG_LEVEL') or 'INFO').upper()
+        root.setLevel(level)
+
+        handlers = []
+        console = logging.StreamHandler()
+        if (os.environ.get('IDCS_LOG_CONSOLE') or 'text').lower() == 'json':
+            console.setFormatter(JsonFormatter())
+        else:
+            console.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console)
+        path = _log_file()
+        if path:
+            try:
+                file_handler = RotatingFileHandler(path, maxBytes=2 * 1024 * 1024, backupCount=3, encoding='utf-8')
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                console.handle(logging.makeLogRecord({'msg': f'[logging] cannot open {path}: {e}', 'levelno': logging.WARNING, 'levelname': 'WARNING'}))
+
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        qh = _QueueHandler(q)
+        qh.addFilter(SampleFilter(int(os.environ.get('IDCS_LOG_SAMPLE_FIRST') or 5),
+                                  int(os.environ.get('IDCS_LOG_SAMPLE_EVERY') or 100)))
+        root.addHandler(qh)
+        _listener = QueueListener(q, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Drain the queue and stop the writer thread."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for h in listener.handlers:
+            try:
+                h.close()
+            except Exception:
+                pass
@@ -0,0 +1,242 @@
+"""Per-request memory profiling (tracemalloc + RSS), off unless IDCS_MEMPROFILE=1.
+
+When enabled, requests to the heavy endpoints are profiled one at a time:
+tracemalloc's peak is reset at the start, handlers call `checkpoint()` at
+points where their working set is largest (workbook loaded, document built)
+and the snapshot with the most live memory is diffed against the request
+baseline to find the top allocation sites. Records are kept in memory and
+served from GET /api/debug/memory; `python -m server.bench.memory` prints
+them or drives an image-heavy corpus against a budget.
+
+    IDCS_MEMPROFILE=1                turn profiling on
+    IDCS_MEMPROFILE_FRAMES=1         traceback depth kept by tracemalloc (cost grows with it)
+    IDCS_MEMPROFILE_TOP=10           allocation sites per record
+    IDCS_MEMPROFILE_KEEP=50          records kept for the debug endpoint
+    IDCS_MEMORY_BUDGET_MB=<n>        flag (and log) requests whose peak exceeds n MB
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Deque, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger('memprofile')
+
+ENABLED = os.environ.get('IDCS_MEMPROFILE', '').strip().lower() in ('1', 'true', 'yes', 'on')
+FRAMES = int(os.environ.get('IDCS_MEMPROFILE_FRAMES') or 1)
+TOP_N = int(os.environ.get('IDCS_MEMPROFILE_TOP') or 10)
+KEEP = int(os.environ.get('IDCS_MEMPROFILE_KEEP') or 50)
+BUDGET_MB = float(os.environ.get('IDCS_MEMORY_BUDGET_MB') or 0) or None
+
+PROFILED_PATHS = (
+    '/api/upload-questions-excel/',
+    '/api/template/scan-docx',
+    '/api/template/generate-docx',
+)
+
+MB = 1024 * 1024
+
+_current: contextvars.ContextVar[Optional['RequestProfile']] = contextvars.ContextVar('memprofile', default=None)
+_records: Deque[dict] = deque(maxlen=KEEP)
+_records_lock = threading.Lock()
+
+
+def rss_bytes() -> int:
+    """Current resident set size, 0 if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    """Process-lifetime peak RSS (a high-water mark, it never goes down)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        mem = psutil.Process().memory_info()
+        return getattr(mem, 'peak_wset', mem.rss)
+    except ImportError:
+        return 0
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.t0 = time.perf_counter()
+        self.rss_start = rss_bytes()
+        self.peak_rss_start = peak_rss_bytes()
+        self.baseline = tracemalloc.take_snapshot()
+        self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.best_snapshot = None
+        self.best_label: Optional[str] = None
+        self.best_current = -1
+        self.checkpoints: List[dict] = []
+
+    def checkpoint(self, label: str):
+        current, _peak = tracemalloc.get_traced_memory()
+        self.checkpoints.append({'label': label, 'live_mb': round((current - self.traced_start) / MB, 2)})
+        if current > self.best_current:
+            self.best_current = current
+            self.best_label = label
+            self.best_snapshot = tracemalloc.take_snapshot()
+
+    def finish(self, status: int) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        top = []
+        if self.best_snapshot is not None:
+            stats = self.best_snapshot.compare_to(self.baseline, 'lineno')
+            for st in sorted(stats, key=lambda s: s.size_diff, reverse=True)[:TOP_N]:
+                if st.size_diff <= 0:
+                    break
+                frame = st.traceback[0]
+                top.append({'site': f'{frame.filename}:{frame.lineno}',
+                            'size_kb': round(st.size_diff / 1024, 1), 'count': st.count_diff})
+        peak_mb = round((peak - self.traced_start) / MB, 2)
+        rec = {
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'at': time.time(),
+            'duration_ms': round((time.perf_counter() - self.t0) * 1000, 1),
+            'peak_traced_mb': peak_mb,
+            'retained_mb': round((current - self.traced_start) / MB, 2),
+            'rss_start_mb': round(self.rss_start / MB, 1),
+            'rss_end_mb': round(rss_bytes() / MB, 1),
+            'peak_rss_mb': round(peak_rss_bytes() / MB, 1),
+            'peak_rss_grew_mb': round((peak_rss_bytes() - self.peak_rss_start) / MB, 1),
+            'checkpoints': self.checkpoints,
+            'top_sites_at': self.best_label,
+            'top_sites': top,
+        }
+        if BUDGET_MB is not None:
+            rec['budget_mb'] = BUDGET_MB
+            rec['over_budget'] = peak_mb > BUDGET_MB
+            if rec['over_budget']:
+                logger.warning('[memprofile] %s %s peaked at %.1f MB traced (budget %.0f MB)',
+                               self.method, self.path, peak_mb, BUDGET_MB)
+        return rec
+
+
+def checkpoint(label: str):
+    """Mark a point of high live memory in the current request (no-op when profiling is off)."""
+    prof = _current.get()
+    if prof is not None:
+        try:
+            prof.checkpoint(label)
+        except Exception:
+            pass
+
+
+def records() -> List[dict]:
+    with _records_lock:
+        return list(_records)
+
+
+def clear():
+    with _records_lock:
+        _records.clear()
+
+
+def summary() -> dict:
+    """Per-path aggregates over the kept records."""
+    out = {}
+    for rec in records():
+        s = out.setdefault(rec['path'], {'requests': 0, 'max_peak_traced_mb': 0.0, 'max_retained_mb': 0.0,
+                                         'max_peak_rss_mb': 0.0, 'over_budget': 0})
+        s['requests'] += 1
+        s['max_peak_traced_mb'] = max(s['max_peak_traced_mb'], rec['peak_traced_mb'])
+        s['max_retained_mb'] = max(s['max_retained_mb'], rec['retained_mb'])
+        s['max_peak_rss_mb'] = max(s['max_peak_rss_mb'], rec['peak_rss_mb'])
+        s['over_budget'] += 1 if rec.get('over_budget') else 0
+    return out
+
+
+class MemoryProfileMiddleware:
+    """Profiles requests to PROFILED_PATHS.
+
+    tracemalloc's peak counter is process-wide, so profiled requests are
+    serialised; other requests are not affected.
+    """
+
+    def __init__(self, app: ASGIApp, paths=PROFILED_PATHS):
+        self.app = app
+        self.paths = tuple(paths)
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._profile(scope, receive, send)
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        tracemalloc.reset_peak()
+        prof = RequestProfile(scope['method'], scope['path'])
+        token = _current.set(prof)
+        status = 500
+        rec = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, rec
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                # The handler is done; the response body is still alive here
+                prof.checkpoint('response')
+                rec = prof.finish(status)
+                headers = MutableHeaders(scope=message)
+                headers['X-Memory-Peak-MB'] = str(rec['peak_traced_mb'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if rec is None:
+                rec = prof.finish(status)
+            with _records_lock:
+                _records.append(rec)
+            logger.info('[memprofile] %s %s status=%s peak=%.1fMB retained=%.1fMB rss=%.0fMB',
+                        rec['method'], rec['path'], rec['status'], rec['peak_traced_mb'],
+                        rec['retained_mb'], rec['rss_end_mb'])
+
+
+def debug_memory(reset: bool = False):
+    data = {'enabled': ENABLED, 'budget_mb': BUDGET_MB, 'summary': summary(), 'records': records()}
+    if reset:
+        clear()
+    return data
+
+
+def install(app):
+    """Enable profiling on a FastAPI app when IDCS_MEMPROFILE is set."""
+    if not ENABLED:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(FRAMES)
+    app.add_middleware(MemoryProfileMiddleware)
+    app.add_api_route('/api/debug/memory', debug_memory, methods=['GET'])
+    logger.info('[memprofile] enabled (frames=%d, budget=%s MB)', FRAMES, BUDGET_MB)
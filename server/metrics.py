@@ -0,0 +1,353 @@
+"""Operational metrics in Prometheus text format, served at GET /metrics.
+
+A small in-process registry (no prometheus_client dependency) with
+counters, gauges and histograms, plus collectors that read live state at
+scrape time: executor queue depths, the anyio thread limiter and the
+per-stage histograms from server.timing.
+
+With IDCS_WORKERS > 1 every worker keeps its own registry and a scrape
+lands on whichever worker accepts it; scrape each worker's port or run a
+single worker when exact totals matter.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Request/render latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# SQLite statements are mostly sub-millisecond
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _fmt(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labelstr(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values, **kw):
+        if kw:
+            values = tuple(str(kw[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels(*(() if not self.labelnames else ('',) * len(self.labelnames)))
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield f'{self.name}{_labelstr(self.labelnames, values)} {_fmt(child.value)}'
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    @contextmanager
+    def track(self, *labelvalues):
+        """Count the enclosed block as in progress."""
+        child = self.labels(*labelvalues) if labelvalues else self._default()
+        child.inc()
+        try:
+            yield
+        finally:
+            child.dec()
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield f'{self.name}{_labelstr(self.labelnames, values)} {_fmt(child.value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from histogram_samples(self.name, self.labelnames, values, self.buckets, child.counts, child.sum)
+
+
+def histogram_samples(name, labelnames, values, buckets, counts, total) -> Iterable[str]:
+    cumulative = 0
+    for bound, n in zip(tuple(buckets) + (float('inf'),), counts):
+        cumulative += n
+        yield f'{name}_bucket{_labelstr(labelnames, values, (("le", _fmt(bound)),))} {cumulative}'
+    yield f'{name}_sum{_labelstr(labelnames, values)} {_fmt(total)}'
+    yield f'{name}_count{_labelstr(labelnames, values)} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[str]]):
+        """fn() yields complete exposition lines (HELP/TYPE included); called per scrape."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in list(self._metrics):
+            lines.extend(m.render())
+        for fn in list(self._collectors):
+            try:
+                lines.extend(list(fn()))
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# --- application metrics -------------------------------------------------------
+
+HTTP_REQUESTS = counter('idcs_http_requests_total', 'HTTP requests handled', ('method', 'route', 'status'))
+HTTP_LATENCY = histogram('idcs_http_request_duration_seconds', 'HTTP request latency', ('method', 'route'))
+HTTP_IN_FLIGHT = gauge('idcs_http_requests_in_flight', 'HTTP requests currently being handled')
+RENDERS_IN_FLIGHT = gauge('idcs_renders_in_flight', 'Question papers currently being rendered', ('backend',))
+SQL_LATENCY = histogram('idcs_sqlite_query_duration_seconds', 'SQLite statement execution time', ('op',), SQL_BUCKETS)
+IMAGE_BYTES = counter('idcs_image_bytes_processed_total', 'Bytes of image data decoded, extracted or embedded', ('source',))
+OCR_CALLS = counter('idcs_ocr_invocations_total', 'OCR runs on question images', ('result',))
+CACHE_REQUESTS = counter('idcs_cache_requests_total', 'Cache lookups', ('cache', 'result'))
+SYNC_ROWS = counter('idcs_sync_rows_total', 'Question rows exchanged with Supabase', ('direction',))
+SYNC_CONFLICTS = counter('idcs_sync_conflicts_total', 'Rows changed on both sides between syncs, by winner', ('winner',))
+ACTIVITY_EVENTS = counter('idcs_activity_events_total', 'Question activity events spooled and flushed to the log', ('stage',))
+
+
+def cache_hit(cache: str):
+    CACHE_REQUESTS.labels(cache, 'hit').inc()
+
+
+def cache_miss(cache: str):
+    CACHE_REQUESTS.labels(cache, 'miss').inc()
+
+
+def add_image_bytes(source: str, n: int):
+    if n:
+        IMAGE_BYTES.labels(source).inc(n)
+
+
+def _collect_pools() -> Iterable[str]:
+    from server import executor
+    yield '# HELP idcs_executor_queue_depth Tasks waiting for a worker in each pool'
+    yield '# TYPE idcs_executor_queue_depth gauge'
+    for name, pool in (('io', executor._io_pool), ('cpu', executor._cpu_pool)):
+        q = getattr(pool, '_work_queue', None) if pool is not None else None
+        depth = q.qsize() if q is not None else 0
+        yield f'idcs_executor_queue_depth{{pool="{name}"}} {depth}'
+    yield '# HELP idcs_executor_workers Configured workers per pool'
+    yield '# TYPE idcs_executor_workers gauge'
+    yield f'idcs_executor_workers{{pool="io"}} {executor.IO_WORKERS}'
+    yield f'idcs_executor_workers{{pool="cpu"}} {executor.CPU_WORKERS}'
+    try:
+        import anyio.to_thread
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except Exception:
+        return
+    yield '# HELP idcs_threadpool_busy Threads in use by plain def endpoints'
+    yield '# TYPE idcs_threadpool_busy gauge'
+    yield f'idcs_threadpool_busy {limiter.borrowed_tokens}'
+    yield '# HELP idcs_threadpool_size Thread limit for plain def endpoints'
+    yield '# TYPE idcs_threadpool_size gauge'
+    yield f'idcs_threadpool_size {_fmt(limiter.total_tokens)}'
+
+
+def _collect_stages() -> Iterable[str]:
+    from server import timing
+    name = 'idcs_request_stage_duration_seconds'
+    yield f'# HELP {name} Per-request time spent in each handler stage'
+    yield f'# TYPE {name} histogram'
+    buckets = tuple(b / 1000.0 for b in timing.BUCKETS_MS)
+    for (route, stage_name), h in sorted(timing.histograms().items()):
+        yield from histogram_samples(name, ('route', 'stage'), (route, stage_name), buckets,
+                                     list(h.counts), h.sum / 1000.0)
+
+
+REGISTRY.add_collector(_collect_pools)
+REGISTRY.add_collector(_collect_stages)
+
+
+# --- HTTP instrumentation ------------------------------------------------------
+
+def _route_label(scope: Scope) -> Optional[str]:
+    # FastAPI stores the matched APIRoute in the scope; static files and 404s
+    # have none and share one label so URLs cannot blow up cardinality.
+    route = scope.get('route')
+    return getattr(route, 'path', None)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = 500
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = _route_label(scope) or 'other'
+            HTTP_REQUESTS.labels(scope['method'], route, status).inc()
+            HTTP_LATENCY.labels(scope['method'], route).observe(time.perf_counter() - t0)
+
+
+async def metrics_endpoint():
+    # async so collectors run on the event loop (the anyio limiter lives there)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def install(app):
+    """Register request instrumentation and GET /metrics on a FastAPI app."""
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route('/metrics', metrics_endpoint, methods=['GET'], include_in_schema=False)
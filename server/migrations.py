@@ -0,0 +1,499 @@
+"""Versioned schema migrations for the local SQLite store.
+
+The schema version lives in `PRAGMA user_version`. `migrate` applies each
+pending entry of MIGRATIONS in its own BEGIN EXCLUSIVE transaction. The DDL
+and the version bump commit together, so a failed migration leaves the
+database at the previous version and the next startup retries it. Worker
+processes that start together queue on the exclusive lock and re-check the
+version once they hold it. A store that is already current pays for one
+PRAGMA read.
+
+Rewriting a large table inside that transaction would hold the write lock
+for the whole rewrite. So a migration only queues a named backfill in
+schema_backfills instead. After startup `run_backfills` works through the
+queue in a background thread, in short keyset-paged batches (one
+transaction each, with a pause between them). Request handlers get the
+write lock between batches, and progress survives a restart.
+
+Migrations are append-only. Never edit one that has shipped. Add a new
+version instead.
+
+    python -m server.migrations [--db PATH] [--backfill]
+"""
+import argparse
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from server.db import SQL_NOW, get_conn
+
+logger = logging.getLogger('migrations')
+
+# Rows per backfill transaction, and the pause that lets other writers in between batches
+BACKFILL_BATCH = 500
+BACKFILL_PAUSE = 0.05
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+def _columns(cur, table: str) -> set:
+    return {r[1] for r in cur.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_column(cur, table: str, column: str, decl: str) -> None:
+    # ALTER TABLE has no IF NOT EXISTS; stores touched by hand may have the column already
+    if column not in _columns(cur, table):
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def queue_backfill(cur, name: str) -> None:
+    """Schedule BACKFILLS[name] to run after startup. Call from a migration."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_backfills(
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            done_at TEXT
+        )
+    """)
+    cur.execute('INSERT OR IGNORE INTO schema_backfills(name) VALUES (?)', (name,))
+
+
+# --- migrations -----------------------------------------------------------------
+# Versions 1-3 are the schema init_db created with CREATE ... IF NOT EXISTS
+# before versioning existed, so they are no-ops on stores that already have it.
+
+def _v1_baseline(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS templates(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            total_marks INTEGER,
+            instructions TEXT,
+            sections TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_titles(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT UNIQUE NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question_text TEXT NOT NULL,
+            type TEXT NOT NULL,
+            options TEXT,
+            correct_answer TEXT,
+            answer_text TEXT,
+            btl INTEGER,
+            marks INTEGER,
+            status TEXT,
+            chapter TEXT,
+            course_outcomes TEXT,
+            title_id INTEGER,
+            FOREIGN KEY(title_id) REFERENCES question_bank_titles(id)
+        )
+    """)
+
+
+def _v2_excel_import(cur):
+    # Excel re-import bookkeeping: which workbook row each imported
+    # question came from, and each sheet's fingerprint at last import
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_sources(
+            question_id INTEGER PRIMARY KEY,
+            title_id INTEGER NOT NULL,
+            sheet TEXT NOT NULL,
+            sheet_row INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            FOREIGN KEY(question_id) REFERENCES question_bank(id),
+            FOREIGN KEY(title_id) REFERENCES question_bank_titles(id)
+        )
+    """)
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_question_bank_sources_sheet ON question_bank_sources(title_id, sheet)')
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_imports(
+            title_id INTEGER NOT NULL,
+            sheet TEXT NOT NULL,
+            sheet_hash TEXT NOT NULL,
+            parser_version INTEGER NOT NULL,
+            questions INTEGER NOT NULL,
+            imported_at TEXT NOT NULL,
+            PRIMARY KEY(title_id, sheet),
+            FOREIGN KEY(title_id) REFERENCES question_bank_titles(id)
+        )
+    """)
+
+
+_TICK = "UPDATE sync_state SET value = value + 1 WHERE key = 'clock';"
+_CLOCK = "(SELECT value FROM sync_state WHERE key = 'clock')"
+
+
+def _v3_sync_tracking(cur):
+    """Change tracking for server.sync.
+
+    Triggers stamp every question_bank write with the next value of a
+    persistent clock (sync_state 'clock') and the UTC time; a row is due
+    for push while its version is ahead of synced_version. Deleting a
+    row that exists remotely leaves a tombstone for the next push.
+    """
+    cur.execute('CREATE TABLE IF NOT EXISTS sync_state(key TEXT PRIMARY KEY, value)')
+    cur.execute("INSERT OR IGNORE INTO sync_state(key, value) VALUES ('clock', 0)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_sync(
+            question_id INTEGER PRIMARY KEY,
+            remote_id TEXT UNIQUE,
+            version INTEGER NOT NULL,
+            synced_version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(question_id) REFERENCES question_bank(id)
+        )
+    """)
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_question_bank_sync_version ON question_bank_sync(version)')
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_tombstones(
+            remote_id TEXT PRIMARY KEY,
+            deleted_at TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_titles_sync(
+            title_id INTEGER PRIMARY KEY,
+            remote_id TEXT UNIQUE NOT NULL,
+            FOREIGN KEY(title_id) REFERENCES question_bank_titles(id)
+        )
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_sync_insert AFTER INSERT ON question_bank BEGIN
+            {_TICK}
+            INSERT OR REPLACE INTO question_bank_sync(question_id, version, updated_at) VALUES (NEW.id, {_CLOCK}, {SQL_NOW});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_sync_update AFTER UPDATE ON question_bank BEGIN
+            {_TICK}
+            UPDATE question_bank_sync SET version = {_CLOCK}, updated_at = {SQL_NOW} WHERE question_id = NEW.id;
+            INSERT OR IGNORE INTO question_bank_sync(question_id, version, updated_at) VALUES (NEW.id, {_CLOCK}, {SQL_NOW});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_sync_delete AFTER DELETE ON question_bank BEGIN
+            INSERT OR REPLACE INTO question_bank_tombstones(remote_id, deleted_at)
+                SELECT remote_id, {SQL_NOW} FROM question_bank_sync WHERE question_id = OLD.id AND remote_id IS NOT NULL;
+            DELETE FROM question_bank_sync WHERE question_id = OLD.id;
+        END
+    """)
+    # Questions written before change tracking existed are due for their first push
+    cur.execute(_TICK)
+    cur.execute(f"""
+        INSERT INTO question_bank_sync(question_id, version, updated_at)
+        SELECT id, {_CLOCK}, {SQL_NOW} FROM question_bank WHERE id NOT IN (SELECT question_id FROM question_bank_sync)
+    """)
+
+
+def _v4_sync_columns_only(cur):
+    # Only writes to columns server.sync pushes make a row due; local-only
+    # columns (and backfills of them) no longer queue a re-push of every row
+    cur.execute('DROP TRIGGER IF EXISTS question_bank_sync_update')
+    cur.execute(f"""
+        CREATE TRIGGER question_bank_sync_update AFTER UPDATE OF
+            question_text, type, options, correct_answer, answer_text, btl, marks, status, chapter, course_outcomes, title_id
+        ON question_bank BEGIN
+            {_TICK}
+            UPDATE question_bank_sync SET version = {_CLOCK}, updated_at = {SQL_NOW} WHERE question_id = NEW.id;
+            INSERT OR IGNORE INTO question_bank_sync(question_id, version, updated_at) VALUES (NEW.id, {_CLOCK}, {SQL_NOW});
+        END
+    """)
+
+
+def _v5_supabase_columns(cur):
+    # Columns the Supabase question_bank already has
+    _add_column(cur, 'question_bank', 'image_url', 'TEXT')
+    _add_column(cur, 'question_bank', 'course_outcomes_numbers', 'TEXT')
+    queue_backfill(cur, 'course_outcomes_numbers')
+
+
+def _v6_list_index(cur):
+    # GET /api/question-bank filters by title and status
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_question_bank_title_status ON question_bank(title_id, status)')
+
+
+# question_bank_stats dimensions. NULL keys are stored as '' because SQLite
+# treats NULLs in a primary key as distinct, which would defeat the upsert.
+STATS_DIMENSIONS = ('title_id', 'status', 'course_outcomes', 'btl', 'marks')
+
+
+def _stats_delta(row: str, delta: int) -> str:
+    keys = ', '.join(f"IFNULL({row}.{d}, '')" for d in STATS_DIMENSIONS)
+    return f"""
+        INSERT INTO question_bank_stats({', '.join(STATS_DIMENSIONS)}, questions) VALUES ({keys}, {delta})
+            ON CONFLICT({', '.join(STATS_DIMENSIONS)}) DO UPDATE SET questions = questions + ({delta});"""
+
+
+def _v7_stats(cur):
+    # Question counts per title/status/CO/BTL/marks, kept current by triggers
+    # so dashboards read O(groups) rows instead of the whole bank
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS question_bank_stats(
+            {' NOT NULL, '.join(STATS_DIMENSIONS)} NOT NULL,
+            questions INTEGER NOT NULL,
+            PRIMARY KEY({', '.join(STATS_DIMENSIONS)})
+        ) WITHOUT ROWID
+    """)
+    cur.execute('DELETE FROM question_bank_stats')
+    keys = ', '.join(f"IFNULL({d}, '')" for d in STATS_DIMENSIONS)
+    cur.execute(f"""
+        INSERT INTO question_bank_stats({', '.join(STATS_DIMENSIONS)}, questions)
+        SELECT {keys}, COUNT(*) FROM question_bank GROUP BY {keys}
+    """)
+    prune = "DELETE FROM question_bank_stats WHERE questions <= 0;"
+    changed = ' OR '.join(f'OLD.{d} IS NOT NEW.{d}' for d in STATS_DIMENSIONS)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_stats_insert AFTER INSERT ON question_bank BEGIN
+            {_stats_delta('NEW', 1)}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_stats_update AFTER UPDATE OF {', '.join(STATS_DIMENSIONS)}
+        ON question_bank WHEN {changed} BEGIN
+            {_stats_delta('OLD', -1)}
+            {_stats_delta('NEW', 1)}
+            {prune}
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS question_bank_stats_delete AFTER DELETE ON question_bank BEGIN
+            {_stats_delta('OLD', -1)}
+            {prune}
+        END
+    """)
+
+
+def _v8_activity_log(cur):
+    # Local counterpart of Supabase's question_activity_logs (ids are local integers)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS question_activity_logs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT NOT NULL,
+            question_id INTEGER,
+            title_id INTEGER,
+            details TEXT,
+            created_at TEXT NOT NULL DEFAULT ({SQL_NOW})
+        )
+    """)
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_question_activity_logs_created_at ON question_activity_logs(created_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_question_activity_logs_question_id ON question_activity_logs(question_id)')
+
+
+def _v9_activity_event_ids(cur):
+    # Events replayed from the activity spool after a crash are matched on event_id
+    _add_column(cur, 'question_activity_logs', 'event_id', 'TEXT')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_question_activity_logs_event_id ON question_activity_logs(event_id)')
+
+
+# Columns server.sync pushes as of migration 10
+_SYNCED_V10 = ('question_text', 'type', 'options', 'correct_answer', 'answer_text', 'btl', 'marks', 'status', 'chapter',
+               'course_outcomes', 'course_outcomes_numbers', 'image_url', 'title_id')
+
+
+def _v10_sync_image_columns(cur):
+    """Sync image_url and course_outcomes_numbers, which migration 5 added.
+
+    Edits to either column now make a row due for push. Filling in a
+    missing course_outcomes_numbers without touching anything else (the
+    migration 5 backfill) does not: the value is derived from
+    course_outcomes. Rows pushed before carried neither column, so those
+    with a local picture are queued again. Their updated_at is kept, so a
+    later remote edit still wins. The pull high-water mark is cleared, so
+    the next sync brings down the remote values of both columns.
+    """
+    derived_fill = ' AND '.join(['OLD.course_outcomes_numbers IS NULL', 'NEW.course_outcomes_numbers IS NOT NULL'] +
+                                [f'OLD.{c} IS NEW.{c}' for c in _SYNCED_V10 if c != 'course_outcomes_numbers'])
+    cur.execute('DROP TRIGGER IF EXISTS question_bank_sync_update')
+    cur.execute(f"""
+        CREATE TRIGGER question_bank_sync_update AFTER UPDATE OF {', '.join(_SYNCED_V10)}
+        ON question_bank WHEN NOT ({derived_fill}) BEGIN
+            {_TICK}
+            UPDATE question_bank_sync SET version = {_CLOCK}, updated_at = {SQL_NOW} WHERE question_id = NEW.id;
+            INSERT OR IGNORE INTO question_bank_sync(question_id, version, updated_at) VALUES (NEW.id, {_CLOCK}, {SQL_NOW});
+        END
+    """)
+    cur.execute(_TICK)
+    cur.execute(f"""
+        UPDATE question_bank_sync SET version = {_CLOCK}
+        WHERE remote_id IS NOT NULL AND question_id IN (SELECT id FROM question_bank WHERE image_url IS NOT NULL)
+    """)
+    cur.execute("DELETE FROM sync_state WHERE key IN ('pull_since', 'pull_since_id')")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'baseline', _v1_baseline),
+    Migration(2, 'excel_import', _v2_excel_import),
+    Migration(3, 'sync_tracking', _v3_sync_tracking),
+    Migration(4, 'sync_columns_only', _v4_sync_columns_only),
+    Migration(5, 'supabase_columns', _v5_supabase_columns),
+    Migration(6, 'list_index', _v6_list_index),
+    Migration(7, 'question_bank_stats', _v7_stats),
+    Migration(8, 'activity_log', _v8_activity_log),
+    Migration(9, 'activity_event_ids', _v9_activity_event_ids),
+    Migration(10, 'sync_image_columns', _v10_sync_image_columns),
+]
+LATEST = MIGRATIONS[-1].version
+
+
+def schema_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, migrations: Optional[List[Migration]] = None) -> List[int]:
+    """Apply pending migrations, one transaction each. Returns the versions applied.
+
+    `conn` must be in autocommit mode (isolation_level None).
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    latest = migrations[-1].version
+    current = schema_version(conn)
+    if current > latest:
+        logger.warning('Database schema v%d is newer than this build (v%d); leaving it as is', current, latest)
+    if current >= latest:
+        return []
+    applied = []
+    for m in migrations:
+        if m.version <= current:
+            continue
+        t = time.perf_counter()
+        # BEGIN EXCLUSIVE doubles as a cross-process lock: workers that
+        # start together queue here instead of racing on DDL
+        conn.execute('BEGIN EXCLUSIVE')
+        try:
+            current = schema_version(conn)
+            if m.version <= current:
+                conn.execute('ROLLBACK')
+                continue
+            m.apply(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {m.version:d}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        current = m.version
+        applied.append(m.version)
+        logger.info('Applied migration %d (%s) in %.0f ms', m.version, m.name, (time.perf_counter() - t) * 1000)
+    return applied
+
+
+# --- backfills --------------------------------------------------------------------
+# name -> fn(cursor, after_id, limit): process up to `limit` rows with id >
+# after_id and return the last id handled, or None once nothing is left.
+
+def _backfill_co_numbers(cur, after_id: int, limit: int) -> Optional[int]:
+    from server.routes.upload_questions_excel import co_numbers
+    rows = cur.execute('SELECT id, course_outcomes FROM question_bank WHERE id > ? ORDER BY id LIMIT ?',
+                       (after_id, limit)).fetchall()
+    if not rows:
+        return None
+    cur.executemany('UPDATE question_bank SET course_outcomes_numbers=? WHERE id=? AND course_outcomes_numbers IS NULL',
+                    [(co_numbers(co), qid) for qid, co in rows if co])
+    return rows[-1][0]
+
+
+BACKFILLS: Dict[str, Callable] = {
+    'course_outcomes_numbers': _backfill_co_numbers,
+}
+
+
+def pending_backfills(conn) -> List[str]:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_backfills'").fetchone() is None:
+        return []
+    return [name for (name,) in conn.execute('SELECT name FROM schema_backfills WHERE done_at IS NULL ORDER BY rowid')]
+
+
+def run_backfills(connect: Callable = get_conn, batch: int = BACKFILL_BATCH, pause: float = BACKFILL_PAUSE) -> Dict[str, int]:
+    """Run queued backfills to completion. Returns batches run per backfill.
+
+    The cursor is read inside each batch's transaction, so several worker
+    processes running this at once share the work instead of repeating it.
+    """
+    conn = connect()
+    conn.isolation_level = None
+    done: Dict[str, int] = {}
+    try:
+        for name in pending_backfills(conn):
+            fn = BACKFILLS.get(name)
+            if fn is None:
+                logger.warning('No backfill named %r in this build; skipping', name)
+                continue
+            t = time.perf_counter()
+            batches = 0
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    after, finished = conn.execute('SELECT last_id, done_at FROM schema_backfills WHERE name=?', (name,)).fetchone()
+                    last = None if finished else fn(conn.cursor(), after, batch)
+                    if last is None:
+                        conn.execute(f'UPDATE schema_backfills SET done_at = COALESCE(done_at, {SQL_NOW}) WHERE name=?', (name,))
+                    else:
+                        conn.execute('UPDATE schema_backfills SET last_id=? WHERE name=?', (last, name))
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+                if last is None:
+                    break
+                batches += 1
+                if pause:
+                    time.sleep(pause)
+            done[name] = batches
+            logger.info('Backfill %s finished: %d batches in %.0f ms', name, batches, (time.perf_counter() - t) * 1000)
+    finally:
+        conn.close()
+    return done
+
+
+def _backfill_thread():
+    try:
+        run_backfills()
+    except Exception:
+        # Progress is committed per batch; the next startup resumes from there
+        logger.exception('Backfill failed')
+
+
+def start_backfills() -> threading.Thread:
+    t = threading.Thread(target=_backfill_thread, name='idcs-backfill', daemon=True)
+    t.start()
+    return t
+
+
+def install(app):
+    """Run queued backfills in the background once the app has started."""
+    app.add_event_handler('startup', start_backfills)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Show or bring up to date the local store schema.')
+    ap.add_argument('--db', default=None, help='database path (default: the app\'s local_store.db)')
+    ap.add_argument('--backfill', action='store_true', help='also run queued backfills to completion')
+    args = ap.parse_args(argv)
+    from server.db import init_db
+    init_db(args.db)
+    if args.backfill:
+        run_backfills(lambda: get_conn(args.db), pause=0)
+    conn = get_conn(args.db)
+    try:
+        print(f'schema version {schema_version(conn)} (latest {LATEST})')
+        for name in pending_backfills(conn):
+            print(f'backfill pending: {name}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Seeded paper generation and the rendered-paper cache.
+
+Question selection and the BTL fallbacks in the generate-docx renderers
+draw from a random.Random seeded per request, so the same questions, header
+fields and seed always give the same paper. The seed is the `seed` form
+field if given. Otherwise it is derived from the request itself, so that
+a plain reprint gets the same paper again. Responses report it in
+X-Paper-Seed.
+
+Rendered .docx and .pdf files are kept in a DiskCache (<data dir>/cache/papers).
+The key is a hash of the renderer's layout version, the canonicalized
+questions, the header fields and the seed. Bump a renderer's
+PAPER_LAYOUT_VERSION whenever its output changes. Images referenced by
+http URL are part of the key only as URLs, since fetching them to hash
+their bytes would cost a cache hit as much as a render. Entries expire
+IDCS_PAPER_CACHE_DAYS after they were rendered, however often they are
+reprinted (see DiskCache), so a picture changed at its URL is in every
+paper rendered after that.
+
+    IDCS_PAPER_CACHE=0          disable
+    IDCS_PAPER_CACHE_MB=512     size budget (least recently used evicted first)
+    IDCS_PAPER_CACHE_DAYS=30    maximum entry age
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.responses import Response
+
+from server.diskcache import DiskCache
+from server.question import Question, parse_questions
+
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_MIME = 'application/pdf'
+
+PAPER_CACHE_ENABLED = (os.environ.get('IDCS_PAPER_CACHE') or '1').strip().lower() not in ('0', 'false', 'no', 'off')
+paper_cache = DiskCache(
+    'papers',
+    max_bytes=int(float(os.environ.get('IDCS_PAPER_CACHE_MB') or 512) * 1024 * 1024),
+    max_age=float(os.environ.get('IDCS_PAPER_CACHE_DAYS') or 30) * 86400,
+)
+
+# Seeds are kept below 2**53 so they survive a round trip through JavaScript numbers
+_SEED_MASK = (1 << 53) - 1
+
+
+def parse_seed(seed: Optional[str]) -> Optional[int]:
+    """The `seed` form field as an int; None when blank. Raises ValueError if it is not an integer."""
+    if seed is None or not str(seed).strip():
+        return None
+    return int(str(seed).strip()) & _SEED_MASK
+
+
+def _content_digest(questions: List[Question], fields: dict) -> bytes:
+    h = hashlib.sha256()
+    for q in questions:
+        h.update(b'\x1e')
+        h.update(json.dumps([getattr(q, name) for name in Question.__slots__], default=str,
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    h.update(b'\x1d')
+    h.update(json.dumps(fields, sort_keys=True, default=str, ensure_ascii=False).encode('utf-8'))
+    return h.digest()
+
+
+def _key(layout: str, content: bytes, seed: int, ext: str) -> str:
+    key = hashlib.sha256(b'%s\x1f%s\x1f%d' % (layout.encode('utf-8'), content, seed)).hexdigest()
+    return f'{key}.{ext}'
+
+
+def paper_keys(layouts: Sequence[Tuple[str, str]], raw_questions, fields: dict,
+               seed: Optional[int]) -> Tuple[List[Question], int, List[str]]:
+    """-> (parsed questions, seed to render with, one cache key per (layout, ext)).
+
+    `layout` names the renderer and its PAPER_LAYOUT_VERSION. `fields` are
+    the header form fields that change the rendered document. A derived
+    seed depends only on the questions and fields, so the DOCX, PDF and
+    preview of one request show the same paper. The questions are parsed
+    and hashed once however many documents are keyed.
+    """
+    questions = parse_questions(raw_questions)
+    content = _content_digest(questions, fields)
+    if seed is None:
+        seed = int.from_bytes(content[:8], 'big') & _SEED_MASK
+    return questions, seed, [_key(layout, content, seed, ext) for layout, ext in layouts]
+
+
+def paper_key(layout: str, raw_questions, fields: dict, seed: Optional[int], ext: str = 'docx') -> Tuple[List[Question], int, str]:
+    """paper_keys() for a single document."""
+    questions, seed, keys = paper_keys([(layout, ext)], raw_questions, fields, seed)
+    return questions, seed, keys[0]
+
+
+def lookup_paper(layout: str, raw_questions, fields: dict, seed: Optional[int],
+                 ext: str = 'docx') -> Tuple[List[Question], int, str, Optional[bytes]]:
+    """paper_key() plus the cached bytes for the key, or None."""
+    questions, seed, key = paper_key(layout, raw_questions, fields, seed, ext)
+    return questions, seed, key, paper_cache.get(key) if PAPER_CACHE_ENABLED else None
+
+
+def lookup_papers(layouts: Sequence[Tuple[str, str]], raw_questions, fields: dict,
+                  seed: Optional[int]) -> Tuple[List[Question], int, List[Tuple[str, Optional[bytes]]]]:
+    """paper_keys() with each key's cached bytes, or None."""
+    questions, seed, keys = paper_keys(layouts, raw_questions, fields, seed)
+    return questions, seed, [(key, paper_cache.get(key) if PAPER_CACHE_ENABLED else None) for key in keys]
+
+
+def store_paper(key: str, path: str) -> None:
+    """Keep a freshly rendered paper for the next request with the same key."""
+    if PAPER_CACHE_ENABLED:
+        with open(path, 'rb') as f:
+            paper_cache.put(key, f.read())
+
+
+def store_paper_bytes(key: str, data: bytes) -> None:
+    if PAPER_CACHE_ENABLED:
+        paper_cache.put(key, data)
+
+
+def paper_headers(seed: int, cache: str) -> Dict[str, str]:
+    return {'X-Paper-Seed': str(seed), 'X-Paper-Cache': cache if PAPER_CACHE_ENABLED else 'off'}
+
+
+def cached_paper_response(data: bytes, seed: int, media_type: str = DOCX_MIME, filename: str = 'question_paper.docx') -> Response:
+    return Response(data, media_type=media_type, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"', **paper_headers(seed, 'hit')})
@@ -0,0 +1,119 @@
+"""Part A/B/C layout of a question paper, shared by the DOCX and HTML renderers.
+
+layout_paper() decides what goes in every cell of the three question tables:
+numbering, (OR) rows, the CO/BTL/marks fallbacks, and the seeded BTL draws
+for Part A questions that have none. Renderers only draw it, so an HTML
+preview and the final DOCX for the same questions and seed show the same
+paper.
+"""
+import random
+import re
+from collections import defaultdict
+from typing import List, NamedTuple, Optional
+
+from server.question import Question
+
+PART_A_HEADING = 'PART- A                                                                (10 x 2 = 20 Marks)'
+PART_B_HEADING = 'PART – B                          (5 x 16 = 80 Marks)'
+
+_LABEL_RE = re.compile(r'^\s*[DO]\.[\s-]*', re.IGNORECASE)
+
+
+class PaperRow(NamedTuple):
+    number: str
+    question: Question
+    text: str
+    co: str
+    btl: str
+    marks: str
+
+
+class PaperLayout(NamedTuple):
+    part_a: List[PaperRow]
+    # None entries are (OR) rows
+    part_b: List[Optional[PaperRow]]
+    part_c_heading: Optional[str]
+    part_c: List[Optional[PaperRow]]
+
+
+def _btl_label(q: Question) -> str:
+    btl = q.str_of('btl')
+    return f'BTL{btl}' if btl and not btl.upper().startswith('BTL') else btl
+
+
+def _part_a(questions: List[Question], rng: random.Random) -> List[PaperRow]:
+    shared_btl = rng.choice([3, 4, 5])
+    rows = []
+    for idx, q in enumerate(questions[:10], start=1):
+        text = _LABEL_RE.sub('', q.text) if q.text else q.text
+        co = q.co or f'CO{(idx + 1) // 2}'
+        btl = q.btl or (shared_btl if idx > 4 else rng.choice([1, 2, 3, 4, 5]))
+        rows.append(PaperRow(str(idx), q, text, str(co), f'BTL{btl}', '2'))
+    return rows
+
+
+def _part_b(questions: List[Question]) -> List[Optional[PaperRow]]:
+    groups = defaultdict(list)
+    for q in questions:
+        if str(q.get('part', '')).upper() == 'B':
+            groups[q.number].append(q)
+
+    def sort_key(k):
+        try:
+            return int(str(k).split('.')[0])
+        except Exception:
+            return 9999
+    rows: List[Optional[PaperRow]] = []
+    for base in sorted(groups.keys(), key=sort_key):
+        group = groups[base]
+        group.sort(key=lambda x: str(x.get('sub', 'a')))
+        has_b = any(str(x.get('sub', '')).lower() == 'b' for x in group)
+        for idx_in, q in enumerate(group):
+            sub = q.get('sub')
+            rows.append(PaperRow(f'{base}.{sub}' if sub else str(base), q, q.text, q.str_of('co'), _btl_label(q),
+                                 q.str_of('marks') or '16'))
+            if idx_in == 0 and has_b:
+                rows.append(None)
+    return rows
+
+
+def _part_c(questions: List[Question]):
+    items = [q for q in questions if str(q.get('part', '')).upper() == 'C']
+    if not items:
+        return None, []
+    groups = defaultdict(list)
+    for q in items:
+        key = str(q.number or q.base_number or 16)
+        # Normalize to the base number, such as 16
+        try:
+            key = str(int(str(key).split('.')[0]))
+        except Exception:
+            key = '16'
+        groups[key].append(q)
+    # The first question's marks stand for the whole part
+    proj_marks = items[0].marks or '10'
+    try:
+        count_pairs = len(groups)
+        heading = f'PART – C                          ({count_pairs} x {proj_marks} = {int(str(proj_marks)) * count_pairs} Marks)'
+    except Exception:
+        heading = 'PART – C'
+    rows: List[Optional[PaperRow]] = []
+    for base in sorted(groups.keys(), key=int):
+        group = groups[base]
+        try:
+            group.sort(key=lambda q: str(q.get('sub', 'a')))
+        except Exception:
+            pass
+        first = group[0]
+        second = group[1] if len(group) > 1 else Question()
+        rows.append(PaperRow(f'{base}.a', first, first.text, first.str_of('co'), _btl_label(first), str(first.get('marks', ''))))
+        rows.append(None)
+        rows.append(PaperRow(f'{base}.b', second, second.text, second.str_of('co'), _btl_label(second), str(second.get('marks', ''))))
+    return heading, rows
+
+
+def layout_paper(questions: List[Question], seed: int) -> PaperLayout:
+    """Lay out canonicalized questions; BTL fallbacks draw from random.Random(seed)."""
+    rng = random.Random(seed)
+    heading_c, part_c = _part_c(questions)
+    return PaperLayout(_part_a(questions, rng), _part_b(questions), heading_c, part_c)
@@ -0,0 +1,300 @@
+"""PDF rendering of question papers, with no Word or office suite involved.
+
+Draws the same paper_layout.PaperLayout as the DOCX renderer with ReportLab:
+the Reg. No. boxes, the header lines, the Part A/B/C tables with their (OR)
+rows, pictures and the footer. Several papers can go into one PDF, each
+starting on a new page, for printing whole sets.
+
+Work that does not depend on the paper is done once per process. The font
+family is registered on first use. Paragraph and table styles are built
+once. Decoded pictures are kept in a small LRU keyed by a hash of their URL,
+so a batch that repeats a figure decodes it once. Pictures fetched over
+http are refetched after REMOTE_PICTURE_TTL seconds, so a picture changed
+at its URL reaches the next render. Output is invariant (no
+timestamps or random IDs), so the same paper always gives the same bytes.
+
+    IDCS_PDF_FONT=builtin     use the PDF core Times fonts instead of a system serif TTF
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from server.metrics import add_image_bytes
+from server.paper_layout import PART_A_HEADING, PART_B_HEADING, PaperLayout, PaperRow
+from server.question import Question
+from server.timing import Stopwatch
+
+MARGIN = 0.5 * inch
+FRAME_WIDTH = A4[0] - 2 * MARGIN
+BOX_COUNT = 16
+PICTURE_MAX_WIDTH = 2.5 * inch
+_WIDTHS_A = (0.7, 4.2, 0.8, 0.8, 0.8)
+_WIDTHS_BC = (0.9, 4.5, 0.9, 0.9, 1.0)
+_DATA_URL_RE = re.compile(r'data:image/[\w.+-]+;base64,', re.I)
+
+# (directory, (regular, bold, italic, bold italic)); the first family whose
+# regular and bold faces exist is used
+_FONT_FAMILIES = (
+    (os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'), ('times.ttf', 'timesbd.ttf', 'timesi.ttf', 'timesbi.ttf')),
+    ('/usr/share/fonts/truetype/liberation',
+     ('LiberationSerif-Regular.ttf', 'LiberationSerif-Bold.ttf', 'LiberationSerif-Italic.ttf', 'LiberationSerif-BoldItalic.ttf')),
+    ('/usr/share/fonts/truetype/dejavu', ('DejaVuSerif.ttf', 'DejaVuSerif-Bold.ttf', 'DejaVuSerif-Italic.ttf', 'DejaVuSerif-BoldItalic.ttf')),
+)
+_BUILTIN_FONTS = ('Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic')
+
+
+@lru_cache(maxsize=1)
+def fonts() -> Tuple[str, str, str, str]:
+    """-> (regular, bold, italic, bold italic) font names, registering a system serif TTF on first call.
+
+    TTFs cover the symbols and Greek letters found in engineering questions;
+    the core Times fonts only cover Latin-1.
+    """
+    if (os.environ.get('IDCS_PDF_FONT') or '').lower() == 'builtin':
+        return _BUILTIN_FONTS
+    for directory, files in _FONT_FAMILIES:
+        paths = [os.path.join(directory, f) for f in files]
+        if not (os.path.isfile(paths[0]) and os.path.isfile(paths[1])):
+            continue
+        # Families without italic faces fall back to the upright ones
+        paths[2] = paths[2] if os.path.isfile(paths[2]) else paths[0]
+        paths[3] = paths[3] if os.path.isfile(paths[3]) else paths[1]
+        names = ('PaperSerif', 'PaperSerif-Bold', 'PaperSerif-Italic', 'PaperSerif-BoldItalic')
+        try:
+            for name, path in zip(names, paths):
+                pdfmetrics.registerFont(TTFont(name, path))
+        except (TTFError, OSError):
+            continue
+        pdfmetrics.registerFontFamily(names[0], normal=names[0], bold=names[1], italic=names[2], boldItalic=names[3])
+        return names
+    return _BUILTIN_FONTS
+
+
+@lru_cache(maxsize=1)
+def styles() -> Dict[str, object]:
+    regular, bold, italic, _ = fonts()
+
+    def para(name, font, size, align=TA_CENTER, **kw):
+        return ParagraphStyle(name, fontName=font, fontSize=size, leading=size * 1.2, alignment=align, **kw)
+
+    grid = [
+        ('GRID', (0, 0), (-1, -1), 0.75, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 5.4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 5.4),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+    ]
+    return {
+        'college': para('college', bold, 14, spaceBefore=6),
+        'bold12': para('bold12', bold, 12),
+        'bold10': para('bold10', bold, 10),
+        'line11': para('line11', regular, 11),
+        'italic11': para('italic11', italic, 11),
+        'left11': para('left11', regular, 11, TA_LEFT),
+        'right11': para('right11', regular, 11, TA_RIGHT),
+        'heading': para('heading', bold, 12, spaceBefore=6, spaceAfter=4),
+        'heading_right': para('heading_right', bold, 12, TA_RIGHT, spaceBefore=6, spaceAfter=4),
+        'cell': para('cell', regular, 12, TA_LEFT),
+        'cell_center': para('cell_center', regular, 12),
+        'cell_head': para('cell_head', bold, 12),
+        'grid': grid,
+        'reg': TableStyle([('GRID', (0, 0), (-1, -1), 1.5, colors.black), ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]),
+        'box': TableStyle([('BOX', (0, 0), (-1, -1), 0.75, colors.black), ('FONTNAME', (0, 0), (-1, -1), bold),
+                           ('FONTSIZE', (0, 0), (-1, -1), 12), ('ALIGN', (0, 0), (-1, -1), 'CENTER')]),
+        'plain': TableStyle([('LEFTPADDING', (0, 0), (-1, -1), 0), ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]),
+    }
+
+
+# Seconds a picture fetched over http is reused before it is fetched again
+REMOTE_PICTURE_TTL = 300.0
+
+
+class _PictureCache:
+    """LRU of url digest -> (image bytes, width px, height px); None for data: URLs that did not decode."""
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        # digest -> (entry, monotonic time it expires at; None for data: URLs)
+        self._entries: 'OrderedDict[str, Tuple[Optional[Tuple[bytes, int, int]], Optional[float]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Tuple[bytes, int, int]]:
+        digest = hashlib.sha256(url.encode('utf-8', 'replace')).hexdigest()
+        with self._lock:
+            cached = self._entries.get(digest)
+            if cached is not None and (cached[1] is None or cached[1] > time.monotonic()):
+                self._entries.move_to_end(digest)
+                return cached[0]
+        entry = _load_picture(url)
+        remote = not url.startswith('data:')
+        if entry is None and remote:
+            # A failed download may work next time
+            return None
+        with self._lock:
+            self._entries[digest] = (entry, time.monotonic() + REMOTE_PICTURE_TTL if remote else None)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_picture(url: str) -> Optional[Tuple[bytes, int, int]]:
+    from PIL import Image as PILImage
+    m = _DATA_URL_RE.match(url)
+    try:
+        if m:
+            data = base64.b64decode(url[m.end():])
+        elif url.startswith(('http://', 'https://')):
+            import requests
+            resp = requests.get(url, timeout=10)
+            if resp.status_code != 200:
+                return None
+            data = resp.content
+        else:
+            return None
+        with PILImage.open(BytesIO(data)) as im:
+            if im.format not in ('PNG', 'JPEG'):
+                buf = BytesIO()
+                im.save(buf, 'PNG')
+                data = buf.getvalue()
+            width, height = im.size
+    except Exception:
+        # Bad base64, an unreachable URL or bytes Pillow cannot decode: print without the picture
+        return None
+    add_image_bytes('paper_pdf', len(data))
+    return data, width, height
+
+
+pictures = _PictureCache()
+
+
+def _scaled(widths_in) -> List[float]:
+    widths = [w * inch for w in widths_in]
+    total = sum(widths)
+    return [w * FRAME_WIDTH / total for w in widths] if total > FRAME_WIDTH else widths
+
+
+def _text(s) -> str:
+    return escape(str(s or '')).replace('\n', '<br/>')
+
+
+def _picture(q: Question, max_width: float):
+    url = q.image
+    if not url or not isinstance(url, str):
+        return None
+    entry = pictures.get(url)
+    if entry is None:
+        return None
+    data, px_w, px_h = entry
+    # Pictures are drawn at 96 dpi, shrunk to fit the question cell
+    width = min(px_w * 0.75, max_width, PICTURE_MAX_WIDTH)
+    return Image(BytesIO(data), width=width, height=width * px_h / px_w, hAlign='LEFT')
+
+
+def _heading(text: str):
+    # The DOCX headings pad the marks to the right with spaces
+    s = styles()
+    title, _, marks = re.sub(r' {2,}', '\x00', text).partition('\x00')
+    t = Table([['', Paragraph(_text(title), s['heading']), Paragraph(_text(marks), s['heading_right'])]],
+              colWidths=[FRAME_WIDTH / 4, FRAME_WIDTH / 2, FRAME_WIDTH / 4])
+    t.setStyle(s['plain'])
+    return t
+
+
+def _question_table(widths_in, header, rows: List[Optional[PaperRow]]):
+    s = styles()
+    widths = _scaled(widths_in)
+    data = [[Paragraph(_text(h), s['cell_head']) for h in header]]
+    commands = list(s['grid'])
+    for row in rows:
+        if row is None:
+            commands.append(('SPAN', (0, len(data)), (-1, len(data))))
+            data.append([Paragraph('(OR)', s['cell_head']), '', '', '', ''])
+            continue
+        question = [Paragraph(_text(row.text), s['cell'])]
+        img = _picture(row.question, widths[1] - 11)
+        if img is not None:
+            question += [Spacer(1, 4), img]
+        data.append([Paragraph(_text(row.number), s['cell_center']), question, Paragraph(_text(row.co), s['cell_center']),
+                     Paragraph(_text(row.btl), s['cell_center']), Paragraph(_text(row.marks), s['cell_center'])])
+    t = Table(data, colWidths=widths, repeatRows=1, hAlign='CENTER')
+    t.setStyle(TableStyle(commands))
+    return t
+
+
+def _paper_story(layout: PaperLayout, fields: Dict[str, str]) -> list:
+    s = styles()
+    get = lambda name: fields.get(name) or ''  # noqa: E731
+    reg = Table([[Paragraph('Reg.<br/>No.:', s['bold10'])] + [''] * BOX_COUNT],
+                colWidths=[0.6 * inch] + [0.25 * inch] * BOX_COUNT, rowHeights=[0.5 * inch], hAlign='CENTER')
+    reg.setStyle(s['reg'])
+    qp_box = Table([[f"Question Paper Code: {get('qpcode')}"]], hAlign='CENTER')
+    qp_box.setStyle(s['box'])
+    story = [reg, Paragraph('K. RAMAKRISHNAN COLLEGE OF ENGINEERING', s['college']), Paragraph('(AUTONOMOUS)', s['bold12']),
+             Spacer(1, 4), qp_box]
+    exam_title = get('exam_title')
+    if exam_title.strip() and not exam_title.lower().startswith('question paper code:'):
+        story.append(Paragraph(_text(exam_title), s['bold12']))
+    story.append(Paragraph(_text(get('semester')), s['italic11']))
+    if get('dept'):
+        story.append(Paragraph(_text(get('dept')), s['italic11']))
+    story.append(Paragraph(_text(f"{get('cc')} – {get('cn')}"), s['bold12']))
+    story.append(Paragraph(_text(f"({get('regulation')})"), s['line11']))
+    times = Table([[Paragraph('Time: Three Hours', s['left11']), Paragraph('Maximum Marks: 100 Marks', s['right11'])]],
+                  colWidths=[FRAME_WIDTH / 2] * 2)
+    times.setStyle(s['plain'])
+    story += [times, Spacer(1, 8)]
+
+    story += [_heading(PART_A_HEADING), _question_table(_WIDTHS_A, ('Q.No.', 'Answer ALL Questions', 'CO', 'BTL', 'Marks'), layout.part_a)]
+    story += [_heading(PART_B_HEADING), _question_table(_WIDTHS_BC, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'), layout.part_b)]
+    if layout.part_c:
+        story += [_heading(layout.part_c_heading),
+                  _question_table(_WIDTHS_BC, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'), layout.part_c)]
+    story += [Spacer(1, 12), Paragraph('******************', s['bold12']), Paragraph(_text(get('qpcode')), s['bold12'])]
+    return story
+
+
+def render_papers_pdf(papers: Iterable[Tuple[PaperLayout, Dict[str, str]]], title: str = 'Question papers') -> bytes:
+    """One PDF holding every (layout, header fields) paper, each from a new page."""
+    sw = Stopwatch()
+    story = []
+    for layout, fields in papers:
+        if story:
+            story.append(PageBreak())
+        story += _paper_story(layout, fields)
+    sw.lap('pdf_story')
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN,
+                            title=title, author='K. Ramakrishnan College of Engineering', invariant=1)
+    doc.build(story)
+    sw.lap('pdf_build')
+    return buf.getvalue()
+
+
+def render_paper_pdf(layout: PaperLayout, fields: Dict[str, str]) -> bytes:
+    """The paper as PDF bytes. `fields` are the generate-docx header fields."""
+    title = f"{fields.get('qpcode') or ''} {fields.get('cn') or ''}".strip() or 'Question paper'
+    return render_papers_pdf([(layout, fields)], title=title)
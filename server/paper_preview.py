@@ -0,0 +1,170 @@
+"""HTML preview of a question paper.
+
+Draws the same paper_layout.PaperLayout as the DOCX renderer, inside the
+college styling of html_template_source.html. The template is compiled
+once, on first use, into alternating literal and «field» segments. A
+preview is then string joins plus the table rows, with no document model.
+
+Pictures are not inlined. A data: URL is written once to a content-addressed
+DiskCache (cache/preview_images) and referenced by URL. The image route
+serves it with a long max-age, so re-previewing the same selection reloads
+nothing. http(s) image URLs are referenced as they are.
+"""
+import base64
+import hashlib
+import html
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from server.diskcache import DiskCache
+from server.paper_layout import PART_A_HEADING, PART_B_HEADING, PaperLayout, PaperRow
+from server.question import Question
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html_template_source.html')
+
+preview_images = DiskCache(
+    'preview_images',
+    max_bytes=int(float(os.environ.get('IDCS_PREVIEW_IMAGE_CACHE_MB') or 128) * 1024 * 1024),
+    max_age=7 * 86400,
+)
+IMAGE_TYPES = {'png': 'image/png', 'jpeg': 'image/jpeg', 'jpg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp'}
+_DATA_URL_RE = re.compile(r'data:image/(png|jpeg|jpg|gif|webp);base64,', re.I)
+_FIELD_RE = re.compile('«(\\w+)»')
+
+# Table rules and cell layout the template leaves to Word
+_EXTRA_CSS = """
+			table.qp { margin:0pt auto 8pt; border-collapse:collapse }
+			table.qp td { border:0.75pt solid #000000; padding:2pt 5.4pt; vertical-align:top; font-family:'Times New Roman'; font-size:12pt }
+			table.qp tr.head td { font-weight:bold; text-align:center }
+			table.qp td.c { text-align:center }
+			table.qp img { display:block; max-width:2.5in; height:auto; margin-top:4pt }
+"""
+_WIDTHS_A = ('0.7in', '4.2in', '0.8in', '0.8in', '0.8in')
+_WIDTHS_BC = ('0.9in', '4.5in', '0.9in', '0.9in', '1.0in')
+
+Compiled = Tuple[str, ...]
+
+
+def _compile(source: str) -> Compiled:
+    """-> (literal, field, literal, field, ..., literal) for a «field» template."""
+    return tuple(_FIELD_RE.split(source))
+
+
+def _fill(compiled: Compiled, values: Dict[str, str]) -> str:
+    parts = list(compiled)
+    parts[1::2] = [values[name] for name in compiled[1::2]]
+    return ''.join(parts)
+
+
+def _paragraph(source: str, text: str) -> Tuple[int, int]:
+    """-> (start, end) of the <p> element containing `text`."""
+    i = source.index(text)
+    return source.rindex('<p', 0, i), source.index('</p>', i) + len('</p>')
+
+
+@lru_cache(maxsize=1)
+def compiled_template() -> Dict[str, Compiled]:
+    """Cut html_template_source.html into the pieces a preview is assembled from."""
+    with open(TEMPLATE_PATH, encoding='utf-8') as f:
+        src = f.read()
+    head_end = src.index('</head>')
+    head = src[:head_end].replace('<title>\n\t\t</title>', '<title>«title»</title>') + '\t\t<style>' + _EXTRA_CSS + '\t\t</style>\n\t'
+    body = src[head_end:]
+
+    # Lines the DOCX leaves out when empty become whole-paragraph fields
+    exam_start, exam_end = _paragraph(body, 'DEGREE EXAMINATIONS')
+    dept_start, dept_end = _paragraph(body, '«dept»')
+    exam_para = body[exam_start:exam_end].replace('B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024', '«text»')
+    dept_para = body[dept_start:dept_end].replace('«dept»', '«text»')
+    autonomous_start, autonomous_end = _paragraph(body, '(AUTONOMOUS)')
+    qp_para = body[autonomous_start:autonomous_end].replace('(AUTONOMOUS)', 'Question Paper Code: «qpcode»')
+
+    part_a_start, part_a_end = _paragraph(body, 'PART- A')
+    header = (body[:autonomous_end] + '\n\t\t\t' + qp_para + body[autonomous_end:exam_start] + '«exam_line»'
+              + body[exam_end:dept_start] + '«dept_line»' + body[dept_end:part_a_start])
+    header = header.replace('>Second Semester<', '>«semester»<').replace('(Regulation 2024) ', '(«regulation»)')
+    heading = body[part_a_start:part_a_end]
+    for text in re.findall(r'<strong>.*?</strong>', heading):
+        heading = heading.replace(text, '', 1)
+    heading = heading.replace('</p>', '<strong><span style="font-family:\'Times New Roman\'; ">«text»</span></strong></p>')
+    footer_start, footer_end = _paragraph(body, '«qpcode»')
+    return {
+        'head': _compile(head),
+        'header': _compile(header),
+        'line_exam': _compile(exam_para),
+        'line_dept': _compile(dept_para),
+        'heading': _compile(heading),
+        'footer': _compile(body[footer_start:footer_end] + '\n\t\t</div>\n\t</body>\n</html>\n'),
+    }
+
+
+def image_ref(url: Optional[str]) -> Optional[str]:
+    """Name under which a data: image is served (stored on first sight); None if it is not one."""
+    if not url or not isinstance(url, str):
+        return None
+    m = _DATA_URL_RE.match(url)
+    if not m:
+        return None
+    ext = m.group(1).lower().replace('jpg', 'jpeg')
+    name = f'{hashlib.sha256(url.encode("ascii", "replace")).hexdigest()}.{ext}'
+    if not preview_images.contains(name):
+        try:
+            data = base64.b64decode(url[m.end():])
+        except ValueError:
+            return None
+        preview_images.put(name, data)
+    return name
+
+
+def _text(s: str) -> str:
+    return html.escape(s or '').replace('\n', '<br>')
+
+
+def _heading(s: str) -> str:
+    # The DOCX headings pad with spaces for Word's layout
+    return _text(re.sub(r' {2,}', ' ', s))
+
+
+def _table(widths, header, rows: List[Optional[PaperRow]], image_src: Callable[[Question], Optional[str]]) -> str:
+    out = ['<table class="qp"><colgroup>', *(f'<col style="width:{w}">' for w in widths), '</colgroup>',
+           '<tr class="head">', *(f'<td>{_text(h)}</td>' for h in header), '</tr>']
+    for row in rows:
+        if row is None:
+            out.append('<tr><td colspan="5" class="c"><strong>(OR)</strong></td></tr>')
+            continue
+        src = image_src(row.question)
+        img = f'<img src="{html.escape(src)}" alt="">' if src else ''
+        out.append(f'<tr><td class="c">{_text(row.number)}</td><td>{_text(row.text)}{img}</td>'
+                   f'<td class="c">{_text(row.co)}</td><td class="c">{_text(row.btl)}</td><td class="c">{_text(row.marks)}</td></tr>')
+    out.append('</table>')
+    return ''.join(out)
+
+
+def render_paper_html(layout: PaperLayout, fields: Dict[str, str], image_src: Callable[[Question], Optional[str]]) -> str:
+    """The paper as a standalone HTML page. `fields` are the generate-docx header
+    fields; `image_src` maps a question to its picture URL or None."""
+    t = compiled_template()
+    exam_title = fields.get('exam_title') or ''
+    show_exam = exam_title.strip() and not exam_title.lower().startswith('question paper code:')
+    parts = [
+        _fill(t['head'], {'title': _text(f"{fields.get('qpcode') or ''} {fields.get('cn') or ''}".strip())}),
+        _fill(t['header'], {
+            'qpcode': _text(fields.get('qpcode')),
+            'exam_line': _fill(t['line_exam'], {'text': _text(exam_title)}) if show_exam else '',
+            'semester': _text(fields.get('semester')),
+            'dept_line': _fill(t['line_dept'], {'text': _text(fields.get('dept'))}) if fields.get('dept') else '',
+            'cc': _text(fields.get('cc')), 'cn': _text(fields.get('cn')),
+            'regulation': _text(fields.get('regulation')),
+        }),
+        _fill(t['heading'], {'text': _heading(PART_A_HEADING)}),
+        _table(_WIDTHS_A, ('Q.No.', 'Answer ALL Questions', 'CO', 'BTL', 'Marks'), layout.part_a, image_src),
+        _fill(t['heading'], {'text': _heading(PART_B_HEADING)}),
+        _table(_WIDTHS_BC, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'), layout.part_b, image_src),
+    ]
+    if layout.part_c:
+        parts.append(_fill(t['heading'], {'text': _heading(layout.part_c_heading)}))
+        parts.append(_table(_WIDTHS_BC, ('Q.No.', 'Question', 'CO', 'BTL', 'Marks'), layout.part_c, image_src))
+    parts.append(_fill(t['footer'], {'qpcode': _text(fields.get('qpcode'))}))
+    return '\n'.join(parts)
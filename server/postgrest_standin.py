@@ -0,0 +1,303 @@
+"""In-memory stand-in for the Supabase REST (PostgREST) endpoints server.sync uses.
+
+Serves /rest/v1/question_bank and /rest/v1/question_bank_titles with the
+subset of PostgREST that the sync engine relies on: horizontal filters
+(eq, neq, gt, gte, lt, lte, in, is) including nested or=/and= groups,
+select, order, limit/offset, upserts with on_conflict and
+Prefer: resolution=merge-duplicates, return=representation, and filtered
+DELETE. Like the migrations in supabase/migrations, ids default to random
+uuids, titles are unique, every write stamps updated_at with the request
+time, and a question's title_id cannot change once set.
+
+    python -m server.postgrest_standin [--port 54321] [--key secret]
+"""
+import argparse
+import datetime
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, Response
+
+Row = Dict[str, Any]
+
+TABLES = {
+    'question_bank': {
+        'columns': ('id', 'question_text', 'answer_text', 'subject', 'difficulty', 'created_at', 'updated_at',
+                    'source_file_path', 'title', 'options', 'correct_answer', 'btl', 'status', 'chapter',
+                    'course_outcomes', 'type', 'user_id', 'marks', 'title_id', 'image_url', 'excel_type',
+                    'course_outcomes_numbers', 'course_code', 'course_name', 'semester'),
+        'unique': ('id',),
+        'not_null': ('question_text', 'answer_text'),
+    },
+    'question_bank_titles': {
+        'columns': ('id', 'title', 'created_at'),
+        'unique': ('id', 'title'),
+        'not_null': ('title',),
+    },
+}
+TIMESTAMPS = frozenset(('created_at', 'updated_at'))
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _split(s: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes."""
+    parts, cur, depth, quoted = [], [], 0, False
+    for ch in s:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == '(':
+            depth += 1
+        elif not quoted and ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0 and not quoted:
+            parts.append(''.join(cur))
+            cur = []
+            continue
+        cur.append(ch)
+    parts.append(''.join(cur))
+    return [p for p in parts if p]
+
+
+def _unquote(v: str) -> str:
+    return v[1:-1] if len(v) >= 2 and v[0] == v[-1] == '"' else v
+
+
+def _coerce(column: str, row_value: Any, raw: str) -> Any:
+    if column in TIMESTAMPS:
+        return datetime.datetime.fromisoformat(raw)
+    if isinstance(row_value, bool):
+        return raw.lower() == 'true'
+    if isinstance(row_value, int):
+        return int(raw)
+    if isinstance(row_value, float):
+        return float(raw)
+    return raw
+
+
+def _value(column: str, row_value: Any) -> Any:
+    return datetime.datetime.fromisoformat(row_value) if column in TIMESTAMPS and row_value else row_value
+
+
+def _predicate(column: str, op: str, raw: str) -> Callable[[Row], bool]:
+    if op == 'is':
+        want = {'null': None, 'true': True, 'false': False}[raw.lower()]
+        return lambda row: row.get(column) is want if want is None else row.get(column) == want
+    if op == 'in':
+        items = [_unquote(v) for v in _split(raw.strip('()'))]
+
+        def test_in(row):
+            v = row.get(column)
+            return v is not None and _value(column, v) in {_coerce(column, v, i) for i in items}
+        return test_in
+    compare = {
+        'eq': lambda a, b: a == b, 'neq': lambda a, b: a != b,
+        'gt': lambda a, b: a > b, 'gte': lambda a, b: a >= b,
+        'lt': lambda a, b: a < b, 'lte': lambda a, b: a <= b,
+    }.get(op)
+    if compare is None:
+        raise PostgrestError(400, 'PGRST100', f'unsupported operator: {op}')
+    raw = _unquote(raw)
+
+    def test(row):
+        v = row.get(column)
+        return v is not None and compare(_value(column, v), _coerce(column, v, raw))
+    return test
+
+
+def _logic(expr: str) -> Callable[[Row], bool]:
+    """col.op.value, or and(...)/or(...) over such terms."""
+    for kind in ('and', 'or'):
+        if expr.startswith(kind + '(') and expr.endswith(')'):
+            return _group(kind, expr[len(kind):])
+    column, op, raw = expr.split('.', 2)
+    return _predicate(column, op, raw)
+
+
+def _group(kind: str, body: str) -> Callable[[Row], bool]:
+    preds = [_logic(p) for p in _split(body[1:-1])]
+    if kind == 'and':
+        return lambda row: all(p(row) for p in preds)
+    return lambda row: any(p(row) for p in preds)
+
+
+def _filters(params) -> List[Callable[[Row], bool]]:
+    out = []
+    for key, value in params.multi_items():
+        if key in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+            continue
+        if key in ('and', 'or'):
+            out.append(_group(key, value))
+        else:
+            op, _, raw = value.partition('.')
+            out.append(_predicate(key, op, raw))
+    return out
+
+
+def _project(rows: List[Row], select: Optional[str]) -> List[Row]:
+    if not select or select == '*':
+        return [dict(r) for r in rows]
+    cols = [c.strip() for c in select.split(',')]
+    return [{c: r.get(c) for c in cols} for r in rows]
+
+
+def _prefer(request: Request) -> set:
+    return {p.strip() for p in request.headers.get('prefer', '').split(',') if p.strip()}
+
+
+class Store:
+    def __init__(self):
+        self.tables: Dict[str, Dict[str, Row]] = {name: {} for name in TABLES}
+        # (table, unique column) -> value -> id
+        self.indexes: Dict[tuple, Dict[Any, str]] = {(t, c): {} for t, spec in TABLES.items() for c in spec['unique']}
+        self.lock = threading.Lock()
+
+    def find(self, table: str, column: str, value: Any) -> Optional[Row]:
+        index = self.indexes.get((table, column))
+        if index is not None:
+            rid = index.get(value)
+            return self.tables[table].get(rid) if rid is not None else None
+        for row in self.tables[table].values():
+            if row.get(column) == value:
+                return row
+        return None
+
+    def delete(self, table: str, rows: List[Row]) -> None:
+        for row in rows:
+            del self.tables[table][row['id']]
+            for c in TABLES[table]['unique']:
+                self.indexes[(table, c)].pop(row[c], None)
+
+    def upsert(self, table: str, records: List[Row], on_conflict: str, merge: bool) -> List[Row]:
+        spec = TABLES[table]
+        now = _now()
+        staged: Dict[str, Row] = {}
+        out = []
+        for rec in records:
+            unknown = set(rec) - set(spec['columns'])
+            if unknown:
+                raise PostgrestError(400, 'PGRST204', f'unknown columns: {sorted(unknown)}')
+            existing = None
+            if rec.get(on_conflict) is not None:
+                existing = next((r for r in staged.values() if r.get(on_conflict) == rec[on_conflict]), None) \
+                    or self.find(table, on_conflict, rec[on_conflict])
+            if existing is not None:
+                if not merge:
+                    raise PostgrestError(409, '23505', f'duplicate key value violates unique constraint on {on_conflict}')
+                row = dict(staged.get(existing['id'], existing))
+                if table == 'question_bank' and row.get('title_id') is not None and 'title_id' in rec \
+                        and rec['title_id'] != row['title_id']:
+                    raise PostgrestError(400, 'P0001', 'Changing title_id is not allowed')
+                row.update(rec)
+            else:
+                row = {c: None for c in spec['columns']}
+                row.update(rec)
+                row['id'] = row['id'] or str(uuid.uuid4())
+                row['created_at'] = row.get('created_at') or now
+            if 'updated_at' in spec['columns']:
+                row['updated_at'] = now
+            for c in spec['not_null']:
+                if row.get(c) is None:
+                    raise PostgrestError(400, '23502', f'null value in column "{c}" violates not-null constraint')
+            for c in spec['unique']:
+                clash = self.find(table, c, row[c])
+                if clash is not None and clash['id'] != row['id']:
+                    raise PostgrestError(409, '23505', f'duplicate key value violates unique constraint on {c}')
+            staged[row['id']] = row
+            out.append(row)
+        for rid, row in staged.items():
+            old = self.tables[table].get(rid)
+            for c in spec['unique']:
+                if old is not None:
+                    self.indexes[(table, c)].pop(old[c], None)
+                self.indexes[(table, c)][row[c]] = rid
+            self.tables[table][rid] = row
+        return out
+
+
+def create_app(api_key: Optional[str] = None) -> FastAPI:
+    app = FastAPI()
+    store = app.state.store = Store()
+
+    def check(request: Request, table: str):
+        if table not in TABLES:
+            raise PostgrestError(404, '42P01', f'relation "public.{table}" does not exist')
+        if api_key and request.headers.get('apikey') != api_key:
+            raise PostgrestError(401, 'PGRST301', 'invalid api key')
+
+    @app.exception_handler(PostgrestError)
+    async def postgrest_error(_request, exc: PostgrestError):
+        return JSONResponse({'code': exc.code, 'message': exc.message, 'details': None, 'hint': None}, status_code=exc.status)
+
+    @app.get('/rest/v1/{table}')
+    def select(table: str, request: Request):
+        check(request, table)
+        params = request.query_params
+        with store.lock:
+            rows = list(store.tables[table].values())
+        for pred in _filters(params):
+            rows = [r for r in rows if pred(r)]
+        for term in reversed(_split(params.get('order', ''))):
+            column, _, direction = term.partition('.')
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: _value(column, r[column]), reverse=direction.startswith('desc'))
+            rows = present + missing
+        offset = int(params.get('offset', 0))
+        limit = params.get('limit')
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        return JSONResponse(_project(rows, params.get('select')))
+
+    @app.post('/rest/v1/{table}')
+    async def insert(table: str, request: Request):
+        check(request, table)
+        body = await request.json()
+        records = body if isinstance(body, list) else [body]
+        prefer = _prefer(request)
+        on_conflict = request.query_params.get('on_conflict', 'id')
+        with store.lock:
+            rows = store.upsert(table, records, on_conflict, 'resolution=merge-duplicates' in prefer)
+        if 'return=representation' in prefer:
+            return JSONResponse(_project(rows, request.query_params.get('select')), status_code=201)
+        return Response(status_code=201)
+
+    @app.delete('/rest/v1/{table}')
+    def delete(table: str, request: Request):
+        check(request, table)
+        preds = _filters(request.query_params)
+        if not preds:
+            raise PostgrestError(400, '21000', 'DELETE requires a WHERE clause')
+        with store.lock:
+            rows = [r for r in store.tables[table].values() if all(p(r) for p in preds)]
+            store.delete(table, rows)
+        if 'return=representation' in _prefer(request):
+            return JSONResponse(_project(rows, request.query_params.get('select')))
+        return Response(status_code=204)
+
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=54321)
+    ap.add_argument('--key', default=None, help='require this apikey header')
+    args = ap.parse_args(argv)
+    uvicorn.run(create_app(args.key), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Compact question record shared by the Excel parser, DOCX scan, bulk insert and rendering.
+
+Payloads arrive as free-form dicts whose keys depend on where they came
+from ('text' from a scanned paper, 'question_text' from the bank or Excel,
+'imageUrl' from some frontend builds, ...). `Question.from_dict` resolves
+all aliases in one pass over the payload's keys, so renderers read plain
+attributes instead of probing alias lists per cell. `to_excel_dict` and
+`to_scan_dict` reproduce the response shapes the frontend already reads.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# field -> accepted payload keys, highest priority first. For these fields
+# the first key holding a non-blank value wins.
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    'text': ('text', 'question_text', 'question', 'q', 'title', 'body', 'content'),
+    'co': ('co', 'CO', 'course_outcomes', 'courseOutcome', 'course_outcome', 'co_code'),
+    'btl': ('btl', 'BTL', 'bloom', 'bloom_level', 'bt', 'bt_level'),
+    'marks': ('marks', 'mark', 'score', 'points'),
+    'image': ('image_url', 'image', 'img', 'imageUrl', 'img_url'),
+    'base_number': ('baseNumber', 'base_number'),
+}
+# Keys copied as-is (payload key -> field)
+PLAIN = {
+    'type': 'type', 'part': 'part', 'number': 'number', 'sub': 'sub', 'chapter': 'chapter',
+    'image_ocr': 'image_ocr', 'images': 'images', 'options': 'options',
+    'correct_answer': 'correct_answer', 'answer_text': 'answer_text', 'or': 'alternative',
+    'course_outcomes_numbers': 'co_numbers',
+}
+
+# payload key -> (field, priority); built once so from_dict is a single dict lookup per key
+_KEY_INDEX: Dict[str, Tuple[str, int]] = {
+    key: (field, rank) for field, keys in ALIASES.items() for rank, key in enumerate(keys)
+}
+
+
+def _blank(v: Any) -> bool:
+    return v is None or (v.strip() == '' if isinstance(v, str) else str(v).strip() == '')
+
+
+class Question:
+    __slots__ = (
+        'text', 'type', 'part', 'number', 'sub', 'base_number', 'co', 'btl', 'marks', 'chapter',
+        'image', 'image_ocr', 'images', 'options', 'correct_answer', 'answer_text', 'alternative',
+        # Excel provenance, reported back to the upload UI
+        'row', 'co_cell', 'co_numbers', 'source_row', 'source_col',
+        'image_anchor_row', 'image_anchor_col', 'image_mapped_row', 'image_present',
+    )
+
+    def __init__(self, text: str = '', **fields):
+        self.text = text
+        for name in self.__slots__[1:]:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f'unknown Question fields: {sorted(fields)}')
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> 'Question':
+        q = cls()
+        best: Dict[str, int] = {}
+        for key, value in d.items():
+            hit = _KEY_INDEX.get(key)
+            if hit is not None:
+                field, rank = hit
+                if rank < best.get(field, len(ALIASES[field])) and not _blank(value):
+                    best[field] = rank
+                    setattr(q, field, value)
+                continue
+            field = PLAIN.get(key)
+            if field is not None:
+                setattr(q, field, value)
+        if q.text is None or not isinstance(q.text, str):
+            q.text = '' if q.text is None else str(q.text)
+        return q
+
+    def __repr__(self):
+        return f'Question(part={self.part!r}, number={self.number!r}, text={self.text[:40]!r})'
+
+    def get(self, field: str, default=None):
+        """Attribute value, or `default` when unset."""
+        v = getattr(self, field)
+        return default if v is None else v
+
+    def str_of(self, field: str) -> str:
+        """Attribute as display text ('' when unset or blank)."""
+        v = getattr(self, field)
+        return '' if _blank(v) else str(v)
+
+    def to_excel_dict(self) -> dict:
+        """Row shape returned by /api/upload-questions-excel/."""
+        return {
+            'question_text': self.text,
+            'type': self.type,
+            'btl': self.btl,
+            'marks': self.marks,
+            'course_outcomes': self.co,
+            'course_outcomes_cell': self.co_cell,
+            'course_outcomes_numbers': self.co_numbers,
+            'chapter': self.chapter,
+            'image': self.image,
+            'question_source_row': self.source_row,
+            'question_source_col': self.source_col,
+            'image_anchor_row': self.image_anchor_row,
+            'image_anchor_col': self.image_anchor_col,
+            'image_mapped_row': self.image_mapped_row,
+            'image_present': bool(self.image_present),
+        }
+
+    def to_scan_dict(self) -> dict:
+        """Row shape returned by /api/template/scan-docx."""
+        out = {'number': self.number, 'text': self.text, 'co': self.co, 'btl': self.btl,
+               'marks': self.marks, 'part': self.part}
+        if self.alternative is not None:
+            out['or'] = self.alternative
+        if self.images:
+            out['images'] = self.images
+        if self.options:
+            out['options'] = self.options
+        if self.type is not None:
+            out['type'] = self.type
+        if self.answer_text:
+            out['answer_text'] = self.answer_text
+        return out
+
+
+def parse_questions(raw: Any) -> List[Question]:
+    """Canonicalize a generate/bulk payload into Questions.
+
+    Accepts a JSON string, a dict, or a list of either (nested lists and
+    JSON-encoded items are flattened); plain non-JSON strings become
+    text-only questions. Each string is decoded once.
+    """
+    out: List[Question] = []
+    stack: List[Any] = [raw]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Question):
+            out.append(item)
+            continue
+        if isinstance(item, (str, bytes)):
+            try:
+                item = json.loads(item)
+            except Exception:
+                item = {'text': item if isinstance(item, str) else item.decode('utf-8', 'replace')}
+        if isinstance(item, dict):
+            out.append(Question.from_dict(item))
+        elif isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+    return out
+
+
+def scan_dicts(questions: Iterable[Question]) -> List[dict]:
+    return [q.to_scan_dict() for q in questions]
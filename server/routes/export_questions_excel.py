@@ -0,0 +1,234 @@
+"""Streaming Excel export of the question bank.
+
+GET /api/question-bank/export.xlsx?title_id=&status= returns a workbook in
+the CO layout that /api/upload-questions-excel reads: one sheet per CO
+group (CO1-CO2, CO3-CO4, CO5), with a title row, a blank row, then the
+header row. A question goes to the sheet of its first course outcome.
+Questions without one go to the first sheet. Pictures stored as data URLs
+in image_url are anchored in the Image column of their question's row.
+
+The package is written by server.xlsx_stream from a producer thread. That
+thread reads each sheet with a SQLite cursor and passes compressed chunks
+through a small bounded queue to the response. Memory stays flat however
+large the bank is, and the download starts after the first few thousand
+rows. A client that disconnects stops the producer at its next chunk.
+"""
+import base64
+import logging
+import queue
+import re
+import threading
+import time
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from server.db import get_conn
+from server.routes.upload_questions_excel import PREFERRED_SHEETS, co_numbers
+from server.xlsx_stream import STYLE_HEADER, StreamingWorkbook
+
+logger = logging.getLogger('export_excel')
+
+router = APIRouter()
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+HEADER = ['S.No', 'Question Bank', 'TYPE', 'BTL Level', 'Course Outcomes', 'Marks', 'Part', 'Image']
+WIDTHS = [6, 80, 8, 10, 16, 8, 16, 36]
+QUESTION_COL, IMAGE_COL = 2, 8
+# Pictures are drawn at most this wide (px); the row is made tall enough to hold them
+IMAGE_MAX_WIDTH = 240
+_TYPE_CODES = {'objective': 'O', 'descriptive': 'D', 'Part_C': 'C'}
+_DATA_URL_RE = re.compile(r'data:image/[\w.+-]+;base64,', re.I)
+
+# Queued chunk size and queue depth: at most about 1 MB waits for a slow client
+CHUNK_SIZE = 64 * 1024
+QUEUE_CHUNKS = 16
+# A producer blocked this long on a client that stopped reading gives up
+STALL_TIMEOUT = 300
+
+# Sheet number (1..3) of a question: by its first CO number (1-2, 3-4, 5 and up).
+# course_outcomes_numbers is NULL only on rows the migration 5 backfill has not reached.
+_SHEET_SQL = """CASE WHEN first_co >= 5 THEN 3 WHEN first_co >= 3 THEN 2 ELSE 1 END"""
+_FIRST_CO_SQL = """CASE WHEN course_outcomes_numbers IS NOT NULL THEN CAST(course_outcomes_numbers AS INTEGER)
+                        ELSE first_co(course_outcomes) END"""
+
+
+def _first_co(co_text) -> int:
+    nums = co_numbers(co_text)
+    return int(nums.split(',')[0]) if nums else 0
+
+
+def _connect():
+    conn = get_conn()
+    conn.create_function('first_co', 1, _first_co, deterministic=True)
+    return conn
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _Pipe:
+    """Write-only file object feeding a bounded queue of byte chunks.
+
+    It has no tell(), so zipfile writes in streaming mode (data descriptors
+    after each entry) instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(QUEUE_CHUNKS)
+        self.cancelled = False
+        self._dead = False
+        self._buf = bytearray()
+
+    def _put(self, item):
+        deadline = time.monotonic() + STALL_TIMEOUT
+        while not self.cancelled and time.monotonic() < deadline:
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        # Writes made while the abandoned zip is torn down are dropped
+        self._dead = True
+        raise _Cancelled()
+
+    def write(self, data) -> int:
+        if self._dead:
+            return len(data)
+        self._buf += data
+        if len(self._buf) >= CHUNK_SIZE:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._dead:
+            return
+        if self._buf:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+        self._put(None)
+
+
+def _where(title_id: Optional[int], status: Optional[str]):
+    where, params = [], []
+    if title_id is not None:
+        where.append('title_id=?'); params.append(title_id)
+    if status is not None:
+        where.append('status=?'); params.append(status)
+    return ''.join(f' AND {w}' for w in where), params
+
+
+def _image_bytes(image_url: Optional[str]) -> Optional[bytes]:
+    if not image_url:
+        return None
+    m = _DATA_URL_RE.match(image_url)
+    if not m:
+        return None
+    try:
+        return base64.b64decode(image_url[m.end():])
+    except ValueError:
+        return None
+
+
+def write_export(out, title: str, title_id: Optional[int] = None, status: Optional[str] = None) -> int:
+    """Write the export workbook into `out`. Returns the number of questions written."""
+    cond, params = _where(title_id, status)
+    conn = _connect()
+    try:
+        # Which sheets will carry pictures has to be known before the first part is written
+        drawings = {PREFERRED_SHEETS[n - 1] for (n,) in conn.execute(
+            f"SELECT DISTINCT {_SHEET_SQL} FROM (SELECT {_FIRST_CO_SQL} AS first_co FROM question_bank "
+            f"WHERE substr(image_url, 1, 11) = 'data:image/'{cond})", params)}
+        book = StreamingWorkbook(out, PREFERRED_SHEETS, drawings)
+        total = 0
+        for n, name in enumerate(PREFERRED_SHEETS, 1):
+            ws = book.sheet(name, widths=WIDTHS, wrap=[QUESTION_COL])
+            ws.append([title], style=STYLE_HEADER)
+            ws.append([])
+            ws.append(HEADER, style=STYLE_HEADER)
+            rows = conn.execute(
+                f"SELECT question_text, type, btl, marks, course_outcomes, course_outcomes_numbers, chapter, "
+                f"{'image_url' if name in drawings else 'NULL'} FROM "
+                f"(SELECT *, {_FIRST_CO_SQL} AS first_co FROM question_bank WHERE 1=1{cond}) "
+                f"WHERE {_SHEET_SQL} = ? ORDER BY id", [*params, n])
+            for i, (text, qtype, btl, marks, co, co_nums, chapter, image_url) in enumerate(rows, 1):
+                if co_nums:
+                    co = ', '.join(f'CO{c}' for c in co_nums.split(','))
+                values = [i, text or '', _TYPE_CODES.get(qtype, qtype), btl, co, marks, chapter]
+                data = _image_bytes(image_url)
+                if data is None:
+                    ws.append(values)
+                    continue
+                # Anchor on the row this question is about to take
+                size = ws.add_image(data, ws.row + 1, IMAGE_COL, max_width=IMAGE_MAX_WIDTH)
+                # Row heights are in points (0.75 per px), with a little padding
+                ws.append(values, height=size[1] * 0.75 + 4 if size else None)
+            total += ws.row - 3
+            ws.close()
+        book.close()
+        return total
+    finally:
+        conn.close()
+
+
+@router.get('/question-bank/export.xlsx')
+def export_questions_excel(title_id: Optional[int] = None, status: Optional[str] = None):
+    title = 'Question Bank'
+    if title_id is not None:
+        conn = get_conn()
+        try:
+            row = conn.execute('SELECT title FROM question_bank_titles WHERE id=?', (title_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail=f'Question bank title {title_id} not found')
+        title = row[0] or title
+    filename = (re.sub(r'[^\w.-]+', '_', title).strip('_') or 'question_bank') + '.xlsx'
+    pipe = _Pipe()
+
+    def produce():
+        t = time.perf_counter()
+        try:
+            n = write_export(pipe, title, title_id, status)
+            pipe.close()
+            logger.info('Exported %d questions (title_id=%s status=%s) in %.0f ms', n, title_id, status,
+                        (time.perf_counter() - t) * 1000)
+        except _Cancelled:
+            logger.info('Export cancelled (title_id=%s): client went away', title_id)
+        except Exception as e:
+            logger.exception('Export failed (title_id=%s)', title_id)
+            try:
+                pipe._put(e)
+            except _Cancelled:
+                pass
+
+    async def body():
+        # Start producing only once the response is being sent
+        threading.Thread(target=produce, name='idcs-export-xlsx', daemon=True).start()
+        try:
+            while True:
+                # Cancellable: on a client disconnect Starlette cancels this await
+                chunk = await anyio.to_thread.run_sync(pipe.queue.get, cancellable=True)
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    # Headers are already sent; all that is left is to cut the download short
+                    raise chunk
+                yield chunk
+        finally:
+            pipe.cancelled = True
+            try:
+                # Release a queue.get abandoned by the cancellation
+                pipe.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    return StreamingResponse(body(), media_type=XLSX_MIME,
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
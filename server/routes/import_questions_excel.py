@@ -0,0 +1,247 @@
+"""Incremental re-import of a CO workbook into a question bank title.
+
+POST /api/question-bank/import-excel takes the whole workbook again, but
+only the edit is paid for:
+
+  1. Each CO sheet is fingerprinted straight from the .xlsx package: its
+     worksheet XML, the shared strings it references (cell text lives in
+     xl/sharedStrings.xml, not in the sheet) and the pictures anchored on
+     it. Sheets whose fingerprint and parser version match the last import
+     for the title are skipped without being opened by openpyxl.
+  2. Changed sheets are streamed (read-only mode) and parsed as usual. Each
+     question's stored fields are hashed and diffed against the rows that
+     sheet produced last time: identical content is kept (even if it moved
+     to another row), a changed row at the same position is updated, and
+     the rest are inserted or deleted.
+
+Updated rows take the request's `status` like new ones, so edited questions
+go back through review; a question's picture is stored in image_url and
+counts as part of its content. A row whose stored fields already match is
+only re-hashed and keeps its status. Only questions created by this
+endpoint are tracked; rows added through /api/question-bank/bulk are left
+alone.
+"""
+import datetime
+import hashlib
+import json
+import re
+import zipfile
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from openpyxl import load_workbook
+
+from server.db import get_conn
+from server.question import Question
+from server.routes.upload_questions_excel import PARSER_VERSION, _parse_sheet, _zip_sheet_images, select_sheets, workbook_sheets
+from server.timing import Stopwatch
+
+router = APIRouter()
+
+# <c ... t="s"><v>N</v>: a cell holding shared string N
+_SHARED_REF_RE = re.compile(rb'<c\b[^>]*?\bt="s"[^>]*>\s*<v>(\d+)</v>')
+_SHARED_ITEM_RE = re.compile(rb'<si\b[^>]*?(?:/>|>.*?</si>)', re.S)
+# Mixed into sheet fingerprints and content hashes. Bumping it makes the next
+# import re-parse and re-hash every sheet (2: pictures are part of both)
+HASH_VERSION = 2
+
+
+def shared_strings(z: zipfile.ZipFile) -> List[bytes]:
+    """Raw <si> elements of xl/sharedStrings.xml, by index (not decoded)."""
+    try:
+        return _SHARED_ITEM_RE.findall(z.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+
+
+def sheet_fingerprint(z: zipfile.ZipFile, path: str, shared: List[bytes], names: set) -> str:
+    xml = z.read(path)
+    h = hashlib.sha256(b'v%d\0' % HASH_VERSION)
+    h.update(xml)
+    for m in _SHARED_REF_RE.finditer(xml):
+        i = int(m.group(1))
+        h.update(b'\0')
+        h.update(shared[i] if i < len(shared) else b'')
+    # Pictures live in the sheet's drawing part, which the sheet XML only points to
+    try:
+        for a_row, a_col, media in _zip_sheet_images(z, names, path):
+            h.update(b'\1%d,%d\0' % (a_row, a_col))
+            h.update(media)
+    except Exception:
+        # _parse_sheet skips a drawing it cannot read, so the pictures do not count
+        pass
+    return h.hexdigest()
+
+
+def content_hash(q: Question) -> str:
+    """Hash of the fields a question_bank row stores."""
+    key = json.dumps([HASH_VERSION, q.text, q.type, q.btl, q.marks, q.chapter, q.co, q.image], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# question_bank columns an import writes, in _row_values order after status
+_STORED = ('question_text', 'type', 'btl', 'marks', 'chapter', 'course_outcomes', 'course_outcomes_numbers', 'image_url')
+
+
+def _row_values(q: Question, status: str) -> tuple:
+    return (q.text, q.get('type', 'objective'), q.get('btl', 2), q.get('marks', 1), status, q.chapter, q.co, q.co_numbers or None,
+            q.image or None)
+
+
+def _stored_values(q: Question) -> tuple:
+    values = _row_values(q, '')
+    return values[:4] + values[5:]
+
+
+def apply_sheet(cur, title_id: int, sheet: str, questions: List[Question], status: str) -> Dict[str, int]:
+    """Bring the title's rows from `sheet` in line with `questions`. Runs inside the caller's transaction."""
+    old = cur.execute(
+        'SELECT s.question_id, s.sheet_row, s.content_hash FROM question_bank_sources s '
+        'JOIN question_bank q ON q.id = s.question_id WHERE s.title_id=? AND s.sheet=?',
+        (title_id, sheet)).fetchall()
+    by_hash: Dict[str, List[Tuple[int, int]]] = {}
+    for qid, row, h in old:
+        by_hash.setdefault(h, []).append((row, qid))
+
+    moved: List[Tuple[int, int]] = []
+    pending: List[Tuple[int, str, Question]] = []
+    unchanged = 0
+    for q in questions:
+        h = content_hash(q)
+        pool = by_hash.get(h)
+        if pool:
+            # Same content seen before; prefer the copy at the same row
+            k = next((k for k, (row, _) in enumerate(pool) if row == q.row), 0)
+            row, qid = pool.pop(k)
+            if row != q.row:
+                moved.append((q.row, qid))
+            unchanged += 1
+        else:
+            pending.append((q.row, h, q))
+
+    # Whatever old content is left was edited or removed; match edits by row
+    leftover = {row: qid for pool in by_hash.values() for row, qid in pool}
+    updates = []
+    inserts = []
+    for row, h, q in pending:
+        qid = leftover.pop(row, None)
+        if qid is None:
+            inserts.append((row, h, q))
+        else:
+            updates.append((qid, h, q))
+    deletes = [(qid,) for qid in leftover.values()]
+
+    # Rows whose stored fields already match (their hash predates a
+    # HASH_VERSION bump) are only re-hashed, so they keep their status
+    rehashed = []
+    if updates:
+        stored = {}
+        for i in range(0, len(updates), 500):
+            chunk = [qid for qid, _h, _q in updates[i:i + 500]]
+            stored.update((r[0], tuple(r[1:])) for r in cur.execute(
+                f'SELECT id,{",".join(_STORED)} FROM question_bank WHERE id IN ({",".join("?" * len(chunk))})', chunk))
+        rehashed = [(h, qid) for qid, h, q in updates if stored.get(qid) == _stored_values(q)]
+        if rehashed:
+            same = {qid for _h, qid in rehashed}
+            updates = [u for u in updates if u[0] not in same]
+
+    if deletes:
+        cur.executemany('DELETE FROM question_bank WHERE id=?', deletes)
+        cur.executemany('DELETE FROM question_bank_sources WHERE question_id=?', deletes)
+    if updates:
+        cur.executemany('UPDATE question_bank SET question_text=?,type=?,btl=?,marks=?,status=?,chapter=?,course_outcomes=?,course_outcomes_numbers=?,image_url=? WHERE id=?',
+                        [_row_values(q, status) + (qid,) for qid, _h, q in updates])
+        cur.executemany('UPDATE question_bank_sources SET content_hash=? WHERE question_id=?',
+                        [(h, qid) for qid, h, _q in updates])
+    if rehashed:
+        cur.executemany('UPDATE question_bank_sources SET content_hash=? WHERE question_id=?', rehashed)
+    if moved:
+        cur.executemany('UPDATE question_bank_sources SET sheet_row=? WHERE question_id=?', moved)
+    sources = []
+    for row, h, q in inserts:
+        cur.execute("""INSERT INTO question_bank(question_text,type,answer_text,btl,marks,status,chapter,course_outcomes,course_outcomes_numbers,image_url,title_id)
+            VALUES (?,?,'',?,?,?,?,?,?,?,?)""", _row_values(q, status) + (title_id,))
+        sources.append((cur.lastrowid, title_id, sheet, row, h))
+    if sources:
+        cur.executemany('INSERT INTO question_bank_sources(question_id,title_id,sheet,sheet_row,content_hash) VALUES (?,?,?,?,?)', sources)
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes), 'unchanged': unchanged + len(rehashed)}
+
+
+@router.post('/question-bank/import-excel')
+def import_questions_excel(title_id: int = Form(...), status: str = Form('pending'), force: bool = Form(False),
+                           file: UploadFile = File(...)):
+    sw = Stopwatch()
+    data = file.file.read()
+    sw.lap('read_upload')
+    try:
+        z = zipfile.ZipFile(BytesIO(data))
+        sheets, active = workbook_sheets(z)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f'Not an Excel workbook: {e}')
+    if not sheets:
+        raise HTTPException(status_code=400, detail='Workbook has no sheets')
+    sheetnames = [name for name, _ in sheets]
+    paths = dict(sheets)
+    chosen = select_sheets(sheetnames, sheetnames[active])
+    shared = shared_strings(z)
+    names = set(z.namelist())
+    fingerprints = {name: sheet_fingerprint(z, paths[name], shared, names) for name in chosen}
+    sw.lap('fingerprint')
+
+    conn = get_conn()
+    try:
+        if conn.execute('SELECT 1 FROM question_bank_titles WHERE id=?', (title_id,)).fetchone() is None:
+            raise HTTPException(status_code=404, detail='Title not found')
+        # sheet -> (sheet_hash, parser_version, questions) at the last import
+        previous = {r[0]: r[1:] for r in conn.execute(
+            'SELECT sheet, sheet_hash, parser_version, questions FROM question_bank_imports WHERE title_id=?', (title_id,))}
+        changed = [s for s in chosen if force or s not in previous or previous[s][:2] != (fingerprints[s], PARSER_VERSION)]
+        removed = [s for s in previous if s not in chosen]
+
+        parsed: Dict[str, List[Question]] = {}
+        if changed:
+            # Streaming mode: sheets that are not asked for are never parsed
+            wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+            sw.lap('workbook_load')
+            try:
+                for s in changed:
+                    parsed[s] = _parse_sheet(wb[s], s, z, names, paths[s], sw)
+            finally:
+                wb.close()
+
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        report = []
+        totals = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        conn.isolation_level = None
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cur = conn.cursor()
+            for s in chosen:
+                if s in parsed:
+                    counts = apply_sheet(cur, title_id, s, parsed[s], status)
+                    cur.execute('INSERT OR REPLACE INTO question_bank_imports(title_id,sheet,sheet_hash,parser_version,questions,imported_at) VALUES (?,?,?,?,?,?)',
+                                (title_id, s, fingerprints[s], PARSER_VERSION, len(parsed[s]), now))
+                    report.append({'sheet': s, 'status': 'changed' if s in previous else 'new', **counts})
+                else:
+                    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': previous[s][2]}
+                    report.append({'sheet': s, 'status': 'unchanged', **counts})
+                for k in totals:
+                    totals[k] += counts[k]
+            for s in removed:
+                counts = apply_sheet(cur, title_id, s, [], status)
+                cur.execute('DELETE FROM question_bank_imports WHERE title_id=? AND sheet=?', (title_id, s))
+                report.append({'sheet': s, 'status': 'removed', **counts})
+                totals['deleted'] += counts['deleted']
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        sw.lap('apply')
+        return {'title_id': title_id, **totals, 'sheets': report}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Excel import failed: {e}')
+    finally:
+        conn.close()
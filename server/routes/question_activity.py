@@ -0,0 +1,49 @@
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Form, HTTPException
+
+from server.activity_log import activity_log
+from server.db import get_conn
+
+router = APIRouter()
+
+
+@router.post('/question-activity')
+def record_activity(events: str = Form(...)):
+    """Queue one activity event (JSON object) or several (JSON list) for question_activity_logs."""
+    try:
+        data = json.loads(events)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'events must be JSON: {e}')
+    items = data if isinstance(data, list) else [data]
+    if not all(isinstance(e, dict) for e in items):
+        raise HTTPException(status_code=400, detail='events must be an object or a list of objects')
+    try:
+        ids = activity_log.record(items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {'queued': len(ids), 'event_ids': ids}
+
+
+@router.get('/question-activity')
+def list_activity(question_id: Optional[str] = None, title_id: Optional[str] = None, limit: int = 100):
+    # Read-your-writes: move anything still spooled first
+    activity_log.flush()
+    sql = 'SELECT id,event_id,user_id,action,question_id,title_id,details,created_at FROM question_activity_logs WHERE 1=1'
+    params: list = []
+    if question_id is not None:
+        sql += ' AND question_id=?'; params.append(question_id)
+    if title_id is not None:
+        sql += ' AND title_id=?'; params.append(title_id)
+    sql += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+    params.append(max(1, min(limit, 1000)))
+    conn = get_conn()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    return [{
+        'id': r[0], 'event_id': r[1], 'user_id': r[2], 'action': r[3], 'question_id': r[4], 'title_id': r[5],
+        'details': json.loads(r[6]) if r[6] else None, 'created_at': r[7],
+    } for r in rows]
@@ -0,0 +1,49 @@
+"""Question-bank counts for dashboards, read from the trigger-maintained
+question_bank_stats table (migration 7) instead of the question rows.
+
+GET /api/question-bank/stats?by=status,btl&title_id=3 returns
+{"total": n, "by": [...], "groups": [{"status": ..., "btl": ..., "count": n}, ...]}.
+`by` defaults to every dimension and may be empty for just the total. The
+cost grows with the number of distinct groups, not with the bank size.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+
+from server.db import get_conn
+from server.migrations import STATS_DIMENSIONS
+
+router = APIRouter()
+
+
+@router.get('/question-bank/stats')
+def question_bank_stats(by: str = ','.join(STATS_DIMENSIONS), title_id: Optional[int] = None, status: Optional[str] = None):
+    dims = list(dict.fromkeys(d.strip() for d in by.split(',') if d.strip()))
+    unknown = [d for d in dims if d not in STATS_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f'Unknown stats dimension(s): {", ".join(unknown)}; '
+                                                    f'expected any of {", ".join(STATS_DIMENSIONS)}')
+    where, params = [], []
+    if title_id is not None:
+        where.append('title_id=?'); params.append(title_id)
+    if status is not None:
+        where.append('status=?'); params.append(status)
+    sql = f'SELECT {"".join(d + ", " for d in dims)}SUM(questions) FROM question_bank_stats'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if dims:
+        sql += f' GROUP BY {", ".join(dims)} ORDER BY {", ".join(dims)}'
+    conn = get_conn()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    groups = []
+    total = 0
+    for r in rows:
+        count = r[-1] or 0
+        if dims:
+            # '' stands for NULL in the stats keys
+            groups.append({**{d: (None if v == '' else v) for d, v in zip(dims, r)}, 'count': count})
+        total += count
+    return {'total': total, 'by': dims, 'groups': groups}
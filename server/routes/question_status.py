@@ -0,0 +1,104 @@
+"""Set-based question status transitions with activity logging.
+
+POST /api/question-bank/transition selects questions by id spec
+("12,15,100-400"), by filter (title_id, from_status) or both, and moves
+them to `status` in one transaction:
+
+  1. the selection is resolved into a temp table, together with each
+     row's current status and title (rows already in the target status
+     are left out, so they are neither rewritten nor logged);
+  2. one UPDATE ... WHERE id IN (temp table) changes them;
+  3. one INSERT ... SELECT writes a question_activity_logs row for each,
+     with details shaped like the frontend's
+     {"changes": {"status": {"before": ..., "after": ...}}}.
+
+Approving a whole bank is one request:
+status=approved&title_id=3&from_status=pending.
+"""
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Form, HTTPException
+
+from server.db import SQL_NOW, get_conn
+from server.timing import Stopwatch
+
+router = APIRouter()
+
+
+def parse_id_spec(spec: str) -> Tuple[List[int], List[Tuple[int, int]]]:
+    """'3,7,10-20' -> ([3, 7], [(10, 20)]). Blank items are ignored."""
+    ids: List[int] = []
+    ranges: List[Tuple[int, int]] = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        lo, sep, hi = item.partition('-')
+        try:
+            if sep:
+                lo_i, hi_i = int(lo), int(hi)
+                if lo_i > hi_i:
+                    raise ValueError
+                ranges.append((lo_i, hi_i))
+            else:
+                ids.append(int(item))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f'Invalid id or range: {item!r}')
+    return ids, ranges
+
+
+def transition_status(conn, status: str, ids: Optional[List[int]] = None, ranges: Optional[List[Tuple[int, int]]] = None,
+                      title_id: Optional[int] = None, from_status: Optional[str] = None,
+                      user_id: Optional[str] = None, action: str = 'status_change') -> dict:
+    """Move the selected questions to `status` and log each change. Commits on success."""
+    ids = ids or []
+    ranges = ranges or []
+    where = ['q.status IS NOT ?']
+    params: list = [status]
+    if title_id is not None:
+        where.append('q.title_id = ?'); params.append(title_id)
+    if from_status is not None:
+        where.append('q.status = ?'); params.append(from_status)
+    conn.isolation_level = None
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.cursor()
+        cur.execute('CREATE TEMP TABLE IF NOT EXISTS transition_pick(id INTEGER PRIMARY KEY)')
+        cur.execute('CREATE TEMP TABLE IF NOT EXISTS transition_rows(id INTEGER PRIMARY KEY, title_id, before)')
+        cur.execute('DELETE FROM temp.transition_pick')
+        cur.execute('DELETE FROM temp.transition_rows')
+        if ids or ranges:
+            cur.executemany('INSERT OR IGNORE INTO temp.transition_pick(id) VALUES (?)', [(i,) for i in ids])
+            cur.executemany('INSERT OR IGNORE INTO temp.transition_pick(id) SELECT id FROM question_bank WHERE id BETWEEN ? AND ?', ranges)
+            where.append('q.id IN (SELECT id FROM temp.transition_pick)')
+        cur.execute(f"""INSERT INTO temp.transition_rows(id, title_id, before)
+            SELECT q.id, q.title_id, q.status FROM question_bank q WHERE {' AND '.join(where)}""", params)
+        updated = cur.execute('UPDATE question_bank SET status = ? WHERE id IN (SELECT id FROM temp.transition_rows)', (status,)).rowcount
+        cur.execute(f"""INSERT INTO question_activity_logs(user_id, action, question_id, title_id, details, created_at)
+            SELECT ?, ?, id, title_id, json_object('changes', json_object('status', json_object('before', before, 'after', ?))), {SQL_NOW}
+            FROM temp.transition_rows ORDER BY id""", (user_id, action, status))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return {'updated': updated, 'status': status}
+
+
+@router.post('/question-bank/transition')
+def transition_questions(status: str = Form(...), ids: str = Form(''), title_id: Optional[int] = Form(None),
+                         from_status: Optional[str] = Form(None), user_id: Optional[str] = Form(None),
+                         action: str = Form('status_change')):
+    id_list, ranges = parse_id_spec(ids)
+    if not (id_list or ranges or title_id is not None or from_status is not None):
+        # Never move the whole bank because a selector was left out
+        raise HTTPException(status_code=400, detail='Give ids, title_id or from_status to select questions')
+    sw = Stopwatch()
+    conn = get_conn()
+    try:
+        result = transition_status(conn, status, id_list, ranges, title_id, from_status, user_id, action)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Status transition failed: {e}')
+    finally:
+        conn.close()
+    sw.lap('transition')
+    return result
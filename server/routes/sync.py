@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException
+
+from server.sync import SyncBusy, SyncError, default_engine, status
+
+router = APIRouter()
+
+
+@router.post("/sync")
+def run_sync():
+    engine = default_engine()
+    if engine is None:
+        raise HTTPException(status_code=400, detail="Sync is not configured: set IDCS_SUPABASE_URL")
+    try:
+        return engine.sync()
+    except SyncBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SyncError as e:
+        raise HTTPException(status_code=502, detail=f"Sync failed: {e}")
+
+
+@router.get("/sync/status")
+def sync_status():
+    return status()
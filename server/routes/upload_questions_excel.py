@@ -1,468 +1,707 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 from openpyxl import load_workbook
 from io import BytesIO
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import islice
+import base64
+import hashlib
 import re
 import zipfile
 import os
 import xml.etree.ElementTree as ET
 import posixpath
+import threading
+from starlette.responses import Response
+from server.diskcache import DiskCache
+from server.json_response import FastJSONResponse
+from server.memprofile import checkpoint
+from server.timing import Stopwatch, stage
+from server.metrics import add_image_bytes, cache_hit, cache_miss
+from server.question import Question
 
 router = APIRouter()
 
-@router.post("/upload-questions-excel/")
-def upload_questions_excel(file: UploadFile = File(...)):
+# Bump whenever parse output for the same workbook can change; cached
+# results from other versions are then ignored and age out.
+PARSER_VERSION = 3
+
+# Re-uploads of an unchanged workbook are served from disk
+PARSE_CACHE_ENABLED = (os.environ.get('IDCS_PARSE_CACHE') or '1').strip().lower() not in ('0', 'false', 'no', 'off')
+parse_cache = DiskCache(
+    'excel_parse',
+    max_bytes=int(float(os.environ.get('IDCS_PARSE_CACHE_MB') or 256) * 1024 * 1024),
+    max_age=float(os.environ.get('IDCS_PARSE_CACHE_DAYS') or 30) * 86400,
+)
+
+# preferred sheets order; process CO1-CO2 then CO3-CO4 then CO5 if present
+PREFERRED_SHEETS = ['CO1-CO2', 'CO3-CO4', 'CO5']
+REQUIRED = ["Question Bank", "TYPE", "BTL Level", "Course Outcomes", "Marks", "Part"]
+# The header row is searched for in this many leading rows (templates put it
+# on row 3 under two title rows; some copies carry extra title lines)
+HEADER_SCAN_ROWS = 20
+# Normalized header spellings that name a required column outright; other
+# headers fall back to substring matching against the column name
+HEADER_ALIASES = {
+    "Question Bank": ("questionbank", "question", "questions", "questiontext"),
+    "TYPE": ("type", "questiontype"),
+    "BTL Level": ("btllevel", "btl", "bloomslevel", "bloomlevel"),
+    "Course Outcomes": ("courseoutcomes", "courseoutcome", "co", "cos"),
+    "Marks": ("marks", "mark"),
+    "Part": ("part",),
+}
+# Blank question cells borrow the nearest question text within this many rows
+FILL_DISTANCE = 5
+
+_DIGITS_RE = re.compile(r'\d+')
+_CO_DIGIT_RE = re.compile(r'([1-5])')
+_CO_SINGLE_RE = re.compile(r'CO\s*([1-5])')
+_WS_RE = re.compile(r"\s+")
+_TYPES = {'o': 'objective', 'd': 'descriptive', 'c': 'Part_C'}
+
+_DRAWING_RE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?drawing\s[^>]*?:id="([^"]*)"')
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_XDR_NS = '{http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing}'
+_A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+try:
+    from openpyxl.utils import coordinate_to_tuple
+except ImportError:
+    def coordinate_to_tuple(cell):
+        m = re.match(r"([A-Z]+)([0-9]+)", cell)
+        if m:
+            col = 0
+            for c in m.group(1):
+                col = col * 26 + (ord(c) - ord('A') + 1)
+            return (int(m.group(2)), col)
+        return (1, 1)
+
 
+def norm(s):
+    return _WS_RE.sub("", s or "").lower()
+
+
+def cell_to_text(val):
+    """Normalize Excel cell value to a string.
+    Convert floats that are whole numbers to integers so '1.0' -> '1'.
+    Return empty string for None or blank-like values.
+    """
+    if val is None:
+        return ''
+    if isinstance(val, str):
+        return val.strip()
+    # handle floats that are integers
     try:
-        data = file.file.read()
-        wb = load_workbook(BytesIO(data), data_only=True)
-
-        # --- Extract meta from INDEX sheet ---
-        meta = {}
-        if 'INDEX' in wb.sheetnames:
-            ws_index = wb['INDEX']
-            # Excel is 1-indexed, so row 7, col 3 is ws_index.cell(row=7, column=3)
-            meta['semester'] = str(ws_index.cell(row=7, column=3).value or '').strip()
-            meta['course_code'] = str(ws_index.cell(row=8, column=3).value or '').strip()
-            meta['course_name'] = str(ws_index.cell(row=9, column=3).value or '').strip()
-
-        # preferred sheets order; process CO1-CO2 then CO3-CO4 then CO5 if present
-        preferred_sheets = ['CO1-CO2', 'CO3-CO4', 'CO5']
-        sheets_to_process = [s for s in preferred_sheets if s in wb.sheetnames]
-        if not sheets_to_process:
-            sheets_to_process = [wb.active.title]
-
-        header_row_idx = 3
-        required = ["Question Bank", "TYPE", "BTL Level", "Course Outcomes", "Marks", "Part"]
+        if isinstance(val, float):
+            if val.is_integer():
+                return str(int(val))
+            return str(val).strip()
+        if isinstance(val, int):
+            return str(val)
+    except Exception:
+        pass
+    # fallback
+    try:
+        return str(val).strip()
+    except Exception:
+        return ''
+
+
+def is_numeric_short(s: str) -> bool:
+    s2 = s.strip()
+    return not s2 or len(s2) <= 3 or _DIGITS_RE.fullmatch(s2) is not None
+
+
+# Column transforms. A CO sheet repeats a handful of distinct values per
+# column, so each transform is memoized on the cell text and runs once per
+# distinct value rather than once per row.
+
+@lru_cache(maxsize=1024)
+def parse_type(type_text: str) -> Optional[str]:
+    return _TYPES.get(type_text.lower())
+
+
+@lru_cache(maxsize=1024)
+def parse_btl(btl_text: str) -> int:
+    nums = _DIGITS_RE.findall(btl_text.upper())
+    return int(max(nums, key=int)) if nums else 2
+
+
+def parse_marks(raw) -> int:
+    try:
+        return int(raw) if raw is not None else 1
+    except Exception:
+        return 1
+
+
+@lru_cache(maxsize=1024)
+def parse_co(co_text: str) -> Tuple[str, str, Optional[str]]:
+    """-> (cleaned cell text, comma-joined CO numbers, primary 'COn' or None)."""
+    co_raw = co_text.replace('\n', ' ').replace('\r', ' ').strip()
+    ordered_unique = list(dict.fromkeys(_CO_DIGIT_RE.findall(co_raw)))
+    co = f"CO{ordered_unique[0]}" if ordered_unique else None
+    if co is None and co_raw:
+        m_single = _CO_SINGLE_RE.search(co_raw.upper())
+        if m_single:
+            co = f"CO{m_single.group(1)}"
+    return co_raw, ','.join(ordered_unique), co
+
+
+def co_numbers(co_text) -> Optional[str]:
+    """question_bank.course_outcomes_numbers for a CO cell or stored course_outcomes value."""
+    return (parse_co(str(co_text))[1] or None) if co_text else None
+
+
+_HEADER_LOOKUP = {alias: col for col, aliases in HEADER_ALIASES.items() for alias in aliases}
+_REQUIRED_NORM = [(col, norm(col)) for col in REQUIRED]
+
+
+@lru_cache(maxsize=4096)
+def header_candidates(h: str) -> Tuple[Optional[str], Tuple[str, ...]]:
+    """-> (required column a normalized header names exactly, required columns it matches as a substring)."""
+    if not h:
+        return None, ()
+    return _HEADER_LOOKUP.get(h), tuple(col for col, n in _REQUIRED_NORM if n in h or h in n)
+
+
+def match_headers(headers: Sequence[str]) -> Tuple[Dict[str, int], int]:
+    """-> (required column -> 1-based column index, score) for one candidate header row.
+
+    Each required column takes the first unused exact match, else the first
+    unused substring match; exact matches score 2, substring matches 1.
+    Blank cells never match.
+    """
+    cands = []
+    for idx, h in enumerate(headers):
+        exact, subs = header_candidates(norm(h))
+        if exact or subs:
+            cands.append((idx, exact, subs))
+    header_map: Dict[str, int] = {}
+    used = set()
+    score = 0
+    for col in REQUIRED:
+        hit = next((idx for idx, exact, _ in cands if exact == col and idx not in used), None)
+        if hit is not None:
+            score += 2
+        else:
+            hit = next((idx for idx, _, subs in cands if col in subs and idx not in used), None)
+            if hit is None:
+                continue
+            score += 1
+        header_map[col] = hit + 1
+        used.add(hit)
+    return header_map, score
+
+
+def _header_texts(row: Sequence) -> List[str]:
+    return [str(v).strip() if v is not None else '' for v in row]
+
+
+def _signature(row: Sequence) -> Tuple[str, ...]:
+    texts = [norm(t) for t in _header_texts(row)]
+    while texts and not texts[-1]:
+        texts.pop()
+    return tuple(texts)
+
+
+def detect_header(rows: Iterable[Sequence], sheet_name: str) -> Tuple[int, Dict[str, int]]:
+    """-> (1-based header row, required column -> 1-based column index).
+
+    Reads at most HEADER_SCAN_ROWS rows from `rows` (a list or a streaming
+    iter_rows generator) and picks the highest-scoring row that names every
+    required column, the earliest on ties. Raises 400 naming the first
+    missing column of the closest row when none does.
+    """
+    perfect = 2 * len(REQUIRED)
+    best = None
+    closest = (-1, -1, [])
+    for r, row in enumerate(islice(rows, HEADER_SCAN_ROWS), start=1):
+        headers = _header_texts(row)
+        header_map, score = match_headers(headers)
+        if len(header_map) == len(REQUIRED):
+            if best is None or score > best[0]:
+                best = (score, r, header_map)
+                if score == perfect:
+                    break
+        elif (len(header_map), score) > closest[:2]:
+            closest = (len(header_map), score, headers)
+    if best is None:
+        headers = closest[2]
+        header_map, _ = match_headers(headers)
+        col = next(c for c in REQUIRED if c not in header_map)
+        raise HTTPException(status_code=400, detail=f"Missing required column: {col} in sheet {sheet_name}. Found headers: {headers}")
+    return best[1], best[2]
+
+
+class LayoutCache:
+    """Recently detected header layouts, per sheet name.
+
+    A department's workbooks share a template, so the header usually sits
+    on the same row with the same cells as last time; checking that one row
+    replaces the scan. A layout is reused only if its header row still holds
+    exactly the cells it was detected from.
+    """
+
+    def __init__(self, per_sheet: int = 4, max_sheets: int = 256):
+        self.per_sheet = per_sheet
+        self.max_sheets = max_sheets
+        self._layouts: Dict[str, List[Tuple[int, Tuple[str, ...], Dict[str, int]]]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, grid: Sequence[Sequence], sheet_name: str) -> Tuple[int, Dict[str, int]]:
+        for r, signature, header_map in self._layouts.get(sheet_name, ()):
+            if r <= len(grid) and _signature(grid[r - 1]) == signature:
+                cache_hit('header_layout')
+                return r, header_map
+        cache_miss('header_layout')
+        r, header_map = detect_header(grid, sheet_name)
+        signature = _signature(grid[r - 1])
+        with self._lock:
+            if sheet_name not in self._layouts and len(self._layouts) >= self.max_sheets:
+                self._layouts.pop(next(iter(self._layouts)))
+            layouts = [l for l in self._layouts.get(sheet_name, ()) if l[0] != r or l[1] != signature]
+            self._layouts[sheet_name] = [(r, signature, header_map)] + layouts[:self.per_sheet - 1]
+        return r, header_map
+
+
+layout_cache = LayoutCache()
+
+
+def fill_sources(qtexts: List[str], first: int, distance: int = FILL_DISTANCE) -> List[int]:
+    """For each row index, the index whose question text it uses.
+
+    Non-blank rows use themselves; a blank row borrows from the nearest
+    non-blank row above within `distance` (rows >= first), else the nearest
+    below within `distance`, else -1. One forward and one backward pass.
+    """
+    n = len(qtexts)
+    src = [-1] * n
+    last = -1
+    for i in range(first, n):
+        if qtexts[i]:
+            last = i
+            src[i] = i
+        elif last >= 0 and i - last <= distance:
+            src[i] = last
+    nxt = -1
+    for i in range(n - 1, first - 1, -1):
+        if qtexts[i]:
+            nxt = i
+        elif src[i] < 0 and nxt >= 0 and nxt - i <= distance:
+            src[i] = nxt
+    return src
+
+
+def nearest_row(candidates: List[int], row: int) -> int:
+    """Closest value in the sorted `candidates` (the lower one on ties); `row` if empty."""
+    if not candidates:
+        return row
+    i = bisect_left(candidates, row)
+    if i == 0:
+        return candidates[0]
+    if i == len(candidates):
+        return candidates[-1]
+    lo, hi = candidates[i - 1], candidates[i]
+    return lo if row - lo <= hi - row else hi
+
+
+def select_sheets(sheetnames: List[str], active: str) -> List[str]:
+    """The CO sheets to import, in PREFERRED_SHEETS order; the active sheet if none exist."""
+    return [s for s in PREFERRED_SHEETS if s in sheetnames] or [active]
+
+
+def workbook_sheets(z: zipfile.ZipFile) -> Tuple[List[Tuple[str, str]], int]:
+    """-> ([(sheet name, worksheet part path)] in tab order, active tab index), read from the package XML."""
+    wb_xml = ET.fromstring(z.read('xl/workbook.xml'))
+    targets = {}
+    try:
+        rels_doc = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    except KeyError:
+        rels_doc = None
+    if rels_doc is not None:
+        for rel in rels_doc.findall('.//' + _PKG_REL_NS + 'Relationship'):
+            target = (rel.attrib.get('Target') or '').replace('\\', '/')
+            if target.startswith('/'):
+                target = target.lstrip('/')
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            targets[rel.attrib.get('Id')] = target
+    sheets = []
+    for i, sheet in enumerate(wb_xml.iter(_MAIN_NS + 'sheet')):
+        path = targets.get(sheet.attrib.get(_REL_NS + 'id')) or f'xl/worksheets/sheet{i + 1}.xml'
+        sheets.append((sheet.attrib.get('name', ''), path))
+    view = wb_xml.find('.//' + _MAIN_NS + 'workbookView')
+    try:
+        active = int(view.attrib.get('activeTab', 0)) if view is not None else 0
+    except ValueError:
+        active = 0
+    return sheets, active if 0 <= active < len(sheets) else 0
 
+
+def _part_target(source: str, target: str) -> str:
+    """Package path of a relationship `target` from the part at `source`."""
+    target = target.replace('\\', '/')
+    if target.startswith('/'):
+        # absolute part name, as openpyxl writes it
+        return posixpath.normpath(target.lstrip('/'))
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+
+def _zip_sheet_images(z: zipfile.ZipFile, names: set, sheet_path: str):
+    """Yield (anchor_row, anchor_col, bytes) for pictures in the drawing part of the worksheet at `sheet_path`."""
+    if sheet_path not in names:
+        return
+    # The sheet XML holds every cell; find the <drawing r:id> tag without parsing it
+    m = _DRAWING_RE.search(z.read(sheet_path))
+    if m is None:
+        return
+    rId = m.group(1).decode('utf-8')
+    rels_path = posixpath.join(posixpath.dirname(sheet_path), '_rels', posixpath.basename(sheet_path) + '.rels')
+    if rels_path not in names:
+        return
+    rels_doc = ET.fromstring(z.read(rels_path))
+    draw_target = None
+    for rel in rels_doc.findall('.//' + _PKG_REL_NS + 'Relationship'):
+        if rel.attrib.get('Id') == rId:
+            draw_target = rel.attrib.get('Target')
+            break
+    if not draw_target:
+        return
+    drawing_path = _part_target(sheet_path, draw_target)
+    if drawing_path not in names:
+        return
+    drawing_xml = ET.fromstring(z.read(drawing_path))
+    drawing_rels_path = posixpath.join(posixpath.dirname(drawing_path), '_rels', posixpath.basename(drawing_path) + '.rels')
+    rels_map = {}
+    if drawing_rels_path in names:
+        dr = ET.fromstring(z.read(drawing_rels_path))
+        for rel in dr.findall('.//' + _PKG_REL_NS + 'Relationship'):
+            Id = rel.attrib.get('Id')
+            Target = rel.attrib.get('Target')
+            if Id and Target:
+                rels_map[Id] = _part_target(drawing_path, Target)
+    anchors = drawing_xml.findall('.//' + _XDR_NS + 'twoCellAnchor') + drawing_xml.findall('.//' + _XDR_NS + 'oneCellAnchor')
+    for anchor in anchors:
+        frm = anchor.find('.//' + _XDR_NS + 'from')
+        if frm is None:
+            continue
+        col_elem = frm.find('./' + _XDR_NS + 'col')
+        row_elem = frm.find('./' + _XDR_NS + 'row')
+        if col_elem is None or row_elem is None:
+            continue
         try:
-            from openpyxl.utils import coordinate_to_tuple
-        except ImportError:
-            def coordinate_to_tuple(cell):
-                m = re.match(r"([A-Z]+)([0-9]+)", cell)
-                if m:
-                    col = 0
-                    for c in m.group(1):
-                        col = col * 26 + (ord(c) - ord('A') + 1)
-                    return (int(m.group(2)), col)
-                return (1, 1)
-
-        def norm(s):
-            return re.sub(r"\s+", "", s or "").replace("\n", "").replace("\r", "").lower()
-
-        def cell_to_text(val):
-            """Normalize Excel cell value to a string.
-            Convert floats that are whole numbers to integers so '1.0' -> '1'.
-            Return empty string for None or blank-like values.
-            """
-            if val is None:
-                return ''
-            # handle floats that are integers
+            a_col = int(col_elem.text) + 1
+            a_row = int(row_elem.text) + 1
+        except Exception:
+            continue
+        blip = anchor.find('.//' + _XDR_NS + 'pic//' + _XDR_NS + 'blipFill//' + _A_NS + 'blip')
+        if blip is None:
+            blip = anchor.find('.//' + _XDR_NS + 'blipFill//' + _A_NS + 'blip')
+        if blip is None:
+            continue
+        embed = blip.attrib.get(_REL_NS + 'embed')
+        media_path = rels_map.get(embed) if embed else None
+        if media_path in names:
+            yield a_row, a_col, z.read(media_path)
+
+
+def _image_bytes(img):
+    """-> (anchor_row, anchor_col, bytes) for a ZIP-extracted dict or an openpyxl Image."""
+    if isinstance(img, dict):
+        return img.get('anchor_row'), img.get('anchor_col'), img.get('bytes')
+    image_anchor_row = image_anchor_col = None
+    img_bytes = None
+    anchor = getattr(img, 'anchor', None)
+    if anchor is not None:
+        if hasattr(anchor, '_from'):
+            image_anchor_row = anchor._from.row + 1
+            image_anchor_col = anchor._from.col + 1
+        elif hasattr(anchor, 'cell'):
+            image_anchor_row, image_anchor_col = coordinate_to_tuple(anchor.cell)
+    for attr in ('_data', 'image', 'ref', 'blob'):
+        v = getattr(img, attr, None)
+        if v:
+            if isinstance(v, bytes):
+                img_bytes = v
+                break
             try:
-                if isinstance(val, float):
-                    if val.is_integer():
-                        return str(int(val))
-                    return str(val).strip()
-                if isinstance(val, int):
-                    return str(val)
+                if hasattr(v, 'tobytes'):
+                    img_bytes = v.tobytes()
+                    break
+                if hasattr(v, 'read'):
+                    img_bytes = v.read()
+                    break
             except Exception:
                 pass
-            # fallback
-            try:
-                return str(val).strip()
-            except Exception:
-                return ''
-
-        all_questions = []
-
-        for sheet_name in sheets_to_process:
-            ws = wb[sheet_name]
-            headers = [str(ws.cell(row=header_row_idx, column=c).value).strip() if ws.cell(row=header_row_idx, column=c).value is not None else '' for c in range(1, ws.max_column + 1)]
-            norm_headers = [norm(h) for h in headers]
-            header_map = {}
-            used_indices = set()
-            for col in required:
-                norm_col = norm(col)
-                found = False
-                for idx, h in enumerate(norm_headers):
-                    if idx in used_indices:
-                        continue
-                    if norm_col in h or h in norm_col:
-                        header_map[col] = idx+1
-                        used_indices.add(idx)
-                        found = True
-                        break
-                if not found:
-                    raise HTTPException(status_code=400, detail=f"Missing required column: {col} in sheet {sheet_name}. Found headers: {headers}")
+    if img_bytes is None:
+        try:
+            v = getattr(img, '_data', None)
+            if v is not None:
+                if hasattr(v, 'tobytes'):
+                    img_bytes = v.tobytes()
+                elif isinstance(v, bytes):
+                    img_bytes = v
+        except Exception:
+            img_bytes = None
+    return image_anchor_row, image_anchor_col, img_bytes
 
-            # image mapping per-sheet
-            image_cell_map = {}
-            image_row_map = {}
-            imgs = list(getattr(ws, '_images', []))
-            try:
-                z = zipfile.ZipFile(BytesIO(data))
-                try:
-                    sheet_index = wb.sheetnames.index(ws.title) + 1
-                except Exception:
-                    sheet_index = 1
-                sheet_path = f'xl/worksheets/sheet{sheet_index}.xml'
-                if sheet_path in z.namelist():
-                    sheet_xml = z.read(sheet_path)
-                    st = ET.fromstring(sheet_xml)
-                    drawing_elem = st.find('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}drawing')
-                    if drawing_elem is not None:
-                        rId = drawing_elem.attrib.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')
-                        rels_path = f'xl/worksheets/_rels/sheet{sheet_index}.xml.rels'
-                        if rels_path in z.namelist():
-                            rels_doc = ET.fromstring(z.read(rels_path))
-                            draw_target = None
-                            for rel in rels_doc.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
-                                if rel.attrib.get('Id') == rId:
-                                    draw_target = rel.attrib.get('Target')
-                                    break
-                            if draw_target:
-                                if draw_target.startswith('../'):
-                                    drawing_path = 'xl/' + draw_target.replace('../', '')
-                                else:
-                                    drawing_path = 'xl/' + draw_target.lstrip('./')
-                                drawing_path = drawing_path.replace('\\', '/').replace('//', '/')
-                                if drawing_path in z.namelist():
-                                    drawing_xml = ET.fromstring(z.read(drawing_path))
-                                    drawing_rels_path = os.path.dirname(drawing_path).rstrip('/') + '/_rels/' + os.path.basename(drawing_path) + '.rels'
-                                    drawing_rels_path = drawing_rels_path.replace('\\', '/').replace('//', '/')
-                                    rels_map = {}
-                                    if drawing_rels_path in z.namelist():
-                                        dr = ET.fromstring(z.read(drawing_rels_path))
-                                        for rel in dr.findall('.//{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'):
-                                            Id = rel.attrib.get('Id')
-                                            Target = rel.attrib.get('Target')
-                                            if Id and Target:
-                                                rel_base = os.path.dirname(drawing_path).replace('\\', '/').rstrip('/')
-                                                combined = posixpath.normpath(posixpath.join(rel_base, Target)).replace('\\', '/')
-                                                if not combined.startswith('xl/'):
-                                                    combined = combined.lstrip('/')
-                                                    combined = 'xl/' + combined
-                                                rels_map[Id] = combined
-                                    xdr_ns = '{http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing}'
-                                    a_ns = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
-                                    anchors = drawing_xml.findall('.//'+xdr_ns+'twoCellAnchor') + drawing_xml.findall('.//'+xdr_ns+'oneCellAnchor')
-                                    for anchor in anchors:
-                                        frm = anchor.find('.//'+xdr_ns+'from')
-                                        if frm is None:
-                                            continue
-                                        col_elem = frm.find('./'+xdr_ns+'col')
-                                        row_elem = frm.find('./'+xdr_ns+'row')
-                                        if col_elem is None or row_elem is None:
-                                            continue
-                                        try:
-                                            a_col = int(col_elem.text) + 1
-                                            a_row = int(row_elem.text) + 1
-                                        except Exception:
-                                            continue
-                                        blip = anchor.find('.//'+xdr_ns+'pic//'+xdr_ns+'blipFill//'+a_ns+'blip')
-                                        if blip is None:
-                                            blip = anchor.find('.//'+xdr_ns+'blipFill//'+a_ns+'blip')
-                                        if blip is None:
-                                            continue
-                                        embed = blip.attrib.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                                        if not embed:
-                                            continue
-                                        media_target = rels_map.get(embed)
-                                        if not media_target:
-                                            continue
-                                        media_path = str(media_target).replace('\\', '/').replace('//', '/')
-                                        while media_path.startswith('./') or media_path.startswith('../'):
-                                            if media_path.startswith('../'):
-                                                media_path = media_path[3:]
-                                            elif media_path.startswith('./'):
-                                                media_path = media_path[2:]
-                                        if not media_path.startswith('xl/'):
-                                            media_path = 'xl/' + media_path.lstrip('/')
-                                        media_path = media_path.replace('xl/xl/', 'xl/')
-                                        if media_path in z.namelist():
-                                            media_bytes = z.read(media_path)
-                                            image_cell_map[(a_row, a_col)] = {'bytes': media_bytes, 'anchor_row': a_row, 'anchor_col': a_col}
-                                            # map to nearest question row in this sheet
-                                            target_row = a_row
-                                            try:
-                                                candidate_rows = []
-                                                q_col_idx = header_map.get('Question Bank')
-                                                if q_col_idx is not None:
-                                                    for rr in range(header_row_idx + 1, ws.max_row + 1):
-                                                        v = ws.cell(row=rr, column=q_col_idx).value
-                                                        if v is not None and cell_to_text(v) != '':
-                                                            candidate_rows.append(rr)
-                                                if candidate_rows:
-                                                    target_row = min(candidate_rows, key=lambda x: abs(x - a_row))
-                                                else:
-                                                    lo = max(header_row_idx + 1, a_row - 50)
-                                                    hi = min(ws.max_row, a_row + 50)
-                                                    for rr in range(lo, hi + 1):
-                                                        v = ws.cell(row=rr, column=header_map.get('Question Bank')).value if header_map.get('Question Bank') is not None else None
-                                                        if v is not None and cell_to_text(v) != '':
-                                                            target_row = rr
-                                                            break
-                                            except Exception:
-                                                target_row = a_row
-                                            if target_row not in image_row_map:
-                                                image_row_map[target_row] = {'anchor_row': a_row, 'anchor_col': a_col, 'bytes': media_bytes}
-            except Exception as e:
-                print(f"[Excel Debug] ZIP parse for sheet '{sheet_name}' failed: {e}")
-
-            for img in imgs:
-                anchor = getattr(img, 'anchor', None)
-                if anchor is None:
-                    continue
-                if hasattr(anchor, '_from'):
-                    a_row = anchor._from.row + 1
-                    a_col = anchor._from.col + 1
-                elif hasattr(anchor, 'cell'):
-                    a_row, a_col = coordinate_to_tuple(anchor.cell)
-                else:
-                    continue
-                q_col_idx = header_map.get('Question Bank')
-                target_row = a_row
-                if q_col_idx is not None:
-                    try:
-                        candidate_rows = [rr for rr in range(header_row_idx + 1, ws.max_row + 1) if cell_to_text(ws.cell(row=rr, column=q_col_idx).value) != '']
-                        if candidate_rows:
-                            target_row = min(candidate_rows, key=lambda x: abs(x - a_row))
-                        else:
-                            lo = max(header_row_idx + 1, a_row - 50)
-                            hi = min(ws.max_row, a_row + 50)
-                            for rr in range(lo, hi + 1):
-                                if cell_to_text(ws.cell(row=rr, column=q_col_idx).value) != '':
-                                    target_row = rr
-                                    break
-                    except Exception:
-                        target_row = a_row
-                image_cell_map[(a_row, a_col)] = img
+
+def _data_url(img_bytes: bytes) -> Optional[str]:
+    fmt = 'png'
+    if img_bytes[:3] == b'\xff\xd8\xff':
+        fmt = 'jpeg'
+    if img_bytes[:8] == b'\x89PNG\r\n\x1a\n' or img_bytes[:3] == b'\xff\xd8\xff':
+        return f"data:image/{fmt};base64," + base64.b64encode(img_bytes).decode('utf-8')
+    return None
+
+
+def _parse_sheet(ws, sheet_name: str, z: Optional[zipfile.ZipFile], names: set, sheet_path: Optional[str], sw: Stopwatch) -> List[Question]:
+    """Extract the questions of one CO sheet.
+
+    The sheet is read once into row tuples; the per-column transforms
+    (type, BTL, marks, CO) then run over plain lists. `sheet_path` is the
+    worksheet's part in the package (from workbook_sheets), where its
+    pictures are looked up.
+    """
+    # The header is found in the first HEADER_SCAN_ROWS rows before the rest
+    # of the sheet is read, so a sheet without one is rejected cheaply
+    rows = ws.iter_rows(min_row=1, values_only=True)
+    head = list(islice(rows, HEADER_SCAN_ROWS))
+    header_row_idx, header_map = layout_cache.lookup(head, sheet_name)
+    sw.lap('header_map')
+    # grid[r - 1] is Excel row r, padded to max_col cells. Streamed sheets
+    # only know their size from an optional <dimension> tag, so it is measured
+    grid = head + list(rows)
+    max_col = max(map(len, grid), default=0)
+    grid = [row if len(row) == max_col else tuple(row) + (None,) * (max_col - len(row)) for row in grid]
+    sw.lap('sheet_rows')
+
+    q_col = header_map['Question Bank'] - 1
+    qtexts = [cell_to_text(row[q_col]) for row in grid]
+    first = header_row_idx  # 0-based index of the first data row
+    # Rows holding question text, for snapping images to their question
+    candidate_rows = [i + 1 for i in range(first, len(grid)) if qtexts[i]]
+
+    # image mapping per-sheet
+    image_cell_map = {}
+    image_row_map = {}
+    if z is not None and sheet_path:
+        try:
+            for a_row, a_col, media_bytes in _zip_sheet_images(z, names, sheet_path):
+                image_cell_map[(a_row, a_col)] = {'bytes': media_bytes, 'anchor_row': a_row, 'anchor_col': a_col}
+                # map to nearest question row in this sheet
+                target_row = nearest_row(candidate_rows, a_row)
                 if target_row not in image_row_map:
-                    image_row_map[target_row] = img
-
-            # extract questions
-            q_col_idx = header_map.get('Question Bank')
-            for r in range(header_row_idx + 1, ws.max_row + 1):
-                qtext = ''
-                q_source_row = r
-                q_source_col = q_col_idx
-                if q_col_idx:
-                    qcell_val = ws.cell(row=r, column=q_col_idx).value
-                    qtext = cell_to_text(qcell_val)
-                if not qtext and q_col_idx:
-                    found = False
-                    for d in range(1, 6):
-                        rr = r - d
-                        if rr > header_row_idx:
-                            val = ws.cell(row=rr, column=q_col_idx).value
-                            if val is not None and cell_to_text(val) != '':
-                                qtext = cell_to_text(val)
-                                q_source_row = rr
-                                found = True
-                                break
-                    if not found:
-                        for d in range(1, 6):
-                            rr = r + d
-                            if rr <= ws.max_row:
-                                val = ws.cell(row=rr, column=q_col_idx).value
-                                if val is not None and cell_to_text(val) != '':
-                                    qtext = cell_to_text(val)
-                                    q_source_row = rr
-                                    break
-                if not qtext:
-                    continue
+                    image_row_map[target_row] = {'anchor_row': a_row, 'anchor_col': a_col, 'bytes': media_bytes}
+        except Exception as e:
+            print(f"[Excel Debug] ZIP parse for sheet '{sheet_name}' failed: {e}")
 
-                def is_numeric_short(s: str) -> bool:
-                    s2 = s.strip()
-                    if not s2:
-                        return True
-                    if re.fullmatch(r"\d+", s2):
-                        return True
-                    if len(s2) <= 3:
-                        return True
-                    return False
-
-                if is_numeric_short(qtext):
-                    best = None
-                    best_len = 0
-                    for c in range(1, ws.max_column + 1):
-                        if c == q_col_idx:
-                            continue
-                        v = ws.cell(row=r, column=c).value
-                        if v is None:
+    for img in list(getattr(ws, '_images', [])):
+        anchor = getattr(img, 'anchor', None)
+        if anchor is None:
+            continue
+        if hasattr(anchor, '_from'):
+            a_row = anchor._from.row + 1
+            a_col = anchor._from.col + 1
+        elif hasattr(anchor, 'cell'):
+            a_row, a_col = coordinate_to_tuple(anchor.cell)
+        else:
+            continue
+        target_row = nearest_row(candidate_rows, a_row)
+        image_cell_map[(a_row, a_col)] = img
+        if target_row not in image_row_map:
+            image_row_map[target_row] = img
+    # row -> (leftmost anchored column, image) for the per-cell fallback
+    images_by_row: Dict[int, Tuple[int, object]] = {}
+    for (a_row, a_col), img in image_cell_map.items():
+        if a_col > max_col:
+            continue
+        cur = images_by_row.get(a_row)
+        if cur is None or a_col < cur[0]:
+            images_by_row[a_row] = (a_col, img)
+
+    sw.lap('image_map')
+
+    # Column-wise normalization
+    src = fill_sources(qtexts, first)
+    type_col = header_map['TYPE'] - 1
+    btl_col = header_map['BTL Level'] - 1
+    marks_col = header_map['Marks'] - 1
+    co_col = header_map['Course Outcomes'] - 1
+    part_col = header_map['Part'] - 1
+    types = [parse_type(cell_to_text(row[type_col] or '')) for row in grid]
+    row_texts: Dict[int, List[Tuple[int, str]]] = {}
+
+    def texts_of(i: int) -> List[Tuple[int, str]]:
+        # (column, text) for the non-blank cells of grid row i, computed on demand
+        cached = row_texts.get(i)
+        if cached is None:
+            cached = row_texts[i] = [(c + 1, t) for c, t in ((c, cell_to_text(v)) for c, v in enumerate(grid[i]) if v is not None) if t]
+        return cached
+
+    questions: List[Question] = []
+    for i in range(first, len(grid)):
+        j = src[i]
+        if j < 0:
+            continue
+        qtype = types[i]
+        r = i + 1
+        qtext = qtexts[j]
+        q_source_row = j + 1
+        q_source_col = q_col + 1
+
+        if is_numeric_short(qtext):
+            best = None
+            best_len = 0
+            for c, s in texts_of(i):
+                if c == q_source_col:
+                    continue
+                if len(s) > best_len and not _DIGITS_RE.fullmatch(s):
+                    best = (s, c)
+                    best_len = len(s)
+            if best:
+                qtext, q_source_col = best
+            else:
+                found = False
+                for d in range(1, 4):
+                    for ii in (i - d, i + d):
+                        if ii < first or ii >= len(grid):
                             continue
-                        s = cell_to_text(v)
-                        if s and not re.fullmatch(r"\d+", s) and len(s) > best_len:
-                            best = (s, c)
-                            best_len = len(s)
-                    if best:
-                        qtext, q_source_col = best[0], best[1]
-                    else:
-                        found = False
-                        for d in range(1, 4):
-                            for rr in (r - d, r + d):
-                                if rr <= header_row_idx or rr > ws.max_row:
-                                    continue
-                                for c in range(1, ws.max_column + 1):
-                                    v = ws.cell(row=rr, column=c).value
-                                    if v is None:
-                                        continue
-                                    s = cell_to_text(v)
-                                    if s and not re.fullmatch(r"\d+", s) and len(s) > 3:
-                                        qtext = s
-                                        q_source_row = rr
-                                        q_source_col = c
-                                        found = True
-                                        break
-                                if found:
-                                    break
-                            if found:
+                        for c, s in texts_of(ii):
+                            if len(s) > 3 and not _DIGITS_RE.fullmatch(s):
+                                qtext, q_source_row, q_source_col = s, ii + 1, c
+                                found = True
                                 break
+                        if found:
+                            break
+                    if found:
+                        break
 
-                type_raw = cell_to_text(ws.cell(row=r, column=header_map['TYPE']).value or '').lower()
-                if type_raw == 'o':
-                    qtype = 'objective'
-                elif type_raw == 'd':
-                    qtype = 'descriptive'
-                elif type_raw == 'c':
-                    qtype = 'Part_C'
-                else:
-                    continue
+        if qtype is None:
+            continue
+        row = grid[i]
+        btl_raw = row[btl_col]
+        btl = parse_btl(cell_to_text(btl_raw)) if btl_raw is not None else 2
+        marks = parse_marks(row[marks_col])
+        co_raw, co_multi_numbers, co = parse_co(cell_to_text(row[co_col]))
+        chapter = cell_to_text(row[part_col] or '') or None
 
-                btl_raw = ws.cell(row=r, column=header_map['BTL Level']).value
-                btl = 2
-                if btl_raw is not None:
-                    btl_str = cell_to_text(btl_raw).upper()
-                    btl_nums = re.findall(r'\d+', btl_str)
-                    if btl_nums:
-                        btl = int(max(btl_nums, key=int))
-
-                marks_raw = ws.cell(row=r, column=header_map['Marks']).value
-                try:
-                    marks = int(marks_raw) if marks_raw is not None else 1
-                except Exception:
-                    marks = 1
-
-                co_cell_value = ws.cell(row=r, column=header_map['Course Outcomes']).value
-                co_raw = cell_to_text(co_cell_value).replace('\n',' ').replace('\r',' ').strip()
-                digits_found = re.findall(r'([1-5])', co_raw)
-                ordered_unique = []
-                for d in digits_found:
-                    if d not in ordered_unique:
-                        ordered_unique.append(d)
-                co_multi_numbers = ','.join(ordered_unique) if ordered_unique else ''
-                co = None
-                if ordered_unique:
-                    co = f"CO{ordered_unique[0]}"
-                if co is None and co_raw:
-                    s_up = co_raw.upper()
-                    m_single = re.search(r'CO\s*([1-5])', s_up)
-                    if m_single:
-                        co = f"CO{m_single.group(1)}"
-
-                chapter = cell_to_text(ws.cell(row=r, column=header_map['Part']).value or '').strip() or None
-
-                image_data = None
-                img = None
-                if q_source_row in image_row_map:
-                    img = image_row_map[q_source_row]
-                    mapped_row = q_source_row
-                elif r in image_row_map:
-                    img = image_row_map[r]
-                    mapped_row = r
-                else:
-                    mapped_row = None
-                    for c in range(1, ws.max_column + 1):
-                        if (r, c) in image_cell_map:
-                            img = image_cell_map[(r, c)]
-                            mapped_row = r
-                            break
-                        if (q_source_row, c) in image_cell_map:
-                            img = image_cell_map[(q_source_row, c)]
-                            mapped_row = q_source_row
-                            break
+        img = None
+        if q_source_row in image_row_map:
+            img = image_row_map[q_source_row]
+            mapped_row = q_source_row
+        elif r in image_row_map:
+            img = image_row_map[r]
+            mapped_row = r
+        else:
+            mapped_row = None
+            here = images_by_row.get(r)
+            there = images_by_row.get(q_source_row)
+            if here is not None and (there is None or here[0] <= there[0]):
+                img, mapped_row = here[1], r
+            elif there is not None:
+                img, mapped_row = there[1], q_source_row
+
+        image_data = None
+        image_anchor_row = None
+        image_anchor_col = None
+        image_present = False
+        if img is not None:
+            image_anchor_row, image_anchor_col, img_bytes = _image_bytes(img)
+            if img_bytes:
+                image_present = True
+                add_image_bytes('excel_upload', len(img_bytes))
+                image_data = _data_url(img_bytes)
+
+        questions.append(Question(
+            qtext, type=qtype, btl=btl, marks=marks, co=co, co_cell=co_raw, co_numbers=co_multi_numbers,
+            chapter=chapter, image=image_data, row=r, source_row=q_source_row, source_col=q_source_col,
+            image_anchor_row=image_anchor_row, image_anchor_col=image_anchor_col,
+            image_mapped_row=mapped_row, image_present=image_present,
+        ))
+    sw.lap('row_extract')
+    return questions
+
+
+def parse_cache_key(data: bytes) -> str:
+    return f'{hashlib.sha256(data).hexdigest()}-v{PARSER_VERSION}.json'
+
+
+def parse_workbook(data: bytes, sw: Optional[Stopwatch] = None) -> dict:
+    """Parse a CO workbook into {'questions': [Question], 'meta': {...}}."""
+    sw = sw or Stopwatch()
+    # Streaming mode: sheets are parsed row by row as they are read, and
+    # pictures come from the package XML (_zip_sheet_images)
+    wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    sw.lap('workbook_load')
+    checkpoint('workbook_loaded')
+    try:
+        return _parse_loaded(wb, data, sw)
+    finally:
+        wb.close()
 
-                image_anchor_row = None
-                image_anchor_col = None
-                image_present = False
-                if img is not None:
-                    import base64
-                    img_bytes = None
-                    if isinstance(img, dict):
-                        image_anchor_row = img.get('anchor_row')
-                        image_anchor_col = img.get('anchor_col')
-                        img_bytes = img.get('bytes')
-                    else:
-                        anchor = getattr(img, 'anchor', None)
-                        if anchor is not None:
-                            if hasattr(anchor, '_from'):
-                                image_anchor_row = anchor._from.row + 1
-                                image_anchor_col = anchor._from.col + 1
-                            elif hasattr(anchor, 'cell'):
-                                rr, cc = coordinate_to_tuple(anchor.cell)
-                                image_anchor_row = rr
-                                image_anchor_col = cc
-                        for attr in ('_data', 'image', 'ref', 'blob'):
-                            v = getattr(img, attr, None)
-                            if v:
-                                if isinstance(v, bytes):
-                                    img_bytes = v
-                                    break
-                                try:
-                                    if hasattr(v, 'tobytes'):
-                                        img_bytes = v.tobytes()
-                                        break
-                                    if hasattr(v, 'read'):
-                                        img_bytes = v.read()
-                                        break
-                                except Exception:
-                                    pass
-                        if img_bytes is None:
-                            try:
-                                v = getattr(img, '_data', None)
-                                if v is not None:
-                                    if hasattr(v, 'tobytes'):
-                                        img_bytes = v.tobytes()
-                                    elif isinstance(v, bytes):
-                                        img_bytes = v
-                            except Exception:
-                                img_bytes = None
-                    if img_bytes:
-                        image_present = True
-                        fmt = 'png'
-                        if img_bytes[:3] == b'\xff\xd8\xff':
-                            fmt = 'jpeg'
-                        if img_bytes[:8] == b'\x89PNG\r\n\x1a\n' or img_bytes[:3] == b'\xff\xd8\xff':
-                            image_data = f"data:image/{fmt};base64," + base64.b64encode(img_bytes).decode('utf-8')
-
-                all_questions.append({
-                    'question_text': qtext,
-                    'type': qtype,
-                    'btl': btl,
-                    'marks': marks,
-                    'course_outcomes': co,
-                    'course_outcomes_cell': co_raw,
-                    'course_outcomes_numbers': co_multi_numbers,
-                    'chapter': chapter,
-                    'image': image_data,
-                    'question_source_row': q_source_row,
-                    'question_source_col': q_source_col,
-                    'image_anchor_row': image_anchor_row,
-                    'image_anchor_col': image_anchor_col,
-                    'image_mapped_row': mapped_row,
-                    'image_present': image_present,
-                })
 
+def _parse_loaded(wb, data: bytes, sw: Stopwatch) -> dict:
+    # --- Extract meta from INDEX sheet (C7:C9) ---
+    meta = {}
+    if 'INDEX' in wb.sheetnames:
+        values = [row[0] for row in wb['INDEX'].iter_rows(min_row=7, max_row=9, min_col=3, max_col=3, values_only=True)]
+        values += [None] * (3 - len(values))
+        for key, value in zip(('semester', 'course_code', 'course_name'), values):
+            meta[key] = str(value or '').strip()
+
+    sheets_to_process = select_sheets(wb.sheetnames, wb.active.title)
+
+    try:
+        z = zipfile.ZipFile(BytesIO(data))
+        names = set(z.namelist())
+        paths = dict(workbook_sheets(z)[0])
+    except Exception as e:
+        print(f"[Excel Debug] ZIP open failed: {e}")
+        z, names, paths = None, set(), {}
+    sw.lap('index_meta')
+
+    all_questions: List[Question] = []
+    for sheet_name in sheets_to_process:
+        all_questions.extend(_parse_sheet(wb[sheet_name], sheet_name, z, names, paths.get(sheet_name), sw))
+    checkpoint('questions_extracted')
+    return {'questions': all_questions, 'meta': meta}
+
+
+@router.post("/upload-questions-excel/")
+def upload_questions_excel(file: UploadFile = File(...)):
+
+    sw = Stopwatch()
+    try:
+        data = file.file.read()
+        sw.lap('read_upload')
+        key = parse_cache_key(data) if PARSE_CACHE_ENABLED else None
+        if key:
+            body = parse_cache.get(key)
+            sw.lap('cache_lookup')
+            if body is not None:
+                return Response(body, media_type='application/json', headers={'X-Parse-Cache': 'hit'})
+        parsed = parse_workbook(data, sw)
+        all_questions, meta = parsed['questions'], parsed['meta']
         if not all_questions:
-            return {
+            content = {
                 'questions': [],
                 'warning': 'No questions parsed from specified CO sheets.',
                 'meta': meta
             }
-        return {'questions': all_questions, 'meta': meta}
+        else:
+            content = {'questions': [q.to_excel_dict() for q in all_questions], 'meta': meta}
+        with stage('serialize'):
+            response = FastJSONResponse(content)
+        if key:
+            with stage('cache_store'):
+                parse_cache.put(key, bytes(response.body))
+            response.headers['X-Parse-Cache'] = 'miss'
+        return response
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Excel parse failed: {e}")
-
-
@@ -0,0 +1,31 @@
+import os
+
+
+def worker_count() -> int:
+    """Number of uvicorn worker processes from IDCS_WORKERS ('auto' = one per core)."""
+    raw = (os.environ.get('IDCS_WORKERS') or '1').strip().lower()
+    if raw == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return 1
+
+
+def run(app_ref: str, host: str, port: int, factory: bool = False, app_obj=None):
+    """Run uvicorn with one process, or several when IDCS_WORKERS > 1.
+
+    Multi-worker mode needs an import string (`app_ref`) so each worker can
+    import the app itself; `app_obj` is served directly in single-process mode.
+    All workers share the SQLite DB (WAL mode, init under an exclusive lock)
+    and the on-disk caches; in-process caches are per worker.
+    """
+    import uvicorn
+    workers = worker_count()
+    if workers > 1:
+        # Split the cores between workers so their CPU pools don't oversubscribe
+        os.environ.setdefault('IDCS_CPU_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+        print(f'[serve] starting {workers} workers on {host}:{port}')
+        uvicorn.run(app_ref, host=host, port=port, workers=workers, factory=factory)
+    else:
+        uvicorn.run(app_obj if app_obj is not None else app_ref, host=host, port=port, factory=factory and app_obj is None)
@@ -0,0 +1,153 @@
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from server.metrics import cache_hit, cache_miss
+
+# Vite emits content-hashed bundles as assets/<name>-<hash>.<ext>; those never
+# change under the same URL and can be cached forever. Everything else
+# (index.html, favicon, public/ files) is revalidated with its ETag.
+HASHED_NAME_RE = re.compile(r"-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Precompressed siblings produced by server/compress_assets.py, in order of preference.
+ENCODINGS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"))
+
+# The Windows registry sometimes maps .js to text/plain, which browsers refuse
+# to execute as a module script.
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("text/css", ".css")
+
+
+@dataclass
+class AssetEntry:
+    path: str
+    stat: os.stat_result
+    content_type: str
+    cache_control: str
+    etag: str
+    variants: Dict[str, Tuple[str, os.stat_result]] = field(default_factory=dict)
+
+
+def _etag(st: os.stat_result, suffix: str = "") -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}{suffix}"'
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    out: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[token] = q
+    return out
+
+
+class AssetIndex:
+    """In-memory index of everything under the frontend build directory.
+
+    Built once at mount time so serving an asset needs no filesystem stat;
+    each entry carries its ETag, Cache-Control policy and any .br/.gz
+    siblings found next to it.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        self.entries: Dict[str, AssetEntry] = {}
+        self.reload()
+
+    def reload(self):
+        entries: Dict[str, AssetEntry] = {}
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".br", ".gz")):
+                    continue
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, self.directory).replace(os.sep, "/")
+                st = os.stat(full)
+                hashed = rel.startswith("assets/") and HASHED_NAME_RE.search(name) is not None
+                entry = AssetEntry(
+                    path=full,
+                    stat=st,
+                    content_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+                    cache_control=IMMUTABLE_CACHE if hashed else REVALIDATE_CACHE,
+                    etag=_etag(st),
+                )
+                for coding, ext in ENCODINGS:
+                    sibling = full + ext
+                    if os.path.isfile(sibling):
+                        entry.variants[coding] = (sibling, os.stat(sibling))
+                entries[rel] = entry
+        self.entries = entries
+
+    def lookup(self, rel: str) -> Tuple[Optional[AssetEntry], bool]:
+        """Return (entry, is_directory_index) for a relative URL path."""
+        rel = rel.strip("/")
+        if rel in ("", "."):
+            return self.entries.get("index.html"), True
+        entry = self.entries.get(rel)
+        if entry is not None:
+            return entry, False
+        return self.entries.get(rel + "/index.html"), True
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves precompressed siblings and long-lived cache headers.
+
+    Requests that hit the asset index are answered from it directly; anything
+    else (directory redirects, 404.html, files added after startup) falls back
+    to the stock StaticFiles behaviour.
+    """
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.index = AssetIndex(directory)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            entry, is_dir_index = self.index.lookup(path.replace(os.sep, "/"))
+            if entry is not None:
+                cache_hit("static_index")
+            else:
+                cache_miss("static_index")
+            # Directory URLs without a trailing slash go through StaticFiles so
+            # the redirect behaviour is unchanged.
+            if entry is not None and (not is_dir_index or scope["path"].endswith("/")):
+                return self.asset_response(entry, scope)
+        return await super().get_response(path, scope)
+
+    def asset_response(self, entry: AssetEntry, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        file_path, st, etag, encoding = entry.path, entry.stat, entry.etag, None
+        for coding, _ext in ENCODINGS:
+            if coding in entry.variants and accepted.get(coding, 0) > 0:
+                file_path, st = entry.variants[coding]
+                etag, encoding = _etag(st, "-" + coding), coding
+                break
+        headers = {"etag": etag, "cache-control": entry.cache_control}
+        if entry.variants:
+            headers["vary"] = "Accept-Encoding"
+        if encoding:
+            headers["content-encoding"] = encoding
+        response = FileResponse(file_path, headers=headers, media_type=entry.content_type, stat_result=st)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
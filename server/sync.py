@@ -0,0 +1,377 @@
+"""Two-way delta sync between the local question bank and Supabase.
+
+The local SQLite store works offline; this module reconciles it with the
+Supabase `question_bank` table over PostgREST when a connection is there.
+Only rows changed since the last sync cross the wire:
+
+  pull    remote rows with updated_at past the stored high-water mark
+          (keyset-paged on (updated_at, id)), applied locally in batches
+  delete  local deletions of rows that exist remotely (tombstones)
+  push    local rows whose version (see migrations._v3_sync_tracking) is
+          past the push high-water mark, upserted in batches
+
+A row edited on both sides since the last sync goes to the side with the
+later updated_at (the local side on ties). The COLUMNS below map onto the
+remote ones of the same name; remote-only columns (course_code, semester,
+...) are left untouched by pushes. A pulled row without
+course_outcomes_numbers gets them derived from course_outcomes, as local
+writes do. PostgREST does not report remote deletions, so those are not
+pulled.
+
+    IDCS_SUPABASE_URL=https://<project>.supabase.co   enables sync
+    IDCS_SUPABASE_KEY=<key>                            apikey / bearer token
+    IDCS_SYNC_BATCH=500                                rows per request
+
+    python -m server.sync [--url URL] [--key KEY]      run one sync cycle
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from server.db import get_conn
+from server.metrics import SYNC_CONFLICTS, SYNC_ROWS
+from server.routes.upload_questions_excel import co_numbers
+
+BATCH = int(os.environ.get('IDCS_SYNC_BATCH') or 500)
+
+# Columns shared by the local and remote question_bank tables
+COLUMNS = ('question_text', 'type', 'options', 'correct_answer', 'answer_text', 'btl', 'marks', 'status',
+           'chapter', 'course_outcomes', 'course_outcomes_numbers', 'image_url', 'title_id')
+PULL_SELECT = ','.join(('id',) + COLUMNS + ('updated_at',))
+
+
+class SyncError(Exception):
+    """The remote rejected a request or could not be reached."""
+
+
+class SyncBusy(SyncError):
+    """Another sync is already running in this process."""
+
+
+def _ts(value: str) -> datetime.datetime:
+    t = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return t if t.tzinfo else t.replace(tzinfo=datetime.timezone.utc)
+
+
+def _comparable(values: tuple) -> tuple:
+    # Pushes send '' for a missing answer_text, jsonb may reorder option keys,
+    # and missing CO numbers stand for the ones course_outcomes gives
+    row = dict(zip(COLUMNS, values))
+    row['answer_text'] = row['answer_text'] or ''
+    row['course_outcomes_numbers'] = row['course_outcomes_numbers'] or co_numbers(row['course_outcomes'])
+    if row['options']:
+        row['options'] = json.loads(row['options'])
+    return tuple(row.values())
+
+
+def _utcnow() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+class PostgrestClient:
+    def __init__(self, url: str, key: Optional[str] = None, timeout: float = 30.0):
+        self.base = url.rstrip('/') + '/rest/v1'
+        self.timeout = timeout
+        self.session = requests.Session()
+        if key:
+            self.session.headers.update({'apikey': key, 'Authorization': f'Bearer {key}'})
+
+    def _request(self, method: str, table: str, params=None, body=None, prefer: Optional[str] = None):
+        headers = {'Prefer': prefer} if prefer else None
+        try:
+            r = self.session.request(method, f'{self.base}/{table}', params=params, json=body,
+                                     headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SyncError(f'{method} {table}: {e}') from e
+        if r.status_code >= 400:
+            raise SyncError(f'{method} {table}: HTTP {r.status_code} {r.text[:300]}')
+        return r.json() if r.content else []
+
+    def select(self, table: str, params: dict) -> List[dict]:
+        return self._request('GET', table, params)
+
+    def upsert(self, table: str, rows: List[dict], on_conflict: str, returning: str) -> List[dict]:
+        return self._request('POST', table, {'on_conflict': on_conflict, 'select': returning}, rows,
+                             prefer='resolution=merge-duplicates,return=representation')
+
+    def delete_ids(self, table: str, ids: Iterable[str]) -> None:
+        self._request('DELETE', table, {'id': f'in.({",".join(ids)})'})
+
+
+class SyncEngine:
+    def __init__(self, client: PostgrestClient, connect: Callable = get_conn, batch: int = BATCH):
+        self.client = client
+        self.connect = connect
+        self.batch = batch
+        self._lock = threading.Lock()
+
+    # --- state -----------------------------------------------------------------
+
+    @staticmethod
+    def _get(conn, key: str, default=None):
+        row = conn.execute('SELECT value FROM sync_state WHERE key=?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    @staticmethod
+    def _set(conn, key: str, value) -> None:
+        conn.execute('INSERT OR REPLACE INTO sync_state(key, value) VALUES (?,?)', (key, value))
+
+    # --- entry point -----------------------------------------------------------
+
+    def sync(self) -> dict:
+        """Pull, push deletions, push changes. Returns per-direction row counts."""
+        if not self._lock.acquire(blocking=False):
+            raise SyncBusy('a sync is already running')
+        try:
+            report = {'pulled': 0, 'deleted': 0, 'pushed': 0, 'conflicts': {'local': 0, 'remote': 0}}
+            conn = self.connect()
+            conn.isolation_level = None
+            try:
+                self.pull(conn, report)
+                self.push_deletes(conn, report)
+                self.push(conn, report)
+                report['finished_at'] = _utcnow()
+                self._set(conn, 'last_sync', json.dumps(report))
+            finally:
+                conn.close()
+            return report
+        finally:
+            self._lock.release()
+
+    # --- titles ----------------------------------------------------------------
+
+    def _map_remote_titles(self, conn, remote_ids: set) -> Dict[str, int]:
+        """Remote title uuid -> local title id, creating local titles as needed."""
+        if not remote_ids:
+            return {}
+        marks = ','.join('?' * len(remote_ids))
+        mapped = {r: t for t, r in conn.execute(
+            f'SELECT title_id, remote_id FROM question_bank_titles_sync WHERE remote_id IN ({marks})', tuple(remote_ids))}
+        missing = sorted(remote_ids - set(mapped))
+        if missing:
+            for rt in self.client.select('question_bank_titles', {'select': 'id,title', 'id': f'in.({",".join(missing)})'}):
+                conn.execute('INSERT OR IGNORE INTO question_bank_titles(title) VALUES (?)', (rt['title'],))
+                local = conn.execute('SELECT id FROM question_bank_titles WHERE title=?', (rt['title'],)).fetchone()[0]
+                conn.execute('INSERT OR REPLACE INTO question_bank_titles_sync(title_id, remote_id) VALUES (?,?)', (local, rt['id']))
+                mapped[rt['id']] = local
+        return mapped
+
+    def _push_titles(self, conn, title_ids: set) -> Dict[int, str]:
+        """Local title id -> remote uuid, upserting titles the remote lacks (matched on the unique title)."""
+        if not title_ids:
+            return {}
+        marks = ','.join('?' * len(title_ids))
+        mapped = dict(conn.execute(
+            f'SELECT title_id, remote_id FROM question_bank_titles_sync WHERE title_id IN ({marks})', tuple(title_ids)))
+        missing = title_ids - set(mapped)
+        if missing:
+            marks = ','.join('?' * len(missing))
+            by_title = {title: tid for tid, title in conn.execute(
+                f'SELECT id, title FROM question_bank_titles WHERE id IN ({marks})', tuple(missing))}
+            if by_title:
+                for rt in self.client.upsert('question_bank_titles', [{'title': t} for t in by_title], 'title', 'id,title'):
+                    tid = by_title[rt['title']]
+                    conn.execute('INSERT OR REPLACE INTO question_bank_titles_sync(title_id, remote_id) VALUES (?,?)', (tid, rt['id']))
+                    mapped[tid] = rt['id']
+        return mapped
+
+    # --- pull ------------------------------------------------------------------
+
+    def pull(self, conn, report: dict) -> None:
+        since = self._get(conn, 'pull_since')
+        since_id = self._get(conn, 'pull_since_id')
+        while True:
+            params = {'select': PULL_SELECT, 'order': 'updated_at.asc,id.asc', 'limit': self.batch}
+            if since:
+                params['or'] = f'(updated_at.gt."{since}",and(updated_at.eq."{since}",id.gt.{since_id}))'
+            rows = self.client.select('question_bank', params)
+            if not rows:
+                return
+            titles = self._map_remote_titles(conn, {r['title_id'] for r in rows if r.get('title_id')})
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for r in rows:
+                    self._apply_remote(conn, r, titles, report)
+                since, since_id = rows[-1]['updated_at'], rows[-1]['id']
+                self._set(conn, 'pull_since', since)
+                self._set(conn, 'pull_since_id', since_id)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            if len(rows) < self.batch:
+                return
+
+    def _conflict(self, report: dict, winner: str) -> None:
+        report['conflicts'][winner] += 1
+        SYNC_CONFLICTS.labels(winner).inc()
+
+    def _apply_remote(self, conn, r: dict, titles: Dict[str, int], report: dict) -> None:
+        values = (
+            r.get('question_text') or '', r.get('type') or 'objective',
+            json.dumps(r['options']) if r.get('options') is not None else None,
+            r.get('correct_answer'), r.get('answer_text'), r.get('btl'), r.get('marks'), r.get('status'),
+            r.get('chapter'), r.get('course_outcomes'),
+            r.get('course_outcomes_numbers') or co_numbers(r.get('course_outcomes')), r.get('image_url'),
+            titles.get(r.get('title_id')),
+        )
+        remote_ts = _ts(r['updated_at'])
+        local = conn.execute('SELECT question_id, version, synced_version, updated_at FROM question_bank_sync WHERE remote_id=?',
+                             (r['id'],)).fetchone()
+        if local is None:
+            tomb = conn.execute('SELECT deleted_at FROM question_bank_tombstones WHERE remote_id=?', (r['id'],)).fetchone()
+            if tomb is not None:
+                if _ts(tomb[0]) >= remote_ts:
+                    self._conflict(report, 'local')
+                    return
+                conn.execute('DELETE FROM question_bank_tombstones WHERE remote_id=?', (r['id'],))
+                self._conflict(report, 'remote')
+            cur = conn.execute(f'INSERT INTO question_bank({",".join(COLUMNS)}) VALUES ({",".join("?" * len(COLUMNS))})', values)
+            qid = cur.lastrowid
+            conn.execute('UPDATE question_bank_sync SET remote_id=? WHERE question_id=?', (r['id'], qid))
+        else:
+            qid, version, synced_version, local_ts = local
+            if version > synced_version:
+                if _ts(local_ts) >= remote_ts:
+                    self._conflict(report, 'local')
+                    return
+                self._conflict(report, 'remote')
+            current = conn.execute(f'SELECT {",".join(COLUMNS)} FROM question_bank WHERE id=?', (qid,)).fetchone()
+            if _comparable(tuple(current)) == _comparable(values):
+                conn.execute('UPDATE question_bank_sync SET synced_version=version, updated_at=? WHERE question_id=?', (r['updated_at'], qid))
+                return
+            conn.execute(f'UPDATE question_bank SET {",".join(c + "=?" for c in COLUMNS)} WHERE id=?', values + (qid,))
+        # The write above went through the change triggers; it is already in sync
+        conn.execute('UPDATE question_bank_sync SET synced_version=version, updated_at=? WHERE question_id=?', (r['updated_at'], qid))
+        report['pulled'] += 1
+        SYNC_ROWS.labels('pull').inc()
+
+    # --- push ------------------------------------------------------------------
+
+    def push_deletes(self, conn, report: dict) -> None:
+        while True:
+            ids = [r[0] for r in conn.execute('SELECT remote_id FROM question_bank_tombstones ORDER BY remote_id LIMIT ?', (self.batch,))]
+            if not ids:
+                return
+            self.client.delete_ids('question_bank', ids)
+            conn.executemany('DELETE FROM question_bank_tombstones WHERE remote_id=?', [(i,) for i in ids])
+            report['deleted'] += len(ids)
+            SYNC_ROWS.labels('delete').inc(len(ids))
+
+    def push(self, conn, report: dict) -> None:
+        hwm = int(self._get(conn, 'push_version', 0))
+        while True:
+            # Writes after this point get a version above `clock`
+            clock = int(self._get(conn, 'clock', 0))
+            rows = conn.execute(f"""
+                SELECT s.question_id, s.version, s.remote_id, {",".join("q." + c for c in COLUMNS)}
+                FROM question_bank_sync s JOIN question_bank q ON q.id = s.question_id
+                WHERE s.version > ? AND s.version > s.synced_version
+                ORDER BY s.version LIMIT ?""", (hwm, self.batch)).fetchall()
+            if not rows:
+                # Everything up to `clock` is pushed or came from a pull
+                self._set(conn, 'push_version', max(hwm, clock))
+                return
+            titles = self._push_titles(conn, {r[3 + COLUMNS.index('title_id')] for r in rows} - {None})
+            # Remote ids are assigned and stored before the upsert, so a
+            # retried push updates the same remote rows
+            fresh = [(str(uuid.uuid4()), r[0]) for r in rows if r[2] is None]
+            if fresh:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany('UPDATE question_bank_sync SET remote_id=? WHERE question_id=?', fresh)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            remote_ids = {qid: rid for rid, qid in fresh}
+            payload = []
+            for r in rows:
+                rec = dict(zip(COLUMNS, r[3:]))
+                rec['id'] = r[2] or remote_ids[r[0]]
+                rec['options'] = json.loads(rec['options']) if rec['options'] else None
+                rec['answer_text'] = rec['answer_text'] or ''
+                rec['title_id'] = titles.get(rec['title_id'])
+                payload.append(rec)
+            stamped = {x['id']: x['updated_at'] for x in self.client.upsert('question_bank', payload, 'id', 'id,updated_at')}
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Rows edited locally while the request was in flight keep their newer version
+                conn.executemany('UPDATE question_bank_sync SET synced_version=?, updated_at=? WHERE question_id=? AND version=?',
+                                 [(r[1], stamped.get(rec['id'], ''), r[0], r[1]) for r, rec in zip(rows, payload)
+                                  if rec['id'] in stamped])
+                hwm = rows[-1][1]
+                self._set(conn, 'push_version', hwm)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            report['pushed'] += len(rows)
+            SYNC_ROWS.labels('push').inc(len(rows))
+
+
+# --- configuration / status -----------------------------------------------------
+
+def configured_engine(url: Optional[str] = None, key: Optional[str] = None) -> Optional[SyncEngine]:
+    url = url or os.environ.get('IDCS_SUPABASE_URL')
+    if not url:
+        return None
+    return SyncEngine(PostgrestClient(url, key or os.environ.get('IDCS_SUPABASE_KEY')))
+
+
+_engine: Optional[SyncEngine] = None
+_engine_lock = threading.Lock()
+
+
+def default_engine() -> Optional[SyncEngine]:
+    """Process-wide engine for the configured project (None when sync is not configured)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = configured_engine()
+        return _engine
+
+
+def status(connect: Callable = get_conn) -> dict:
+    conn = connect()
+    try:
+        state = dict(conn.execute('SELECT key, value FROM sync_state'))
+        pending = conn.execute('SELECT COUNT(*) FROM question_bank_sync WHERE version > synced_version').fetchone()[0]
+        deletes = conn.execute('SELECT COUNT(*) FROM question_bank_tombstones').fetchone()[0]
+    finally:
+        conn.close()
+    last = state.get('last_sync')
+    return {
+        'configured': bool(os.environ.get('IDCS_SUPABASE_URL')),
+        'pending_push': pending,
+        'pending_deletes': deletes,
+        'pull_since': state.get('pull_since'),
+        'last_sync': json.loads(last) if last else None,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Run one sync cycle with Supabase.')
+    ap.add_argument('--url', help='project URL (default: IDCS_SUPABASE_URL)')
+    ap.add_argument('--key', help='API key (default: IDCS_SUPABASE_KEY)')
+    args = ap.parse_args(argv)
+    from server.db import init_db
+    init_db()
+    engine = configured_engine(args.url, args.key)
+    if engine is None:
+        sys.exit('set IDCS_SUPABASE_URL or pass --url')
+    try:
+        print(json.dumps(engine.sync(), indent=2))
+    except SyncError as e:
+        sys.exit(f'sync failed: {e}')
+
+
+if __name__ == '__main__':
+    main()
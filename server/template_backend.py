@@ -1,26 +1,10 @@
 import logging
+from server.logsetup import SAMPLE, setup_logging
 
-# Setup logging to file and console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("template_backend.log", mode="a", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
-from logging.handlers import RotatingFileHandler
+# Records go through a queue; a background thread writes console + server.log
+setup_logging()
 logger = logging.getLogger("template_backend")
-logger.setLevel(logging.INFO)
-
-# Add file handler to log to 'server.log' with rotation
-file_handler = RotatingFileHandler("server.log", maxBytes=2*1024*1024, backupCount=3)
-file_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
-file_handler.setFormatter(formatter)
-if not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
-    logger.addHandler(file_handler)
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, HTTPException, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 from typing import List, Optional
@@ -30,8 +14,18 @@ import tempfile
 import csv
 from docx import Document
 from server.routes.upload_questions_excel import router as upload_questions_router
+from server.docx_skeleton import new_document
+from server.json_response import FastJSONResponse
+from server.compression import CompressionMiddleware
+from server.executor import install as install_executor, run_cpu, run_io
+from server.memprofile import checkpoint, install as install_memprofile
+from server.timing import Stopwatch, install as install_timing, stage
+from server.metrics import OCR_CALLS, RENDERS_IN_FLIGHT, add_image_bytes, install as install_metrics
+from server.paper_cache import cached_paper_response, lookup_paper, paper_headers, parse_seed, store_paper
+from server.question import Question, parse_questions, scan_dicts
+from starlette.background import BackgroundTask
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Register the upload questions router
 app.include_router(upload_questions_router, prefix="/api")
@@ -43,13 +37,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli for JSON bodies over 1 KB (scan results carry base64 images)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+# Blocking work (python-docx, image fetches) runs in sized pools, not on the event loop
+install_executor(app)
+# IDCS_MEMPROFILE=1: per-request tracemalloc/RSS records at /api/debug/memory
+install_memprofile(app)
+# Server-Timing headers, timing log lines and /api/debug/timings histograms
+install_timing(app)
+# Prometheus text metrics at /metrics
+install_metrics(app)
 
-@app.post("/api/template/upload")
-async def upload_template(file: UploadFile = File(...)):
-    ext = os.path.splitext(file.filename)[1].lower()
+def extract_template_lines(data: bytes, ext: str):
+    """Return the non-empty lines of a txt/csv/docx template, or None if unsupported."""
     content_lines: List[str] = []
     with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        tmp.write(await file.read())
+        tmp.write(data)
         tmp_path = tmp.name
     try:
         if ext == ".txt":
@@ -67,23 +70,35 @@ async def upload_template(file: UploadFile = File(...)):
                 if text:
                     content_lines.append(text)
         else:
-            return JSONResponse(status_code=400, content={"error": "Unsupported file type"})
+            return None
     finally:
         os.remove(tmp_path)
+    return content_lines
+
+@app.post("/api/template/upload")
+async def upload_template(file: UploadFile = File(...)):
+    ext = os.path.splitext(file.filename)[1].lower()
+    content_lines = await run_cpu(extract_template_lines, await file.read(), ext)
+    if content_lines is None:
+        return JSONResponse(status_code=400, content={"error": "Unsupported file type"})
     return {"lines": content_lines}
 
-@app.post("/api/template/scan-docx")
-async def scan_docx(file: UploadFile = File(...)):
+def scan_docx_bytes(data: bytes) -> dict:
+    """Extract questions (and parse diagnostics) from a question-paper DOCX."""
     import re
     from docx import Document
     import tempfile
     import os
     questions = []
+    sw = Stopwatch()
     with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
-        tmp.write(await file.read())
+        tmp.write(data)
         tmp_path = tmp.name
+    sw.lap("write_temp")
     try:
         doc = Document(tmp_path)
+        sw.lap("docx_load")
+        checkpoint("document_loaded")
         part = None
         import base64
         # Build a map of image related parts (rid -> data-uri)
@@ -94,9 +109,11 @@ async def scan_docx(file: UploadFile = File(...)):
                 if ct.startswith('image/'):
                     blob = getattr(part_obj, 'blob', None)
                     if blob:
+                        add_image_bytes("docx_scan", len(blob))
                         image_map[rid] = f"data:{ct};base64,{base64.b64encode(blob).decode('ascii')}"
         except Exception:
             image_map = {}
+        sw.lap("image_parts")
 
         def extract_images_from_paragraph(p):
             imgs = []
@@ -107,7 +124,7 @@ async def scan_docx(file: UploadFile = File(...)):
                         if attrib_value in image_map:
                             if image_map[attrib_value] not in imgs:
                                 imgs.append(image_map[attrib_value])
-                                logger.info('template_backend: found image via attribute %s="%s" on tag %s', attrib_name, attrib_value, elem.tag)
+                                logger.debug('template_backend: found image via attribute %s="%s" on tag %s', attrib_name, attrib_value, elem.tag)
             except Exception as e:
                 logger.error('template_backend: error extracting images from paragraph: %s', e)
             return imgs
@@ -123,7 +140,7 @@ async def scan_docx(file: UploadFile = File(...)):
                     for rel in embeds:
                         if rel in image_map and image_map[rel] not in imgs:
                             imgs.append(image_map[rel])
-                            logger.info('template_backend: cell attached image via r:embed rel=%s', rel)
+                            logger.debug('template_backend: cell attached image via r:embed rel=%s', rel)
                 except Exception:
                     pass
             except Exception:
@@ -145,6 +162,7 @@ async def scan_docx(file: UploadFile = File(...)):
             table_shapes = []
             sample_table_texts = []
             para_snippets = []
+        sw.lap("table_summary")
         for table in doc.tables:
             # PART-A: 4 or 5 column table (some templates use 5 columns: Q.No, Question, CO, BTL, Marks)
             cols = len(table.columns)
@@ -158,16 +176,8 @@ async def scan_docx(file: UploadFile = File(...)):
                     number = len(questions) + 1
                     if qtext:
                         imgs = extract_images_from_cell(row.cells[1]) if len(row.cells) > 1 else []
-                        qobj = {
-                            'number': number,
-                            'text': qtext,
-                            'co': co,
-                            'btl': btl,
-                            'marks': marks or 2,
-                            'part': part
-                        }
-                        if imgs: qobj['images'] = imgs
-                        questions.append(qobj)
+                        questions.append(Question(qtext, number=number, co=co, btl=btl, marks=marks or 2,
+                                                  part=part, images=imgs or None))
             # PART-B: tables with OR structure. Accept 5+ columns (some generators use 5 columns)
             elif cols >= 5:
                 part = 'B'
@@ -191,35 +201,18 @@ async def scan_docx(file: UploadFile = File(...)):
                         number = 10 + (len(questions) // 2) + 1
                         if q_a:
                             imgs_a = extract_images_from_cell(row.cells[1]) if len(row.cells) > 1 else []
-                            qobj_a = {
-                                'number': f'{number}a',
-                                'text': q_a,
-                                'co': co_a,
-                                'btl': btl_a,
-                                'marks': marks_a,
-                                'part': part,
-                                'or': False
-                            }
-                            if imgs_a: qobj_a['images'] = imgs_a
-                            questions.append(qobj_a)
+                            questions.append(Question(q_a, number=f'{number}a', co=co_a, btl=btl_a, marks=marks_a,
+                                                      part=part, alternative=False, images=imgs_a or None))
                         if q_b:
                             imgs_b = extract_images_from_cell(rows[i+2].cells[1]) if len(rows[i+2].cells) > 1 else []
-                            qobj_b = {
-                                'number': f'{number}b',
-                                'text': q_b,
-                                'co': co_b,
-                                'btl': btl_b,
-                                'marks': marks_b,
-                                'part': part,
-                                'or': True
-                            }
-                            if imgs_b: qobj_b['images'] = imgs_b
-                            questions.append(qobj_b)
+                            questions.append(Question(q_b, number=f'{number}b', co=co_b, btl=btl_b, marks=marks_b,
+                                                      part=part, alternative=True, images=imgs_b or None))
                         i += 3
                     else:
                         i += 1
     finally:
         os.remove(tmp_path)
+    sw.lap("table_parse")
     # Fallback: if no questions found from tables, try paragraph-based parsing
     if not questions:
         import re
@@ -267,20 +260,17 @@ async def scan_docx(file: UploadFile = File(...)):
                     except Exception:
                         pass
                     j += 1
-                qobj = {'number': num, 'text': text, 'co': None, 'btl': None, 'marks': None, 'part': None}
-                if options:
-                    qobj['options'] = options
-                    qobj['type'] = 'objective'
-                if answer_text:
-                    qobj['answer_text'] = answer_text
+                qobj = Question(text, number=num, options=options or None,
+                                type='objective' if options else None, answer_text=answer_text)
                 if 'images' in locals() and images:
-                    qobj['images'] = images
+                    qobj.images = images
                     del images
                 questions.append(qobj)
                 i = j
             else:
                 i += 1
 
+    sw.lap("paragraph_fallback")
     # Add diagnostic info to response to help debug parsing failures
     diagnostic = {
         'table_count': len(table_shapes),
@@ -288,7 +278,7 @@ async def scan_docx(file: UploadFile = File(...)):
         'sample_table_texts': sample_table_texts,
         'paragraph_snippets': para_snippets,
         'parsed_questions': len(questions),
-        'image_count': sum(len(q.get('images', [])) for q in questions)
+        'image_count': sum(len(q.images or ()) for q in questions)
     }
     # Summarize related parts (images, media) present in the docx package for debugging
     try:
@@ -325,27 +315,47 @@ async def scan_docx(file: UploadFile = File(...)):
     except Exception:
         diagnostic['references'] = {}
         diagnostic['image_hint_parts'] = []
+    sw.lap("package_scan")
     try:
-        logger.info('scan-docx diagnostic: %s', diagnostic)
+        # Counts only; the full dict (snippets, part references) is in the response
+        logger.info('scan-docx parsed %d question(s), %d image(s), %d table(s)',
+                    diagnostic['parsed_questions'], diagnostic['image_count'], diagnostic['table_count'],
+                    extra={'related_parts': len(diagnostic.get('related_parts', []))})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('scan-docx diagnostic: %s', diagnostic)
     except Exception:
         pass
-    return {"questions": questions, "diagnostic": diagnostic}
+    sw.lap("diagnostic_log")
+    checkpoint("questions_extracted")
+    return {"questions": scan_dicts(questions), "diagnostic": diagnostic}
 
-@app.post("/api/template/generate-docx")
-async def generate_docx(
-    questions: list = Form(...),
-    dept: str = Form(""),
-    cc: str = Form(""),
-    cn: str = Form(""),
-    qpcode: str = Form(""),
-    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"),
-    regulation: str = Form("Regulation 2023"),
-    semester: str = Form("Second Semester"),
-    excel_meta: str = Form(None),
-    ocr_images: Optional[str] = Form(None),
-    title_image_url: Optional[str] = Form(None),
-    header_logo_url: Optional[str] = Form(None),
-):
+@app.post("/api/template/scan-docx")
+async def scan_docx(file: UploadFile = File(...)):
+    return FastJSONResponse(await run_cpu(scan_docx_bytes, await file.read()))
+
+# Part of the rendered-paper cache key: bump whenever render_paper_docx output changes
+PAPER_LAYOUT_VERSION = 1
+
+def render_paper_docx(
+    questions: list,
+    dept: str,
+    cc: str,
+    cn: str,
+    qpcode: str,
+    exam_title: str,
+    regulation: str,
+    semester: str,
+    excel_meta: Optional[str],
+    ocr_images: Optional[str],
+    title_image_url: Optional[str],
+    header_logo_url: Optional[str],
+    seed: int = 0,
+) -> str:
+    """Build the question paper and return the path of the saved temp .docx.
+
+    Shuffles and BTL fallbacks draw from random.Random(seed), so equal
+    inputs give an equal paper.
+    """
     from docx import Document
     from docx.shared import Pt, Inches
     from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -355,8 +365,7 @@ async def generate_docx(
     from io import BytesIO
     import base64, requests
 
-    
-
+    sw = Stopwatch()
 
     # If excel_meta is provided, parse and override cc/cn/dept/semester
     import json
@@ -390,7 +399,9 @@ async def generate_docx(
         return str(sem)
     sem_word = semester_to_words(sem_from_excel)
 
-    doc = Document()
+    sw.lap("excel_meta")
+    doc = new_document()
+    sw.lap("skeleton")
 
       # Insert banner image above semester line if provided
     logo_url = title_image_url if title_image_url else None
@@ -404,12 +415,17 @@ async def generate_docx(
                 header, b64data = logo_url.split(',', 1)
                 img_bytes = base64.b64decode(b64data)
                 stream = BytesIO(img_bytes)
-                banner_cell.paragraphs[0].add_run().add_picture(stream, width=Inches(6))
+                add_image_bytes("docx_render", len(img_bytes))
+                with stage("image_embed"):
+                    banner_cell.paragraphs[0].add_run().add_picture(stream, width=Inches(6))
             elif logo_url.startswith('http://') or logo_url.startswith('https://'):
-                resp = requests.get(logo_url, timeout=5)
+                with stage("image_fetch"):
+                    resp = requests.get(logo_url, timeout=5)
                 if resp.ok:
                     stream = BytesIO(resp.content)
-                    banner_cell.paragraphs[0].add_run().add_picture(stream, width=Inches(6))
+                    add_image_bytes("docx_render", len(resp.content))
+                    with stage("image_embed"):
+                        banner_cell.paragraphs[0].add_run().add_picture(stream, width=Inches(6))
             banner_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
         except Exception:
             logger.exception("Failed to insert banner image; continuing without it")
@@ -455,12 +471,17 @@ async def generate_docx(
                 header, b64data = header_logo_url.split(',', 1)
                 img_bytes = base64.b64decode(b64data)
                 stream = BytesIO(img_bytes)
-                c_logo.paragraphs[0].add_run().add_picture(stream, width=Inches(1.5))
+                add_image_bytes("docx_render", len(img_bytes))
+                with stage("image_embed"):
+                    c_logo.paragraphs[0].add_run().add_picture(stream, width=Inches(1.5))
             elif header_logo_url.startswith('http://') or header_logo_url.startswith('https://'):
-                resp = requests.get(header_logo_url, timeout=5)
+                with stage("image_fetch"):
+                    resp = requests.get(header_logo_url, timeout=5)
                 if resp.ok:
                     stream = BytesIO(resp.content)
-                    c_logo.paragraphs[0].add_run().add_picture(stream, width=Inches(1.5))
+                    add_image_bytes("docx_render", len(resp.content))
+                    with stage("image_embed"):
+                        c_logo.paragraphs[0].add_run().add_picture(stream, width=Inches(1.5))
             c_logo.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
         except Exception:
             logger.exception("Failed to insert header logo; falling back to text-only title")
@@ -501,6 +522,7 @@ async def generate_docx(
 
    
 
+    sw.lap("header")
     # PART-A title and marks in a single row using a table for alignment
     parta_tbl = doc.add_table(rows=1, cols=3)
     parta_tbl.alignment = WD_TABLE_ALIGNMENT.CENTER
@@ -553,32 +575,10 @@ async def generate_docx(
         for r in c.paragraphs[0].runs:
             r.bold = True
 
-    # Normalize incoming questions to dicts
-    import json, random
-    def _normalize(raw):
-        out = []
-        def _push(item):
-            if isinstance(item, str):
-                try:
-                    item = json.loads(item)
-                except Exception:
-                    item = {"text": item}
-            if isinstance(item, list):
-                for sub in item:
-                    _push(sub)
-            elif isinstance(item, dict):
-                out.append(item)
-        # entry point
-        if isinstance(raw, str) or isinstance(raw, dict) or isinstance(raw, list):
-            _push(raw)
-        else:
-            try:
-                _push(json.loads(str(raw)))
-            except Exception:
-                pass
-        return out
-
-    _questions = _normalize(questions)
+    # Canonicalize once; everything below reads Question attributes
+    import random
+    rng = random.Random(seed)
+    _questions = parse_questions(questions)
     # Parse optional OCR images map: { index_or_id: dataUrl }
     import json as _json
     ocr_map = {}
@@ -590,76 +590,59 @@ async def generate_docx(
     except Exception:
         logger.exception("Failed to parse ocr_images payload")
     logger.info("generate_docx called: received %d question(s)", len(_questions))
-    # Normalize common image keys and log per-question image presence (without dumping full base64)
+    # Log per-question image presence (without dumping full base64)
     try:
         image_count = 0
+        # Building previews costs more than the loop itself; only do it when DEBUG is on
+        debug_images = logger.isEnabledFor(logging.DEBUG)
         for i, q in enumerate(_questions):
-            if not isinstance(q, dict):
-                logger.debug("Question %s is not a dict (type=%s)", i, type(q))
-                continue
-            # Support alternate keys the frontend might send
-            for alt in ('image', 'img', 'imageUrl', 'img_url'):
-                if alt in q and 'image_url' not in q:
-                    q['image_url'] = q.get(alt)
-                    logger.debug("Normalized image key '%s' -> 'image_url' for question %s", alt, i)
-
-            img = q.get('image_url')
+            img = q.image
             if img:
                 image_count += 1
-                try:
+                if debug_images:
                     kind = 'data' if isinstance(img, str) and img.startswith('data:') else ('http' if isinstance(img, str) and img.startswith('http') else type(img))
                     preview = (img[:80] + '...') if isinstance(img, str) and len(img) > 80 else str(img)
-                    logger.info("Question %s: has image_url (kind=%s, preview=%s)", i, kind, preview)
-                except Exception:
-                    logger.exception("Error while logging image preview for question %s", i)
-            else:
-                logger.debug("Question %s: no image_url", i)
+                    logger.debug("Question %s: has image_url (kind=%s, preview=%s)", i, kind, preview)
 
         logger.info("Found %d questions with image_url", image_count)
     except Exception:
         logger.exception("Error while counting/normalizing image URLs")
 
+    sw.lap("normalize_questions")
     # Choose up to 10 random Part-A questions; fall back sensibly
     a_questions = [q for q in _questions if str(q.get('part', '')).upper() == 'A']
     if not a_questions:
         # heuristic fallback by marks/type if part missing
         a_questions = [
             q for q in _questions
-            if str(q.get('marks', '')).strip().lower() in ("2", "2m", "2 marks", "2 mark", "2-marks")
-            or str(q.get('type', '')).strip().lower() in ("a", "part-a", "short", "objective", "two", "2")
+            if q.str_of('marks').strip().lower() in ("2", "2m", "2 marks", "2 mark", "2-marks")
+            or q.str_of('type').strip().lower() in ("a", "part-a", "short", "objective", "two", "2")
         ]
     if not a_questions:
         a_questions = _questions
 
-    random.shuffle(a_questions)
+    rng.shuffle(a_questions)
     selected_a = a_questions[:10]
 
-    # Helpers to read common field names
-    def _first_non_empty(d: dict, keys: list[str]):
-        for k in keys:
-            if k in d and d[k] is not None and str(d[k]).strip() != "":
-                return str(d[k])
-        return ""
-
     # Separate descriptive and objective questions for PART-A
-    desc_qs = [q for q in _questions if isinstance(q, dict) and (
+    desc_qs = [q for q in _questions if (
         str(q.get('type', '')).lower() in ('descriptive', 'd', 'desc', 'long', 'theory') or
         (str(q.get('part', '')).upper() == 'A' and str(q.get('marks', '2')).strip() != '2')
     )]
-    obj_qs = [q for q in _questions if isinstance(q, dict) and (
+    obj_qs = [q for q in _questions if (
         str(q.get('type', '')).lower() in ('objective', 'o', 'obj', 'short', 'mcq', 'one', '2', 'two') or
         (str(q.get('part', '')).upper() == 'A' and str(q.get('marks', '2')).strip() == '2')
     )]
     # Fallbacks if not enough
     if not desc_qs:
-        desc_qs = [q for q in _questions if isinstance(q, dict)]
+        desc_qs = list(_questions)
     if not obj_qs:
-        obj_qs = [q for q in _questions if isinstance(q, dict)]
-    random.shuffle(desc_qs)
-    random.shuffle(obj_qs)
+        obj_qs = list(_questions)
+    rng.shuffle(desc_qs)
+    rng.shuffle(obj_qs)
 
     # Prepare BTL shared value for questions 5-10 (must be 3,4 or 5)
-    btl_shared = random.choice([3, 4, 5])
+    btl_shared = rng.choice([3, 4, 5])
     idx = 1
     import re
 
@@ -680,8 +663,10 @@ async def generate_docx(
                     img = img.convert("RGB")
                 text = pytesseract.image_to_string(img)
                 cleaned = text.strip()
+                OCR_CALLS.labels("text" if cleaned else "empty").inc()
                 return cleaned if cleaned else None
         except Exception:
+            OCR_CALLS.labels("error").inc()
             logger.exception("OCR failed for provided data URL")
             return None
     for i, q in enumerate(_questions[:10]):
@@ -693,7 +678,7 @@ async def generate_docx(
         row_cells[0].text = str(idx)
 
         # Question text without any label prefix
-        text = _first_non_empty(q, ['text', 'question_text', 'question', 'q', 'title', 'body', 'content'])
+        text = q.text
         if text:
             text = re.sub(r'^\s*[DO]\.[\s-]*', '', text, flags=re.IGNORECASE)
 
@@ -701,16 +686,17 @@ async def generate_docx(
         p = row_cells[1].paragraphs[0]
         if text:
             p.add_run(text)
-        img_url = q.get('image_url')
+        img_url = q.image
         if img_url:
             try:
                 # If OCR is requested and we have a matching data URL, try OCR
-                do_ocr = bool(q.get('image_ocr'))
+                do_ocr = bool(q.image_ocr)
                 if do_ocr and isinstance(img_url, str) and img_url.startswith('data:image/'):
-                    ocr_text = _ocr_data_url(img_url)
+                    with stage("ocr"):
+                        ocr_text = _ocr_data_url(img_url)
                     if ocr_text:
                         p.add_run("\n" + ocr_text)
-                        logger.info("Inserted OCR text for question index %s", idx)
+                        logger.info("Inserted OCR text for question index %s", idx, extra=SAMPLE)
                         raise StopIteration  # Skip image insertion below
                 if img_url.startswith('data:image/'):
                     # data URL
@@ -718,16 +704,21 @@ async def generate_docx(
                     img_bytes = base64.b64decode(b64data)
                     ext = '.png' if 'png' in header else '.jpg'
                     img_stream = BytesIO(img_bytes)
-                    p.add_run().add_picture(img_stream, width=Inches(2.5))
-                    logger.info("Inserted data:image for question index %s (ext=%s)", idx, ext)
+                    add_image_bytes("docx_render", len(img_bytes))
+                    with stage("image_embed"):
+                        p.add_run().add_picture(img_stream, width=Inches(2.5))
+                    logger.info("Inserted data:image for question index %s (ext=%s)", idx, ext, extra=SAMPLE)
                 elif img_url.startswith('http'):
-                    resp = requests.get(img_url)
+                    with stage("image_fetch"):
+                        resp = requests.get(img_url)
                     if resp.ok:
                         content_type = resp.headers.get('content-type','')
                         ext = '.png' if 'png' in content_type else '.jpg'
                         img_stream = BytesIO(resp.content)
-                        p.add_run().add_picture(img_stream, width=Inches(2.5))
-                        logger.info("Fetched and inserted remote image for question index %s (content-type=%s)", idx, content_type)
+                        add_image_bytes("docx_render", len(resp.content))
+                        with stage("image_embed"):
+                            p.add_run().add_picture(img_stream, width=Inches(2.5))
+                        logger.info("Fetched and inserted remote image for question index %s (content-type=%s)", idx, content_type, extra=SAMPLE)
             except StopIteration:
                 pass
             except Exception as e:
@@ -735,7 +726,7 @@ async def generate_docx(
                 p.add_run(" [Image error]")
 
         # CO: use from question if present, else fallback to mapping
-        co_val = q.get('co') or q.get('CO') or q.get('course_outcome')
+        co_val = q.co
         if co_val:
             row_cells[2].text = str(co_val)
         else:
@@ -744,9 +735,9 @@ async def generate_docx(
 
         # BTL logic: random for first 4 questions, shared value for 5-10
         if i < 4:
-            btl_val = q.get('btl') or q.get('BTL') or random.choice([1, 2, 3, 4, 5])
+            btl_val = q.btl or rng.choice([1, 2, 3, 4, 5])
         else:
-            btl_val = q.get('btl') or q.get('BTL') or btl_shared
+            btl_val = q.btl or btl_shared
         # Remove 'BTL' prefix if present, only show number
         btl_str = str(btl_val)
         if btl_str.upper().startswith('BTL'):
@@ -761,6 +752,7 @@ async def generate_docx(
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
         idx += 1
+    sw.lap("part_a")
     # PART-B title and marks in a single row using a table for alignment
     partb_tbl = doc.add_table(rows=1, cols=3)
     partb_tbl.alignment = WD_TABLE_ALIGNMENT.CENTER
@@ -812,7 +804,7 @@ async def generate_docx(
     b_pairs = []
     temp_pair = []
     for q in _questions:
-        if isinstance(q, dict) and q.get('part', '').upper() == 'B':
+        if str(q.get('part', '')).upper() == 'B':
             temp_pair.append(q)
             if len(temp_pair) == 2:
                 b_pairs.append(temp_pair)
@@ -838,41 +830,47 @@ async def generate_docx(
         p_a.paragraph_format.left_indent = Inches(0.0)
         if qa:
             # Add question text
-            p_a.add_run(_first_non_empty(qa, ['text','question_text','question','q','title','body','content']))
+            p_a.add_run(qa.text)
             # Add image if present
-            img_url = qa.get('image_url')
+            img_url = qa.image
             if img_url:
                 try:
-                    do_ocr = bool(qa.get('image_ocr'))
+                    do_ocr = bool(qa.image_ocr)
                     if do_ocr and isinstance(img_url, str) and img_url.startswith('data:image/'):
-                        ocr_text = _ocr_data_url(img_url)
+                        with stage("ocr"):
+                            ocr_text = _ocr_data_url(img_url)
                         if ocr_text:
                             p_a.add_run("\n" + ocr_text)
-                            logger.info("Inserted OCR text for PART-B (a) %s", base_no)
+                            logger.info("Inserted OCR text for PART-B (a) %s", base_no, extra=SAMPLE)
                             raise StopIteration
                     if img_url.startswith('data:image/'):
                         header, b64data = img_url.split(',', 1)
                         img_bytes = base64.b64decode(b64data)
                         ext = '.png' if 'png' in header else '.jpg'
                         img_stream = BytesIO(img_bytes)
-                        p_a.add_run().add_picture(img_stream, width=Inches(2.5))
-                        logger.info("Inserted data:image for PART-A question %s (ext=%s)", idx, ext)
+                        add_image_bytes("docx_render", len(img_bytes))
+                        with stage("image_embed"):
+                            p_a.add_run().add_picture(img_stream, width=Inches(2.5))
+                        logger.info("Inserted data:image for PART-A question %s (ext=%s)", idx, ext, extra=SAMPLE)
                     elif img_url.startswith('http'):
-                        resp = requests.get(img_url)
+                        with stage("image_fetch"):
+                            resp = requests.get(img_url)
                         if resp.ok:
                             content_type = resp.headers.get('content-type','')
                             ext = '.png' if 'png' in content_type else '.jpg'
                             img_stream = BytesIO(resp.content)
-                            p_a.add_run().add_picture(img_stream, width=Inches(2.5))
-                            logger.info("Fetched and inserted PART-A remote image for %s (content-type=%s)", idx, content_type)
+                            add_image_bytes("docx_render", len(resp.content))
+                            with stage("image_embed"):
+                                p_a.add_run().add_picture(img_stream, width=Inches(2.5))
+                            logger.info("Fetched and inserted PART-A remote image for %s (content-type=%s)", idx, content_type, extra=SAMPLE)
                 except StopIteration:
                     pass
                 except Exception as e:
                     logger.exception("Failed to insert PART-A image for %s, img_url=%s", idx, img_url)
                     p_a.add_run(" [Image error]")
-            row_a[2].text = _first_non_empty(qa, ['co','course_outcomes','courseOutcome','course_outcome','co_code'])
-            row_a[3].text = _first_non_empty(qa, ['btl','bloom','bloom_level','bt','bt_level'])
-            row_a[4].text = _first_non_empty(qa, ['marks','mark','score','points'])
+            row_a[2].text = qa.str_of('co')
+            row_a[3].text = qa.str_of('btl')
+            row_a[4].text = qa.str_of('marks')
         else:
             row_a[2].text = row_a[3].text = row_a[4].text = ""
         for p in (
@@ -896,41 +894,47 @@ async def generate_docx(
         p_b.paragraph_format.left_indent = Inches(0.0)
         if qb:
             # Add question text
-            p_b.add_run(_first_non_empty(qb, ['text','question_text','question','q','title','body','content']))
+            p_b.add_run(qb.text)
             # Add image if present
-            img_url = qb.get('image_url')
+            img_url = qb.image
             if img_url:
                 try:
-                    do_ocr = bool(qb.get('image_ocr'))
+                    do_ocr = bool(qb.image_ocr)
                     if do_ocr and isinstance(img_url, str) and img_url.startswith('data:image/'):
-                        ocr_text = _ocr_data_url(img_url)
+                        with stage("ocr"):
+                            ocr_text = _ocr_data_url(img_url)
                         if ocr_text:
                             p_b.add_run("\n" + ocr_text)
-                            logger.info("Inserted OCR text for PART-B (b) %s", base_no)
+                            logger.info("Inserted OCR text for PART-B (b) %s", base_no, extra=SAMPLE)
                             raise StopIteration
                     if img_url.startswith('data:image/'):
                         header, b64data = img_url.split(',', 1)
                         img_bytes = base64.b64decode(b64data)
                         ext = '.png' if 'png' in header else '.jpg'
                         img_stream = BytesIO(img_bytes)
-                        p_b.add_run().add_picture(img_stream, width=Inches(2.5))
-                        logger.info("Inserted data:image for PART-B question %s (ext=%s)", idx, ext)
+                        add_image_bytes("docx_render", len(img_bytes))
+                        with stage("image_embed"):
+                            p_b.add_run().add_picture(img_stream, width=Inches(2.5))
+                        logger.info("Inserted data:image for PART-B question %s (ext=%s)", idx, ext, extra=SAMPLE)
                     elif img_url.startswith('http'):
-                        resp = requests.get(img_url)
+                        with stage("image_fetch"):
+                            resp = requests.get(img_url)
                         if resp.ok:
                             content_type = resp.headers.get('content-type','')
                             ext = '.png' if 'png' in content_type else '.jpg'
                             img_stream = BytesIO(resp.content)
-                            p_b.add_run().add_picture(img_stream, width=Inches(2.5))
-                            logger.info("Fetched and inserted PART-B remote image for %s (content-type=%s)", idx, content_type)
+                            add_image_bytes("docx_render", len(resp.content))
+                            with stage("image_embed"):
+                                p_b.add_run().add_picture(img_stream, width=Inches(2.5))
+                            logger.info("Fetched and inserted PART-B remote image for %s (content-type=%s)", idx, content_type, extra=SAMPLE)
                 except StopIteration:
                     pass
                 except Exception as e:
                     logger.exception("Failed to insert PART-B image for %s, img_url=%s", idx, img_url)
                     p_b.add_run(" [Image error]")
-            row_b[2].text = _first_non_empty(qb, ['co','course_outcomes','courseOutcome','course_outcome','co_code'])
-            row_b[3].text = _first_non_empty(qb, ['btl','bloom','bloom_level','bt','bt_level'])
-            row_b[4].text = _first_non_empty(qb, ['marks','mark','score','points'])
+            row_b[2].text = qb.str_of('co')
+            row_b[3].text = qb.str_of('btl')
+            row_b[4].text = qb.str_of('marks')
         else:
             row_b[2].text = row_b[3].text = row_b[4].text = ""
         for p in (
@@ -938,10 +942,11 @@ async def generate_docx(
         ):
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
     
+    sw.lap("part_b")
     # PART-C (optional single question worth 10 marks)
-    c_questions = [q for q in _questions if isinstance(q, dict) and (
+    c_questions = [q for q in _questions if (
         str(q.get('part','')).upper() == 'C' or
-        str(q.get('baseNumber','')).strip() == '16' or
+        str(q.get('base_number','')).strip() == '16' or
         str(q.get('number','')).strip().startswith('16')
     )]
     if c_questions:
@@ -1002,7 +1007,9 @@ async def generate_docx(
         else:
             qa = c_questions[0]
 
-        base_no = _first_non_empty(qa if qa else (qb or {}), ['baseNumber','number']) or '16'
+        first_c = qa or qb
+        base_no = (first_c.str_of('base_number') or first_c.str_of('number')) if first_c else ''
+        base_no = base_no or '16'
 
         # (a) row
         row_a = table_c.add_row().cells
@@ -1012,35 +1019,41 @@ async def generate_docx(
         p_a = row_a[1].paragraphs[0]
         p_a.paragraph_format.left_indent = Inches(0.0)
         if qa:
-            p_a.add_run(_first_non_empty(qa, ['text','question_text','question','q','title','body','content']))
-            img_url = qa.get('image_url')
+            p_a.add_run(qa.text)
+            img_url = qa.image
             if img_url:
                 try:
-                    do_ocr = bool(qa.get('image_ocr'))
+                    do_ocr = bool(qa.image_ocr)
                     if do_ocr and isinstance(img_url, str) and img_url.startswith('data:image/'):
-                        ocr_text = _ocr_data_url(img_url)
+                        with stage("ocr"):
+                            ocr_text = _ocr_data_url(img_url)
                         if ocr_text:
                             p_a.add_run("\n" + ocr_text)
-                            logger.info("Inserted OCR text for PART-C (a) %s", base_no)
+                            logger.info("Inserted OCR text for PART-C (a) %s", base_no, extra=SAMPLE)
                             raise StopIteration
                     if img_url.startswith('data:image/'):
                         header, b64data = img_url.split(',', 1)
                         img_bytes = base64.b64decode(b64data)
                         img_stream = BytesIO(img_bytes)
-                        p_a.add_run().add_picture(img_stream, width=Inches(2.5))
+                        add_image_bytes("docx_render", len(img_bytes))
+                        with stage("image_embed"):
+                            p_a.add_run().add_picture(img_stream, width=Inches(2.5))
                     elif img_url.startswith('http'):
-                        resp = requests.get(img_url)
+                        with stage("image_fetch"):
+                            resp = requests.get(img_url)
                         if resp.ok:
                             img_stream = BytesIO(resp.content)
-                            p_a.add_run().add_picture(img_stream, width=Inches(2.5))
+                            add_image_bytes("docx_render", len(resp.content))
+                            with stage("image_embed"):
+                                p_a.add_run().add_picture(img_stream, width=Inches(2.5))
                 except StopIteration:
                     pass
                 except Exception:
                     logger.exception("Failed to insert PART-C (a) image for %s, img_url=%s", base_no, img_url)
                     p_a.add_run(" [Image error]")
-        row_a[2].text = _first_non_empty(qa or {}, ['co','course_outcomes','courseOutcome','course_outcome','co_code'])
-        row_a[3].text = _first_non_empty(qa or {}, ['btl','bloom','bloom_level','bt','bt_level'])
-        row_a[4].text = _first_non_empty(qa or {}, ['marks','mark','score','points']) or '10'
+        row_a[2].text = (qa.str_of('co') if qa else '')
+        row_a[3].text = (qa.str_of('btl') if qa else '')
+        row_a[4].text = (qa.str_of('marks') if qa else '') or '10'
         for p in (row_a[0].paragraphs + row_a[2].paragraphs + row_a[3].paragraphs + row_a[4].paragraphs):
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
@@ -1059,46 +1072,93 @@ async def generate_docx(
         p_b = row_b[1].paragraphs[0]
         p_b.paragraph_format.left_indent = Inches(0.0)
         if qb:
-            p_b.add_run(_first_non_empty(qb, ['text','question_text','question','q','title','body','content']))
-            img_url = qb.get('image_url')
+            p_b.add_run(qb.text)
+            img_url = qb.image
             if img_url:
                 try:
-                    do_ocr = bool(qb.get('image_ocr'))
+                    do_ocr = bool(qb.image_ocr)
                     if do_ocr and isinstance(img_url, str) and img_url.startswith('data:image/'):
-                        ocr_text = _ocr_data_url(img_url)
+                        with stage("ocr"):
+                            ocr_text = _ocr_data_url(img_url)
                         if ocr_text:
                             p_b.add_run("\n" + ocr_text)
-                            logger.info("Inserted OCR text for PART-C (b) %s", base_no)
+                            logger.info("Inserted OCR text for PART-C (b) %s", base_no, extra=SAMPLE)
                             raise StopIteration
                     if img_url.startswith('data:image/'):
                         header, b64data = img_url.split(',', 1)
                         img_bytes = base64.b64decode(b64data)
                         img_stream = BytesIO(img_bytes)
-                        p_b.add_run().add_picture(img_stream, width=Inches(2.5))
+                        add_image_bytes("docx_render", len(img_bytes))
+                        with stage("image_embed"):
+                            p_b.add_run().add_picture(img_stream, width=Inches(2.5))
                     elif img_url.startswith('http'):
-                        resp = requests.get(img_url)
+                        with stage("image_fetch"):
+                            resp = requests.get(img_url)
                         if resp.ok:
                             img_stream = BytesIO(resp.content)
-                            p_b.add_run().add_picture(img_stream, width=Inches(2.5))
+                            add_image_bytes("docx_render", len(resp.content))
+                            with stage("image_embed"):
+                                p_b.add_run().add_picture(img_stream, width=Inches(2.5))
                 except StopIteration:
                     pass
                 except Exception:
                     logger.exception("Failed to insert PART-C (b) image for %s, img_url=%s", base_no, img_url)
                     p_b.add_run(" [Image error]")
-        row_b[2].text = _first_non_empty(qb or {}, ['co','course_outcomes','courseOutcome','course_outcome','co_code'])
-        row_b[3].text = _first_non_empty(qb or {}, ['btl','bloom','bloom_level','bt','bt_level'])
-        row_b[4].text = _first_non_empty(qb or {}, ['marks','mark','score','points']) or '10'
+        row_b[2].text = (qb.str_of('co') if qb else '')
+        row_b[3].text = (qb.str_of('btl') if qb else '')
+        row_b[4].text = (qb.str_of('marks') if qb else '') or '10'
         for p in (row_b[0].paragraphs + row_b[2].paragraphs + row_b[3].paragraphs + row_b[4].paragraphs):
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    sw.lap("part_c")
     doc.add_paragraph(" ")
     doc.add_paragraph("******************").bold = True
     # Footer
     doc.add_paragraph(f"  {qpcode}").bold = True
+    checkpoint("document_built")
     # Save to temp file
     with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp:
         doc.save(tmp.name)
         tmp_path = tmp.name
-    return FileResponse(tmp_path, filename="question_paper.docx")
+    sw.lap("save")
+    return tmp_path
+
+@app.post("/api/template/generate-docx")
+async def generate_docx(
+    questions: list = Form(...),
+    dept: str = Form(""),
+    cc: str = Form(""),
+    cn: str = Form(""),
+    qpcode: str = Form(""),
+    exam_title: str = Form("B.E., /B.Tech., DEGREE EXAMINATIONS, APRIL/MAY2024"),
+    regulation: str = Form("Regulation 2023"),
+    semester: str = Form("Second Semester"),
+    excel_meta: str = Form(None),
+    ocr_images: Optional[str] = Form(None),
+    title_image_url: Optional[str] = Form(None),
+    header_logo_url: Optional[str] = Form(None),
+    seed: str = Form(""),
+):
+    try:
+        seed_val = parse_seed(seed)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="seed must be an integer")
+    fields = {
+        "dept": dept, "cc": cc, "cn": cn, "qpcode": qpcode, "exam_title": exam_title, "regulation": regulation,
+        "semester": semester, "excel_meta": excel_meta, "ocr_images": ocr_images,
+        "title_image_url": title_image_url, "header_logo_url": header_logo_url,
+    }
+    parsed, seed_val, key, cached = await run_io(
+        lookup_paper, f"template_backend-v{PAPER_LAYOUT_VERSION}", questions, fields, seed_val)
+    if cached is not None:
+        return cached_paper_response(cached, seed_val)
+    with RENDERS_IN_FLIGHT.track("template_backend"):
+        tmp_path = await run_cpu(
+            render_paper_docx, parsed, dept, cc, cn, qpcode, exam_title, regulation, semester,
+            excel_meta, ocr_images, title_image_url, header_logo_url, seed_val,
+        )
+    await run_io(store_paper, key, tmp_path)
+    return FileResponse(tmp_path, filename="question_paper.docx", headers=paper_headers(seed_val, "miss"),
+                        background=BackgroundTask(os.remove, tmp_path))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=4000)
@@ -0,0 +1,143 @@
+"""Exercise the write-behind activity log (server/activity_log.py).
+
+On a throwaway store: per-action cost against a synchronous insert into
+the main store, flushes triggered by size and by time, recovery of events
+spooled by a process that was killed before it flushed, replay of a batch
+that already reached the log, and read-your-writes through the HTTP
+endpoints. Exits non-zero on the first mismatch.
+
+    python -m server.test_activity_log [--events 2000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# The app reads its DB path at import time
+os.environ['IDCS_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='idcs-activity-'), 'local_store.db')
+
+from server.activity_log import ActivityLog  # noqa: E402
+from server.db import get_conn, init_db  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def logged() -> int:
+    conn = get_conn()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM question_activity_logs').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def wait_for(cond, timeout=5.0) -> float:
+    t = time.perf_counter()
+    while not cond():
+        if time.perf_counter() - t > timeout:
+            return -1
+        time.sleep(0.01)
+    return time.perf_counter() - t
+
+
+def event(i, action='verify'):
+    return {'action': action, 'user_id': 'u-1', 'question_id': i, 'title_id': 1,
+            'details': {'changes': {'status': {'before': 'pending', 'after': 'verified'}}}}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--events', type=int, default=2000)
+    args = ap.parse_args(argv)
+    init_db()
+
+    print('per-action cost')
+    conn = get_conn()
+    t = time.perf_counter()
+    for i in range(args.events):
+        conn.execute('INSERT INTO question_activity_logs(user_id, action, question_id, title_id, details) VALUES (?,?,?,?,?)',
+                     ('u-1', 'verify', i, 1, '{}'))
+        conn.commit()
+    direct_us = (time.perf_counter() - t) / args.events * 1e6
+    conn.execute('DELETE FROM question_activity_logs')
+    conn.commit()
+    conn.close()
+    log = ActivityLog(flush_size=10 ** 9, flush_seconds=3600)
+    t = time.perf_counter()
+    for i in range(args.events):
+        log.record([event(i)])
+    spool_us = (time.perf_counter() - t) / args.events * 1e6
+    t = time.perf_counter()
+    moved = log.flush()
+    flush_ms = (time.perf_counter() - t) * 1000
+    print(f'  synchronous insert + commit: {direct_us:.0f} us/event; spooled: {spool_us:.0f} us/event '
+          f'(+ one {flush_ms:.0f} ms flush for {moved})')
+    check(moved == args.events and logged() == args.events, 'flush did not move every event')
+    log.stop()
+
+    print('flush on size')
+    base = logged()
+    log = ActivityLog(flush_size=100, flush_seconds=3600)
+    log.start()
+    for i in range(250):
+        log.record([event(i)])
+    check(wait_for(lambda: logged() >= base + 200) >= 0, 'size threshold did not trigger a flush')
+    log.stop()
+    check(logged() == base + 250, 'stop() did not flush the remainder')
+
+    print('flush on time')
+    base = logged()
+    log = ActivityLog(flush_size=10 ** 9, flush_seconds=0.2)
+    log.start()
+    log.record([event(1), event(2), event(3)])
+    waited = wait_for(lambda: logged() == base + 3)
+    check(waited >= 0, 'time threshold did not trigger a flush')
+    print(f'  flushed after {waited * 1000:.0f} ms')
+    log.stop()
+
+    print('events spooled by a killed process are recovered')
+    base = logged()
+    code = ('import os; from server.activity_log import ActivityLog; '
+            "ActivityLog().record([{'action': 'verify', 'question_id': i} for i in range(500)]); os._exit(9)")
+    r = subprocess.run([sys.executable, '-c', code], env=os.environ.copy())
+    check(r.returncode == 9, 'crash subprocess did not run')
+    check(logged() == base, 'killed process should not have flushed')
+    log = ActivityLog()
+    log.start()
+    check(logged() == base + 500, 'spooled events not recovered at start')
+    log.stop()
+
+    print('replaying a batch that already reached the log adds nothing')
+    base = logged()
+    log = ActivityLog(flush_size=10 ** 9, flush_seconds=3600)
+    ids = log.record([event(i, 'unverify') for i in range(10)])
+    conn = get_conn()
+    # As if the previous flush committed the log rows but died before clearing the spool
+    conn.executemany("INSERT INTO question_activity_logs(event_id, action) VALUES (?, 'unverify')", [(i,) for i in ids[:5]])
+    conn.commit()
+    conn.close()
+    log.flush()
+    check(logged() == base + 10, 'replayed events were duplicated')
+    log.stop()
+
+    print('HTTP endpoints')
+    import json
+    from fastapi.testclient import TestClient
+    from server.app_local import app
+    with TestClient(app) as client:
+        r = client.post('/api/question-activity', data={'events': json.dumps([event(4242), event(4242, 'unverify')])})
+        check(r.status_code == 200 and r.json()['queued'] == 2, f'record: {r.text}')
+        rows = client.get('/api/question-activity', params={'question_id': 4242}).json()
+        check(sorted(x['action'] for x in rows) == ['unverify', 'verify'], f'read-your-writes: {rows}')
+        check(rows[0]['details'] == event(0)['details'], 'details round trip')
+        check(client.post('/api/question-activity', data={'events': '{"user_id": "x"}'}).status_code == 400, 'missing action accepted')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
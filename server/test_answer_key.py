@@ -0,0 +1,146 @@
+"""Exercise the answer key emitted with generate-docx (answer_key=1).
+
+Checks that the zip holds the paper and its key, that the key follows the
+paper's numbering and (OR) rows, and that answers are resolved from
+correct_answer, options and answer_text. The paper is laid out once per
+request. A paper already in the cache is reused, so adding the key costs
+only the key's own render; the test times that against a paper render.
+
+    python -m server.test_answer_key
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+# The app reads its DB and cache locations at import time
+_tmp = tempfile.mkdtemp(prefix='idcs-key-')
+os.environ['IDCS_DB_PATH'] = os.path.join(_tmp, 'local_store.db')
+os.environ['IDCS_CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from docx import Document  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server import app_local  # noqa: E402
+from server.answer_key import KEY_NAME, PAPER_NAME  # noqa: E402
+from server.paper_cache import paper_cache  # noqa: E402
+from server.test_paper_preview import docx_rows  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+OPTIONS = ['Stack', 'Queue', 'Tree', 'Graph']
+# (correct_answer, answer_text) -> expected answer cell
+ANSWERS = [
+    ('B', None, '(b) Queue'),
+    ('c)', None, '(c) Tree'),
+    ('4', None, '(d) Graph'),
+    ('tree', 'A hierarchy of nodes', '(c) Tree\nA hierarchy of nodes'),
+    (None, 'LIFO order', 'LIFO order'),
+    (None, None, ''),
+    ('Z', None, 'Z'),
+    ('A', 'A', '(a) Stack\nA'),
+    (None, None, ''),
+    (None, None, ''),
+]
+QUESTIONS = [
+    {'question_text': f'Part A question {i}', 'part': 'A', 'marks': 2, 'type': 'objective', 'btl': 2,
+     'options': OPTIONS if ans[0] else None, 'correct_answer': ans[0], 'answer_text': ans[1]}
+    for i, ans in enumerate(ANSWERS)
+] + [
+    {'question_text': f'Part B question {n}{sub}', 'part': 'B', 'number': n, 'sub': sub, 'marks': 16, 'btl': 3,
+     'course_outcomes': f'CO{n - 10}', 'answer_text': f'Scheme for {n}.{sub}: definition 4, derivation 8, example 4'}
+    for n in range(11, 16) for sub in 'ab'
+] + [
+    {'question_text': f'Part C case study {sub}', 'part': 'C', 'number': 16, 'sub': sub, 'marks': 15, 'btl': 5, 'course_outcomes': 'CO5'}
+    for sub in 'ab'
+]
+FORM = {'questions': json.dumps(QUESTIONS), 'dept': 'CSE', 'cc': 'CS3301', 'cn': 'Data Structures', 'qpcode': 'QP-9'}
+
+
+def key_rows(data: bytes):
+    rows = []
+    for table in Document(BytesIO(data)).tables:
+        for row in table.rows[1:]:
+            cells = [c.text for c in row.cells]
+            rows.append(['(OR)'] if all(c == '(OR)' for c in cells) else cells)
+    return rows
+
+
+def unzip(data: bytes):
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        return [(i.filename, z.read(i.filename)) for i in z.infolist()]
+
+
+def main():
+    layouts = []
+    layout_paper = app_local.layout_paper
+
+    def counting_layout(*a, **kw):
+        layouts.append(a)
+        return layout_paper(*a, **kw)
+    app_local.layout_paper = counting_layout
+
+    with TestClient(app_local.app) as client:
+        print('the paper and its key come back together')
+        plain = client.post('/api/template/generate-docx', data=FORM)
+        check(plain.status_code == 200, f'generate-docx: {plain.status_code} {plain.text[:200]}')
+        r = client.post('/api/template/generate-docx', data={**FORM, 'answer_key': '1'})
+        check(r.status_code == 200 and r.headers['content-type'] == 'application/zip', f'answer_key: {r.status_code} {r.text[:200]}')
+        check('question_paper.zip' in r.headers['content-disposition'], 'download name')
+        files = unzip(r.content)
+        check([name for name, _ in files] == [PAPER_NAME, KEY_NAME], f'zip members: {[name for name, _ in files]}')
+        paper, key = files[0][1], files[1][1]
+        check(paper == plain.content, 'the bundled paper differs from the plain download')
+        check(r.headers['x-paper-seed'] == plain.headers['x-paper-seed'], 'seed changed')
+
+        print('the key follows the paper')
+        prows, krows = docx_rows(paper), key_rows(key)
+        check([row[0] for row in prows] == [row[0] for row in krows], 'key numbering or (OR) rows differ from the paper')
+        check(all(p[1] == k[1] and p[-1] == k[-1] for p, k in zip(prows, krows) if len(p) > 1), 'question text or marks differ')
+        for i, (_c, _a, expected) in enumerate(ANSWERS):
+            check(krows[i][2] == expected, f'Part A {i + 1}: expected {expected!r}, got {krows[i][2]!r}')
+        check(krows[10][2] == 'Scheme for 11.a: definition 4, derivation 8, example 4', f'Part B answer: {krows[10][2]!r}')
+        text = '\n'.join(p.text for p in Document(BytesIO(key)).paragraphs)
+        check('ANSWER KEY' in text and 'Question Paper Code: QP-9' in text and 'CS3301 – Data Structures' in text, 'key header')
+
+        print('repeats are cached; the paper is laid out once')
+        again = client.post('/api/template/generate-docx', data={**FORM, 'answer_key': '1'})
+        check(again.headers['x-paper-cache'] == 'hit' and again.content == r.content, 'repeat was not served from the cache')
+        layouts.clear()
+        fresh = client.post('/api/template/generate-docx', data={**FORM, 'answer_key': 'true', 'seed': '77'})
+        check(fresh.headers['x-paper-cache'] == 'miss' and fresh.headers['x-paper-seed'] == '77', 'new seed')
+        check(len(layouts) == 1, f'paper laid out {len(layouts)} times for one bundle')
+        check(client.post('/api/template/generate-docx', data={**FORM, 'seed': '77'}).headers['x-paper-cache'] == 'hit',
+              'the bundle did not cache its paper for plain downloads')
+
+        print('timing')
+        paper_ms, key_ms, both_ms = [], [], []
+        for i in range(3):
+            seed = str(3000 + i)
+            t = time.perf_counter()
+            client.post('/api/template/generate-docx', data={**FORM, 'seed': seed})
+            paper_ms.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            client.post('/api/template/generate-docx', data={**FORM, 'seed': seed, 'answer_key': '1'})
+            key_ms.append((time.perf_counter() - t) * 1000)
+            paper_cache.clear()
+            t = time.perf_counter()
+            client.post('/api/template/generate-docx', data={**FORM, 'seed': seed, 'answer_key': '1'})
+            both_ms.append((time.perf_counter() - t) * 1000)
+        paper_med, key_med, both_med = (statistics.median(v) for v in (paper_ms, key_ms, both_ms))
+        print(f'  paper {paper_med:.0f} ms; key added to a cached paper {key_med:.0f} ms; paper and key from scratch {both_med:.0f} ms')
+        check(key_med < paper_med, 'adding the key to a cached paper costs more than rendering the paper')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
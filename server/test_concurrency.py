@@ -0,0 +1,106 @@
+"""Check that list endpoints stay responsive while papers render.
+
+Starts app_local on a free port against a throwaway SQLite DB, keeps
+/api/template/generate-docx busy with large papers from background threads,
+and measures GET /api/question-bank-titles latency meanwhile. Exits non-zero
+if the worst list latency exceeds the budget.
+
+    python -m server.test_concurrency [--renders 4] [--budget-ms 500]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int):
+    import uvicorn
+    tmp = tempfile.mkdtemp(prefix='idcs-conc-')
+    os.environ['IDCS_DB_PATH'] = os.path.join(tmp, 'local_store.db')
+    # Fresh caches too, so cached papers and parses do not skip the work under test
+    os.environ['IDCS_CACHE_DIR'] = os.path.join(tmp, 'cache')
+    import server.app_local as app_local
+    server = uvicorn.Server(uvicorn.Config(app_local.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return server
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('server did not start')
+
+
+def big_paper(n_part_b: int):
+    qs = [{'text': f'Part A question {i} ' * 8, 'part': 'A', 'btl': 2, 'marks': 2} for i in range(10)]
+    for i in range(n_part_b):
+        base = 11 + i // 2
+        qs.append({'text': f'Part B question {i} ' * 30, 'part': 'B', 'number': base,
+                   'sub': 'a' if i % 2 == 0 else 'b', 'btl': 3, 'marks': 16, 'co': 'CO2'})
+    return json.dumps(qs)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--renders', type=int, default=4, help='concurrent paper renders')
+    ap.add_argument('--part-b', type=int, default=200, help='Part B questions per paper')
+    ap.add_argument('--budget-ms', type=float, default=500.0)
+    args = ap.parse_args(argv)
+
+    port = free_port()
+    server = start_server(port)
+    base = f'http://127.0.0.1:{port}'
+    payload = {'questions': big_paper(args.part_b), 'cc': 'CS101', 'cn': 'Test', 'qpcode': 'QP1'}
+
+    render_times = []
+
+    def render():
+        t = time.perf_counter()
+        r = requests.post(base + '/api/template/generate-docx', data=payload, timeout=300)
+        r.raise_for_status()
+        render_times.append(time.perf_counter() - t)
+
+    renderers = [threading.Thread(target=render) for _ in range(args.renders)]
+    for t in renderers:
+        t.start()
+    time.sleep(0.2)
+
+    latencies = []
+    while any(t.is_alive() for t in renderers):
+        t = time.perf_counter()
+        requests.get(base + '/api/question-bank-titles', timeout=300).raise_for_status()
+        latencies.append((time.perf_counter() - t) * 1000)
+        time.sleep(0.05)
+    for t in renderers:
+        t.join()
+    server.should_exit = True
+
+    if not latencies:
+        print('renders finished before any list request was made; increase --part-b')
+        return 1
+    worst = max(latencies)
+    print(f'renders: {len(render_times)} x {statistics.mean(render_times):.2f}s avg')
+    print(f'list latency during renders: n={len(latencies)} p50={statistics.median(latencies):.1f}ms max={worst:.1f}ms')
+    if worst > args.budget_ms:
+        print(f'FAIL: list latency {worst:.1f}ms exceeds budget {args.budget_ms:.0f}ms')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
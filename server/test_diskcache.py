@@ -0,0 +1,64 @@
+"""Exercise DiskCache expiry and LRU eviction.
+
+An entry expires `max_age` seconds after it was written, even if it is
+read all the time; reads only decide which entries the byte budget evicts
+first. Files written before entries carried their write time are misses.
+
+    python -m server.test_diskcache
+"""
+import os
+import sys
+import tempfile
+import time
+
+from server.diskcache import DiskCache
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def main():
+    root = tempfile.mkdtemp(prefix='idcs-diskcache-')
+
+    print('an entry read over and over still expires')
+    cache = DiskCache('ages', max_bytes=1 << 20, max_age=1.0, root=root)
+    cache.put('hot', b'payload')
+    written = time.time()
+    reads = 0
+    while time.time() - written < 0.9:
+        check(cache.get('hot') == b'payload' and cache.contains('hot'), 'entry missing before max_age')
+        reads += 1
+        time.sleep(0.05)
+    time.sleep(0.2)
+    check(cache.get('hot') is None, f'entry still served after {reads} reads past max_age')
+    check(not cache.contains('hot') and not os.path.exists(os.path.join(cache.dir, 'hot')), 'expired entry left behind')
+
+    print('eviction drops entries that have not been read within max_age')
+    cache.put('cold', b'x')
+    time.sleep(1.1)
+    cache.put('new', b'y')
+    check(not os.path.exists(os.path.join(cache.dir, 'cold')) and cache.get('new') == b'y', 'cold entry survived eviction')
+
+    print('the byte budget evicts the least recently read')
+    lru = DiskCache('lru', max_bytes=3 * 1100, root=root)
+    for key in ('a', 'b', 'c'):
+        lru.put(key, b'.' * 1000)
+        time.sleep(0.02)
+    check(lru.get('a') is not None, 'a missing')
+    time.sleep(0.02)
+    lru.put('d', b'.' * 1000)
+    check(lru.contains('a') and not lru.contains('b') and lru.contains('c') and lru.contains('d'),
+          'eviction did not follow read order')
+
+    print('files without a header are misses')
+    with open(os.path.join(lru.dir, 'legacy'), 'wb') as f:
+        f.write(b'old format')
+    check(lru.get('legacy') is None and not lru.contains('legacy'), 'headerless file served')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
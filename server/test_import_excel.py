@@ -0,0 +1,206 @@
+"""Exercise picture lookup for CO workbooks whose worksheet parts are not in tab order.
+
+Excel keeps a sheet's part name (xl/worksheets/sheetN.xml) when sheets are
+reordered or renamed, so N need not be the tab position. Rotates the part
+names of a generated workbook and checks that the upload parser and the
+incremental import still attach every picture to the same question. Also
+checks that the header is detected before the rest of a sheet is read, and
+that the import stores pictures in image_url and picks up a changed
+picture.
+
+    python -m server.test_import_excel
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import zipfile
+from io import BytesIO
+
+# The app reads its DB and cache locations at import time
+_tmp = tempfile.mkdtemp(prefix='idcs-import-')
+os.environ['IDCS_DB_PATH'] = os.path.join(_tmp, 'local_store.db')
+os.environ['IDCS_CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from fastapi import HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from openpyxl import load_workbook  # noqa: E402
+
+from server.app_local import app  # noqa: E402
+from server.bench.corpus import make_workbook, png_bytes  # noqa: E402
+from server.db import get_conn  # noqa: E402
+from server.routes import upload_questions_excel  # noqa: E402
+from server.routes.upload_questions_excel import (  # noqa: E402
+    HEADER_SCAN_ROWS, _parse_sheet, parse_workbook, select_sheets, workbook_sheets)
+from server.timing import Stopwatch  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+_SHEET_PART_RE = re.compile(r'worksheets/(_rels/)?sheet(\d+)\.xml')
+
+
+def rotate_sheet_parts(data: bytes) -> bytes:
+    """Rename worksheet parts sheetN.xml -> sheet(N % count + 1).xml, with their rels and references."""
+    src = zipfile.ZipFile(BytesIO(data))
+    count = sum(1 for n in src.namelist() if re.fullmatch(r'xl/worksheets/sheet\d+\.xml', n))
+
+    def rename(m):
+        return f'worksheets/{m.group(1) or ""}sheet{int(m.group(2)) % count + 1}.xml'
+    out = BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            body = src.read(info.filename)
+            if info.filename == 'xl/_rels/workbook.xml.rels':
+                body = _SHEET_PART_RE.sub(rename, body.decode('utf-8')).encode('utf-8')
+            dst.writestr(_SHEET_PART_RE.sub(rename, info.filename), body)
+    return out.getvalue()
+
+
+def replace_member(data: bytes, name: str, body: bytes) -> bytes:
+    src = zipfile.ZipFile(BytesIO(data))
+    out = BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            dst.writestr(info.filename, body if info.filename == name else src.read(info.filename))
+    return out.getvalue()
+
+
+def sql(query, params=()):
+    conn = get_conn()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def pictures(questions):
+    return [(q.source_row, q.image) for q in questions]
+
+
+def streamed(data: bytes):
+    """Parse the CO sheets the way the incremental import does: read-only, part paths from the package."""
+    z = zipfile.ZipFile(BytesIO(data))
+    sheets, active = workbook_sheets(z)
+    names, paths = set(z.namelist()), dict(sheets)
+    sheetnames = [name for name, _ in sheets]
+    wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        return {s: _parse_sheet(wb[s], s, z, names, paths[s], Stopwatch())
+                for s in select_sheets(sheetnames, sheetnames[active])}
+    finally:
+        wb.close()
+
+
+class CountingSheet:
+    """Worksheet stand-in that counts the rows handed out by iter_rows."""
+    def __init__(self, ws):
+        self.ws, self.read = ws, 0
+
+    def __getattr__(self, name):
+        return getattr(self.ws, name)
+
+    def iter_rows(self, *a, **kw):
+        for row in self.ws.iter_rows(*a, **kw):
+            self.read += 1
+            yield row
+
+
+def rows_read_at_header(data: bytes, sheet: str):
+    """Rows read from `sheet` when its header is looked up, and the rows in the sheet."""
+    wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    ws = CountingSheet(wb[sheet])
+    seen = []
+    lookup = upload_questions_excel.layout_cache.lookup
+
+    def spying_lookup(grid, sheet_name):
+        seen.append(ws.read)
+        return lookup(grid, sheet_name)
+    upload_questions_excel.layout_cache.lookup = spying_lookup
+    try:
+        _parse_sheet(ws, sheet, None, set(), None, Stopwatch())
+    finally:
+        upload_questions_excel.layout_cache.lookup = lookup
+        wb.close()
+    return seen[0], ws.read
+
+
+def main():
+    original = make_workbook(rows=12, image_every=3, seed=7)
+    rotated = rotate_sheet_parts(original)
+    sheets = dict(workbook_sheets(zipfile.ZipFile(BytesIO(rotated)))[0])
+    check(sheets['CO1-CO2'] == 'xl/worksheets/sheet3.xml', f'parts were not rotated: {sheets}')
+
+    print('upload parser finds pictures through the workbook rels')
+    before = parse_workbook(original)['questions']
+    check(sum(1 for q in before if q.image) == 12, 'expected 12 pictures in the generated workbook')
+    check(pictures(parse_workbook(rotated)['questions']) == pictures(before), 'pictures moved after renaming sheet parts')
+
+    print('incremental import does too')
+    by_sheet = streamed(original)
+    check(pictures(q for qs in by_sheet.values() for q in qs) == pictures(before), 'import parse differs from upload parse')
+    check({s: pictures(qs) for s, qs in streamed(rotated).items()} == {s: pictures(qs) for s, qs in by_sheet.items()},
+          'import pictures moved after renaming sheet parts')
+
+    print('the header is found before the rest of the sheet is read')
+    large = make_workbook(rows=60, image_every=0, seed=7)
+    at_header, total = rows_read_at_header(large, 'CO1-CO2')
+    check(at_header == HEADER_SCAN_ROWS and total > at_header, f'{at_header} of {total} rows read before header detection')
+    wb = load_workbook(BytesIO(large))
+    wb['CO1-CO2'].insert_rows(1, HEADER_SCAN_ROWS)
+    buf = BytesIO()
+    wb.save(buf)
+    try:
+        rows_read_at_header(buf.getvalue(), 'CO1-CO2')
+        check(False, 'a header below the scanned rows was accepted')
+    except HTTPException as e:
+        check(e.status_code == 400, f'unexpected status {e.status_code}')
+
+    with TestClient(app) as client:
+        def import_excel(data: bytes):
+            r = client.post('/api/question-bank/import-excel', data={'title_id': str(title_id)},
+                            files={'file': ('co.xlsx', data, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')})
+            check(r.status_code == 200, f'import-excel: {r.status_code} {r.text[:200]}')
+            return r.json()
+
+        def stored():
+            return dict(sql('SELECT question_text, image_url FROM question_bank WHERE title_id=?', (title_id,)))
+
+        print('the import stores pictures')
+        sql("INSERT INTO question_bank_titles(title) VALUES ('CS3401 Algorithms')")
+        title_id = sql("SELECT id FROM question_bank_titles WHERE title='CS3401 Algorithms'")[0][0]
+        r = import_excel(original)
+        check(r['inserted'] == len(before), f'first import: {r}')
+        check(stored() == {q.text: q.image or None for q in before}, 'image_url does not match the parsed pictures')
+        check(import_excel(original)['unchanged'] == len(before), 'unchanged workbook was re-imported')
+
+        print('a changed picture reaches the bank')
+        media = sorted(n for n in zipfile.ZipFile(BytesIO(original)).namelist() if n.startswith('xl/media/'))[0]
+        edited = replace_member(original, media, png_bytes(random.Random(99)))
+        r = import_excel(edited)
+        check((r['updated'], r['inserted'], r['deleted']) == (1, 0, 0), f'picture edit: {r}')
+        after = {q.text: q.image or None for q in parse_workbook(edited)['questions']}
+        check(stored() == after and after != {q.text: q.image or None for q in before}, 'new picture not stored')
+
+        print('rows hashed without their pictures are re-hashed, keeping their status')
+        sql("UPDATE question_bank SET image_url=NULL, status='approved' WHERE title_id=?", (title_id,))
+        sql("UPDATE question_bank_sources SET content_hash='legacy' WHERE title_id=?", (title_id,))
+        sql("UPDATE question_bank_imports SET sheet_hash='legacy' WHERE title_id=?", (title_id,))
+        r = import_excel(edited)
+        with_pictures = sum(1 for image in after.values() if image)
+        check((r['updated'], r['unchanged']) == (with_pictures, len(before) - with_pictures), f'legacy re-import: {r}')
+        check(stored() == after, 'pictures missing after the legacy re-import')
+        statuses = dict(sql('SELECT question_text, status FROM question_bank WHERE title_id=?', (title_id,)))
+        check(all(statuses[t] == ('pending' if image else 'approved') for t, image in after.items()), 'statuses after re-hash')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Scrape /metrics the way Prometheus would and check the exposition.
+
+Starts app_local on a free port against a throwaway SQLite DB, drives the
+upload, scan, render and list endpoints, then parses GET /metrics with a
+minimal text-format parser (a stand-in for a real scraper) and checks that
+the expected series exist and histograms are well formed.
+
+    python -m server.test_metrics
+"""
+import json
+import re
+import sys
+from collections import defaultdict
+
+import requests
+
+from server.bench import corpus
+from server.test_concurrency import free_port, start_server
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_exposition(text: str):
+    """Return ({metric: type}, [(name, labels, value)]); raises on malformed lines."""
+    types, samples = {}, []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(None, 3)
+            types[name] = kind
+            continue
+        if line.startswith('#'):
+            continue
+        m = _SAMPLE_RE.match(line)
+        if not m:
+            raise ValueError(f'malformed sample line: {line!r}')
+        labels = dict(_LABEL_RE.findall(m.group(3) or ''))
+        samples.append((m.group(1), labels, float(m.group(4))))
+    return types, samples
+
+
+def check_histograms(types, samples):
+    """Buckets must be cumulative and the +Inf bucket must equal _count."""
+    problems = []
+    for name, kind in types.items():
+        if kind != 'histogram':
+            continue
+        series = defaultdict(list)
+        counts = {}
+        for sname, labels, value in samples:
+            key = tuple(sorted((k, v) for k, v in labels.items() if k != 'le'))
+            if sname == name + '_bucket':
+                series[key].append((float(labels['le']), value))
+            elif sname == name + '_count':
+                counts[key] = value
+        for key, buckets in series.items():
+            buckets.sort()
+            values = [v for _, v in buckets]
+            if values != sorted(values):
+                problems.append(f'{name}{dict(key)}: buckets not cumulative')
+            if buckets[-1][0] != float('inf') or buckets[-1][1] != counts.get(key):
+                problems.append(f'{name}{dict(key)}: +Inf bucket does not match _count')
+    return problems
+
+
+def main(argv=None):
+    port = free_port()
+    server = start_server(port)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        requests.post(base + '/api/question-bank-titles', data={'title': 'Metrics check'}, timeout=60).raise_for_status()
+        requests.get(base + '/api/question-bank-titles', timeout=60).raise_for_status()
+        requests.post(base + '/api/upload-questions-excel/', timeout=300,
+                      files={'file': ('bank.xlsx', corpus.make_workbook(rows=20, image_every=5))}).raise_for_status()
+        requests.post(base + '/api/template/scan-docx', timeout=300,
+                      files={'file': ('paper.docx', corpus.make_paper_docx(image_every=2))}).raise_for_status()
+        requests.post(base + '/api/template/generate-docx', timeout=300,
+                      data={'questions': json.dumps(corpus.make_questions())}).raise_for_status()
+        requests.get(base + '/api/does-not-exist', timeout=60)
+        resp = requests.get(base + '/metrics', timeout=60)
+        resp.raise_for_status()
+    finally:
+        server.should_exit = True
+
+    if not resp.headers.get('content-type', '').startswith('text/plain; version=0.0.4'):
+        print(f"FAIL: unexpected content type {resp.headers.get('content-type')}")
+        return 1
+    types, samples = parse_exposition(resp.text)
+    names = {s[0] for s in samples}
+    failures = []
+    expected = (
+        'idcs_http_requests_total', 'idcs_http_request_duration_seconds_bucket', 'idcs_http_requests_in_flight',
+        'idcs_renders_in_flight', 'idcs_sqlite_query_duration_seconds_bucket', 'idcs_image_bytes_processed_total',
+        'idcs_cache_requests_total', 'idcs_executor_queue_depth', 'idcs_request_stage_duration_seconds_bucket',
+    )
+    for name in expected:
+        if name not in names:
+            failures.append(f'missing series {name}')
+    routes = {labels.get('route') for n, labels, _ in samples if n == 'idcs_http_requests_total'}
+    for route in ('/api/upload-questions-excel/', '/api/template/scan-docx', '/api/template/generate-docx', 'other'):
+        if route not in routes:
+            failures.append(f'no request count for route {route}')
+    image_sources = {labels.get('source') for n, labels, _ in samples if n == 'idcs_image_bytes_processed_total'}
+    if not {'excel_upload', 'docx_scan'} <= image_sources:
+        failures.append(f'image byte sources incomplete: {sorted(image_sources)}')
+    failures.extend(check_histograms(types, samples))
+
+    print(f'scraped {len(samples)} samples across {len(types)} metrics')
+    if failures:
+        for f in failures:
+            print('FAIL:', f)
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Exercise server.migrations on a copy of a pre-versioning store.
+
+Starts from the committed server/local_store.db (user_version 0, the
+original three tables), fills it with questions through the old columns,
+then migrates: every version applies once, sync tracking picks up the
+existing rows, the course_outcomes_numbers backfill runs in batches
+without marking rows for a sync push, a failing migration rolls back
+completely, and a second startup is a no-op. Exits non-zero on the
+first mismatch.
+
+    python -m server.test_migrations [--rows 5000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from server.db import get_conn, init_db
+from server.migrations import LATEST, MIGRATIONS, Migration, migrate, pending_backfills, run_backfills, schema_version
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'local_store.db')
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=5000)
+    args = ap.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='idcs-migrate-'), 'local_store.db')
+    shutil.copyfile(BASELINE, path)
+    conn = get_conn(path)
+    check(schema_version(conn) == 0, 'baseline store should be unversioned')
+    conn.execute("INSERT INTO question_bank_titles(title) VALUES ('CS3401 Algorithms')")
+    cos = ['CO1', 'CO2', None, 'CO1, CO3', 'co5']
+    conn.executemany('INSERT INTO question_bank(question_text,type,btl,marks,status,course_outcomes,title_id) VALUES (?,?,?,?,?,?,1)',
+                     [(f'Question {i}', 'descriptive', 2, 16, 'pending', cos[i % len(cos)]) for i in range(args.rows)])
+    conn.commit()
+    conn.close()
+
+    print('startup migrates the old store')
+    t = time.perf_counter()
+    init_db(path)
+    print(f'  migrated in {(time.perf_counter() - t) * 1000:.0f} ms')
+    conn = get_conn(path)
+    conn.isolation_level = None
+    check(schema_version(conn) == LATEST, f'expected schema v{LATEST}')
+    cols = {r[1] for r in conn.execute('PRAGMA table_info(question_bank)')}
+    check({'image_url', 'course_outcomes_numbers'} <= cols, 'new columns missing')
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    check('idx_question_bank_title_status' in indexes, 'list index missing')
+    check(conn.execute('SELECT COUNT(*) FROM question_bank_sync').fetchone()[0] == args.rows, 'existing rows not tracked for sync')
+    check(pending_backfills(conn) == ['course_outcomes_numbers'], 'backfill not queued')
+    versions = conn.execute('SELECT question_id, version FROM question_bank_sync ORDER BY question_id').fetchall()
+
+    print('backfill runs in batches and leaves sync versions alone')
+    t = time.perf_counter()
+    batches = run_backfills(lambda: get_conn(path), batch=400, pause=0)
+    print(f'  {batches} in {(time.perf_counter() - t) * 1000:.0f} ms')
+    check(batches == {'course_outcomes_numbers': -(-args.rows // 400)}, 'unexpected batch count')
+    got = dict(conn.execute('SELECT course_outcomes, course_outcomes_numbers FROM question_bank GROUP BY course_outcomes'))
+    check(got == {None: None, 'CO1': '1', 'CO2': '2', 'CO1, CO3': '1,3', 'co5': '5'}, f'backfilled values: {got}')
+    check(pending_backfills(conn) == [], 'backfill not marked done')
+    check(conn.execute('SELECT question_id, version FROM question_bank_sync ORDER BY question_id').fetchall() == versions,
+          'backfill marked rows for a sync push')
+    conn.execute("UPDATE question_bank SET status='approved' WHERE id=1")
+    check(conn.execute('SELECT version FROM question_bank_sync WHERE question_id=1').fetchone()[0] > versions[0][1],
+          'synced column update no longer tracked')
+    for column, value in (('image_url', 'data:image/png;base64,AA=='), ('course_outcomes_numbers', '9')):
+        before = conn.execute('SELECT version FROM question_bank_sync WHERE question_id=2').fetchone()[0]
+        conn.execute(f'UPDATE question_bank SET {column}=? WHERE id=2', (value,))
+        check(conn.execute('SELECT version FROM question_bank_sync WHERE question_id=2').fetchone()[0] > before,
+              f'{column} update not tracked')
+
+    print('a failing migration rolls back with its version')
+
+    def broken(cur):
+        cur.execute('CREATE TABLE half_done(x)')
+        raise RuntimeError('boom')
+    try:
+        migrate(conn, MIGRATIONS + [Migration(LATEST + 1, 'broken', broken)])
+        check(False, 'broken migration should raise')
+    except RuntimeError:
+        pass
+    check(schema_version(conn) == LATEST, 'version moved despite failure')
+    check(conn.execute("SELECT 1 FROM sqlite_master WHERE name='half_done'").fetchone() is None, 'partial DDL kept')
+
+    print('second startup is a no-op')
+    check(migrate(conn) == [], 'migrations re-applied')
+    conn.close()
+    t = time.perf_counter()
+    init_db(path)
+    print(f'  init_db on a current store: {(time.perf_counter() - t) * 1000:.1f} ms')
+
+    print('fresh store')
+    fresh = os.path.join(os.path.dirname(path), 'fresh.db')
+    init_db(fresh)
+    conn = get_conn(fresh)
+    check(schema_version(conn) == LATEST, 'fresh store not at latest version')
+    conn.close()
+    check(run_backfills(lambda: get_conn(fresh), pause=0) == {'course_outcomes_numbers': 0}, 'fresh store backfill')
+
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Exercise seeded paper generation and the rendered-paper cache.
+
+Renders papers whose questions lack BTLs, so the random fallbacks matter.
+Checks that a seed fixes the document and that different seeds differ.
+Then posts to both generate-docx endpoints: a repeated request is served
+from the cache, while a different seed or header field renders again.
+Last, a picture served over http is changed at its URL: reprints keep the
+cached paper, and once the entry is older than the cache's max age the
+DOCX and the PDF carry the new picture, however often it was reprinted.
+
+    python -m server.test_paper_cache
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import zipfile
+from io import BytesIO
+
+# The apps read their DB and cache locations at import time
+_tmp = tempfile.mkdtemp(prefix='idcs-papers-')
+os.environ['IDCS_DB_PATH'] = os.path.join(_tmp, 'local_store.db')
+os.environ['IDCS_CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server import app_local, paper_pdf, template_backend  # noqa: E402
+from server.bench.corpus import png_bytes  # noqa: E402
+from server.paper_cache import paper_cache  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def document_xml(data: bytes) -> bytes:
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        return z.read('word/document.xml')
+
+
+def rendered(path: str) -> bytes:
+    try:
+        with open(path, 'rb') as f:
+            return document_xml(f.read())
+    finally:
+        os.remove(path)
+
+
+QUESTIONS = [{'question_text': f'Part A question {i}', 'part': 'A', 'marks': 2, 'type': 'objective'} for i in range(10)] + [
+    {'question_text': f'Part B question {n}{sub}', 'part': 'B', 'number': n, 'sub': sub, 'marks': 16, 'btl': 3,
+     'course_outcomes': f'CO{(n - 11) % 5 + 1}'}
+    for n in range(11, 16) for sub in 'ab'
+]
+FORM = {'questions': json.dumps(QUESTIONS), 'dept': 'CSE', 'cc': 'CS3301', 'cn': 'Data Structures', 'qpcode': 'QP-1'}
+
+
+class Figure:
+    """An http server whose one picture can be swapped; counts its downloads."""
+
+    def __init__(self, data: bytes):
+        self.data, self.fetches = data, 0
+        figure = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                figure.fetches += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(figure.data)))
+                self.end_headers()
+                self.wfile.write(figure.data)
+
+            def log_message(self, *args):
+                pass
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/figure.png'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def media(data: bytes):
+    with zipfile.ZipFile(BytesIO(data)) as z:
+        return {z.read(n) for n in z.namelist() if n.startswith('word/media/')}
+
+
+def remote_picture_expires(max_age: float):
+    old, new = png_bytes(random.Random(1)), png_bytes(random.Random(2))
+    figure = Figure(old)
+    questions = [dict(q) for q in QUESTIONS]
+    questions[0]['image_url'] = figure.url
+    form = {**FORM, 'questions': json.dumps(questions), 'seed': '5'}
+    endpoints = (('template_backend', template_backend.app, '/api/template/generate-docx'),
+                 ('app_local', app_local.app, '/api/template/generate-pdf'))
+    saved = paper_cache.max_age, paper_pdf.REMOTE_PICTURE_TTL
+    paper_cache.max_age = paper_pdf.REMOTE_PICTURE_TTL = max_age
+    try:
+        for name, app, path in endpoints:
+            print(f'{name}: a picture changed at its URL shows up once the cached paper is {max_age:g} s old')
+            paper_cache.clear()
+            figure.data = old
+            with TestClient(app) as client:
+                first = client.post(path, data=form)
+                written = time.time()
+                check(first.headers['x-paper-cache'] == 'miss', f'{name}: first render was not a miss')
+                if path.endswith('docx'):
+                    check(old in media(first.content), f'{name}: remote picture not embedded')
+                figure.data = new
+                fetches, reprints = figure.fetches, 0
+                while time.time() - written < max_age * 0.8:
+                    r = client.post(path, data=form)
+                    check(r.headers['x-paper-cache'] == 'hit' and r.content == first.content, f'{name}: reprint was not the cached paper')
+                    reprints += 1
+                    time.sleep(max_age / 20)
+                check(figure.fetches == fetches, f'{name}: a cache hit fetched the picture')
+                time.sleep(max_age * 0.3)
+                fresh = client.post(path, data=form)
+                check(fresh.headers['x-paper-cache'] == 'miss', f'{name}: paper still cached after {reprints} reprints past max_age')
+                check(figure.fetches > fetches and fresh.content != first.content, f'{name}: the new picture was not fetched')
+                if path.endswith('docx'):
+                    check(new in media(fresh.content) and old not in media(fresh.content), f'{name}: old picture still embedded')
+    finally:
+        paper_cache.max_age, paper_pdf.REMOTE_PICTURE_TTL = saved
+        figure.server.shutdown()
+
+
+def main():
+    print('a seed fixes the paper')
+    args = (QUESTIONS, 'CSE', 'CS3301', 'Data Structures', 'QP-1', 'Exam', 'Regulation 2024', 'Third Semester')
+    first = rendered(app_local.render_paper_docx(*args, seed=42))
+    check(rendered(app_local.render_paper_docx(*args, seed=42)) == first, 'same seed gave a different paper')
+    check(any(rendered(app_local.render_paper_docx(*args, seed=s)) != first for s in range(1, 6)),
+          'different seeds all gave the same paper')
+
+    for name, app in (('app_local', app_local.app), ('template_backend', template_backend.app)):
+        print(f'{name}: repeated downloads come from the cache')
+        paper_cache.clear()
+        with TestClient(app) as client:
+            def post(**extra):
+                t = time.perf_counter()
+                r = client.post('/api/template/generate-docx', data={**FORM, **extra})
+                check(r.status_code == 200, f'{name}: {r.status_code} {r.text[:200]}')
+                return r, (time.perf_counter() - t) * 1000
+
+            r1, miss_ms = post()
+            seed = r1.headers['x-paper-seed']
+            check(r1.headers['x-paper-cache'] == 'miss', f'{name}: first request was not a miss')
+            r2, hit_ms = post()
+            check(r2.headers['x-paper-cache'] == 'hit' and r2.content == r1.content, f'{name}: repeat was not served from the cache')
+            check(r2.headers['content-disposition'] == r1.headers['content-disposition'], f'{name}: download name changed')
+            print(f'  render {miss_ms:.0f} ms, cached {hit_ms:.1f} ms')
+            r3, _ = post(seed=seed)
+            check(r3.headers['x-paper-cache'] == 'hit', f'{name}: the reported seed does not reprint the paper')
+            r4, _ = post(seed=str(int(seed) + 1))
+            check(r4.headers['x-paper-cache'] == 'miss' and r4.headers['x-paper-seed'] == str(int(seed) + 1),
+                  f'{name}: a new seed was served from the cache')
+            r5, _ = post(qpcode='QP-2')
+            check(r5.headers['x-paper-cache'] == 'miss' and b'QP-2' in document_xml(r5.content),
+                  f'{name}: a changed header field was served from the cache')
+            check(client.post('/api/template/generate-docx', data={**FORM, 'seed': 'abc'}).status_code == 400,
+                  f'{name}: non-integer seed accepted')
+
+    remote_picture_expires(1.0)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
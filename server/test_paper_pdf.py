@@ -0,0 +1,151 @@
+"""Exercise POST /api/template/generate-pdf and its batch form.
+
+Compares the PDF with the DOCX for the same fields and seed: the table
+cells appear in the same order, pictures are embedded, and a repeat is
+served from the paper cache. Checks that the same paper always gives the
+same bytes and that a batch holds every paper, each from a new page.
+Times the PDF render against the DOCX render.
+
+    python -m server.test_paper_pdf [--batch 20]
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+# The app reads its DB and cache locations at import time. The core Times
+# fonts keep page text as plain strings, so the test can read it back.
+_tmp = tempfile.mkdtemp(prefix='idcs-pdf-')
+os.environ['IDCS_DB_PATH'] = os.path.join(_tmp, 'local_store.db')
+os.environ['IDCS_CACHE_DIR'] = os.path.join(_tmp, 'cache')
+os.environ['IDCS_PDF_FONT'] = 'builtin'
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server.app_local import app  # noqa: E402
+from server.test_paper_preview import FORM, QUESTIONS, docx_rows  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+_STREAM_RE = re.compile(rb'stream\r?\n(.*?)\s*endstream', re.S)
+_BLOCK_RE = re.compile(rb'BT (.*?) ET', re.S)
+_TEXT_RE = re.compile(rb'\(((?:[^()\\]|\\.)*)\) Tj')
+_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|.)', re.S)
+
+
+def _unescape(s: bytes) -> str:
+    s = _ESCAPE_RE.sub(lambda m: bytes([int(m.group(1), 8)]) if m.group(1).isdigit() else m.group(1), s)
+    return s.decode('cp1252')
+
+
+def pdf_lines(data: bytes):
+    """Text lines shown on the pages, in drawing order."""
+    out = []
+    for raw in _STREAM_RE.findall(data):
+        raw = raw.strip()
+        if raw.endswith(b'~>'):
+            raw = base64.a85decode(raw[:-2])
+        try:
+            content = zlib.decompress(raw)
+        except zlib.error:
+            continue
+        for block in _BLOCK_RE.findall(content):
+            for line in block.split(b'T*'):
+                text = ''.join(_unescape(t) for t in _TEXT_RE.findall(line)).strip()
+                if text:
+                    out.append(text)
+    return out
+
+
+def is_subsequence(needles, haystack) -> bool:
+    it = iter(haystack)
+    return all(any(n == h for h in it) for n in needles)
+
+
+def cell_lines(rows):
+    return [line.strip() for row in rows for cell in row for line in cell.split('\n') if line.strip()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--batch', type=int, default=20)
+    args = ap.parse_args(argv)
+
+    with TestClient(app) as client:
+        print('PDF and DOCX show the same paper')
+        r = client.post('/api/template/generate-pdf', data=FORM)
+        check(r.status_code == 200 and r.headers['content-type'] == 'application/pdf', f'generate-pdf: {r.status_code} {r.text[:200]}')
+        check(r.content.startswith(b'%PDF-') and 'question_paper.pdf' in r.headers['content-disposition'], 'not a PDF download')
+        d = client.post('/api/template/generate-docx', data=FORM)
+        check(r.headers['x-paper-seed'] == d.headers['x-paper-seed'], 'PDF and DOCX derived different seeds')
+        text = pdf_lines(r.content)
+        check(is_subsequence(cell_lines(docx_rows(d.content)), text), 'PDF cells differ from the DOCX')
+        for seed in ('1', '2', '3'):
+            p = client.post('/api/template/generate-pdf', data={**FORM, 'seed': seed}).content
+            d = client.post('/api/template/generate-docx', data={**FORM, 'seed': seed}).content
+            check(is_subsequence(cell_lines(docx_rows(d)), pdf_lines(p)), f'seed {seed}: PDF cells differ from the DOCX')
+        for line in ('K. RAMAKRISHNAN COLLEGE OF ENGINEERING', 'Question Paper Code: QP-7', 'CS3301 – Data Structures',
+                     'Third Semester', '(Regulation 2024)', 'Computer Science and Engineering', 'Reg.', 'No.:',
+                     'Time: Three Hours', 'Maximum Marks: 100 Marks', 'PART- A', '(10 x 2 = 20 Marks)', 'PART – C'):
+            check(line in text, f'header line missing: {line}')
+        check('Is <script>alert(1)</script> & "x" < y?' in text, 'markup in question text was not drawn as text')
+        # Part A's picture and the five Part B (b) pictures; the http figure is unreachable here
+        check(r.content.count(b'/Subtype /Image') == 6, f'expected 6 pictures, got {r.content.count(b"/Subtype /Image")}')
+
+        print('repeats are identical and cached')
+        again = client.post('/api/template/generate-pdf', data=FORM)
+        check(again.headers['x-paper-cache'] == 'hit' and again.content == r.content, 'repeat was not served from the cache')
+        from server.paper_cache import paper_cache
+        paper_cache.clear()
+        fresh = client.post('/api/template/generate-pdf', data=FORM)
+        check(fresh.headers['x-paper-cache'] == 'miss' and fresh.content == r.content, 'a re-render gave different bytes')
+        check(client.post('/api/template/generate-pdf', data={**FORM, 'seed': 'x'}).status_code == 400, 'non-integer seed accepted')
+
+        print(f'a batch of {args.batch} papers')
+        papers = [{'questions': QUESTIONS, 'qpcode': f'QP-{i}', 'cc': 'CS3301', 'cn': 'Data Structures', 'seed': i}
+                  for i in range(args.batch)]
+        t = time.perf_counter()
+        b = client.post('/api/template/generate-pdf/batch', data={'papers': json.dumps(papers)})
+        batch_ms = (time.perf_counter() - t) * 1000
+        check(b.status_code == 200 and b.headers['content-type'] == 'application/pdf', f'batch: {b.status_code} {b.text[:200]}')
+        check(b.headers['x-paper-seeds'] == ','.join(str(i) for i in range(args.batch)), 'batch seeds not reported in order')
+        text = pdf_lines(b.content)
+        codes = [s for s in text if s.startswith('Question Paper Code: ')]
+        check(codes == [f'Question Paper Code: QP-{i}' for i in range(args.batch)], 'batch is missing papers or out of order')
+        one = client.post('/api/template/generate-pdf', data={'questions': json.dumps(QUESTIONS), 'qpcode': 'QP-0', 'cc': 'CS3301',
+                                                               'cn': 'Data Structures', 'seed': '0'})
+        pages = one.content.count(b'/Type /Page\n')
+        check(b.content.count(b'/Type /Page\n') == pages * args.batch, 'papers in a batch do not start on new pages')
+        # Pictures repeated across the batch are embedded once
+        check(b.content.count(b'/Subtype /Image') == 6, 'batch embeds repeated pictures more than once')
+        for bad in ('not json', '[]', '[{"qpcode": "x"}]', json.dumps([{'questions': [], 'seed': 'x'}])):
+            check(client.post('/api/template/generate-pdf/batch', data={'papers': bad}).status_code == 400, f'bad batch accepted: {bad}')
+
+        print('timing')
+        pdf_ms, docx_ms = [], []
+        for i in range(5):
+            # Fresh seeds, so every paper is a real render rather than a cache hit
+            t = time.perf_counter()
+            client.post('/api/template/generate-pdf', data={**FORM, 'seed': str(2000 + i)})
+            pdf_ms.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            client.post('/api/template/generate-docx', data={**FORM, 'seed': str(2000 + i)})
+            docx_ms.append((time.perf_counter() - t) * 1000)
+        print(f'  PDF median {statistics.median(pdf_ms):.0f} ms, DOCX median {statistics.median(docx_ms):.0f} ms; '
+              f'batch of {args.batch}: {batch_ms:.0f} ms ({batch_ms / args.batch:.0f} ms per paper)')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Exercise POST /api/template/preview against generate-docx.
+
+Times previews of a full Part A/B/C paper with pictures and compares them
+with the DOCX render. Checks that the preview shows the same cells as the
+DOCX for the same fields and seed, that pictures are referenced by URL
+and served from the image route, and that question text is escaped.
+
+    python -m server.test_paper_preview [--runs 20]
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from html import unescape
+from io import BytesIO
+
+# The app reads its DB and cache locations at import time
+_tmp = tempfile.mkdtemp(prefix='idcs-preview-')
+os.environ['IDCS_DB_PATH'] = os.path.join(_tmp, 'local_store.db')
+os.environ['IDCS_CACHE_DIR'] = os.path.join(_tmp, 'cache')
+
+from docx import Document  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from server.app_local import app  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def png(color) -> str:
+    buf = BytesIO()
+    Image.new('RGB', (300, 120), color).save(buf, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+
+
+PICTURE = png((200, 30, 30))
+QUESTIONS = [
+    {'question_text': f'D. Part A question {i}' if i != 3 else 'Is <script>alert(1)</script> & "x" < y?', 'part': 'A',
+     'marks': 2, 'type': 'objective', 'course_outcomes': f'CO{i % 5 + 1}' if i % 2 else None,
+     'image_url': PICTURE if i == 0 else None}
+    for i in range(10)
+] + [
+    {'question_text': f'Part B question {n}{sub}\nwith a second line', 'part': 'B', 'number': n, 'sub': sub, 'marks': 16,
+     'btl': 3 + (n % 2), 'course_outcomes': f'CO{n - 10}',
+     'image_url': png((0, n * 10, 200)) if sub == 'b' else ('https://example.org/figure.png' if n == 12 else None)}
+    for n in range(11, 16) for sub in 'ab'
+] + [
+    {'question_text': f'Part C case study {sub}', 'part': 'C', 'number': 16, 'sub': sub, 'marks': 15, 'btl': 5, 'course_outcomes': 'CO5'}
+    for sub in 'ab'
+]
+FORM = {'questions': json.dumps(QUESTIONS), 'dept': 'Computer Science and Engineering', 'cc': 'CS3301',
+        'cn': 'Data Structures', 'qpcode': 'QP-7', 'semester': 'Third Semester'}
+
+_ROW_RE = re.compile(r'<tr>(.*?)</tr>', re.S)
+_CELL_RE = re.compile(r'<td[^>]*>(.*?)</td>', re.S)
+
+
+def html_rows(page: str):
+    rows = []
+    for tr in _ROW_RE.findall(page):
+        cells = [unescape(re.sub(r'<[^>]+>', '', c.replace('<br>', '\n'))) for c in _CELL_RE.findall(tr)]
+        rows.append(cells if len(cells) > 1 else ['(OR)'])
+    return rows
+
+
+def docx_rows(data: bytes):
+    rows = []
+    # Tables 0 and 1 are the register-number boxes and the time/marks line
+    for table in Document(BytesIO(data)).tables[2:]:
+        for row in table.rows[1:]:
+            cells = [c.text for c in row.cells]
+            rows.append(['(OR)'] if all(c == '(OR)' for c in cells) else cells)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--runs', type=int, default=20)
+    args = ap.parse_args(argv)
+
+    with TestClient(app) as client:
+        print('preview and DOCX show the same paper')
+        r = client.post('/api/template/preview', data=FORM)
+        check(r.status_code == 200 and r.headers['content-type'].startswith('text/html'), f'preview: {r.status_code}')
+        page = r.text
+        d = client.post('/api/template/generate-docx', data=FORM)
+        check(r.headers['x-paper-seed'] == d.headers['x-paper-seed'], 'preview and DOCX derived different seeds')
+        check(html_rows(page) == docx_rows(d.content), 'preview cells differ from the DOCX')
+        for seed in ('1', '2', '3'):
+            p = client.post('/api/template/preview', data={**FORM, 'seed': seed}).text
+            d = client.post('/api/template/generate-docx', data={**FORM, 'seed': seed}).content
+            check(html_rows(p) == docx_rows(d), f'seed {seed}: preview cells differ from the DOCX')
+        for text in ('K. RAMAKRISHNAN COLLEGE OF ENGINEERING', 'Question Paper Code: QP-7', 'CS3301 – Data Structures',
+                     'Third Semester', '(Regulation 2024)', 'Computer Science and Engineering'):
+            check(text in page, f'header line missing: {text}')
+        check('<script>' not in page and '&lt;script&gt;' in page, 'question text not escaped')
+
+        print('pictures are referenced, not embedded')
+        check('base64' not in page, 'preview inlines image data')
+        check('src="https://example.org/figure.png"' in page, 'http picture not referenced as is')
+        srcs = re.findall(r'<img src="([^"]+)"', page)
+        local = [s for s in srcs if '/api/template/preview/images/' in s]
+        check(len(local) == 6, f'expected 6 stored pictures, got {len(local)}')
+        img = client.get(local[0])
+        check(img.status_code == 200 and img.headers['content-type'] == 'image/png'
+              and 'immutable' in img.headers['cache-control'], 'image route')
+        check(base64.b64encode(img.content).decode('ascii') == PICTURE.split(',', 1)[1], 'picture bytes changed')
+        check(client.get('/api/template/preview/images/0123.png').status_code == 404, 'unknown picture served')
+        check(client.get('/api/template/preview/images/..%2Fx.png').status_code == 404, 'bad picture name served')
+        check(client.post('/api/template/preview', data={**FORM, 'seed': 'x'}).status_code == 400, 'non-integer seed accepted')
+
+        print(f'timing over {args.runs} runs')
+        preview_ms, docx_ms = [], []
+        for i in range(args.runs):
+            t = time.perf_counter()
+            client.post('/api/template/preview', data={**FORM, 'seed': str(i)})
+            preview_ms.append((time.perf_counter() - t) * 1000)
+        for i in range(3):
+            t = time.perf_counter()
+            # Fresh seeds, so every DOCX is a real render rather than a cache hit
+            client.post('/api/template/generate-docx', data={**FORM, 'seed': str(1000 + i)})
+            docx_ms.append((time.perf_counter() - t) * 1000)
+        median = statistics.median(preview_ms)
+        print(f'  preview median {median:.1f} ms (max {max(preview_ms):.1f}); DOCX render median {statistics.median(docx_ms):.0f} ms')
+        check(median < 100, 'preview is not under 100 ms')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Check question_bank_stats against a full GROUP BY after random writes.
+
+Runs against a throwaway store: bulk inserts, status changes, edits of
+every stats dimension (including to and from NULL), deletes and an Excel
+style delete-and-reinsert. After each round the trigger-maintained table
+must equal the aggregate computed from question_bank. Finally times
+/api/question-bank/stats against downloading the full list.
+
+    python -m server.test_question_bank_stats [--rows 20000] [--rounds 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# The app reads its DB path at import time
+os.environ['IDCS_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='idcs-stats-'), 'local_store.db')
+
+from server.db import DB_PATH, get_conn, init_db  # noqa: E402
+from server.migrations import STATS_DIMENSIONS  # noqa: E402
+
+KEYS = ', '.join(f"IFNULL({d}, '')" for d in STATS_DIMENSIONS)
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def consistent(conn) -> bool:
+    expected = set(conn.execute(f'SELECT {KEYS}, COUNT(*) FROM question_bank GROUP BY {KEYS}'))
+    got = set(conn.execute(f'SELECT {", ".join(STATS_DIMENSIONS)}, questions FROM question_bank_stats'))
+    return expected == got
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=20000)
+    ap.add_argument('--rounds', type=int, default=20)
+    args = ap.parse_args(argv)
+    rnd = random.Random(7)
+    statuses = ['pending', 'approved', 'rejected', None]
+    cos = ['CO1', 'CO2', 'CO3', 'CO4', 'CO5', None]
+
+    def row():
+        return (f'Q{rnd.random()}', 'descriptive', rnd.choice([1, 2, 3, 4, 5, 6, None]), rnd.choice([1, 2, 13, 16, None]),
+                rnd.choice(statuses), rnd.choice(cos), rnd.choice([1, 2, 3]))
+
+    init_db()
+    conn = get_conn(DB_PATH)
+    for t in ('Title A', 'Title B', 'Title C'):
+        conn.execute('INSERT INTO question_bank_titles(title) VALUES (?)', (t,))
+    insert = 'INSERT INTO question_bank(question_text,type,btl,marks,status,course_outcomes,title_id) VALUES (?,?,?,?,?,?,?)'
+    t = time.perf_counter()
+    conn.executemany(insert, [row() for _ in range(args.rows)])
+    conn.commit()
+    print(f'inserted {args.rows} rows in {(time.perf_counter() - t) * 1000:.0f} ms')
+    check(consistent(conn), 'stats wrong after bulk insert')
+
+    for i in range(args.rounds):
+        ids = [r[0] for r in conn.execute('SELECT id FROM question_bank')]
+        pick = rnd.sample(ids, 200)
+        conn.executemany('UPDATE question_bank SET status=? WHERE id=?', [(rnd.choice(statuses), q) for q in pick[:80]])
+        dim = rnd.choice(STATS_DIMENSIONS)
+        values = {'title_id': [1, 2, 3, None], 'status': statuses, 'course_outcomes': cos,
+                  'btl': [1, 2, 3, None], 'marks': [2, 16, None]}[dim]
+        conn.executemany(f'UPDATE question_bank SET {dim}=? WHERE id=?', [(rnd.choice(values), q) for q in pick[80:140]])
+        conn.executemany('UPDATE question_bank SET question_text=question_text || ? WHERE id=?', [('!', q) for q in pick[140:160]])
+        conn.executemany('DELETE FROM question_bank WHERE id=?', [(q,) for q in pick[160:200]])
+        conn.executemany(insert, [row() for _ in range(40)])
+        conn.commit()
+        check(consistent(conn), f'stats wrong after round {i + 1} (last dimension edited: {dim})')
+    check(conn.execute('SELECT COUNT(*) FROM question_bank_stats WHERE questions <= 0').fetchone()[0] == 0, 'empty groups kept')
+    groups = conn.execute('SELECT COUNT(*) FROM question_bank_stats').fetchone()[0]
+    conn.close()
+    print(f'{args.rounds} rounds of mixed writes: stats consistent ({groups} groups)')
+
+    from fastapi.testclient import TestClient
+    from server.app_local import app
+    with TestClient(app) as client:
+        client.get('/api/question-bank/stats', params={'by': ''})
+        t = time.perf_counter()
+        stats = client.get('/api/question-bank/stats').json()
+        stats_ms = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        full = client.get('/api/question-bank').json()
+        list_ms = (time.perf_counter() - t) * 1000
+        check(stats['total'] == len(full), 'stats total differs from the list')
+        by_status = client.get('/api/question-bank/stats', params={'by': 'status', 'title_id': 2}).json()
+        expected = {}
+        for q in full:
+            if q['title_id'] == 2:
+                expected[q['status']] = expected.get(q['status'], 0) + 1
+        check({g['status']: g['count'] for g in by_status['groups']} == expected, 'by=status rollup')
+        check(client.get('/api/question-bank/stats', params={'by': 'chapter'}).status_code == 400, 'unknown dimension accepted')
+    print(f'stats endpoint {stats_ms:.1f} ms ({len(stats["groups"])} groups) vs full list {list_ms:.1f} ms ({len(full)} rows)')
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Exercise POST /api/question-bank/transition on a throwaway store.
+
+Approves a 5000-question title in one request and compares it with the
+per-row executemany the update-status endpoint used to run. Checks that
+only the selected rows move, that each move gets one activity log row with
+before/after statuses, that a repeated request is a no-op, that id ranges
+work, and that requests without a selector are refused.
+
+    python -m server.test_status_transition [--rows 5000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# The app reads its DB path at import time
+os.environ['IDCS_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='idcs-transition-'), 'local_store.db')
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from server.app_local import app  # noqa: E402
+from server.db import get_conn  # noqa: E402
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=5000)
+    args = ap.parse_args(argv)
+
+    conn = get_conn()
+    conn.executemany('INSERT INTO question_bank_titles(title) VALUES (?)', [('Bank A',), ('Bank B',)])
+    insert = 'INSERT INTO question_bank(question_text,type,btl,marks,status,title_id) VALUES (?,?,?,?,?,?)'
+    conn.executemany(insert, [(f'A{i}', 'descriptive', 2, 16, 'pending', 1) for i in range(args.rows)])
+    conn.executemany(insert, [(f'B{i}', 'descriptive', 2, 16, 'pending', 2) for i in range(200)])
+    conn.commit()
+    ids_a = [i for (i,) in conn.execute('SELECT id FROM question_bank WHERE title_id=1')]
+
+    # What update-status used to do: one UPDATE per id, no log
+    t = time.perf_counter()
+    conn.executemany('UPDATE question_bank SET status=? WHERE id=?', [('approved', i) for i in ids_a])
+    conn.commit()
+    per_row_ms = (time.perf_counter() - t) * 1000
+    conn.execute("UPDATE question_bank SET status='pending'")
+    conn.commit()
+
+    def logs():
+        return conn.execute('SELECT COUNT(*) FROM question_activity_logs').fetchone()[0]
+
+    with TestClient(app) as client:
+        print('approve a whole title in one request')
+        t = time.perf_counter()
+        r = client.post('/api/question-bank/transition',
+                        data={'status': 'approved', 'title_id': 1, 'from_status': 'pending', 'user_id': 'u-1', 'action': 'verify'})
+        set_ms = (time.perf_counter() - t) * 1000
+        check(r.status_code == 200 and r.json() == {'updated': args.rows, 'status': 'approved'}, f'transition: {r.text}')
+        print(f'  {args.rows} rows + log in {set_ms:.0f} ms (one request); per-row executemany without log: {per_row_ms:.0f} ms')
+        counts = dict(conn.execute('SELECT title_id, COUNT(*) FROM question_bank WHERE status=? GROUP BY title_id', ('approved',)))
+        check(counts == {1: args.rows}, f'wrong rows moved: {counts}')
+        check(logs() == args.rows, 'one log row per moved question')
+        user, action, details = conn.execute('SELECT user_id, action, details FROM question_activity_logs LIMIT 1').fetchone()
+        check((user, action) == ('u-1', 'verify'), 'log user/action')
+        check(json.loads(details) == {'changes': {'status': {'before': 'pending', 'after': 'approved'}}}, f'log details: {details}')
+
+        print('repeating it changes and logs nothing')
+        r = client.post('/api/question-bank/transition', data={'status': 'approved', 'title_id': 1})
+        check(r.json()['updated'] == 0 and logs() == args.rows, 'repeat was not a no-op')
+
+        print('id ranges and single ids')
+        lo = ids_a[0]
+        r = client.post('/api/question-bank/transition', data={'status': 'rejected', 'ids': f'{lo}-{lo + 9}, {lo + 20},{lo + 5}'})
+        check(r.json()['updated'] == 11 and logs() == args.rows + 11, f'range transition: {r.text}')
+
+        print('legacy update-status goes through the same path')
+        r = client.post('/api/question-bank/update-status', data={'ids': f'{lo},{lo + 1}', 'status': 'pending'})
+        check(r.json() == {'updated': 2, 'status': 'pending'} and logs() == args.rows + 13, f'update-status: {r.text}')
+
+        print('requests without a selector or with a bad range are refused')
+        check(client.post('/api/question-bank/transition', data={'status': 'approved'}).status_code == 400, 'no selector accepted')
+        check(client.post('/api/question-bank/transition', data={'status': 'approved', 'ids': '9-3'}).status_code == 400, 'bad range accepted')
+
+        stats = client.get('/api/question-bank/stats', params={'by': 'title_id,status'}).json()['groups']
+        check({(g['title_id'], g['status']): g['count'] for g in stats}
+              == {(1, 'approved'): args.rows - 11, (1, 'rejected'): 9, (1, 'pending'): 2, (2, 'pending'): 200}, f'stats: {stats}')
+    conn.close()
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Exercise server.sync against the in-memory PostgREST stand-in.
+
+Two throwaway SQLite stores play two offline lab machines sharing one
+stand-in project: a full first push and pull, edits and deletions on one
+side, pictures and CO numbers travelling both ways, conflicting edits
+resolved by updated_at, a no-op sync, and a sync attempted while the
+remote is down. Exits non-zero on the first mismatch.
+
+    python -m server.test_sync [--rows 1200] [--batch 500]
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from server.db import get_conn, init_db
+from server.migrations import _v10_sync_image_columns
+from server.postgrest_standin import create_app
+from server.sync import PostgrestClient, SyncEngine, SyncError
+from server.test_concurrency import free_port
+
+
+def serve(app, port: int):
+    import socket
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return server
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('stand-in did not start')
+
+
+class Lab:
+    def __init__(self, name: str, url: str, key: str, batch: int):
+        self.name = name
+        self.path = os.path.join(tempfile.mkdtemp(prefix=f'idcs-sync-{name}-'), 'local_store.db')
+        init_db(self.path)
+        self.engine = SyncEngine(PostgrestClient(url, key), connect=lambda: get_conn(self.path), batch=batch)
+
+    def sql(self, query, params=()):
+        conn = get_conn(self.path)
+        try:
+            rows = conn.execute(query, params).fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    def sync(self):
+        t = time.perf_counter()
+        report = self.engine.sync()
+        report['ms'] = round((time.perf_counter() - t) * 1000)
+        print(f'  {self.name}: {report}')
+        return report
+
+    def texts(self):
+        return {rid: text for rid, text in self.sql(
+            'SELECT s.remote_id, q.question_text FROM question_bank q JOIN question_bank_sync s ON s.question_id = q.id')}
+
+
+def check(cond, msg):
+    if not cond:
+        print('FAIL:', msg)
+        sys.exit(1)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=1200)
+    ap.add_argument('--batch', type=int, default=500)
+    args = ap.parse_args(argv)
+
+    key = 'standin-key'
+    app = create_app(key)
+    port = free_port()
+    serve(app, port)
+    url = f'http://127.0.0.1:{port}'
+    remote = app.state.store.tables['question_bank']
+
+    a = Lab('lab-a', url, key, args.batch)
+    b = Lab('lab-b', url, key, args.batch)
+
+    print('first push and pull')
+    a.sql("INSERT INTO question_bank_titles(title) VALUES ('CS3401 Algorithms')")
+    conn = get_conn(a.path)
+    conn.executemany('INSERT INTO question_bank(question_text,type,btl,marks,status,course_outcomes,title_id) VALUES (?,?,?,?,?,?,1)',
+                     [(f'Question {i}', 'descriptive', 2, 16, 'pending', 'CO1') for i in range(args.rows)])
+    conn.commit()
+    conn.close()
+    r = a.sync()
+    check(r['pushed'] == args.rows and len(remote) == args.rows, 'lab-a did not push every row')
+    r = b.sync()
+    check(r['pulled'] == args.rows, 'lab-b did not pull every row')
+    check(a.texts() == b.texts(), 'labs differ after first sync')
+    check(b.sql('SELECT title FROM question_bank_titles') == [('CS3401 Algorithms',)], 'title not pulled')
+
+    print('no-op sync')
+    r = a.sync()
+    check(r['pulled'] == r['pushed'] == 0, 'no-op sync moved rows')
+
+    print('edits, inserts and deletions travel as deltas')
+    ids = [i for (i,) in b.sql('SELECT id FROM question_bank ORDER BY id LIMIT 5')]
+    b.sql("UPDATE question_bank SET question_text = question_text || ' (edited)', status = 'approved' WHERE id IN (?,?,?)", ids[:3])
+    b.sql('DELETE FROM question_bank WHERE id IN (?,?)', ids[3:5])
+    b.sql("INSERT INTO question_bank(question_text,type,btl,marks,status,title_id) VALUES ('New on B','objective',1,2,'pending',1)")
+    r = b.sync()
+    check(r['pushed'] == 4 and r['deleted'] == 2, 'lab-b pushed the wrong delta')
+    check(len(remote) == args.rows - 1, 'remote row count after deletes')
+    r = a.sync()
+    check(r['pulled'] == 4, 'lab-a pulled the wrong delta')
+    check(sum(t.endswith('(edited)') for t in a.texts().values()) == 3, 'edits missing on lab-a')
+
+    print('pictures and CO numbers travel both ways')
+    picture = 'data:image/png;base64,iVBORw0KGgo='
+    rid_a, rid_b = sorted(a.texts())[20:22]
+    a.sql("UPDATE question_bank SET image_url = ?, course_outcomes = 'CO2, CO4', course_outcomes_numbers = '2,4' "
+          'WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)', (picture, rid_a))
+    r = a.sync()
+    check(r['pushed'] == 1, 'picture edit was not pushed')
+    check((remote[rid_a]['image_url'], remote[rid_a]['course_outcomes_numbers']) == (picture, '2,4'), 'remote missed the picture')
+    b.sync()
+    remote[rid_b].update(image_url='https://example.org/fig.png', course_outcomes_numbers='5',
+                         updated_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+    r = a.sync()
+    check(r['pulled'] == 1, 'remote picture edit was not pulled')
+    for lab, want_b in ((a, ('https://example.org/fig.png', '5')), (b, (None, '1'))):
+        got = {rid: (image, numbers) for rid, image, numbers in lab.sql(
+            'SELECT s.remote_id, q.image_url, q.course_outcomes_numbers FROM question_bank q '
+            'JOIN question_bank_sync s ON s.question_id = q.id WHERE s.remote_id IN (?,?)', (rid_a, rid_b))}
+        check(got == {rid_a: (picture, '2,4'), rid_b: want_b}, f'{lab.name}: pictures after sync: {got}')
+    b.sync()
+    r = a.sync()
+    check(r['pulled'] == r['pushed'] == 0, 'picture round trip did not settle')
+    a.sql("UPDATE question_bank SET image_url = NULL WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)", (rid_a,))
+    a.sync()
+    b.sync()
+    check(remote[rid_a]['image_url'] is None and b.sql('SELECT image_url FROM question_bank q JOIN question_bank_sync s '
+                                                       'ON s.question_id = q.id WHERE s.remote_id = ?', (rid_a,)) == [(None,)],
+          'removing a picture did not sync')
+
+    print('migration 10 catches up pictures synced before it')
+    # As if both pictures were set before image_url was synced: neither side has the other's
+    rid_c, rid_d = sorted(a.texts())[30:32]
+    a.sql("UPDATE question_bank SET image_url = ? WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)",
+          (picture, rid_c))
+    a.sql('UPDATE question_bank_sync SET synced_version = version')
+    remote[rid_d]['image_url'] = 'https://example.org/old.png'
+    conn = get_conn(a.path)
+    _v10_sync_image_columns(conn.cursor())
+    conn.commit()
+    conn.close()
+    r = a.sync()
+    # Both rows with a local picture (rid_c and rid_b from above) are pushed again
+    check(r['pushed'] == 2 and remote[rid_c]['image_url'] == picture, 'local picture not pushed after migration 10')
+    check(a.sql('SELECT image_url FROM question_bank q JOIN question_bank_sync s ON s.question_id = q.id '
+                'WHERE s.remote_id = ?', (rid_d,)) == [('https://example.org/old.png',)], 'remote picture not pulled after migration 10')
+    b.sync()
+
+    print('conflicts go to the later updated_at')
+    rid = sorted(b.texts())[10]
+    a.sql("UPDATE question_bank SET question_text = 'A was first' WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)", (rid,))
+    time.sleep(0.05)
+    b.sql("UPDATE question_bank SET question_text = 'B was later' WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)", (rid,))
+    b.sync()
+    r = a.sync()
+    check(r['conflicts']['remote'] == 1 and a.texts()[rid] == 'B was later', 'remote newer edit should win')
+    b.sync()
+    time.sleep(0.05)
+    a.sql("UPDATE question_bank SET question_text = 'A edits after B synced' WHERE id = (SELECT question_id FROM question_bank_sync WHERE remote_id = ?)", (rid,))
+    r = a.sync()
+    check(remote[rid]['question_text'] == 'A edits after B synced', 'local newer edit should be pushed')
+    b.sync()
+    check(b.texts()[rid] == 'A edits after B synced', 'lab-b did not get the winning edit')
+
+    print('offline: changes stay queued until the remote is back')
+    offline = SyncEngine(PostgrestClient(f'http://127.0.0.1:{free_port()}', key, timeout=2), connect=lambda: get_conn(a.path))
+    a.sql("UPDATE question_bank SET marks = 13 WHERE id = 1")
+    try:
+        offline.sync()
+        check(False, 'sync against a closed port should fail')
+    except SyncError as e:
+        print('  offline sync failed as expected:', str(e)[:80])
+    check(a.sql('SELECT COUNT(*) FROM question_bank_sync WHERE version > synced_version')[0][0] == 1, 'pending change lost')
+    r = a.sync()
+    check(r['pushed'] == 1, 'queued change not pushed once back online')
+
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
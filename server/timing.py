@@ -0,0 +1,248 @@
+"""Per-stage request timing: Server-Timing headers, timing logs, in-process histograms.
+
+Handlers mark stages either with the `stage(name)` context manager or, for
+long straight-line code, with a `Stopwatch` whose `lap(name)` charges the
+time since the previous lap to `name`. Repeated stages within a request
+(per sheet, per image) accumulate, and stage() blocks may sit inside a lap
+(image_embed inside part_b), so entries can overlap. TimingMiddleware
+collects them into a `Server-Timing` header and one structured log line
+per request; each stage's per-request total also feeds a histogram keyed
+by (route, stage), readable at GET /api/debug/timings.
+
+Stages run in the CPU thread pool are attributed correctly because the
+executor copies the request context; with IDCS_CPU_POOL=process they are
+only recorded in the worker's own histograms.
+"""
+import bisect
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger('timing')
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS: Tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Requests to these paths get a timing log line even without stages
+TIMED_PATHS = (
+    '/api/upload-questions-excel/',
+    '/api/template/scan-docx',
+    '/api/template/generate-docx',
+)
+
+_TOKEN_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative counts are derived on read)."""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None past the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum, 3),
+            'mean_ms': round(self.sum / self.count, 3) if self.count else 0.0,
+            'p50_le_ms': self.quantile(0.5),
+            'p95_le_ms': self.quantile(0.95),
+            'p99_le_ms': self.quantile(0.99),
+            'buckets': {str(b): c for b, c in zip(BUCKETS_MS + ('+Inf',), self.counts)},
+        }
+
+
+_hist_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], Histogram] = {}
+
+
+def observe(route: str, stage_name: str, ms: float):
+    key = (route, stage_name)
+    with _hist_lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = Histogram()
+        h.observe(ms)
+
+
+def histograms() -> Dict[Tuple[str, str], Histogram]:
+    """The live (route, stage) -> Histogram map; treat as read-only."""
+    with _hist_lock:
+        return dict(_histograms)
+
+
+def reset():
+    with _hist_lock:
+        _histograms.clear()
+
+
+class RequestTimings:
+    def __init__(self, route: str):
+        self.route = route
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        # name -> [total ms, occurrences], in first-seen order
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            entry = self.stages.get(name)
+            if entry is None:
+                self.stages[name] = [ms, 1]
+            else:
+                entry[0] += ms
+                entry[1] += 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        parts = []
+        for name, (ms, n) in list(self.stages.items()):
+            item = f'{_TOKEN_RE.sub("_", name)};dur={ms:.1f}'
+            if n > 1:
+                item += f';desc="x{n}"'
+            parts.append(item)
+        parts.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(parts)
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar('request_timings', default=None)
+
+
+def record(name: str, ms: float):
+    """Charge `ms` to stage `name` of the current request.
+
+    Outside a request the sample goes straight to the histogram under route '-'.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+    else:
+        observe('-', name, ms)
+
+
+@contextmanager
+def stage(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - t) * 1000)
+
+
+class Stopwatch:
+    """Lap timer for straight-line code: lap(name) charges the time since the last lap."""
+
+    __slots__ = ('_last',)
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        record(name, (now - self._last) * 1000)
+        self._last = now
+
+    def reset(self):
+        self._last = time.perf_counter()
+
+
+def _route_of(scope: Scope) -> str:
+    route = scope.get('route')
+    return getattr(route, 'path', None) or scope['path']
+
+
+class TimingMiddleware:
+    """Adds Server-Timing to responses and logs a timing line per request.
+
+    Only requests that recorded stages (or hit TIMED_PATHS) are logged, so
+    static files and list endpoints stay quiet.
+    """
+
+    def __init__(self, app: ASGIApp, log_paths=TIMED_PATHS):
+        self.app = app
+        self.log_paths = tuple(log_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings(scope['path'])
+        token = _current.set(timings)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                # The router has matched by now; use the route template as the label
+                timings.route = _route_of(scope)
+                if timings.stages:
+                    headers = MutableHeaders(scope=message)
+                    headers.append('Server-Timing', timings.server_timing(timings.elapsed_ms()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            total_ms = timings.elapsed_ms()
+            if timings.stages or scope['path'] in self.log_paths:
+                timings.route = _route_of(scope)
+                # Histograms hold per-request totals for each stage
+                for name, (ms, _n) in list(timings.stages.items()):
+                    observe(timings.route, name, ms)
+                observe(timings.route, 'total', total_ms)
+                stages = {k: round(v[0], 1) for k, v in timings.stages.items()}
+                # Fields travel as extras so the JSON log file keeps them structured
+                logger.info('request_timing %s %s %s %.1fms %s', scope['method'], timings.route, status,
+                            total_ms, json.dumps(stages), extra={
+                                'event': 'request_timing',
+                                'method': scope['method'],
+                                'route': timings.route,
+                                'status': status,
+                                'total_ms': round(total_ms, 1),
+                                'stages': stages,
+                            })
+
+
+def debug_timings():
+    out: Dict[str, Dict[str, dict]] = {}
+    for (route, name), h in sorted(histograms().items()):
+        out.setdefault(route, {})[name] = h.snapshot()
+    return {'buckets_ms': list(BUCKETS_MS), 'routes': out}
+
+
+def install(app):
+    """Register the timing middleware and GET /api/debug/timings on a FastAPI app."""
+    app.add_middleware(TimingMiddleware)
+    app.add_api_route('/api/debug/timings', debug_timings, methods=['GET'])
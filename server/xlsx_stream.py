@@ -0,0 +1,259 @@
+"""Streaming .xlsx writer for exports too large to build in memory.
+
+openpyxl's write-only mode keeps memory flat, but it buffers every sheet
+in a temp file and only zips the package in save(). So a download cannot
+start until the last row has been read. This writer emits the package parts
+straight into a zip stream as rows are appended. The stream may be
+unseekable, e.g. a pipe into an HTTP response. Order: [Content_Types].xml,
+workbook and styles first, then each worksheet row by row, then that
+sheet's pictures.
+
+It covers what the question-bank export needs: inline strings and numbers,
+a bold header style and a wrapped-text style, column widths, row heights,
+and one-cell-anchored PNG/JPEG pictures. The content types list needs
+every part up front, so the constructor takes the sheet names and the
+sheets that will carry pictures. Sheets are then written in that order.
+"""
+import re
+import tempfile
+import zipfile
+from io import BytesIO
+from typing import Iterable, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+
+STYLE_DEFAULT = 0
+STYLE_HEADER = 1
+STYLE_WRAP = 2
+
+EMU_PER_PX = 9525
+# Deflate level: 1 is several times faster than the default 6 and only slightly larger on sheet XML
+COMPRESSLEVEL = 1
+# Sheet XML is handed to the zip stream in pieces of about this size
+WRITE_BUFFER = 64 * 1024
+
+_ILLEGAL_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f￾￿]')
+
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+_XDR_NS = 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing'
+_A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+_CT = 'application/vnd.openxmlformats-officedocument.'
+
+_STYLES = (
+    f'{_XML_HEAD}<styleSheet xmlns="{_MAIN_NS}">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+    '<alignment vertical="top" wrapText="1"/></xf></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _text(s: str) -> str:
+    return escape(_ILLEGAL_XML_RE.sub('', s))
+
+
+def _rels(rels: Iterable[Tuple[str, str, str]]) -> str:
+    items = ''.join(f'<Relationship Id="{i}" Type="{t}" Target={quoteattr(target)}/>' for i, t, target in rels)
+    return f'{_XML_HEAD}<Relationships xmlns="{_PKG_REL_NS}">{items}</Relationships>'
+
+
+def image_info(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """-> (extension, width px, height px) for PNG/JPEG bytes, else None."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        ext = 'png'
+    elif data[:3] == b'\xff\xd8\xff':
+        ext = 'jpeg'
+    else:
+        return None
+    try:
+        from PIL import Image
+        with Image.open(BytesIO(data)) as im:
+            w, h = im.size
+    except Exception:
+        return None
+    return ext, w, h
+
+
+class SheetWriter:
+    """One worksheet being streamed; get it from StreamingWorkbook.sheet()."""
+
+    def __init__(self, book: 'StreamingWorkbook', index: int, widths: Sequence[float], wrap: Iterable[int]):
+        self.book = book
+        self.index = index
+        self.row = 0
+        self.wrap = frozenset(wrap)
+        self._letters: List[str] = []
+        # (row, col, ext, width px, height px, media spool offset, length)
+        self._images: List[Tuple[int, int, str, int, int, int, int]] = []
+        self._fh = book.zip.open(f'xl/worksheets/sheet{index}.xml', 'w', force_zip64=True)
+        self._buf: List[str] = [f'{_XML_HEAD}<worksheet xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">']
+        self._size = 0
+        if widths:
+            self._buf.append('<cols>' + ''.join(
+                f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>' for i, w in enumerate(widths, 1)) + '</cols>')
+        self._buf.append('<sheetData>')
+
+    def _letter(self, col: int) -> str:
+        while len(self._letters) < col:
+            self._letters.append(get_column_letter(len(self._letters) + 1))
+        return self._letters[col - 1]
+
+    def _write(self, s: str):
+        self._buf.append(s)
+        self._size += len(s)
+        if self._size >= WRITE_BUFFER:
+            self._fh.write(''.join(self._buf).encode('utf-8'))
+            self._buf.clear()
+            self._size = 0
+
+    def append(self, values: Sequence, style: int = STYLE_DEFAULT, height: Optional[float] = None) -> int:
+        """Write the next row; blank cells (None or '') are skipped. Returns the row number."""
+        self.row += 1
+        r = self.row
+        out = [f'<row r="{r}" ht="{height:.2f}" customHeight="1">' if height else f'<row r="{r}">']
+        for c, v in enumerate(values, 1):
+            if v is None or v == '':
+                continue
+            s = style or (STYLE_WRAP if c in self.wrap else STYLE_DEFAULT)
+            attrs = f' r="{self._letter(c)}{r}"' + (f' s="{s}"' if s else '')
+            if isinstance(v, bool):
+                out.append(f'<c{attrs} t="b"><v>{int(v)}</v></c>')
+            elif isinstance(v, (int, float)):
+                out.append(f'<c{attrs}><v>{v}</v></c>')
+            else:
+                out.append(f'<c{attrs} t="inlineStr"><is><t xml:space="preserve">{_text(str(v))}</t></is></c>')
+        out.append('</row>')
+        self._write(''.join(out))
+        return r
+
+    def add_image(self, data: bytes, row: int, col: int, max_width: int = 0) -> Optional[Tuple[int, int]]:
+        """Anchor a PNG/JPEG picture at (row, col), scaled down to max_width px.
+
+        Returns the drawn (width, height) in px, or None if the bytes are
+        not a usable picture. The sheet must have been declared with drawings.
+        """
+        if self.index not in self.book.drawings:
+            raise ValueError(f'sheet {self.index} was not declared with drawings')
+        info = image_info(data)
+        if info is None:
+            return None
+        ext, w, h = info
+        if max_width and w > max_width:
+            h = max(1, round(h * max_width / w))
+            w = max_width
+        offset = self.book._media.seek(0, 2)
+        self.book._media.write(data)
+        self._images.append((row, col, ext, w, h, offset, len(data)))
+        return w, h
+
+    def close(self):
+        drawing = self.index in self.book.drawings
+        self._write('</sheetData>' + ('<drawing r:id="rId1"/>' if drawing else '') + '</worksheet>')
+        self._fh.write(''.join(self._buf).encode('utf-8'))
+        self._buf.clear()
+        self._fh.close()
+        if drawing:
+            self._write_drawing()
+
+    def _write_drawing(self):
+        book = self.book
+        anchors = []
+        media_rels = []
+        for k, (row, col, ext, w, h, offset, length) in enumerate(self._images, 1):
+            book._media_count += 1
+            name = f'image{book._media_count}.{ext}'
+            book._media.seek(offset)
+            book.zip.writestr(f'xl/media/{name}', book._media.read(length), compress_type=zipfile.ZIP_STORED)
+            media_rels.append((f'rId{k}', f'{_REL_NS}/image', f'../media/{name}'))
+            cx, cy = w * EMU_PER_PX, h * EMU_PER_PX
+            anchors.append(
+                f'<xdr:oneCellAnchor><xdr:from><xdr:col>{col - 1}</xdr:col><xdr:colOff>0</xdr:colOff>'
+                f'<xdr:row>{row - 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from><xdr:ext cx="{cx}" cy="{cy}"/>'
+                f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="{k + 1}" name="Picture {k}"/><xdr:cNvPicPr>'
+                f'<a:picLocks noChangeAspect="1"/></xdr:cNvPicPr></xdr:nvPicPr>'
+                f'<xdr:blipFill><a:blip r:embed="rId{k}"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+                f'<xdr:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+                f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr></xdr:pic><xdr:clientData/></xdr:oneCellAnchor>')
+        book._media.seek(0)
+        book._media.truncate()
+        n = self.index
+        book.zip.writestr(f'xl/drawings/drawing{n}.xml',
+                          f'{_XML_HEAD}<xdr:wsDr xmlns:xdr="{_XDR_NS}" xmlns:a="{_A_NS}" xmlns:r="{_REL_NS}">'
+                          f'{"".join(anchors)}</xdr:wsDr>')
+        book.zip.writestr(f'xl/drawings/_rels/drawing{n}.xml.rels', _rels(media_rels))
+        book.zip.writestr(f'xl/worksheets/_rels/sheet{n}.xml.rels',
+                          _rels([('rId1', f'{_REL_NS}/drawing', f'../drawings/drawing{n}.xml')]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+
+
+class StreamingWorkbook:
+    """Write an .xlsx package into `out` (any writable binary file object, seekable or not).
+
+    `sheets` are the sheet names in tab order; `drawings` the names of
+    those that will get pictures.
+    """
+
+    def __init__(self, out, sheets: Sequence[str], drawings: Iterable[str] = ()):
+        self.sheets = list(sheets)
+        self.drawings = {self.sheets.index(name) + 1 for name in drawings}
+        self.zip = zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESSLEVEL)
+        # Picture bytes wait here until their sheet's XML is finished
+        self._media = tempfile.TemporaryFile()
+        self._media_count = 0
+        self._next = 0
+        n = len(self.sheets)
+        overrides = [('/xl/workbook.xml', f'{_CT}spreadsheetml.sheet.main+xml'),
+                     ('/xl/styles.xml', f'{_CT}spreadsheetml.styles+xml')]
+        overrides += [(f'/xl/worksheets/sheet{i}.xml', f'{_CT}spreadsheetml.worksheet+xml') for i in range(1, n + 1)]
+        overrides += [(f'/xl/drawings/drawing{i}.xml', f'{_CT}drawing+xml') for i in sorted(self.drawings)]
+        self.zip.writestr('[Content_Types].xml', (
+            f'{_XML_HEAD}<Types xmlns="{_CT_NS}">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="png" ContentType="image/png"/>'
+            '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+            + ''.join(f'<Override PartName="{p}" ContentType="{t}"/>' for p, t in overrides)
+            + '</Types>'))
+        self.zip.writestr('_rels/.rels', _rels([('rId1', f'{_REL_NS}/officeDocument', 'xl/workbook.xml')]))
+        self.zip.writestr('xl/workbook.xml', (
+            f'{_XML_HEAD}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+            '<bookViews><workbookView activeTab="0"/></bookViews><sheets>'
+            + ''.join(f'<sheet name={quoteattr(_text(name))} sheetId="{i}" r:id="rId{i}"/>'
+                      for i, name in enumerate(self.sheets, 1))
+            + '</sheets></workbook>'))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', _rels(
+            [(f'rId{i}', f'{_REL_NS}/worksheet', f'worksheets/sheet{i}.xml') for i in range(1, n + 1)]
+            + [(f'rId{n + 1}', f'{_REL_NS}/styles', 'styles.xml')]))
+        self.zip.writestr('xl/styles.xml', _STYLES)
+
+    def sheet(self, name: str, widths: Sequence[float] = (), wrap: Iterable[int] = ()) -> SheetWriter:
+        """Start the next declared sheet. `wrap` lists 1-based columns shown with wrapped text."""
+        if self._next >= len(self.sheets) or self.sheets[self._next] != name:
+            raise ValueError(f'sheets must be written in declared order; expected {self.sheets[self._next:self._next + 1]}')
+        self._next += 1
+        return SheetWriter(self, self._next, widths, wrap)
+
+    def close(self):
+        # Declared sheets that were never written still need a part
+        while self._next < len(self.sheets):
+            self.sheet(self.sheets[self._next]).close()
+        self.zip.close()
+        self._media.close()